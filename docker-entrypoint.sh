@@ -7,11 +7,39 @@ echo "=== Gestion Locative - Démarrage ==="
 echo "Application des migrations..."
 python manage.py migrate --noinput
 
+# Loyers dus : repousse l'horizon des baux sans date de fin
+python manage.py rafraichir_loyers_dus
+
+# Indices IRL / ILC : lus sur le site de l'INSEE au démarrage puis chaque jour,
+# en tâche de fond. Les vues ne lisent que la base. Même boucle : audit de
+# continuité des tarifications (anomalies dans les logs) et, au changement
+# d'année, prolongation des loyers dus des baux en cours.
+(
+    while true; do
+        python manage.py rafraichir_indices || echo "Rafraîchissement des indices INSEE en échec, nouvel essai demain."
+        python manage.py auditer_tarifications || echo "Audit des tarifications en échec."
+        python manage.py rafraichir_loyers_dus --prolonger || echo "Prolongation des loyers dus en échec."
+        sleep 86400
+    done
+) &
+
 # Créer le superuser si les variables sont définies
 if [ -n "$DJANGO_SUPERUSER_USERNAME" ] && [ -n "$DJANGO_SUPERUSER_PASSWORD" ]; then
     python manage.py createsuperuser --noinput 2>/dev/null || true
 fi
 
+# Workers des tâches de fond (ZIP de documents, campagnes de révision,
+# échéanciers) : le travail long ne bloque plus les workers gunicorn.
+# Un worker arrêté est relancé après quelques secondes.
+for _ in $(seq "${TACHES_WORKERS:-1}"); do
+    (
+        while true; do
+            python manage.py traiter_taches || echo "Worker de tâches arrêté, relance dans 5 s."
+            sleep 5
+        done
+    ) &
+done
+
 echo "Lancement de Gunicorn..."
 exec gunicorn gestion_locative.wsgi:application \
     --bind 0.0.0.0:8000 \
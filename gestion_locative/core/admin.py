@@ -1,32 +1,131 @@
 from django.contrib import admin
 from django.shortcuts import redirect
+from django.urls import reverse
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
-from django.db.models import Sum, Count, Q
-from django.http import HttpResponse
+from django.db.models import Sum, Count, Q, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+from django.utils import timezone
 from django.forms import BaseInlineFormSet, ValidationError
 from datetime import date
-import zipfile
-from io import BytesIO
+from decimal import Decimal
 import logging
 
 from .models import (
     Immeuble, Local, Bail, Occupant, Proprietaire, CleRepartition, QuotePart,
     Depense, Consommation, Ajustement, Regularisation, BailTarification,
     EstimationValeur, CreditImmobilier, EcheanceCredit, ChargeFiscale,
-    Amortissement, VacanceLocative
+    Amortissement, VacanceLocative, IndiceReference, Tache
 )
-from .patrimoine_calculators import (
-    PatrimoineCalculator, RentabiliteCalculator, CreditGenerator
+from .indicateurs import indicateurs_immeuble, indicateurs_immeubles
+from . import taches
+from .frise_tarifications import (
+    AUCUNE_TARIFICATION, SANS_TARIF_ACTIF, FriseTarifications, rapport_continuite,
 )
 
 logger = logging.getLogger(__name__)
 
+# Anomalies affichées une à une par l'action de vérification des tarifications
+MAX_MESSAGES_AUDIT = 20
+
+
+def soumettre_tache(modeladmin, request, type_tache, libelle, parametres):
+    """
+    Met en file une tâche de fond et redirige vers sa page de suivi.
+
+    Les ZIP de documents et les échéanciers ne sont plus produits dans la
+    requête : le worker `traiter_taches` s'en charge (core/taches.py).
+    """
+    tache = taches.soumettre(type_tache, libelle, parametres, request.user)
+    modeladmin.message_user(
+        request, f"✓ « {libelle} » mis en file : suivez l'avancement et téléchargez le résultat.",
+        level='success'
+    )
+    return redirect('app_tache_detail', pk=tache.pk)
+
 # Personnalisation de l'interface (complétée par Jazzmin dans settings.py)
 admin.site.site_header = "Gestion Locative & Patrimoine"
 admin.site.site_title = "Administration Immobilière"
 admin.site.index_title = "Tableau de Bord"
 
+
+class RelationAvecImmeubleFilter(admin.RelatedFieldListFilter):
+    """Filtre sur une clé ou un crédit : leur libellé affiche le nom de l'immeuble.
+
+    Les choix sont chargés avec select_related('immeuble'), en une requête
+    au lieu d'une par choix.
+    """
+
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        objets = field.related_model._default_manager.select_related('immeuble')
+        if ordering:
+            objets = objets.order_by(*ordering)
+        return [(objet.pk, str(objet)) for objet in objets]
+
+
+def annoter_tarification_actuelle(baux):
+    """
+    Ajoute aux baux, en SQL, le loyer du jour et le locataire principal.
+
+    Mêmes règles que Bail.tarification_actuelle (tarification couvrant la
+    date du jour, la plus récente d'abord) et Bail.locataire_principal
+    (LOCATAIRE de plus petit pk) : colonnes triables et filtrables dans
+    l'admin, sans lecture ligne par ligne.
+
+    Annotations : loyer_hc_actuel, charges_actuelles, taxes_actuelles
+    (NULL sans tarification en cours), locataire_nom (NULL sans locataire).
+    """
+    aujourdhui = timezone.now().date()
+    tarif = BailTarification.objects.filter(
+        Q(date_fin__isnull=True) | Q(date_fin__gte=aujourdhui),
+        bail=OuterRef('pk'), date_debut__lte=aujourdhui,
+    ).order_by('-date_debut')
+    locataire = Occupant.objects.filter(bail=OuterRef('pk'), role='LOCATAIRE').order_by('pk')
+    return baux.annotate(
+        loyer_hc_actuel=Subquery(tarif.values('loyer_hc')[:1]),
+        charges_actuelles=Subquery(tarif.values('charges')[:1]),
+        taxes_actuelles=Subquery(tarif.values('taxes')[:1]),
+        locataire_nom=Subquery(
+            locataire.annotate(nom_complet=Concat('nom', Value(' '), 'prenom')).values('nom_complet')[:1]
+        ),
+    )
+
+
+class TarificationEnCoursFilter(admin.SimpleListFilter):
+    """Baux avec ou sans tarification couvrant la date du jour (annotation loyer_hc_actuel)."""
+
+    title = 'tarification en cours'
+    parameter_name = 'tarification_en_cours'
+
+    def lookups(self, request, model_admin):
+        return (('oui', 'Oui'), ('non', 'Non (loyer à 0)'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'oui':
+            return queryset.filter(loyer_hc_actuel__isnull=False)
+        if self.value() == 'non':
+            return queryset.filter(loyer_hc_actuel__isnull=True)
+        return queryset
+
+
+class FinancementFilter(admin.SimpleListFilter):
+    """Immeubles avec ou sans crédit (annotation capital_emprunte)."""
+
+    title = 'financement'
+    parameter_name = 'financement'
+
+    def lookups(self, request, model_admin):
+        return (('credit', 'Avec crédit'), ('comptant', 'Sans crédit'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'credit':
+            return queryset.filter(capital_emprunte__gt=0)
+        if self.value() == 'comptant':
+            return queryset.filter(capital_emprunte=0)
+        return queryset
+
+
 class OccupantInline(admin.TabularInline):
     model = Occupant
     extra = 1
@@ -80,18 +179,6 @@ class ChargeFiscaleInline(admin.TabularInline):
     ordering = ['-annee', 'type_charge']
 
 
-class EcheanceInline(admin.TabularInline):
-    model = EcheanceCredit
-    extra = 0
-    fields = ('numero_echeance', 'date_echeance', 'capital_rembourse', 'interets', 'assurance', 'capital_restant_du', 'payee')
-    readonly_fields = ('numero_echeance', 'date_echeance', 'capital_rembourse', 'interets', 'assurance', 'capital_restant_du')
-    ordering = ['numero_echeance']
-    can_delete = False
-
-    def has_add_permission(self, request, obj=None):
-        return False
-
-
 class AmortissementInline(admin.TabularInline):
     model = Amortissement
     extra = 0
@@ -131,45 +218,26 @@ class BailTarificationFormSet(BaseInlineFormSet):
 
     Contrairement à la validation dans le modèle, ce formset voit TOUTES les
     tarifications en cours de modification (y compris celles pas encore sauvegardées).
+    Les instances des formulaires sont rangées dans une frise et contrôlées en un
+    seul balayage (core/frise_tarifications.py).
     """
 
     def clean(self):
         super().clean()
 
-        # Collecter toutes les tarifications valides (non supprimées)
-        tarifications = []
-        for form in self.forms:
-            if form.cleaned_data and not form.cleaned_data.get('DELETE', False):
-                tarifications.append({
-                    'date_debut': form.cleaned_data.get('date_debut'),
-                    'date_fin': form.cleaned_data.get('date_fin'),
-                    'form': form,
-                })
-
-        # Vérifier les chevauchements entre tarifications
-        for i, t1 in enumerate(tarifications):
-            if not t1['date_debut']:
-                continue
-            for t2 in tarifications[i + 1:]:
-                if not t2['date_debut']:
-                    continue
-                if self._periods_overlap(t1, t2):
-                    raise ValidationError(
-                        f"Chevauchement détecté entre la tarification du "
-                        f"{t1['date_debut'].strftime('%d/%m/%Y')} et celle du "
-                        f"{t2['date_debut'].strftime('%d/%m/%Y')}."
-                    )
-
-    def _periods_overlap(self, t1, t2):
-        """Vérifie si deux périodes se chevauchent."""
-        # Utiliser une date très lointaine pour les périodes sans fin
-        far_future = date(9999, 12, 31)
-        t1_fin = t1['date_fin'] if t1['date_fin'] else far_future
-        t2_fin = t2['date_fin'] if t2['date_fin'] else far_future
-
-        # Deux périodes se chevauchent si elles ne sont PAS disjointes
-        # Disjointes si: t1 finit avant t2 commence OU t2 finit avant t1 commence
-        return not (t1_fin < t2['date_debut'] or t2_fin < t1['date_debut'])
+        # Tarifications valides (non supprimées), dates saisies reportées sur l'instance
+        frise = FriseTarifications(
+            form.instance for form in self.forms
+            if form.cleaned_data and not form.cleaned_data.get('DELETE', False)
+        )
+        chevauchements = frise.chevauchements()
+        if chevauchements:
+            t1, t2 = chevauchements[0].tarifs
+            raise ValidationError(
+                f"Chevauchement détecté entre la tarification du "
+                f"{t1.date_debut.strftime('%d/%m/%Y')} et celle du "
+                f"{t2.date_debut.strftime('%d/%m/%Y')}."
+            )
 
 
 class BailTarificationInline(admin.TabularInline):
@@ -228,6 +296,7 @@ class BailAdmin(admin.ModelAdmin):
     # Filtres avancés
     list_filter = (
         'actif',
+        TarificationEnCoursFilter,
         'frequence_paiement',
         'type_charges',
         'soumis_tva',
@@ -256,39 +325,42 @@ class BailAdmin(admin.ModelAdmin):
         'imprimer_solde_tout_compte',
         'imprimer_revision_loyer',
         'generer_quittances_zip',
+        'generer_avis_echeance_zip',
+        'generer_regularisations_zip',
         'verifier_continuite_tarifications',
     ]
 
     def get_queryset(self, request):
-        """Optimisation des requêtes avec select_related et prefetch_related."""
+        """Loyer du jour et locataire calculés en SQL (colonnes triables), local par jointure."""
         qs = super().get_queryset(request)
-        return qs.select_related(
-            'local__immeuble__proprietaire'
-        ).prefetch_related(
-            'tarifications',
-            'occupants'
+        return annoter_tarification_actuelle(
+            qs.select_related('local__immeuble__proprietaire')
         )
 
+    @staticmethod
+    def _montant(valeur):
+        return f"{valeur if valeur is not None else Decimal('0')} €"
+
     def get_locataire(self, obj):
         """Affiche le nom du locataire principal."""
-        locataire = obj.occupants.filter(role='LOCATAIRE').first()
-        if locataire:
-            return f"{locataire.nom} {locataire.prenom}"
-        return "-"
+        return obj.locataire_nom or "-"
     get_locataire.short_description = 'Locataire'
+    get_locataire.admin_order_field = 'locataire_nom'
 
     def get_loyer_hc(self, obj):
-        return f"{obj.loyer_hc} €"
+        return self._montant(obj.loyer_hc_actuel)
     get_loyer_hc.short_description = 'Loyer HC'
-    get_loyer_hc.admin_order_field = 'tarifications__loyer_hc'
+    get_loyer_hc.admin_order_field = 'loyer_hc_actuel'
 
     def get_charges(self, obj):
-        return f"{obj.charges} €"
+        return self._montant(obj.charges_actuelles)
     get_charges.short_description = 'Charges'
+    get_charges.admin_order_field = 'charges_actuelles'
 
     def get_taxes(self, obj):
-        return f"{obj.taxes} €"
+        return self._montant(obj.taxes_actuelles)
     get_taxes.short_description = 'Taxes'
+    get_taxes.admin_order_field = 'taxes_actuelles'
 
     def get_actif_badge(self, obj):
         """Badge coloré pour le statut actif/inactif."""
@@ -343,104 +415,61 @@ class BailAdmin(admin.ModelAdmin):
     def generer_quittances_zip(self, request, queryset):
         """
         Génère un fichier ZIP contenant les quittances de tous les baux sélectionnés.
-        Utilise la dernière période disponible pour chaque bail.
+        Utilise la période du mois en cours pour chaque bail.
         """
-        if queryset.count() == 0:
-            self.message_user(request, "Aucun bail sélectionné.", level='warning')
-            return
-
-        logger.info(f"Génération ZIP quittances pour {queryset.count()} baux")
-
-        try:
-            # Créer ZIP en mémoire
-            zip_buffer = BytesIO()
-
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for bail in queryset:
-                    try:
-                        # Période actuelle (mois en cours)
-                        today = date.today()
-                        periode = date(today.year, today.month, 1)
-
-                        # Générer quittance avec PDFGenerator
-                        from .pdf_generator import PDFGenerator
-                        generator = PDFGenerator(bail)
-                        pdf_content = generator.generer_quittance([periode])
-
-                        # Nom du fichier dans le ZIP
-                        occupant = bail.occupants.filter(role='LOCATAIRE').first()
-                        nom_locataire = occupant.nom.upper().replace(" ", "_") if occupant else "Inconnu"
-                        filename = f"Quittance_{nom_locataire}_{bail.local.numero_porte}_{periode.strftime('%Y-%m')}.pdf"
-
-                        # Ajouter au ZIP
-                        zip_file.writestr(filename, pdf_content)
-
-                        logger.debug(f"Quittance ajoutée au ZIP: {filename}")
-
-                    except Exception as e:
-                        logger.error(f"Erreur génération quittance pour bail {bail.pk}: {str(e)}")
-                        # Continue avec les autres baux
-                        continue
-
-            # Préparer la réponse
-            zip_buffer.seek(0)
-            response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
-            response['Content-Disposition'] = f'attachment; filename="Quittances_{date.today().strftime("%Y%m%d")}.zip"'
+        periode = date.today().replace(day=1)
+        return self._soumettre_lot(
+            request, queryset, 'quittances_zip', f"Quittances {periode:%m/%Y}", periode=periode.isoformat()
+        )
 
-            self.message_user(request, f'✓ ZIP généré avec {queryset.count()} quittance(s).', level='success')
+    @admin.action(description="📦 Générer Avis d'échéance Groupés (ZIP)")
+    def generer_avis_echeance_zip(self, request, queryset):
+        """ZIP des avis d'échéance du mois en cours pour les baux sélectionnés."""
+        periode = date.today().replace(day=1)
+        return self._soumettre_lot(
+            request, queryset, 'avis_echeance_zip', f"Avis d'échéance {periode:%m/%Y}", periode=periode.isoformat()
+        )
 
-            logger.info(f"ZIP généré avec succès: {len(zip_buffer.getvalue())} bytes")
-            return response
+    @admin.action(description='📦 Générer Régularisations Groupées N-1 (ZIP)')
+    def generer_regularisations_zip(self, request, queryset):
+        """ZIP des régularisations de l'année précédente, enregistrées dans l'historique."""
+        annee_prec = date.today().year - 1
+        return self._soumettre_lot(
+            request, queryset, 'regularisations_zip', f"Régularisations {annee_prec}",
+            date_debut=date(annee_prec, 1, 1).isoformat(), date_fin=date(annee_prec, 12, 31).isoformat(),
+        )
 
-        except Exception as e:
-            logger.exception("Erreur génération ZIP quittances")
-            self.message_user(request, f'Erreur: {str(e)}', level='error')
+    def _soumettre_lot(self, request, queryset, type_tache, libelle, **parametres):
+        """Met en file le ZIP d'un lot de documents pour les baux sélectionnés."""
+        baux = list(queryset.values_list('pk', flat=True))
+        if not baux:
+            self.message_user(request, "Aucun bail sélectionné.", level='warning')
             return
+        logger.info(f"ZIP {type_tache} mis en file pour {len(baux)} baux")
+        return soumettre_tache(self, request, type_tache, f"{libelle} ({len(baux)} baux)", {'baux': baux, **parametres})
 
     @admin.action(description='🔍 Vérifier Continuité Tarifications')
     def verifier_continuite_tarifications(self, request, queryset):
         """
-        Vérifie qu'il n'y a pas de trous dans les tarifications des baux sélectionnés.
+        Vérifie qu'il n'y a ni trou ni chevauchement dans les tarifications des
+        baux sélectionnés (une requête pour toute la sélection). Le détail du
+        portefeuille complet est sur la page d'audit, exportable en CSV.
         """
-        problemes = []
-
-        for bail in queryset:
-            tarifs = bail.tarifications.order_by('date_debut')
-
-            if not tarifs.exists():
-                problemes.append(f"❌ {bail}: Aucune tarification définie")
-                continue
-
-            # Vérifier continuité
-            for i in range(len(tarifs) - 1):
-                tarif_current = tarifs[i]
-                tarif_next = tarifs[i + 1]
-
-                if tarif_current.date_fin:
-                    from datetime import timedelta
-                    expected_next = tarif_current.date_fin + timedelta(days=1)
-
-                    if tarif_next.date_debut != expected_next:
-                        gap_days = (tarif_next.date_debut - tarif_current.date_fin).days - 1
-                        problemes.append(
-                            f"⚠️ {bail}: Trou de {gap_days} jour(s) entre "
-                            f"{tarif_current.date_fin.strftime('%d/%m/%Y')} et "
-                            f"{tarif_next.date_debut.strftime('%d/%m/%Y')}"
-                        )
-
-            # Vérifier qu'il y a une tarification active
-            tarif_actif = bail.tarification_actuelle
-            if not tarif_actif:
-                problemes.append(f"❌ {bail}: Aucune tarification active aujourd'hui")
-
-        # Afficher résultats
-        if problemes:
-            message = "Problèmes détectés:\n" + "\n".join(problemes)
-            self.message_user(request, message, level='warning')
-            logger.warning(f"Vérification tarifications: {len(problemes)} problème(s) détecté(s)")
-        else:
+        lignes = rapport_continuite(queryset)
+        if not lignes:
             self.message_user(request, f'✓ Toutes les tarifications sont continues ({queryset.count()} bail(s) vérifiés).', level='success')
             logger.info(f"Vérification tarifications: OK pour {queryset.count()} baux")
+            return
+
+        logger.warning(f"Vérification tarifications: {len(lignes)} problème(s) détecté(s)")
+        for ligne in lignes[:MAX_MESSAGES_AUDIT]:
+            icone = '❌' if ligne.anomalie.type_anomalie in (AUCUNE_TARIFICATION, SANS_TARIF_ACTIF) else '⚠️'
+            self.message_user(request, f"{icone} {ligne.bail}: {ligne.anomalie}", level='warning')
+        if len(lignes) > MAX_MESSAGES_AUDIT:
+            self.message_user(request, format_html(
+                '… et {} autre(s) problème(s) : voir <a href="{}">l\'audit des tarifications</a>.',
+                len(lignes) - MAX_MESSAGES_AUDIT, reverse('app_audit_tarifications'),
+            ), level='warning')
 
 @admin.register(Proprietaire)
 class ProprietaireAdmin(admin.ModelAdmin):
@@ -450,10 +479,11 @@ class ProprietaireAdmin(admin.ModelAdmin):
 class ImmeubleAdmin(admin.ModelAdmin):
     list_display = (
         'nom', 'ville', 'proprietaire', 'regime_fiscal',
-        'get_valeur_actuelle', 'get_capital_restant_du', 'get_valeur_nette',
+        'get_valeur_actuelle', 'get_capital_emprunte', 'get_capital_restant_du', 'get_valeur_nette',
         'get_rendement_brut', 'get_cashflow'
     )
-    list_filter = ('proprietaire', 'regime_fiscal', 'ville')
+    list_filter = ('proprietaire', 'regime_fiscal', 'ville', FinancementFilter)
+    list_select_related = ('proprietaire',)
     search_fields = ('nom', 'adresse', 'ville')
 
     fieldsets = (
@@ -474,28 +504,70 @@ class ImmeubleAdmin(admin.ModelAdmin):
 
     inlines = [EstimationValeurInline, CreditImmobilierInline, ChargeFiscaleInline, AmortissementInline]
 
+    def get_queryset(self, request):
+        """
+        Valeur actuelle et capital emprunté en SQL, pour trier et filtrer.
+
+        Le CRD, les rendements et le cash-flow dépendent des échéanciers : ils
+        restent lus dans les instantanés du jour (get_changelist_instance).
+        """
+        estimation = EstimationValeur.objects.filter(
+            immeuble=OuterRef('pk')
+        ).order_by('-date_estimation')
+        capital = CreditImmobilier.objects.filter(
+            immeuble=OuterRef('pk')
+        ).order_by().values('immeuble').annotate(total=Sum('capital_emprunte')).values('total')
+        return super().get_queryset(request).annotate(
+            valeur_actuelle=Coalesce(
+                Subquery(estimation.values('valeur_estimee')[:1]), 'prix_achat', Decimal('0')
+            ),
+            capital_emprunte=Coalesce(Subquery(capital), Decimal('0')),
+        )
+
+    def get_changelist_instance(self, request):
+        """Indicateurs de la page lus en un lot (instantanés du jour) et posés sur chaque ligne."""
+        changelist = super().get_changelist_instance(request)
+        indicateurs = indicateurs_immeubles(changelist.result_list)
+        for immeuble in changelist.result_list:
+            immeuble.indicateurs = indicateurs[immeuble.pk]
+        return changelist
+
+    @staticmethod
+    def _indicateurs(obj):
+        indicateurs = getattr(obj, 'indicateurs', None)
+        return indicateurs if indicateurs is not None else indicateurs_immeuble(obj)
+
     def get_valeur_actuelle(self, obj):
-        valeur = PatrimoineCalculator.get_valeur_actuelle(obj)
+        valeur = self._indicateurs(obj)['valeur']
         if valeur:
             return f"{valeur:,.0f} €".replace(',', ' ')
         return "-"
     get_valeur_actuelle.short_description = "Valeur actuelle"
+    get_valeur_actuelle.admin_order_field = 'valeur_actuelle'
+
+    def get_capital_emprunte(self, obj):
+        capital = getattr(obj, 'capital_emprunte', None)
+        if capital:
+            return f"{capital:,.0f} €".replace(',', ' ')
+        return "-"
+    get_capital_emprunte.short_description = "Emprunté"
+    get_capital_emprunte.admin_order_field = 'capital_emprunte'
 
     def get_capital_restant_du(self, obj):
-        crd = PatrimoineCalculator.get_capital_restant_du(obj)
+        crd = self._indicateurs(obj)['crd']
         if crd > 0:
             return f"{crd:,.0f} €".replace(',', ' ')
         return "0 €"
     get_capital_restant_du.short_description = "CRD"
 
     def get_valeur_nette(self, obj):
-        valeur_nette = PatrimoineCalculator.get_valeur_nette(obj)
+        valeur_nette = self._indicateurs(obj)['valeur_nette']
         color = "#28a745" if valeur_nette >= 0 else "#dc3545"
         return mark_safe(f'<span style="color: {color}; font-weight: bold;">{valeur_nette:,.0f} €</span>'.replace(',', ' '))
     get_valeur_nette.short_description = "Valeur nette"
 
     def get_rendement_brut(self, obj):
-        rendement = RentabiliteCalculator.get_rendement_brut(obj)
+        rendement = self._indicateurs(obj)['rendement_brut']
         if rendement is not None:
             color = "#28a745" if rendement >= 5 else "#ffc107" if rendement >= 3 else "#dc3545"
             return mark_safe(f'<span style="color: {color}; font-weight: bold;">{rendement:.1f}%</span>')
@@ -503,12 +575,29 @@ class ImmeubleAdmin(admin.ModelAdmin):
     get_rendement_brut.short_description = "Rdt brut"
 
     def get_cashflow(self, obj):
-        cashflow = RentabiliteCalculator.get_cashflow_mensuel(obj)
+        cashflow = self._indicateurs(obj)['cashflow']
         color = "#28a745" if cashflow >= 0 else "#dc3545"
         return mark_safe(f'<span style="color: {color}; font-weight: bold;">{cashflow:,.0f} €/mois</span>'.replace(',', ' '))
     get_cashflow.short_description = "Cash-flow"
 
-    actions = ['voir_bilan_fiscal']
+    actions = ['voir_bilan_fiscal', 'cloturer_charges_zip']
+
+    @admin.action(description='📦 Clôturer les charges N-1 (ZIP des régularisations)')
+    def cloturer_charges_zip(self, request, queryset):
+        """
+        Régularisations de l'année précédente de tous les baux des immeubles
+        sélectionnés : un seul calcul par lot, historisé, PDF en ZIP (tâche de fond).
+        """
+        annee_prec = date.today().year - 1
+        immeubles = list(queryset.values_list('pk', flat=True))
+        return soumettre_tache(
+            self, request, 'regularisations_zip', f"Clôture des charges {annee_prec}",
+            {
+                'immeubles': immeubles,
+                'date_debut': date(annee_prec, 1, 1).isoformat(),
+                'date_fin': date(annee_prec, 12, 31).isoformat(),
+            },
+        )
 
     @admin.action(description='📊 Voir Bilan Fiscal')
     def voir_bilan_fiscal(self, request, queryset):
@@ -534,12 +623,14 @@ class CleRepartitionAdmin(admin.ModelAdmin):
 @admin.register(Depense)
 class DepenseAdmin(admin.ModelAdmin):
     list_display = ('date', 'libelle', 'montant', 'immeuble', 'cle_repartition', 'date_debut', 'date_fin')
-    list_filter = ('immeuble', 'cle_repartition', 'date')
+    list_filter = ('immeuble', ('cle_repartition', RelationAvecImmeubleFilter), 'date')
+    list_select_related = ('immeuble', 'cle_repartition__immeuble')
 
 @admin.register(Consommation)
 class ConsommationAdmin(admin.ModelAdmin):
     list_display = ('local', 'cle_repartition', 'date_debut', 'date_releve', 'index_debut', 'index_fin', 'quantite')
-    list_filter = ('local__immeuble', 'cle_repartition', 'date_releve')
+    list_filter = ('local__immeuble', ('cle_repartition', RelationAvecImmeubleFilter), 'date_releve')
+    list_select_related = ('local__immeuble', 'cle_repartition__immeuble')
 
 @admin.register(Ajustement)
 class AjustementAdmin(admin.ModelAdmin):
@@ -559,7 +650,8 @@ class AjustementAdmin(admin.ModelAdmin):
 class QuotePartAdmin(admin.ModelAdmin):
     """Admin standalone pour gérer toutes les quote-parts."""
     list_display = ('local', 'cle', 'valeur', 'get_immeuble')
-    list_filter = ('cle__immeuble', 'cle')
+    list_filter = ('cle__immeuble', ('cle', RelationAvecImmeubleFilter))
+    list_select_related = ('local__immeuble', 'cle__immeuble')
     search_fields = ('local__numero_porte', 'cle__nom')
     ordering = ['cle__immeuble', 'cle', 'local']
 
@@ -625,11 +717,27 @@ class CreditImmobilierAdmin(admin.ModelAdmin):
                 'assurance_mensuelle',
             )
         }),
+        ('Échéancier', {
+            'fields': ('get_echeancier',),
+        }),
     )
+    readonly_fields = ('get_echeancier',)
 
-    inlines = [EcheanceInline]
+    # L'échéancier (jusqu'à 300 lignes) n'est plus un inline : liens vers ses
+    # vues paginées (application et liste admin filtrée sur le crédit).
     actions = ['generer_echeancier']
 
+    def get_echeancier(self, obj):
+        if not obj.pk:
+            return "Généré à l'enregistrement (action « Générer/Régénérer échéancier »)."
+        return format_html(
+            '<a href="{}">Échéancier paginé et résumé annuel</a> · '
+            '<a href="{}?credit__id__exact={}">Échéances dans l\'admin (paiements)</a>',
+            reverse('app_credit_echeancier', args=[obj.pk]),
+            reverse('admin:core_echeancecredit_changelist'), obj.pk,
+        )
+    get_echeancier.short_description = "Échéancier"
+
     def get_mensualite(self, obj):
         return f"{obj.mensualite:.2f} €"
     get_mensualite.short_description = "Mensualité"
@@ -646,17 +754,10 @@ class CreditImmobilierAdmin(admin.ModelAdmin):
 
     @admin.action(description='📅 Générer/Régénérer échéancier')
     def generer_echeancier(self, request, queryset):
-        total = 0
-        for credit in queryset:
-            generator = CreditGenerator(credit)
-            nb_echeances = generator.creer_echeances_en_base()
-            total += nb_echeances
-            logger.info(f"Échéancier généré pour {credit}: {nb_echeances} échéances")
-
-        self.message_user(
-            request,
-            f'✓ {total} échéances générées pour {queryset.count()} crédit(s).',
-            level='success'
+        """Recalcule les échéanciers ; seules les échéances changées sont réécrites, paiements conservés."""
+        credits = list(queryset.values_list('pk', flat=True))
+        return soumettre_tache(
+            self, request, 'echeanciers', f"Échéanciers de {len(credits)} crédit(s)", {'credits': credits}
         )
 
 
@@ -667,7 +768,8 @@ class EcheanceCreditAdmin(admin.ModelAdmin):
         'capital_rembourse', 'interets', 'assurance',
         'capital_restant_du', 'payee'
     )
-    list_filter = ('credit__immeuble', 'credit', 'payee', 'date_echeance')
+    list_filter = ('credit__immeuble', ('credit', RelationAvecImmeubleFilter), 'payee', 'date_echeance')
+    list_select_related = ('credit__immeuble',)
     readonly_fields = (
         'credit', 'numero_echeance', 'date_echeance',
         'capital_rembourse', 'interets', 'assurance', 'capital_restant_du'
@@ -738,4 +840,39 @@ class VacanceLocativeAdmin(admin.ModelAdmin):
         return mark_safe(
             '<span style="background-color: #28a745; color: white; padding: 3px 8px; border-radius: 3px;">○ Terminée</span>'
         )
-    get_statut.short_description = "Statut"
\ No newline at end of file
+    get_statut.short_description = "Statut"
+
+
+@admin.register(IndiceReference)
+class IndiceReferenceAdmin(admin.ModelAdmin):
+    """Indices tenus à jour par `manage.py rafraichir_indices` ; saisie manuelle possible."""
+    list_display = ('type_indice', 'get_trimestre', 'valeur', 'mis_a_jour')
+    list_filter = ('type_indice', 'annee')
+    ordering = ('type_indice', '-annee', '-trimestre')
+
+    def get_trimestre(self, obj):
+        return obj.libelle_trimestre
+    get_trimestre.short_description = "Trimestre"
+    get_trimestre.admin_order_field = 'annee'
+
+
+@admin.register(Tache)
+class TacheAdmin(admin.ModelAdmin):
+    """Historique des tâches de fond (exécutées par `manage.py traiter_taches`)."""
+    list_display = ('libelle', 'type_tache', 'statut', 'get_avancement', 'cree_par', 'cree_le', 'fin')
+    list_filter = ('statut', 'type_tache')
+    list_select_related = ('cree_par',)
+    readonly_fields = [field.name for field in Tache._meta.fields]
+    actions = ['relancer']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Relancer les tâches sélectionnées")
+    def relancer(self, request, queryset):
+        nombre = taches.relancer(queryset)
+        self.message_user(request, f"{nombre} tâche(s) remise(s) en file.")
+
+    def get_avancement(self, obj):
+        return f"{obj.pourcentage} %"
+    get_avancement.short_description = "Avancement"
@@ -0,0 +1,171 @@
+"""
+Cache disque des PDF générés, adressé par le contenu de leurs données.
+
+La clé d'un document est l'empreinte SHA-256 de tout ce que son rendu lit :
+type de document, périodes, bail, local, coordonnées de l'immeuble et du
+propriétaire, tarifications et occupants du bail. Une donnée modifiée donne
+une autre empreinte : l'ancien fichier n'est plus jamais servi, sans
+invalidation explicite. Les fichiers orphelins sont supprimés par purger()
+(commande purger_cache_pdf).
+
+Les fichiers vivent sous settings.PDF_CACHE_DIR, dans le volume de données,
+et sont servis tels quels (FileResponse). Un document servi depuis le cache
+est le duplicata du premier émis : il en garde la date « Fait le ».
+
+Seuls les documents entièrement déterminés par ces données sont mis en
+cache (quittances, avis d'échéance) : une régularisation dépend aussi des
+dépenses de l'immeuble.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter dès que le dessin d'un document mis en cache change :
+# les PDF déjà en cache ne seraient sinon plus à jour.
+VERSION_RENDU = 1
+
+COORDONNEES = ('nom', 'adresse', 'code_postal', 'ville')
+
+
+def _ligne(instance, champs=None):
+    """Valeurs des champs d'une instance (tous les champs concrets par défaut)."""
+    if instance is None:
+        return None
+    if champs is None:
+        champs = [champ.attname for champ in instance._meta.concrete_fields]
+    return [(champ, getattr(instance, champ)) for champ in champs]
+
+
+def _normaliser_periode(periode):
+    if isinstance(periode, (date, datetime)):
+        return periode.isoformat()
+    return str(periode)
+
+
+def empreinte(bail, methode, periodes):
+    """
+    Empreinte des données d'un document.
+
+    Lit tarifications.all() et occupants.all() : sans requête sur un bail
+    préchargé (documents_lot.precharger_baux).
+
+    Args:
+        bail: Instance de Bail
+        methode (str): Méthode de PDFGenerator (ex: 'generer_quittance')
+        periodes (list): Périodes du document (date ou 'YYYY-MM-DD')
+
+    Returns:
+        str: Empreinte hexadécimale (64 caractères)
+    """
+    immeuble = bail.local.immeuble
+    donnees = {
+        'version': VERSION_RENDU,
+        'document': methode,
+        'periodes': sorted({_normaliser_periode(periode) for periode in periodes}),
+        'bail': _ligne(bail),
+        'local': _ligne(bail.local),
+        'immeuble': _ligne(immeuble, COORDONNEES),
+        'proprietaire': _ligne(immeuble.proprietaire, COORDONNEES),
+        'tarifications': sorted(
+            (_ligne(tarif) for tarif in bail.tarifications.all()), key=lambda ligne: ligne[0][1]
+        ),
+        'occupants': sorted(
+            (_ligne(occupant) for occupant in bail.occupants.all()), key=lambda ligne: ligne[0][1]
+        ),
+    }
+    contenu = json.dumps(donnees, default=str, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+
+def chemin(cle):
+    """Fichier d'une empreinte, réparti en sous-dossiers de 256 entrées au plus."""
+    return Path(settings.PDF_CACHE_DIR) / cle[:2] / f"{cle}.pdf"
+
+
+def lire(cle):
+    """Chemin du PDF en cache, ou None."""
+    fichier = chemin(cle)
+    return fichier if fichier.is_file() else None
+
+
+def enregistrer(cle, contenu):
+    """
+    Écrit un PDF dans le cache (sans effet s'il y est déjà).
+
+    Écriture dans un fichier temporaire puis renommage : un autre worker ne
+    lit jamais un PDF à moitié écrit.
+
+    Returns:
+        Path: Fichier en cache
+    """
+    fichier = chemin(cle)
+    if fichier.is_file():
+        return fichier
+    fichier.parent.mkdir(parents=True, exist_ok=True)
+    descripteur, temporaire = tempfile.mkstemp(dir=fichier.parent, suffix='.tmp')
+    try:
+        with os.fdopen(descripteur, 'wb') as sortie:
+            sortie.write(contenu)
+        os.replace(temporaire, fichier)
+    except OSError:
+        Path(temporaire).unlink(missing_ok=True)
+        raise
+    return fichier
+
+
+def document(bail, methode, periodes):
+    """
+    PDF d'un document, depuis le cache ou rendu puis mis en cache.
+
+    Les erreurs de rendu (tarification manquante...) remontent telles quelles
+    et rien n'est écrit.
+
+    Returns:
+        Path: Fichier PDF
+    """
+    from .pdf_generator import PDFGenerator
+
+    cle = empreinte(bail, methode, periodes)
+    fichier = lire(cle)
+    if fichier:
+        logger.debug(f"PDF servi depuis le cache : {cle}")
+        try:
+            # Date de dernier usage, lue par purger()
+            os.utime(fichier)
+        except OSError:
+            pass
+        return fichier
+    return enregistrer(cle, getattr(PDFGenerator(bail), methode)(periodes))
+
+
+def purger(age_max_jours):
+    """
+    Supprime les PDF en cache non servis depuis `age_max_jours` jours.
+
+    Returns:
+        int: Nombre de fichiers supprimés
+    """
+    dossier = Path(settings.PDF_CACHE_DIR)
+    if not dossier.is_dir():
+        return 0
+    limite = time.time() - age_max_jours * 86400
+    supprimes = 0
+    for fichier in dossier.glob('*/*'):
+        try:
+            if fichier.stat().st_mtime < limite:
+                fichier.unlink()
+                supprimes += 1
+        except FileNotFoundError:
+            # Supprimé entre-temps par un autre processus
+            continue
+    logger.info(f"Cache PDF : {supprimes} fichier(s) supprimé(s)")
+    return supprimes
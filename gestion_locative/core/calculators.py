@@ -2,7 +2,7 @@
 Calculateurs pour les opérations complexes de gestion locative.
 """
 import calendar
-from datetime import date, timedelta
+from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
 import logging
 
@@ -118,14 +118,15 @@ class BailCalculator:
         return total_provisions, details
 
     @staticmethod
-    def calculer_revision_irl(bail, nouvel_indice, ancien_indice=None):
+    def calculer_revision_irl(bail, nouvel_indice, ancien_indice=None, tarif=None):
         """
         Calcule le nouveau loyer après révision IRL/ILC.
 
         Args:
             bail: Instance de Bail
             nouvel_indice (Decimal): Nouvel indice IRL/ILC
-            ancien_indice (Decimal, optional): Ancien indice. Si None, utilise tarification actuelle.
+            ancien_indice (Decimal, optional): Ancien indice. Si None, utilise celui de la tarification révisée.
+            tarif (BailTarification, optional): Tarification révisée (défaut : tarification actuelle)
 
         Returns:
             dict: {
@@ -136,7 +137,7 @@ class BailCalculator:
                 'nouvel_indice': Decimal
             }
         """
-        tarif_actuel = bail.tarification_actuelle
+        tarif_actuel = tarif or bail.tarification_actuelle
 
         if not tarif_actuel:
             raise ValueError(f"Aucune tarification actuelle pour {bail}")
@@ -151,7 +152,8 @@ class BailCalculator:
 
         # Calcul
         nouveau_loyer = Decimal(ancien_loyer) * (Decimal(nouvel_indice) / Decimal(ancien_indice))
-        nouveau_loyer = nouveau_loyer.quantize(Decimal('0.01'))  # Arrondi à 2 décimales
+        # Arrondi au centime le plus proche, comme le courrier de révision
+        nouveau_loyer = nouveau_loyer.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
         variation_pct = float((nouveau_loyer - ancien_loyer) / ancien_loyer * 100)
 
@@ -241,25 +243,15 @@ class BailCalculator:
                 - is_continuous (bool): True si continu
                 - gaps_list (list): Liste des trous détectés
         """
-        tarifs = bail.tarifications.order_by('date_debut')
+        frise = bail.frise_tarifications()
 
-        if not tarifs.exists():
+        if not frise:
             return False, ["Aucune tarification définie"]
 
-        gaps = []
-
-        for i in range(len(tarifs) - 1):
-            tarif_current = tarifs[i]
-            tarif_next = tarifs[i + 1]
-
-            if tarif_current.date_fin:
-                expected_next = tarif_current.date_fin + timedelta(days=1)
-                if tarif_next.date_debut != expected_next:
-                    gaps.append({
-                        'end': tarif_current.date_fin,
-                        'start': tarif_next.date_debut,
-                        'days': (tarif_next.date_debut - tarif_current.date_fin).days - 1
-                    })
+        gaps = [
+            {'end': trou.tarifs[0].date_fin, 'start': trou.tarifs[1].date_debut, 'days': trou.jours}
+            for trou in frise.trous()
+        ]
 
         is_continuous = len(gaps) == 0
 
@@ -0,0 +1,288 @@
+"""
+Génération de documents par lot (quittances, avis d'échéance, régularisations).
+
+Les données de tous les baux sont chargées en un nombre fixe de requêtes,
+puis chaque PDF est rendu sans retourner en base : le rendu ReportLab, qui
+est le vrai coût, peut alors être réparti sur plusieurs processus.
+
+Les lots sont archivés par une tâche de fond (core/taches.py) dans un ZIP
+écrit « au fil de l'eau » (zip_en_flux) : chaque PDF part sur le disque dès
+qu'il est rendu, la mémoire du worker ne dépend donc pas de la taille du
+portefeuille.
+"""
+import logging
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+
+from . import cache_pdf
+from .models import Bail
+from .pdf_generator import PDFGenerator
+from .regularisation import MoteurRegularisation, enregistrer_decomptes
+
+logger = logging.getLogger(__name__)
+
+
+def precharger_baux(baux=None):
+    """
+    Charge les baux avec tout ce que le rendu d'une quittance lit.
+
+    Local, immeuble et propriétaire par jointure, tarifications et occupants
+    par prefetch : 3 requêtes quel que soit le nombre de baux.
+
+    Args:
+        baux: QuerySet de Bail (par défaut : tous les baux actifs)
+
+    Returns:
+        list: Baux triés par immeuble puis numéro de porte
+    """
+    if baux is None:
+        baux = Bail.objects.filter(actif=True)
+    return list(
+        baux.select_related('local__immeuble__proprietaire')
+        .prefetch_related('tarifications', 'occupants')
+        .order_by('local__immeuble__nom', 'local__numero_porte', 'pk')
+    )
+
+
+def nom_fichier_document(bail, prefixe, suffixe):
+    """Nom du PDF dans l'archive : Quittance_NOM_porte_AAAA-MM.pdf"""
+    occupant = bail.locataire_principal
+    nom_locataire = occupant.nom.upper().replace(" ", "_") if occupant else "Inconnu"
+    return f"{prefixe}_{nom_locataire}_{bail.local.numero_porte}_{suffixe}.pdf"
+
+
+def _rendre_document(bail, methode, arguments, nom):
+    """
+    Rend un document (exécuté éventuellement dans un autre processus).
+
+    Returns:
+        tuple: (nom_fichier, contenu_pdf ou None, message d'erreur ou None)
+    """
+    try:
+        return nom, getattr(PDFGenerator(bail), methode)(*arguments), None
+    except Exception as e:
+        # Message plutôt qu'exception : toutes ne se sérialisent pas entre processus
+        return nom, None, str(e)
+
+
+def _initialiser_processus():
+    """Initialisation d'un processus de rendu (nécessaire en démarrage « spawn »)."""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+class LotDocuments:
+    """
+    Un même document PDF pour un ensemble de baux.
+
+    S'itère en (nom_fichier, contenu_pdf), dans l'ordre des baux. Un bail en
+    erreur (tarification manquante...) est journalisé, ajouté à `erreurs` et
+    sauté : il ne bloque pas le reste du lot.
+
+    Les sous-classes fixent `methode` (méthode de PDFGenerator), `prefixe`
+    (nom de fichier), `multi_processus` (False si le rendu lit la base) et
+    `en_cache` (True si le document passe par le cache disque, core/cache_pdf.py :
+    seuls les PDF absents du cache sont alors rendus).
+    """
+
+    methode = None
+    prefixe = None
+    multi_processus = True
+    en_cache = False
+
+    def __init__(self, baux, arguments, suffixe, processus=None):
+        """
+        Args:
+            baux: QuerySet de Bail (None = tous les baux actifs)
+            arguments (tuple): Arguments passés à la méthode de PDFGenerator
+            suffixe (str): Période figurant dans le nom des fichiers
+            processus (int): Processus de rendu (défaut : settings.PDF_LOT_PROCESSUS)
+        """
+        self.baux = precharger_baux(baux)
+        self.arguments = arguments
+        self.suffixe = suffixe
+        self.processus = settings.PDF_LOT_PROCESSUS if processus is None else processus
+        self.erreurs = []
+        self._empreintes = {}
+
+    def __len__(self):
+        return len(self.baux)
+
+    def __iter__(self):
+        if self.multi_processus and self.processus > 1 and len(self.baux) > 1:
+            resultats = self._rendre_en_parallele()
+        else:
+            resultats = (self._rendre(bail) for bail in self.baux)
+
+        for bail, (nom, pdf, erreur) in zip(self.baux, resultats):
+            if erreur:
+                logger.error(f"Erreur génération {self.prefixe} pour bail {bail.pk}: {erreur}")
+                self.erreurs.append((bail, erreur))
+                continue
+            logger.debug(f"Document généré : {nom}")
+            if self.en_cache:
+                cache_pdf.enregistrer(self._empreintes[bail.pk], pdf)
+            yield nom, pdf
+
+    def _arguments(self, bail):
+        """Arguments de la méthode de rendu pour un bail (les mêmes pour tous par défaut)."""
+        return self.arguments
+
+    def _depuis_cache(self, bail, nom):
+        """Résultat lu dans le cache disque, ou None (document à rendre)."""
+        if not self.en_cache:
+            return None
+        cle = cache_pdf.empreinte(bail, self.methode, *self._arguments(bail))
+        self._empreintes[bail.pk] = cle
+        fichier = cache_pdf.lire(cle)
+        return (nom, fichier.read_bytes(), None) if fichier else None
+
+    def _rendre(self, bail):
+        nom = nom_fichier_document(bail, self.prefixe, self.suffixe)
+        return self._depuis_cache(bail, nom) or _rendre_document(
+            bail, self.methode, self._arguments(bail), nom
+        )
+
+    def _rendre_en_parallele(self):
+        """Rendu réparti sur un pool de processus, dans l'ordre des baux.
+
+        Le nombre de rendus en vol est borné (2 par processus) pour ne pas
+        garder tout le lot en mémoire quand le consommateur est plus lent.
+        """
+        fenetre = 2 * self.processus
+        with ProcessPoolExecutor(max_workers=self.processus,
+                                 initializer=_initialiser_processus) as pool:
+            en_cours = deque()
+            for bail in self.baux:
+                nom = nom_fichier_document(bail, self.prefixe, self.suffixe)
+                resultat = self._depuis_cache(bail, nom)
+                if resultat:
+                    deja_rendu = Future()
+                    deja_rendu.set_result(resultat)
+                    en_cours.append(deja_rendu)
+                else:
+                    en_cours.append(pool.submit(
+                        _rendre_document, bail, self.methode, self._arguments(bail), nom
+                    ))
+                if len(en_cours) >= fenetre:
+                    yield en_cours.popleft().result()
+            while en_cours:
+                yield en_cours.popleft().result()
+
+
+class LotQuittances(LotDocuments):
+    """Quittances d'un même mois."""
+
+    methode = 'generer_quittance'
+    prefixe = 'Quittance'
+    en_cache = True
+
+    def __init__(self, baux, periode, processus=None):
+        """
+        Args:
+            baux: QuerySet de Bail (None = tous les baux actifs)
+            periode (date): Premier jour du mois quittancé
+            processus (int): Processus de rendu (défaut : settings.PDF_LOT_PROCESSUS)
+        """
+        super().__init__(baux, ([periode],), periode.strftime('%Y-%m'), processus)
+        self.periode = periode
+
+
+class LotAvisEcheance(LotQuittances):
+    """Avis d'échéance d'un même mois."""
+
+    methode = 'generer_avis_echeance'
+    prefixe = 'Avis_Echeance'
+
+
+class LotRegularisations(LotDocuments):
+    """Décomptes de régularisation de charges sur une même période.
+
+    Les décomptes de tous les baux sont calculés d'abord, en une passe
+    (MoteurRegularisation), et historisés en bloc ; le rendu ne lit plus la
+    base et peut donc être réparti sur plusieurs processus.
+    """
+
+    methode = 'generer_regularisation'
+    prefixe = 'Regularisation'
+
+    def __init__(self, baux, date_debut, date_fin, enregistrer_historique=True, processus=None):
+        """
+        Args:
+            baux: QuerySet de Bail (None = tous les baux actifs)
+            date_debut (date): Début de la période régularisée
+            date_fin (date): Fin de la période régularisée
+            enregistrer_historique (bool): Historiser les décomptes (table Regularisation)
+            processus (int): Processus de rendu (défaut : settings.PDF_LOT_PROCESSUS)
+        """
+        suffixe = f"{date_debut:%Y-%m-%d}_{date_fin:%Y-%m-%d}"
+        super().__init__(baux, (date_debut, date_fin, False), suffixe, processus)
+
+        moteur = MoteurRegularisation(self.baux, date_debut, date_fin)
+        self.decomptes = moteur.decomptes()
+        self.erreurs.extend(moteur.erreurs)
+        self.baux = [bail for bail in self.baux if bail.pk in self.decomptes]
+        if enregistrer_historique:
+            enregistrer_decomptes(self.decomptes.values())
+
+    def _arguments(self, bail):
+        return self.arguments + (self.decomptes[bail.pk],)
+
+
+# ─── ZIP en flux ─────────────────────────────────────────────────────────────
+
+class _TamponZip:
+    """
+    Fichier en écriture seule et non positionnable.
+
+    Sans seek(), zipfile écrit chaque entrée d'une traite (descripteur de
+    données après le contenu) : ce qui est écrit peut partir immédiatement.
+    """
+
+    def __init__(self):
+        self._morceaux = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._morceaux.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def vider(self):
+        """Renvoie et oublie les octets écrits depuis le dernier appel."""
+        contenu = b''.join(self._morceaux)
+        self._morceaux.clear()
+        return contenu
+
+
+def zip_en_flux(fichiers):
+    """
+    Produit une archive ZIP morceau par morceau.
+
+    Args:
+        fichiers: Itérable de (nom_fichier, contenu)
+
+    Yields:
+        bytes: Portion de l'archive, une par fichier, puis le répertoire central
+    """
+    tampon = _TamponZip()
+    with zipfile.ZipFile(tampon, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for nom, contenu in fichiers:
+            archive.writestr(nom, contenu)
+            yield tampon.vider()
+    yield tampon.vider()
+
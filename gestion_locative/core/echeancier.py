@@ -0,0 +1,120 @@
+"""
+Lecture paginée de l'échéancier d'un crédit (table EcheanceCredit).
+
+Un prêt sur 25 ans compte 300 échéances : au lieu de toutes les charger,
+les pages de l'admin et de l'application lisent une fenêtre par pagination
+« keyset » sur (credit, numero_echeance), l'index de la contrainte d'unicité.
+Chaque page coûte une requête bornée, quelle que soit sa position dans le
+prêt. Par défaut, la fenêtre est centrée sur l'échéance en cours (±12 mois).
+
+Le résumé annuel (capital, intérêts, assurance par année) est agrégé en SQL.
+"""
+from datetime import date
+
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import ExtractYear
+
+TAILLE_PAGE = 25
+MOIS_AVANT_COURANTE = 12
+
+
+class PageEcheancier:
+    """
+    Fenêtre de l'échéancier d'un crédit.
+
+    Attributs:
+        echeances (list): EcheanceCredit de la page, par numéro croissant
+        precedente (int|None): Paramètre `avant` de la page précédente (None = première page)
+        suivante (int|None): Paramètre `apres` de la page suivante (None = dernière page)
+        courante (int|None): Numéro de la première échéance non échue
+    """
+
+    def __init__(self, echeances, precedente, suivante, courante):
+        self.echeances = echeances
+        self.precedente = precedente
+        self.suivante = suivante
+        self.courante = courante
+
+
+def echeance_courante(credit_id, jour=None):
+    """Numéro de la première échéance datée d'aujourd'hui ou après (None si prêt terminé)."""
+    from .models import EcheanceCredit
+
+    return EcheanceCredit.objects.filter(
+        credit_id=credit_id, date_echeance__gte=jour or date.today(),
+    ).order_by('numero_echeance').values_list('numero_echeance', flat=True).first()
+
+
+def page_echeancier(credit_id, apres=None, avant=None, taille=TAILLE_PAGE, jour=None):
+    """
+    Une page de l'échéancier, lue par pagination keyset.
+
+    Args:
+        credit_id (int): Crédit
+        apres (int): Page des échéances de numéro > apres
+        avant (int): Page des échéances de numéro < avant
+        taille (int): Échéances par page
+        jour (date): Date de l'échéance courante (défaut : aujourd'hui)
+
+    Sans `apres` ni `avant`, la page commence MOIS_AVANT_COURANTE échéances
+    avant l'échéance courante.
+
+    Returns:
+        PageEcheancier
+    """
+    from .models import EcheanceCredit
+
+    courante = echeance_courante(credit_id, jour)
+    echeances = EcheanceCredit.objects.filter(credit_id=credit_id)
+
+    # Prêt terminé et aucune position demandée : dernière page
+    derniere_page = apres is None and avant is None and courante is None
+
+    if avant is not None or derniere_page:
+        if avant is not None:
+            echeances = echeances.filter(numero_echeance__lt=avant)
+        lignes = list(echeances.order_by('-numero_echeance')[:taille + 1])
+        plus_anciennes = len(lignes) > taille
+        lignes = lignes[:taille][::-1]
+        plus_recentes = not derniere_page
+    else:
+        if apres is None:
+            apres = max(courante - MOIS_AVANT_COURANTE - 1, 0)
+        lignes = list(echeances.filter(numero_echeance__gt=apres).order_by('numero_echeance')[:taille + 1])
+        plus_recentes = len(lignes) > taille
+        lignes = lignes[:taille]
+        plus_anciennes = apres > 0
+
+    if not lignes:
+        return PageEcheancier([], None, None, courante)
+    return PageEcheancier(
+        lignes,
+        lignes[0].numero_echeance if plus_anciennes else None,
+        lignes[-1].numero_echeance if plus_recentes else None,
+        courante,
+    )
+
+
+def resume_annuel(credit_id):
+    """
+    Échéancier agrégé par année civile, en une requête.
+
+    Returns:
+        list: dicts annee, nb_echeances, capital, interets, assurance,
+        capital_restant_du (en fin d'année), par année croissante
+    """
+    from .models import EcheanceCredit
+
+    return list(
+        EcheanceCredit.objects.filter(credit_id=credit_id)
+        .annotate(annee=ExtractYear('date_echeance'))
+        .values('annee')
+        .annotate(
+            nb_echeances=Count('pk'),
+            capital=Sum('capital_rembourse'),
+            interets=Sum('interets'),
+            assurance=Sum('assurance'),
+            capital_restant_du=Min('capital_restant_du'),
+        )
+        .order_by('annee')
+    )
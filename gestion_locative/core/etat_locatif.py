@@ -0,0 +1,129 @@
+"""
+État locatif : loyers théoriques au prorata des jours, en arithmétique entière.
+
+L'historique de tarification de chaque bail est converti une fois pour toutes
+en intervalles (début, fin, loyer en centimes). Les loyers d'une ou plusieurs
+années, pour un immeuble ou tout le portefeuille, se calculent ensuite en une
+passe sur ces intervalles, sans Decimal ni lecture de tarification par mois.
+
+Les montants sont cumulés exactement, sur le dénominateur commun DENOMINATEUR :
+un mois de 28 à 31 jours et le tiers d'un loyer trimestriel tombent tous juste.
+L'arrondi au centime (demi supérieur) n'intervient qu'une fois, sur le total,
+comme dans l'ancien calcul en Decimal.
+"""
+import calendar
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+# ppcm(28, 29, 30, 31) × 3 : divisible par (jours du mois × 1 ou 3)
+DENOMINATEUR = 1132740
+
+DIVISEUR_FREQUENCE = {'MENSUEL': 1, 'TRIMESTRIEL': 3}
+
+
+def centimes(montant):
+    """Montant Decimal (2 décimales) en centimes entiers."""
+    return int((Decimal(montant) * 100).to_integral_value())
+
+
+def arrondir_centimes(numerateur):
+    """Numérateur sur DENOMINATEUR (en centimes) → Decimal en euros, arrondi au demi supérieur."""
+    signe = -1 if numerateur < 0 else 1
+    cents = signe * ((2 * abs(numerateur) + DENOMINATEUR) // (2 * DENOMINATEUR))
+    return (Decimal(cents) / 100).quantize(Decimal('0.01'))
+
+
+def ventiler_par_mois(debut, fin):
+    """
+    Découpe [debut, fin] en mois calendaires.
+
+    Yields:
+        tuple: (annee, mois, jours couverts, jours du mois)
+    """
+    annee, mois = debut.year, debut.month
+    while (annee, mois) <= (fin.year, fin.month):
+        nb_jours_mois = calendar.monthrange(annee, mois)[1]
+        premier = debut.day if (annee, mois) == (debut.year, debut.month) else 1
+        dernier = fin.day if (annee, mois) == (fin.year, fin.month) else nb_jours_mois
+        yield annee, mois, dernier - premier + 1, nb_jours_mois
+        mois += 1
+        if mois > 12:
+            annee, mois = annee + 1, 1
+
+
+class EtatLocatif:
+    """
+    Loyers théoriques (dus d'après les tarifications) d'un ensemble de baux.
+
+    Un mois entier compte pour le loyer mensuel (tiers du loyer trimestriel),
+    un mois partiel au prorata des jours couverts : mêmes règles que l'ancien
+    RentabiliteCalculator.get_loyers_annuels, au centime près.
+    """
+
+    def __init__(self, baux):
+        """
+        Args:
+            baux: Itérable de Bail ; local et tarifications idéalement préchargés
+        """
+        # (immeuble_id, debut, fin, loyer en centimes, diviseur de fréquence)
+        self.intervalles = []
+        for bail in baux:
+            diviseur = DIVISEUR_FREQUENCE.get(bail.frequence_paiement, 1)
+            for tarif in bail.tarifications.all():
+                debut = max(bail.date_debut, tarif.date_debut)
+                fins = [f for f in (bail.date_fin, tarif.date_fin) if f is not None]
+                fin = min(fins) if fins else None
+                if fin is not None and debut > fin:
+                    continue
+                self.intervalles.append(
+                    (bail.local.immeuble_id, debut, fin, centimes(tarif.loyer_hc), diviseur)
+                )
+        self._numerateurs = defaultdict(int)
+        self._annees_calculees = set()
+
+    @classmethod
+    def depuis_immeuble(cls, immeuble):
+        """État locatif d'un immeuble, en profitant des prefetch locaux__baux__tarifications."""
+        return cls(bail for local in immeuble.locaux.all() for bail in local.baux.all())
+
+    @classmethod
+    def depuis_immeubles(cls, immeubles=None):
+        """État locatif de plusieurs immeubles (tous par défaut) en 2 requêtes."""
+        from .models import Bail
+        baux = Bail.objects.select_related('local').prefetch_related('tarifications')
+        if immeubles is not None:
+            baux = baux.filter(local__immeuble__in=immeubles)
+        return cls(baux)
+
+    def calculer(self, annees):
+        """Cumule en une passe les loyers des années demandées non encore calculées."""
+        annees = set(annees) - self._annees_calculees
+        if not annees:
+            return
+        borne_debut = date(min(annees), 1, 1)
+        borne_fin = date(max(annees), 12, 31)
+
+        for immeuble_id, debut, fin, loyer, diviseur in self.intervalles:
+            debut = max(debut, borne_debut)
+            fin = borne_fin if fin is None else min(fin, borne_fin)
+            if debut > fin:
+                continue
+            for annee, _mois, jours, nb_jours_mois in ventiler_par_mois(debut, fin):
+                if annee in annees:
+                    self._numerateurs[(immeuble_id, annee)] += (
+                        loyer * jours * (DENOMINATEUR // (diviseur * nb_jours_mois))
+                    )
+        self._annees_calculees |= annees
+
+    def loyers_annuels(self, immeuble_id, annee):
+        """Loyers théoriques d'un immeuble sur une année, arrondis au centime."""
+        self.calculer([annee])
+        return arrondir_centimes(self._numerateurs[(immeuble_id, annee)])
+
+    def loyers_portefeuille(self, annee):
+        """Loyers théoriques de tous les immeubles de l'état sur une année."""
+        self.calculer([annee])
+        return arrondir_centimes(sum(
+            numerateur for (_, a), numerateur in self._numerateurs.items() if a == annee
+        ))
@@ -45,6 +45,8 @@ class DepenseQuickForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # select_related : le libellé d'une clé affiche le nom de son immeuble
+        self.fields['cle_repartition'].queryset = CleRepartition.objects.select_related('immeuble')
         self.fields['cle_repartition'].required = False
         self.fields['cle_repartition'].empty_label = "-- Aucune --"
         self.fields['date_debut'].required = False
@@ -218,8 +220,10 @@ class DepenseForm(forms.ModelForm):
         self.fields['cle_repartition'].empty_label = "-- Aucune --"
         self.fields['date_debut'].required = False
         self.fields['date_fin'].required = False
-        if immeuble:
-            self.fields['cle_repartition'].queryset = CleRepartition.objects.filter(immeuble=immeuble)
+        cles = CleRepartition.objects.select_related('immeuble')
+        self.fields['cle_repartition'].queryset = (
+            cles.filter(immeuble=immeuble) if immeuble else cles
+        )
 
 
 # ─── CleRepartition ─────────────────────────────────────────────────────────
@@ -252,8 +256,12 @@ class QuotePartForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         cle = kwargs.pop('cle', None)
         super().__init__(*args, **kwargs)
-        if cle:
-            self.fields['local'].queryset = Local.objects.filter(immeuble=cle.immeuble)
+        # Les libellés des clés et des locaux affichent le nom de l'immeuble
+        self.fields['cle'].queryset = CleRepartition.objects.select_related('immeuble')
+        locaux = Local.objects.select_related('immeuble')
+        self.fields['local'].queryset = (
+            locaux.filter(immeuble_id=cle.immeuble_id) if cle else locaux
+        )
 
 
 # ─── Consommation ────────────────────────────────────────────────────────────
@@ -274,11 +282,13 @@ class ConsommationForm(forms.ModelForm):
         immeuble = kwargs.pop('immeuble', None)
         super().__init__(*args, **kwargs)
         self.fields['date_debut'].required = False
+        locaux = Local.objects.select_related('immeuble')
+        cles = CleRepartition.objects.select_related('immeuble')
         if immeuble:
-            self.fields['local'].queryset = Local.objects.filter(immeuble=immeuble)
-            self.fields['cle_repartition'].queryset = CleRepartition.objects.filter(
-                immeuble=immeuble, mode_repartition='CONSOMMATION',
-            )
+            locaux = locaux.filter(immeuble=immeuble)
+            cles = cles.filter(immeuble=immeuble, mode_repartition='CONSOMMATION')
+        self.fields['local'].queryset = locaux
+        self.fields['cle_repartition'].queryset = cles
 
 
 # ─── Regularisation ──────────────────────────────────────────────────────────
@@ -0,0 +1,349 @@
+"""
+Frise des tarifications d'un bail : recherche par date et contrôle de continuité.
+
+Une seule structure remplace les contrôles dispersés (BailTarification.clean,
+formset de l'admin, BailCalculator, action d'admin) :
+  - les tarifications sont triées une fois par date de début ;
+  - la tarification à une date se trouve par dichotomie (bisect) sur les
+    débuts, en O(log n) tant que les périodes ne se chevauchent pas ;
+  - chevauchements et trous sont détectés en un seul balayage, en O(n).
+
+rapport_continuite() audite tout un portefeuille en une requête : jointure
+gauche baux / tarifications, comparaisons entre tarifications successives
+faites par la base avec des fonctions de fenêtre (MAX) partitionnées par
+bail. Utilisé par l'action d'admin, la page /app/tarifications/audit/
+(export CSV) et la commande `auditer_tarifications`.
+"""
+import bisect
+import itertools
+import logging
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Fin des périodes ouvertes (date_fin vide)
+FIN_OUVERTE = date.max
+
+TROU = 'TROU'
+CHEVAUCHEMENT = 'CHEVAUCHEMENT'
+AUCUNE_TARIFICATION = 'AUCUNE_TARIFICATION'
+SANS_TARIF_ACTIF = 'SANS_TARIF_ACTIF'
+APRES_FIN_BAIL = 'APRES_FIN_BAIL'
+
+LIBELLES = {
+    TROU: "Trou",
+    CHEVAUCHEMENT: "Chevauchement",
+    AUCUNE_TARIFICATION: "Aucune tarification",
+    SANS_TARIF_ACTIF: "Pas de tarification active",
+    APRES_FIN_BAIL: "Après la fin du bail",
+}
+
+
+class Anomalie:
+    """Défaut de continuité d'un bail.
+
+    Attributs:
+        type_anomalie (str): Clé de LIBELLES
+        debut, fin (date): Période concernée (jours non couverts pour un trou,
+            jours couverts deux fois pour un chevauchement)
+        tarifs (tuple): Tarifications en cause
+    """
+
+    def __init__(self, type_anomalie, debut=None, fin=None, tarifs=()):
+        self.type_anomalie = type_anomalie
+        self.debut = debut
+        self.fin = fin
+        self.tarifs = tuple(tarifs)
+
+    def get_type_display(self):
+        return LIBELLES[self.type_anomalie]
+
+    @property
+    def jours(self):
+        if self.debut is None or self.fin is None or self.fin == FIN_OUVERTE:
+            return None
+        return (self.fin - self.debut).days + 1
+
+    def __str__(self):
+        if self.type_anomalie == TROU:
+            return (
+                f"Trou de {self.jours} jour(s) entre "
+                f"{(self.debut - timedelta(days=1)).strftime('%d/%m/%Y')} et "
+                f"{(self.fin + timedelta(days=1)).strftime('%d/%m/%Y')}"
+            )
+        if self.type_anomalie == CHEVAUCHEMENT:
+            return (
+                f"Chevauchement entre la tarification du {self.tarifs[0].date_debut.strftime('%d/%m/%Y')} "
+                f"et celle du {self.tarifs[1].date_debut.strftime('%d/%m/%Y')}"
+            )
+        if self.type_anomalie == AUCUNE_TARIFICATION:
+            return "Aucune tarification définie"
+        if self.type_anomalie == APRES_FIN_BAIL:
+            fin = self.tarifs[0].date_fin
+            return (
+                f"Tarification du {self.tarifs[0].date_debut.strftime('%d/%m/%Y')} "
+                + (f"jusqu'au {fin.strftime('%d/%m/%Y')}" if fin else "toujours ouverte")
+                + f", après la sortie du {(self.debut - timedelta(days=1)).strftime('%d/%m/%Y')}"
+            )
+        return f"Aucune tarification active au {self.debut.strftime('%d/%m/%Y')}"
+
+    def __repr__(self):
+        return f"<Anomalie {self.type_anomalie} {self.debut} {self.fin}>"
+
+
+class FriseTarifications:
+    """
+    Tarifications d'un bail triées par date de début.
+
+    Accepte tout objet ayant date_debut et date_fin (BailTarification,
+    instance de formulaire en cours de saisie...). Les éléments sans date de
+    début (formulaire incomplet) sont ignorés.
+    """
+
+    def __init__(self, tarifications):
+        self.tarifs = sorted(
+            (tarif for tarif in tarifications if tarif.date_debut),
+            key=lambda tarif: tarif.date_debut,
+        )
+        self.debuts = [tarif.date_debut for tarif in self.tarifs]
+        # fins_max[i] : fin la plus tardive parmi tarifs[0..i]. Borne la
+        # remontée dans a_la_date et conflit : sans chevauchement, un seul pas.
+        self.fins_max = list(itertools.accumulate(
+            (self._fin(tarif) for tarif in self.tarifs), max,
+        ))
+
+    def __len__(self):
+        return len(self.tarifs)
+
+    def __iter__(self):
+        return iter(self.tarifs)
+
+    @staticmethod
+    def _fin(tarif):
+        return tarif.date_fin or FIN_OUVERTE
+
+    def conflit(self, debut, fin=None):
+        """
+        Tarification (la plus récente) qui couvre au moins un jour de [debut, fin].
+
+        Args:
+            debut (date): Premier jour
+            fin (date): Dernier jour (None : période ouverte)
+
+        Returns:
+            Tarification ou None
+        """
+        fin = fin or FIN_OUVERTE
+        position = bisect.bisect_right(self.debuts, fin) - 1
+        while position >= 0 and self.fins_max[position] >= debut:
+            if self._fin(self.tarifs[position]) >= debut:
+                return self.tarifs[position]
+            position -= 1
+        return None
+
+    def a_la_date(self, jour):
+        """Tarification en vigueur à `jour` (la plus récente si plusieurs), ou None."""
+        return self.conflit(jour, jour)
+
+    def sur_periode(self, debut, fin):
+        """Tarifications qui chevauchent [debut, fin], par date de début croissante."""
+        return [
+            tarif for tarif in self.tarifs[:bisect.bisect_right(self.debuts, fin)]
+            if self._fin(tarif) >= debut
+        ]
+
+    def anomalies(self):
+        """
+        Chevauchements et trous, en un balayage des périodes triées.
+
+        Returns:
+            list: Anomalie dans l'ordre chronologique
+        """
+        if not self.tarifs:
+            return [Anomalie(AUCUNE_TARIFICATION)]
+
+        anomalies = []
+        # Tarification qui couvre le plus loin parmi celles déjà vues (la plus récente à fin égale)
+        couvrante = self.tarifs[0]
+        for tarif in self.tarifs[1:]:
+            fin_couverte = self._fin(couvrante)
+            if tarif.date_debut <= fin_couverte:
+                anomalies.append(Anomalie(
+                    CHEVAUCHEMENT, tarif.date_debut, min(fin_couverte, self._fin(tarif)), (couvrante, tarif),
+                ))
+            elif tarif.date_debut > fin_couverte + timedelta(days=1):
+                anomalies.append(Anomalie(
+                    TROU, fin_couverte + timedelta(days=1), tarif.date_debut - timedelta(days=1), (couvrante, tarif),
+                ))
+            if self._fin(tarif) >= fin_couverte:
+                couvrante = tarif
+        return anomalies
+
+    def chevauchements(self):
+        return [anomalie for anomalie in self.anomalies() if anomalie.type_anomalie == CHEVAUCHEMENT]
+
+    def trous(self):
+        return [anomalie for anomalie in self.anomalies() if anomalie.type_anomalie == TROU]
+
+
+class _Periode:
+    """Tarification réduite à ses dates (lecture .values() de l'audit)."""
+
+    __slots__ = ('pk', 'date_debut', 'date_fin')
+
+    def __init__(self, pk, date_debut, date_fin):
+        self.pk = pk
+        self.date_debut = date_debut
+        self.date_fin = date_fin
+
+
+class LigneAudit:
+    """Anomalie d'un bail dans le rapport d'audit (une ligne du CSV)."""
+
+    def __init__(self, bail_id, immeuble, porte, debut_bail, fin_bail, anomalie):
+        self.bail_id = bail_id
+        self.immeuble = immeuble
+        self.porte = porte
+        self.debut_bail = debut_bail
+        self.fin_bail = fin_bail
+        self.anomalie = anomalie
+
+    @property
+    def bail(self):
+        return f"Bail {self.immeuble} - Porte {self.porte} ({self.debut_bail})"
+
+
+# Clé de la tarification couvrante : 'fin|début|pk', ordonnée comme
+# (fin, début, pk) ; la plus grande est celle qui couvre le plus loin
+LONGUEUR_PK = 12
+
+
+def _lire_couvrante(cle):
+    fin, debut, pk = cle.split('|')
+    fin = date.fromisoformat(fin)
+    return _Periode(int(pk), date.fromisoformat(debut), None if fin == FIN_OUVERTE else fin)
+
+
+def _requete_audit(baux, jour):
+    """
+    Une ligne par tarification (ou par bail sans tarification), avec fenêtres par bail.
+
+    - couverture : fin la plus tardive des tarifications précédentes
+      (MAX sur les lignes antérieures), pour qu'une longue période qui en
+      englobe d'autres ne fasse pas voir de faux trous ;
+    - couvrante : clé (fin|début|pk) de la tarification qui atteint cette
+      fin, la plus récente à fin égale (même fenêtre) : c'est elle qui est
+      en cause dans un trou ou un chevauchement, comme dans
+      FriseTarifications.anomalies() ;
+    - actif_au_jour : le bail a-t-il une tarification couvrant `jour`.
+    """
+    from django.db.models import Case, CharField, DateField, F, IntegerField, Max, Q, Value, When, Window
+    from django.db.models.functions import Cast, Coalesce, Concat, LPad
+    from django.db.models.expressions import RowRange
+
+    par_bail = {
+        'partition_by': [F('pk')], 'order_by': [F('tarifications__date_debut').asc()],
+        'frame': RowRange(start=None, end=-1),
+    }
+    fin_ou_ouverte = Coalesce('tarifications__date_fin', Value(FIN_OUVERTE), output_field=DateField())
+    cle_couvrante = Concat(
+        Cast(fin_ou_ouverte, CharField()), Value('|'),
+        Cast('tarifications__date_debut', CharField()), Value('|'),
+        LPad(Cast('tarifications__pk', CharField()), LONGUEUR_PK, Value('0')),
+        output_field=CharField(),
+    )
+    return baux.annotate(
+        couverture=Window(Max(fin_ou_ouverte), output_field=DateField(), **par_bail),
+        couvrante=Window(Max(cle_couvrante), output_field=CharField(), **par_bail),
+        actif_au_jour=Window(
+            Max(Case(
+                When(Q(tarifications__date_debut__lte=jour) & (
+                    Q(tarifications__date_fin__isnull=True) | Q(tarifications__date_fin__gte=jour)
+                ), then=Value(1)),
+                default=Value(0), output_field=IntegerField(),
+            )),
+            partition_by=[F('pk')],
+        ),
+    ).order_by('local__immeuble__nom', 'local__numero_porte', 'pk', 'tarifications__date_debut').values_list(
+        'pk', 'local__immeuble__nom', 'local__numero_porte', 'date_debut', 'date_fin', 'actif',
+        'tarifications__pk', 'tarifications__date_debut', 'tarifications__date_fin',
+        'couverture', 'couvrante', 'actif_au_jour',
+    )
+
+
+def rapport_continuite(baux=None, jour=None):
+    """
+    Audit de continuité des tarifications d'un portefeuille, en une requête.
+
+    Les comparaisons entre tarifications successives sont faites par la base
+    (fonctions de fenêtre MAX partitionnées par bail) ; Python ne fait
+    que parcourir le résultat, sans rien garder en mémoire par bail.
+
+    Anomalies relevées :
+      - TROU / CHEVAUCHEMENT entre tarifications successives ;
+      - AUCUNE_TARIFICATION ;
+      - SANS_TARIF_ACTIF : bail actif, non terminé à `jour`, sans tarification à cette date ;
+      - APRES_FIN_BAIL : tarification ouverte ou finissant après la sortie du locataire.
+
+    Args:
+        baux: QuerySet de Bail (défaut : tous les baux)
+        jour (date): Date de contrôle de la tarification active (défaut : aujourd'hui)
+
+    Returns:
+        list: LigneAudit, par immeuble, porte puis date
+    """
+    from .models import Bail
+
+    if baux is None:
+        baux = Bail.objects.all()
+    jour = jour or date.today()
+
+    lignes = []
+    for (bail_id, immeuble, porte, debut_bail, fin_bail, actif, pk, debut, fin,
+         couverture, couvrante, actif_au_jour) in _requete_audit(baux, jour).iterator():
+        def signaler(anomalie):
+            lignes.append(LigneAudit(bail_id, immeuble, porte, debut_bail, fin_bail, anomalie))
+
+        if pk is None:
+            signaler(Anomalie(AUCUNE_TARIFICATION))
+            continue
+        tarif = _Periode(pk, debut, fin)
+        if couvrante is not None:
+            if debut <= couverture:
+                signaler(Anomalie(
+                    CHEVAUCHEMENT, debut, min(couverture, fin or FIN_OUVERTE), (_lire_couvrante(couvrante), tarif),
+                ))
+            elif debut > couverture + timedelta(days=1):
+                signaler(Anomalie(
+                    TROU, couverture + timedelta(days=1), debut - timedelta(days=1), (_lire_couvrante(couvrante), tarif),
+                ))
+        else:
+            # Première tarification du bail : contrôle de la tarification active, une fois par bail
+            if actif and (fin_bail is None or fin_bail >= jour) and not actif_au_jour:
+                signaler(Anomalie(SANS_TARIF_ACTIF, jour, jour))
+        if fin_bail and (fin is None or fin > fin_bail):
+            signaler(Anomalie(APRES_FIN_BAIL, fin_bail + timedelta(days=1), fin or FIN_OUVERTE, (tarif,)))
+
+    logger.info(f"Audit de continuité : {len(lignes)} anomalie(s) sur {len({l.bail_id for l in lignes})} bail(s)")
+    return lignes
+
+
+COLONNES_CSV = ['Immeuble', 'Porte', 'Entrée', 'Sortie', 'Anomalie', 'Du', 'Au', 'Jours', 'Détail']
+
+
+def ecrire_csv(lignes, sortie):
+    """Écrit le rapport d'audit en CSV (séparateur « ; », dates JJ/MM/AAAA, pour Excel)."""
+    import csv
+
+    def jour(valeur):
+        return valeur.strftime('%d/%m/%Y') if valeur and valeur != FIN_OUVERTE else ''
+
+    redacteur = csv.writer(sortie, delimiter=';')
+    redacteur.writerow(COLONNES_CSV)
+    for ligne in lignes:
+        anomalie = ligne.anomalie
+        redacteur.writerow([
+            ligne.immeuble, ligne.porte, jour(ligne.debut_bail), jour(ligne.fin_bail),
+            anomalie.get_type_display(), jour(anomalie.debut), jour(anomalie.fin),
+            anomalie.jours or '', str(anomalie),
+        ])
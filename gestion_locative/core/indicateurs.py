@@ -0,0 +1,104 @@
+"""
+Instantanés des indicateurs d'un immeuble (valeur, CRD, rendements, cash-flow,
+occupation), conservés dans le cache partagé entre les workers.
+
+Les tableaux de bord et l'en-tête des onglets HTMX lisent ces instantanés au
+lieu de tout recalculer à chaque affichage. Les signaux (core/signals.py)
+suppriment l'instantané d'un immeuble dès qu'une donnée dont il dépend est
+écrite. La date du jour fait partie de la clé : CRD et occupation dépendent
+de la date, un instantané ne sert donc jamais au-delà de sa journée.
+"""
+import logging
+from datetime import date
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .patrimoine_calculators import PatrimoineCalculator, RatiosCalculator, RentabiliteCalculator
+
+logger = logging.getLogger(__name__)
+
+DUREE_CACHE = 24 * 3600
+
+# Relations lues par le calcul des indicateurs
+PREFETCH_INDICATEURS = (
+    'locaux__baux__tarifications',
+    'locaux__vacances',
+    'credits',
+    'estimations',
+    'charges_fiscales',
+)
+
+
+def _cle(immeuble_id, jour=None):
+    return f"indicateurs:immeuble:{immeuble_id}:{(jour or date.today()).isoformat()}"
+
+
+def calculer_indicateurs(immeuble, annee=None):
+    """Calcule (sans cache) les indicateurs d'un immeuble pour l'année en cours."""
+    annee = annee or date.today().year
+    valeur = PatrimoineCalculator.get_valeur_actuelle(immeuble)
+    crd = PatrimoineCalculator.get_capital_restant_du(immeuble)
+    return {
+        'valeur': valeur,
+        'crd': crd,
+        'valeur_nette': valeur - crd,
+        'plus_value': PatrimoineCalculator.get_plus_value_latente(immeuble),
+        'rendement_brut': RentabiliteCalculator.get_rendement_brut(immeuble),
+        'rendement_net': RentabiliteCalculator.get_rendement_net(immeuble),
+        'cashflow': RentabiliteCalculator.get_cashflow_mensuel(immeuble),
+        'taux_occupation': RatiosCalculator.get_taux_occupation(immeuble, annee),
+        'nb_locaux': len(immeuble.locaux.all()),
+    }
+
+
+def indicateurs_immeubles(immeubles):
+    """
+    Indicateurs de plusieurs immeubles : {immeuble_id: dict}.
+
+    Une lecture groupée du cache ; les immeubles absents sont rechargés avec
+    PREFETCH_INDICATEURS et leurs totaux annuels préchargés, puis recalculés
+    sans requête par immeuble : le coût d'un recalcul ne dépend pas du nombre
+    d'immeubles.
+    """
+    from .models import Immeuble
+
+    ids = [immeuble.pk for immeuble in immeubles]
+    cles = {immeuble_id: _cle(immeuble_id) for immeuble_id in ids}
+    en_cache = cache.get_many(list(cles.values()))
+    resultats = {
+        immeuble_id: en_cache[cle] for immeuble_id, cle in cles.items() if cle in en_cache
+    }
+
+    manquants = [immeuble_id for immeuble_id in ids if immeuble_id not in resultats]
+    if manquants:
+        logger.debug(f"Indicateurs recalculés pour {len(manquants)} immeuble(s)")
+        annee = date.today().year
+        recharges = list(
+            Immeuble.objects.filter(pk__in=manquants).prefetch_related(*PREFETCH_INDICATEURS)
+        )
+        RentabiliteCalculator.precharger_annuels(recharges, [annee])
+        calcules = {immeuble.pk: calculer_indicateurs(immeuble, annee) for immeuble in recharges}
+        cache.set_many({cles[pk]: valeurs for pk, valeurs in calcules.items()}, DUREE_CACHE)
+        resultats.update(calcules)
+
+    return resultats
+
+
+def indicateurs_immeuble(immeuble):
+    """Indicateurs d'un immeuble (instantané du jour, calculé au besoin)."""
+    return indicateurs_immeubles([immeuble])[immeuble.pk]
+
+
+def invalider_indicateurs(*immeuble_ids):
+    """
+    Supprime les instantanés du jour des immeubles donnés.
+
+    Suppression immédiate, puis de nouveau après le commit : un autre worker
+    a pu recalculer entre-temps à partir des données d'avant la transaction.
+    """
+    cles = [_cle(immeuble_id) for immeuble_id in set(immeuble_ids) if immeuble_id]
+    if not cles:
+        return
+    cache.delete_many(cles)
+    transaction.on_commit(lambda: cache.delete_many(cles))
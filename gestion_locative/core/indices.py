@@ -0,0 +1,221 @@
+"""
+Indices de révision des loyers (IRL, ILC) : stockage et rafraîchissement.
+
+Les vues lisent la table IndiceReference et ne touchent jamais au réseau.
+La table est alimentée hors requête :
+  - par la commande `rafraichir_indices`, lancée au démarrage du conteneur
+    puis une fois par jour (docker-entrypoint.sh), qui lit les pages
+    séries de l'INSEE ;
+  - par import d'un fichier CSV téléchargé sur insee.fr
+    (`rafraichir_indices --csv fichier.csv`), sans accès réseau.
+
+Les indices ne changent qu'une fois par trimestre : un échec de
+rafraîchissement laisse en place les dernières valeurs connues.
+"""
+import csv
+import io
+import logging
+import re
+import time
+from decimal import Decimal, InvalidOperation
+
+logger = logging.getLogger(__name__)
+
+# idBank des séries INSEE, par type d'indice
+SERIES_INSEE = {
+    'IRL': '001515333',
+    'ILC': '001515332',
+}
+URL_SERIE = "https://www.insee.fr/fr/statistiques/serie/{idbank}"
+
+NB_INDICES_PROPOSES = 8
+
+_PERIODE = re.compile(r'^\s*(?:(\d{4})-T([1-4])|T([1-4]) (\d{4}))\s*$')
+_LIGNE_PAGE = re.compile(
+    r'<th[^>]*>(T[1-4] [0-9]{4})</th>[\s\S]*?<td class="nombre">([0-9]+,[0-9]+)</td>'
+)
+
+
+def type_indice_du_bail(bail):
+    """IRL pour un logement, ILC pour les autres locaux."""
+    return 'IRL' if bail.local.type_local == 'APPART' else 'ILC'
+
+
+def derniers_indices(type_indice, limite=NB_INDICES_PROPOSES):
+    """
+    Derniers indices connus, du plus récent au plus ancien (une requête).
+
+    Returns:
+        list: dicts trimestre (« T1 2024 »), valeur (Decimal)
+    """
+    from .models import IndiceReference
+
+    return [
+        {'trimestre': indice.libelle_trimestre, 'valeur': indice.valeur}
+        for indice in IndiceReference.objects.filter(type_indice=type_indice)[:limite]
+    ]
+
+
+def valeur_indice(type_indice, trimestre):
+    """Valeur en base d'un indice pour « T1 2024 » (ou « 2024-T1 »), None si inconnue."""
+    from .models import IndiceReference
+
+    periode = lire_periode(trimestre)
+    if periode is None:
+        return None
+    return IndiceReference.objects.filter(
+        type_indice=type_indice, annee=periode[0], trimestre=periode[1],
+    ).values_list('valeur', flat=True).first()
+
+
+def lire_periode(texte):
+    """« 2024-T1 » ou « T1 2024 » -> (2024, 1), None si le texte n'est pas un trimestre."""
+    trouve = _PERIODE.match(texte or '')
+    if not trouve:
+        return None
+    annee, trimestre, trimestre_bis, annee_bis = trouve.groups()
+    return int(annee or annee_bis), int(trimestre or trimestre_bis)
+
+
+def _lire_valeur(texte):
+    try:
+        valeur = Decimal((texte or '').strip().replace(',', '.'))
+    except InvalidOperation:
+        return None
+    return valeur if valeur > 0 else None
+
+
+def enregistrer_indices(type_indice, valeurs):
+    """
+    Insère ou met à jour des indices, en une requête.
+
+    Args:
+        type_indice (str): 'IRL' ou 'ILC'
+        valeurs (iterable): (annee, trimestre, valeur)
+
+    Returns:
+        int: Nombre d'indices enregistrés
+    """
+    from .models import IndiceReference
+
+    indices = [
+        IndiceReference(type_indice=type_indice, annee=annee, trimestre=trimestre, valeur=valeur)
+        for annee, trimestre, valeur in valeurs
+    ]
+    IndiceReference.objects.bulk_create(
+        indices,
+        update_conflicts=True,
+        unique_fields=['type_indice', 'annee', 'trimestre'],
+        update_fields=['valeur', 'mis_a_jour'],
+    )
+    return len(indices)
+
+
+def lire_csv_insee(fichier, type_indice=None):
+    """
+    Lit un export CSV de séries INSEE (une ou plusieurs colonnes de valeurs).
+
+    Le type de chaque colonne est déduit de la ligne « idBank » ; à défaut,
+    `type_indice` s'applique à la première colonne. Les lignes d'en-tête
+    (libellé, date de mise à jour...) et les valeurs absentes sont ignorées.
+
+    Args:
+        fichier: Fichier texte ouvert (ou chaîne)
+        type_indice (str): Type de la série si le fichier n'a pas de ligne idBank
+
+    Returns:
+        dict: {type_indice: [(annee, trimestre, valeur), ...]}
+    """
+    contenu = fichier if isinstance(fichier, str) else fichier.read()
+    contenu = contenu.lstrip('\ufeff')
+    separateur = ';' if contenu.count(';') >= contenu.count(',') else ','
+    par_idbank = {idbank: nom for nom, idbank in SERIES_INSEE.items()}
+
+    colonnes = {1: type_indice} if type_indice else {}
+    resultat = {}
+    for ligne in csv.reader(io.StringIO(contenu), delimiter=separateur):
+        if not ligne:
+            continue
+        if ligne[0].strip().lower() == 'idbank':
+            colonnes = {
+                position: par_idbank[idbank.strip()]
+                for position, idbank in enumerate(ligne[1:], start=1)
+                if idbank.strip() in par_idbank
+            }
+            continue
+        periode = lire_periode(ligne[0])
+        if periode is None:
+            continue
+        for position, nom in colonnes.items():
+            valeur = _lire_valeur(ligne[position]) if position < len(ligne) else None
+            if valeur is not None:
+                resultat.setdefault(nom, []).append((*periode, valeur))
+    return resultat
+
+
+def importer_csv_insee(fichier, type_indice=None):
+    """
+    Importe un export CSV INSEE dans IndiceReference.
+
+    Returns:
+        dict: {type_indice: nombre d'indices enregistrés}
+    """
+    return {
+        nom: enregistrer_indices(nom, valeurs)
+        for nom, valeurs in lire_csv_insee(fichier, type_indice).items()
+    }
+
+
+def lire_page_insee(html):
+    """Indices (annee, trimestre, valeur) du tableau d'une page série insee.fr."""
+    valeurs = []
+    for periode, valeur in _LIGNE_PAGE.findall(html):
+        valeurs.append((*lire_periode(periode), _lire_valeur(valeur)))
+    return valeurs
+
+
+def telecharger_indices(type_indice, timeout=10, tentatives=3):
+    """
+    Lit la page série INSEE d'un indice (hors requête : attend entre les essais).
+
+    Returns:
+        list: (annee, trimestre, valeur), vide si la page est injoignable ou
+        si son format a changé
+    """
+    import urllib.error
+    import urllib.request
+
+    url = URL_SERIE.format(idbank=SERIES_INSEE[type_indice])
+    requete = urllib.request.Request(url, headers={
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    })
+    for tentative in range(tentatives):
+        try:
+            with urllib.request.urlopen(requete, timeout=timeout) as reponse:
+                html = reponse.read().decode('utf-8')
+        except urllib.error.URLError as e:
+            logger.warning("Erreur réseau INSEE %s (tentative %d/%d) : %s", type_indice, tentative + 1, tentatives, e)
+            if tentative < tentatives - 1:
+                time.sleep(2 ** tentative)
+            continue
+
+        valeurs = lire_page_insee(html)
+        if not valeurs:
+            # Le format de la page a changé : mieux vaut le savoir que de
+            # garder des indices périmés sans explication.
+            logger.error("Aucun indice extrait de %s : le format de la page INSEE a probablement changé.", url)
+        return valeurs
+    return []
+
+
+def rafraichir_indices(types=None):
+    """
+    Télécharge et enregistre les indices INSEE.
+
+    Returns:
+        dict: {type_indice: nombre d'indices enregistrés (0 en cas d'échec)}
+    """
+    return {
+        nom: enregistrer_indices(nom, telecharger_indices(nom))
+        for nom in (types or SERIES_INSEE)
+    }
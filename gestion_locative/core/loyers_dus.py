@@ -0,0 +1,230 @@
+"""
+Tenue de la table LoyerDu (loyers dus, mois par mois, pour chaque bail).
+
+La table est dérivée des tarifications : elle est recalculée par les signaux
+(core/signals.py) sur les seuls mois touchés par une modification, et les
+totaux (loyers annuels, provisions) deviennent de simples SUM en base.
+
+Les baux sans date de fin sont matérialisés jusqu'à l'horizon (fin de l'année
+suivante) ; la commande rafraichir_loyers_dus, lancée au démarrage du
+conteneur puis chaque jour (--prolonger), le repousse quand l'année change.
+Les lectures comparent à l'horizon réellement matérialisé (horizon_materialise),
+pas à celui de la date du jour : au-delà, elles retombent sur l'état locatif.
+"""
+import logging
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import ExtractYear
+
+from .etat_locatif import DENOMINATEUR, DIVISEUR_FREQUENCE, arrondir_centimes, centimes, ventiler_par_mois
+
+logger = logging.getLogger(__name__)
+
+CENTIME = Decimal('0.01')
+
+
+def horizon():
+    """Dernier jour matérialisé pour les baux en cours : fin de l'année suivante."""
+    return date(date.today().year + 1, 12, 31)
+
+
+CLE_HORIZON = 'loyers_dus:horizon'
+
+
+def horizon_materialise():
+    """
+    Dernière année entièrement matérialisée pour les baux sans date de fin.
+
+    Lue dans le cache partagé, où rafraichir_loyers_dus l'écrit ; à défaut,
+    déduite de la table (plus ancien dernier mois parmi les baux sans date
+    de fin), en une requête.
+
+    Returns:
+        int
+    """
+    annee = cache.get(CLE_HORIZON)
+    if annee is None:
+        from .models import LoyerDu
+
+        dernier = LoyerDu.objects.filter(bail__date_fin__isnull=True).values('bail_id').annotate(
+            dernier=Max('mois')
+        ).order_by().aggregate(plus_ancien=Min('dernier'))['plus_ancien']
+        if dernier is None:
+            annee = horizon().year
+        else:
+            annee = dernier.year if dernier.month == 12 else dernier.year - 1
+        cache.set(CLE_HORIZON, annee, None)
+    return annee
+
+
+def enregistrer_horizon(annee):
+    """Mémorise l'horizon matérialisé (après une reconstruction par la commande)."""
+    cache.set(CLE_HORIZON, annee, None)
+
+
+def _prorata(montant, jours, nb_jours_mois, diviseur=1):
+    """Part d'un montant mensuel (ou trimestriel) pour les jours couverts, arrondie au centime."""
+    return (
+        montant * Decimal(jours) / Decimal(nb_jours_mois * diviseur)
+    ).quantize(CENTIME, rounding=ROUND_HALF_UP)
+
+
+def lignes_loyers_dus(bail, tarifs, debut=None, fin=None, jusqu_a=None):
+    """
+    Calcule les loyers dus d'un bail, mois par mois.
+
+    Fonction pure (aucune requête) : sert aussi à la migration de remplissage,
+    avec les modèles historiques.
+
+    Args:
+        bail: Bail (date_debut, date_fin, frequence_paiement, soumis_tva, taux_tva)
+        tarifs (list): Tarifications du bail
+        debut (date): Premier mois à calculer (défaut : début du bail)
+        fin (date): Dernier mois à calculer (défaut : fin du bail ou horizon)
+        jusqu_a (date): Horizon (défaut : horizon())
+
+    Returns:
+        list: Un dict par mois facturé (champs de LoyerDu hors bail/immeuble)
+    """
+    jusqu_a = jusqu_a or horizon()
+    start = bail.date_debut
+    end = min(bail.date_fin, jusqu_a) if bail.date_fin else jusqu_a
+    if debut:
+        start = max(start, debut.replace(day=1))
+    if fin:
+        end = min(end, fin)
+    if start > end:
+        return []
+
+    diviseur = DIVISEUR_FREQUENCE.get(bail.frequence_paiement, 1)
+    tarifs = sorted(tarifs, key=lambda t: t.date_debut)
+    lignes = []
+
+    for annee, mois, _, nb_jours_mois in ventiler_par_mois(start, end):
+        p_start = max(date(annee, mois, 1), start)
+        p_end = min(date(annee, mois, nb_jours_mois), end)
+        ligne = {
+            'mois': date(annee, mois, 1), 'jours_factures': 0,
+            'loyer_hc': Decimal('0'), 'charges': Decimal('0'), 'taxes': Decimal('0'),
+            'tva': Decimal('0'), 'loyer_hc_exact': 0,
+        }
+
+        for tarif in tarifs:
+            seg_start = max(p_start, tarif.date_debut)
+            seg_end = min(p_end, tarif.date_fin) if tarif.date_fin else p_end
+            if seg_start > seg_end:
+                continue
+            jours = (seg_end - seg_start).days + 1
+            ligne['jours_factures'] += jours
+            # Mêmes règles que BailCalculator : charges et taxes sont mensuelles,
+            # le loyer trimestriel est ramené au mois.
+            ligne['loyer_hc'] += _prorata(tarif.loyer_hc, jours, nb_jours_mois, diviseur)
+            ligne['charges'] += _prorata(tarif.charges, jours, nb_jours_mois)
+            ligne['taxes'] += _prorata(tarif.taxes, jours, nb_jours_mois)
+            ligne['loyer_hc_exact'] += (
+                centimes(tarif.loyer_hc) * jours * (DENOMINATEUR // (diviseur * nb_jours_mois))
+            )
+
+        if not ligne['jours_factures']:
+            continue
+        if bail.soumis_tva:
+            # str() : taux_tva vaut encore le float par défaut sur un bail juste créé
+            ligne['tva'] = (
+                (ligne['loyer_hc'] + ligne['charges']) * Decimal(str(bail.taux_tva)) / 100
+            ).quantize(CENTIME, rounding=ROUND_HALF_UP)
+        lignes.append(ligne)
+
+    return lignes
+
+
+def rafraichir_loyers_dus(bail, debut=None, fin=None):
+    """
+    Recalcule les lignes d'un bail sur les mois de [debut, fin] (tout le bail par défaut).
+
+    Les tarifications sont relues en base : le cache éventuellement chargé sur
+    l'instance de bail peut être antérieur à la modification.
+    """
+    from .models import BailTarification, LoyerDu
+
+    tarifs = list(BailTarification.objects.filter(bail_id=bail.pk))
+    lignes = lignes_loyers_dus(bail, tarifs, debut, fin)
+    immeuble_id = bail.local.immeuble_id
+
+    with transaction.atomic():
+        anciennes = LoyerDu.objects.filter(bail_id=bail.pk)
+        if debut:
+            anciennes = anciennes.filter(mois__gte=debut.replace(day=1))
+        if fin:
+            anciennes = anciennes.filter(mois__lte=fin)
+        anciennes.delete()
+        LoyerDu.objects.bulk_create([
+            LoyerDu(bail_id=bail.pk, immeuble_id=immeuble_id, **ligne) for ligne in lignes
+        ])
+
+    logger.debug(f"Loyers dus rafraîchis pour {bail} ({debut} - {fin}) : {len(lignes)} mois")
+    return len(lignes)
+
+
+def loyers_annuels(immeuble, annee):
+    """
+    Loyers HC dus d'un immeuble sur une année, en une requête SUM.
+
+    Returns:
+        Decimal, ou None si l'année dépasse l'horizon matérialisé
+    """
+    from .models import LoyerDu
+
+    if annee > horizon_materialise():
+        return None
+    total = LoyerDu.objects.filter(
+        immeuble=immeuble, mois__year=annee
+    ).aggregate(total=Sum('loyer_hc_exact'))['total']
+    return arrondir_centimes(total or 0)
+
+
+def loyers_annuels_par_immeuble(annee, immeubles=None):
+    """Loyers HC dus par immeuble sur une année : {immeuble_id: Decimal}, en une requête."""
+    return {
+        immeuble_id: total
+        for (immeuble_id, _), total in loyers_par_immeuble_et_annee([annee], immeubles).items()
+    }
+
+
+def loyers_par_immeuble_et_annee(annees, immeubles=None):
+    """
+    Loyers HC dus par immeuble et par année, en une requête groupée.
+
+    Returns:
+        dict: {(immeuble_id, annee): Decimal} ; couples sans loyer absents
+    """
+    from .models import LoyerDu
+
+    lignes = LoyerDu.objects.filter(mois__year__in=list(annees))
+    if immeubles is not None:
+        lignes = lignes.filter(immeuble__in=immeubles)
+    lignes = lignes.annotate(annee=ExtractYear('mois')).values(
+        'immeuble_id', 'annee'
+    ).annotate(total=Sum('loyer_hc_exact')).order_by()
+    return {
+        (ligne['immeuble_id'], ligne['annee']): arrondir_centimes(ligne['total'])
+        for ligne in lignes
+    }
+
+
+def provisions_dues(bail, date_debut, date_fin):
+    """
+    Total des provisions sur charges dues sur des mois entiers, en une requête SUM.
+
+    Identique au total de BailCalculator.calculer_provisions_mensuelles quand la
+    période commence un 1er et finit un dernier jour de mois ; ne signale pas
+    en revanche les mois sans tarification (le calculateur, lui, refuse).
+    """
+    from .models import LoyerDu
+
+    return LoyerDu.objects.filter(
+        bail=bail, mois__gte=date_debut.replace(day=1), mois__lte=date_fin
+    ).aggregate(total=Sum('charges'))['total'] or Decimal('0')
@@ -0,0 +1,46 @@
+"""
+Audit de continuité des tarifications de tout le portefeuille.
+
+Relève trous, chevauchements, baux actifs sans tarification en vigueur et
+tarifications qui dépassent la sortie du locataire, en une requête
+(core/frise_tarifications.py). Lancée chaque jour par docker-entrypoint.sh ;
+`--csv` écrit le rapport complet (même format que l'export de la page d'audit).
+"""
+from collections import Counter
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.frise_tarifications import LIBELLES, ecrire_csv, rapport_continuite
+
+
+class Command(BaseCommand):
+    help = "Audite la continuité des tarifications de tous les baux."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', help="Fichier CSV où écrire le rapport")
+        parser.add_argument('--date', help="Date de contrôle de la tarification active (AAAA-MM-JJ, défaut : aujourd'hui)")
+
+    def handle(self, *args, **options):
+        try:
+            jour = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError(f"Date invalide : {options['date']}")
+
+        lignes = rapport_continuite(jour=jour)
+
+        if options['csv']:
+            try:
+                with open(options['csv'], 'w', encoding='utf-8-sig', newline='') as sortie:
+                    ecrire_csv(lignes, sortie)
+            except OSError as e:
+                raise CommandError(f"Écriture de {options['csv']} impossible : {e}")
+
+        if not lignes:
+            self.stdout.write(self.style.SUCCESS("Toutes les tarifications sont continues."))
+            return
+        par_type = Counter(ligne.anomalie.type_anomalie for ligne in lignes)
+        nb_baux = len({ligne.bail_id for ligne in lignes})
+        self.stdout.write(self.style.WARNING(f"{len(lignes)} anomalie(s) sur {nb_baux} bail(s) :"))
+        for type_anomalie, nombre in sorted(par_type.items()):
+            self.stdout.write(f"  {LIBELLES[type_anomalie]} : {nombre}")
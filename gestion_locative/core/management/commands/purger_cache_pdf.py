@@ -0,0 +1,21 @@
+"""
+Supprime les PDF du cache disque qui n'ont pas été servis depuis longtemps.
+
+Les PDF dont les données ont changé ne sont plus jamais servis (leur
+empreinte ne correspond plus) : cette commande, à lancer périodiquement
+(tâche planifiée du NAS), libère leur place.
+"""
+from django.core.management.base import BaseCommand
+
+from core.cache_pdf import purger
+
+
+class Command(BaseCommand):
+    help = "Supprime les PDF en cache non servis depuis N jours."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jours', type=int, default=90, help="Âge maximal en jours (défaut : 90)")
+
+    def handle(self, *args, **options):
+        supprimes = purger(options['jours'])
+        self.stdout.write(self.style.SUCCESS(f"{supprimes} PDF supprimé(s) du cache."))
@@ -0,0 +1,41 @@
+"""
+Met à jour les indices IRL / ILC (table IndiceReference).
+
+Sans option : lit les pages séries de l'INSEE (réseau). Lancée au démarrage
+du conteneur puis une fois par jour par docker-entrypoint.sh ; les vues ne
+lisent que la table.
+
+Avec --csv : importe un export CSV téléchargé sur insee.fr, sans réseau.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.indices import SERIES_INSEE, importer_csv_insee, rafraichir_indices
+
+
+class Command(BaseCommand):
+    help = "Rafraîchit les indices de révision des loyers depuis l'INSEE ou un fichier CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', help="Fichier CSV INSEE à importer (pas d'accès réseau)")
+        parser.add_argument(
+            '--type', choices=sorted(SERIES_INSEE), action='append', dest='types',
+            help="Limiter à cet indice ; avec --csv, type de la série si le fichier n'a pas de ligne idBank",
+        )
+
+    def handle(self, *args, **options):
+        if options['csv']:
+            type_indice = options['types'][0] if options['types'] else None
+            try:
+                with open(options['csv'], encoding='utf-8') as fichier:
+                    bilan = importer_csv_insee(fichier, type_indice)
+            except OSError as e:
+                raise CommandError(f"Lecture de {options['csv']} impossible : {e}")
+            if not bilan:
+                raise CommandError("Aucun indice reconnu dans le fichier (ligne idBank absente ? utilisez --type).")
+        else:
+            bilan = rafraichir_indices(options['types'])
+            if not any(bilan.values()):
+                raise CommandError("Aucun indice récupéré : les dernières valeurs connues restent en place.")
+
+        for type_indice, nombre in sorted(bilan.items()):
+            self.stdout.write(self.style.SUCCESS(f"{type_indice} : {nombre} indice(s) enregistré(s)."))
@@ -0,0 +1,57 @@
+"""
+Reconstruit la table des loyers dus (LoyerDu).
+
+À lancer après un import en masse (bulk_create, loaddata) et au démarrage
+du conteneur. Périme aussi les indicateurs et les matrices de répartition
+en cache, que les écritures en masse n'ont pas invalidés.
+
+Avec --prolonger (lancé chaque jour par docker-entrypoint.sh) : ne fait rien
+tant que l'horizon matérialisé est à jour ; au changement d'année, ne
+calcule que les nouveaux mois des baux qui courent au-delà de l'ancien horizon.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.indicateurs import invalider_indicateurs
+from core.loyers_dus import enregistrer_horizon, horizon, horizon_materialise, rafraichir_loyers_dus
+from core.models import Bail, Immeuble
+from core.repartition import invalider_repartition
+
+
+class Command(BaseCommand):
+    help = "Recalcule les loyers dus mensuels de tous les baux."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bail', type=int, action='append', help="Limiter à ce(s) bail(s) (pk)")
+        parser.add_argument(
+            '--prolonger', action='store_true',
+            help="Seulement repousser l'horizon des baux en cours s'il est dépassé",
+        )
+
+    def handle(self, *args, **options):
+        baux = Bail.objects.select_related('local')
+        debut = None
+        if options['bail']:
+            baux = baux.filter(pk__in=options['bail'])
+        elif options['prolonger']:
+            ancien = horizon_materialise()
+            if ancien >= horizon().year:
+                self.stdout.write(f"Loyers dus matérialisés jusqu'en {ancien} : rien à prolonger.")
+                return
+            debut = date(ancien + 1, 1, 1)
+            baux = baux.filter(Q(date_fin__isnull=True) | Q(date_fin__gte=debut))
+
+        nb_baux = nb_mois = 0
+        for bail in baux.iterator():
+            nb_mois += rafraichir_loyers_dus(bail, debut)
+            nb_baux += 1
+
+        if not options['bail']:
+            enregistrer_horizon(horizon().year)
+        immeuble_ids = list(Immeuble.objects.values_list('pk', flat=True))
+        invalider_indicateurs(*immeuble_ids)
+        invalider_repartition(*immeuble_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"{nb_mois} loyer(s) dû(s) recalculé(s) pour {nb_baux} bail(s)."))
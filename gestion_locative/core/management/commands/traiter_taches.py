@@ -0,0 +1,63 @@
+"""
+Worker de la file de tâches (table Tache, core/taches.py).
+
+Lancé en tâche de fond par docker-entrypoint.sh (TACHES_WORKERS processus,
+1 par défaut) : attend les tâches en interrogeant la base toutes les
+`--intervalle` secondes. `--une-fois` vide la file puis s'arrête (cron,
+tests). Passe en échec les tâches orphelines (chaque minute) et purge les
+tâches terminées depuis `--jours` jours (chaque jour).
+
+Une erreur de base (verrou SQLite, base indisponible) est journalisée et
+le worker reprend après une pause ; docker-entrypoint.sh le relance s'il
+s'arrête malgré tout.
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from core import taches
+
+logger = logging.getLogger(__name__)
+
+# Secondes entre deux recherches de tâches orphelines
+INTERVALLE_ORPHELINES = 60
+
+
+class Command(BaseCommand):
+    help = "Exécute les tâches de fond en attente (ZIP de documents, campagnes, échéanciers)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--une-fois', action='store_true', help="Vider la file puis s'arrêter")
+        parser.add_argument('--intervalle', type=float, default=2.0, help="Secondes entre deux scrutations de la file")
+        parser.add_argument('--jours', type=int, default=7, help="Conserver les tâches terminées ce nombre de jours")
+
+    def handle(self, *args, **options):
+        taches.abandonner_orphelines()
+        taches.purger(options['jours'])
+
+        if options['une_fois']:
+            nombre = taches.traiter_en_attente()
+            self.stdout.write(self.style.SUCCESS(f"{nombre} tâche(s) exécutée(s)."))
+            return
+
+        self.stdout.write("Worker de tâches démarré.")
+        derniere_purge = derniers_orphelins = time.monotonic()
+        try:
+            while True:
+                try:
+                    close_old_connections()
+                    if not taches.traiter_en_attente(limite=1):
+                        time.sleep(options['intervalle'])
+                    if time.monotonic() - derniers_orphelins > INTERVALLE_ORPHELINES:
+                        taches.abandonner_orphelines()
+                        derniers_orphelins = time.monotonic()
+                    if time.monotonic() - derniere_purge > 86400:
+                        taches.purger(options['jours'])
+                        derniere_purge = time.monotonic()
+                except DatabaseError:
+                    logger.exception("Worker de tâches : erreur de base, nouvel essai après une pause")
+                    time.sleep(options['intervalle'])
+        except KeyboardInterrupt:
+            self.stdout.write("Worker de tâches arrêté.")
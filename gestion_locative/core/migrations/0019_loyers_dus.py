@@ -0,0 +1,51 @@
+# Generated by Django 5.2.17 on 2026-10-17 02:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def remplir_loyers_dus(apps, schema_editor):
+    """Matérialise les loyers dus de tous les baux existants."""
+    from core.loyers_dus import lignes_loyers_dus
+
+    Bail = apps.get_model('core', 'Bail')
+    LoyerDu = apps.get_model('core', 'LoyerDu')
+
+    for bail in Bail.objects.select_related('local').prefetch_related('tarifications'):
+        LoyerDu.objects.bulk_create([
+            LoyerDu(bail_id=bail.pk, immeuble_id=bail.local.immeuble_id, **ligne)
+            for ligne in lignes_loyers_dus(bail, bail.tarifications.all())
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_unicite_regularisation_et_libelle_prix_achat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoyerDu',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField(help_text='Premier jour du mois', verbose_name='Mois')),
+                ('jours_factures', models.PositiveSmallIntegerField(verbose_name='Jours facturés')),
+                ('loyer_hc', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Loyer HC (mensuel)')),
+                ('charges', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Provisions charges')),
+                ('taxes', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Taxes')),
+                ('tva', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='TVA')),
+                ('loyer_hc_exact', models.BigIntegerField()),
+                ('bail', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loyers_dus', to='core.bail')),
+                ('immeuble', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loyers_dus', to='core.immeuble')),
+            ],
+            options={
+                'verbose_name': 'Loyer dû',
+                'verbose_name_plural': 'Loyers dus',
+                'ordering': ['bail', 'mois'],
+                'indexes': [models.Index(fields=['immeuble', 'mois'], name='core_loyerd_immeubl_3b7699_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bail', 'mois'), name='un_loyer_du_par_mois')],
+            },
+        ),
+        migrations.RunPython(remplir_loyers_dus, migrations.RunPython.noop),
+    ]
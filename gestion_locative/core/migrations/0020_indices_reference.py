@@ -0,0 +1,30 @@
+# Generated by Django 5.2.17 on 2026-10-17 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_loyers_dus'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndiceReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_indice', models.CharField(choices=[('IRL', 'Indice de référence des loyers (IRL)'), ('ILC', 'Indice des loyers commerciaux (ILC)')], max_length=3, verbose_name='Indice')),
+                ('annee', models.PositiveSmallIntegerField(verbose_name='Année')),
+                ('trimestre', models.PositiveSmallIntegerField(help_text='1 à 4', verbose_name='Trimestre')),
+                ('valeur', models.DecimalField(decimal_places=2, max_digits=6, verbose_name='Valeur')),
+                ('mis_a_jour', models.DateTimeField(auto_now=True, verbose_name='Mis à jour le')),
+            ],
+            options={
+                'verbose_name': 'Indice de référence',
+                'verbose_name_plural': 'Indices de référence',
+                'ordering': ['type_indice', '-annee', '-trimestre'],
+                'constraints': [models.UniqueConstraint(fields=('type_indice', 'annee', 'trimestre'), name='un_indice_par_trimestre')],
+            },
+        ),
+    ]
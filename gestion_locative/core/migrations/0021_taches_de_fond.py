@@ -0,0 +1,42 @@
+# Generated by Django 5.2.17 on 2026-10-17 02:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_indices_reference'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_tache', models.CharField(max_length=40, verbose_name='Type')),
+                ('libelle', models.CharField(max_length=200, verbose_name='Libellé')),
+                ('parametres', models.JSONField(blank=True, default=dict, verbose_name='Paramètres')),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('EN_COURS', 'En cours'), ('TERMINEE', 'Terminée'), ('ECHEC', 'Échec')], default='EN_ATTENTE', max_length=12, verbose_name='Statut')),
+                ('avancement', models.PositiveIntegerField(default=0, verbose_name='Étapes faites')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Étapes prévues')),
+                ('message', models.TextField(blank=True, verbose_name='Message')),
+                ('fichier', models.CharField(blank=True, help_text='Chemin du résultat dans TACHES_DIR', max_length=500)),
+                ('nom_fichier', models.CharField(blank=True, max_length=200, verbose_name='Nom du fichier téléchargé')),
+                ('cree_le', models.DateTimeField(auto_now_add=True, verbose_name='Demandée le')),
+                ('debut', models.DateTimeField(blank=True, null=True, verbose_name='Début')),
+                ('fin', models.DateTimeField(blank=True, null=True, verbose_name='Fin')),
+                ('battement', models.DateTimeField(blank=True, null=True)),
+                ('cree_par', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Demandée par')),
+            ],
+            options={
+                'verbose_name': 'Tâche de fond',
+                'verbose_name_plural': 'Tâches de fond',
+                'ordering': ['-cree_le', '-pk'],
+                'indexes': [models.Index(fields=['statut', 'cree_le'], name='core_tache_statut_251ad5_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,7 @@
 from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
@@ -75,6 +76,15 @@ class Local(models.Model):
     surface_m2 = models.DecimalField(max_digits=6, decimal_places=2, verbose_name="Surface (m²)")
     type_local = models.CharField(max_length=20, choices=TYPE_CHOICES, default='APPART', verbose_name="Type de local")
 
+    @property
+    def bail_actif(self):
+        """Premier bail actif (plus petit pk, comme .filter(actif=True).first()).
+
+        Lit baux.all() pour profiter d'un prefetch_related('locaux__baux') :
+        les onglets et tableaux de bord n'ajoutent ainsi aucune requête par local.
+        """
+        return min((b for b in self.baux.all() if b.actif), key=lambda b: b.pk, default=None)
+
     def __str__(self):
         return f"{self.immeuble.nom} - Porte {self.numero_porte}"
 
@@ -108,7 +118,7 @@ class Bail(models.Model):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._tarifs_cached = None
+        self._frise = None
 
     @property
     def montant_tva(self):
@@ -123,46 +133,34 @@ class Bail(models.Model):
 
     # === TARIFICATION HISTORY METHODS ===
 
-    def _tarifications_cache(self):
-        """Toutes les tarifications du bail, chargées une seule fois par instance.
+    def frise_tarifications(self):
+        """Frise des tarifications du bail, construite une seule fois par instance.
 
         Passer par ce cache (au lieu d'un .filter() par appel) évite de repartir
         en base à chaque lecture de loyer, et laisse les prefetch_related des vues
-        faire leur travail.
+        faire leur travail. Voir core/frise_tarifications.py.
         """
-        if self._tarifs_cached is None:
-            self._tarifs_cached = sorted(
-                self.tarifications.all(),
-                key=lambda t: t.date_debut,
-                reverse=True,
-            )
-        return self._tarifs_cached
+        if self._frise is None:
+            from .frise_tarifications import FriseTarifications
+            self._frise = FriseTarifications(self.tarifications.all())
+        return self._frise
 
     def vider_cache_tarifications(self):
         """À appeler après avoir créé ou modifié une tarification de ce bail."""
-        self._tarifs_cached = None
+        self._frise = None
 
     def get_tarification_at(self, target_date):
         """
         Récupère la tarification active à une date donnée.
 
         Retourne la tarification la plus récente (date_debut la plus proche)
-        qui couvre la date cible.
+        qui couvre la date cible (recherche dichotomique dans la frise).
         """
-        for tarif in self._tarifications_cache():
-            if tarif.date_debut <= target_date and (
-                tarif.date_fin is None or tarif.date_fin >= target_date
-            ):
-                return tarif
-        return None
+        return self.frise_tarifications().a_la_date(target_date)
 
     def get_tarifications_for_period(self, start_date, end_date):
         """Récupère toutes les tarifications qui chevauchent une période."""
-        return [
-            tarif for tarif in reversed(self._tarifications_cache())
-            if tarif.date_debut <= end_date
-            and (tarif.date_fin is None or tarif.date_fin >= start_date)
-        ]
+        return self.frise_tarifications().sur_periode(start_date, end_date)
 
     @property
     def tarification_actuelle(self):
@@ -204,6 +202,16 @@ class Bail(models.Model):
         tarif = self.tarification_actuelle
         return tarif.trimestre_reference if tarif else ""
 
+    @property
+    def locataire_principal(self):
+        """Premier occupant LOCATAIRE (plus petit pk, comme .filter().first()).
+
+        Lit occupants.all() pour profiter d'un prefetch_related('occupants') :
+        les générations par lot n'ajoutent ainsi aucune requête par bail.
+        """
+        locataires = [o for o in self.occupants.all() if o.role == 'LOCATAIRE']
+        return min(locataires, key=lambda o: o.pk, default=None)
+
     def __str__(self):
         return f"Bail {self.local} ({self.date_debut})"
 
@@ -302,7 +310,6 @@ class BailTarification(models.Model):
     def clean(self):
         """Validation des dates et des chevauchements avec les tarifications existantes."""
         from django.core.exceptions import ValidationError
-        from django.db.models import Q
         errors = {}
 
         # 1. date_fin > date_debut
@@ -316,22 +323,16 @@ class BailTarification(models.Model):
 
         # 3. Vérifier le chevauchement avec les tarifications existantes en base
         if self.bail_id and self.date_debut:
-            far_future = date(9999, 12, 31)
-            my_fin = self.date_fin or far_future
-
-            overlapping = self.bail.tarifications.filter(
-                date_debut__lte=my_fin
-            ).filter(
-                Q(date_fin__gte=self.date_debut) | Q(date_fin__isnull=True)
-            )
+            from .frise_tarifications import FriseTarifications
+            autres = self.bail.tarifications.only('pk', 'date_debut', 'date_fin')
             if self.pk:
-                overlapping = overlapping.exclude(pk=self.pk)
+                autres = autres.exclude(pk=self.pk)
 
-            if overlapping.exists():
-                conflicts = overlapping.first()
+            conflict = FriseTarifications(autres).conflit(self.date_debut, self.date_fin)
+            if conflict:
                 errors['date_debut'] = (
                     f"Chevauchement avec la tarification du "
-                    f"{conflicts.date_debut.strftime('%d/%m/%Y')}."
+                    f"{conflict.date_debut.strftime('%d/%m/%Y')}."
                 )
 
         if errors:
@@ -347,6 +348,39 @@ class BailTarification(models.Model):
         if bail_charge is not None:
             bail_charge.vider_cache_tarifications()
 
+class LoyerDu(models.Model):
+    """Loyer dû d'un bail pour un mois (état locatif matérialisé).
+
+    Table dérivée des tarifications, tenue à jour par les signaux (core/signals.py) :
+    ne pas la modifier à la main. Montants au prorata des jours, arrondis par
+    segment comme BailCalculator.calculer_provisions_mensuelles.
+    """
+    bail = models.ForeignKey(Bail, on_delete=models.CASCADE, related_name='loyers_dus')
+    # Dénormalisé pour les totaux par immeuble en une seule requête
+    immeuble = models.ForeignKey(Immeuble, on_delete=models.CASCADE, related_name='loyers_dus')
+    mois = models.DateField(verbose_name="Mois", help_text="Premier jour du mois")
+    jours_factures = models.PositiveSmallIntegerField(verbose_name="Jours facturés")
+    loyer_hc = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Loyer HC (mensuel)")
+    charges = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Provisions charges")
+    taxes = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Taxes")
+    tva = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="TVA")
+    # Loyer HC exact en centimes × etat_locatif.DENOMINATEUR : la somme reste exacte
+    loyer_hc_exact = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.bail} - {self.mois.strftime('%m/%Y')} : {self.loyer_hc}€"
+
+    class Meta:
+        verbose_name = "Loyer dû"
+        verbose_name_plural = "Loyers dus"
+        ordering = ['bail', 'mois']
+        constraints = [
+            models.UniqueConstraint(fields=['bail', 'mois'], name='un_loyer_du_par_mois'),
+        ]
+        indexes = [
+            models.Index(fields=['immeuble', 'mois']),
+        ]
+
 class CleRepartition(models.Model):
     """Définit comment une catégorie de charges est répartie (ex: Charges Générales, Ascenseur, Eau)."""
     MODE_CHOICES = [
@@ -570,24 +604,17 @@ class CreditImmobilier(models.Model):
             raise ValidationError(erreurs)
 
     @property
-    def mensualite_hors_assurance(self):
-        """Calcule la mensualité hors assurance (formule prêt amortissable)."""
-        capital = Decimal(str(self.capital_emprunte))
-        taux = Decimal(str(self.taux_interet))
-        taux_mensuel = taux / 100 / 12
-        n = self.duree_mois
+    def tableau_amortissement(self):
+        """Échéancier indexé par date (cache partagé, voir TableauAmortissement)."""
+        from .patrimoine_calculators import TableauAmortissement
+        return TableauAmortissement.pour_credit(self)
 
-        if not n:
+    @property
+    def mensualite_hors_assurance(self):
+        """Mensualité hors assurance (première échéance de l'échéancier en cache)."""
+        if not self.duree_mois:
             return Decimal('0.00')
-
-        if self.type_credit == 'IN_FINE':
-            return (capital * taux_mensuel).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-
-        if taux_mensuel == 0:
-            return (capital / n).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-
-        mensualite = capital * (taux_mensuel * (1 + taux_mensuel) ** n) / ((1 + taux_mensuel) ** n - 1)
-        return mensualite.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return self.tableau_amortissement.mensualite_hors_assurance
 
     @property
     def mensualite(self):
@@ -607,34 +634,14 @@ class CreditImmobilier(models.Model):
         return self.get_capital_restant_du_at(timezone.now().date())
 
     def get_capital_restant_du_at(self, target_date):
-        """Calcule le capital restant dû à une date donnée (Decimal pour la précision)."""
+        """Capital restant dû à une date donnée, lu dans l'échéancier (recherche dichotomique)."""
         capital = Decimal(str(self.capital_emprunte))
 
         if target_date < self.date_debut:
             return capital
         if target_date >= self.date_fin:
             return Decimal('0.00')
-        if self.type_credit == 'IN_FINE':
-            return capital
-
-        # Compter le nombre de mois écoulés
-        from dateutil.relativedelta import relativedelta
-        delta = relativedelta(target_date, self.date_debut)
-        mois_ecoules = delta.years * 12 + delta.months
-
-        taux_mensuel = Decimal(str(self.taux_interet)) / 100 / 12
-        n = self.duree_mois
-
-        if taux_mensuel == 0:
-            crd = capital - (capital / n * mois_ecoules)
-        else:
-            mensualite = capital * (taux_mensuel * (1 + taux_mensuel) ** n) / ((1 + taux_mensuel) ** n - 1)
-            crd = (
-                capital * ((1 + taux_mensuel) ** mois_ecoules)
-                - mensualite * (((1 + taux_mensuel) ** mois_ecoules - 1) / taux_mensuel)
-            )
-
-        return max(Decimal('0'), crd.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+        return self.tableau_amortissement.capital_restant_du_at(target_date)
 
     class Meta:
         verbose_name = "Crédit immobilier"
@@ -812,4 +819,94 @@ class VacanceLocative(models.Model):
     class Meta:
         verbose_name = "Vacance locative"
         verbose_name_plural = "Vacances locatives"
-        ordering = ['-date_debut']
\ No newline at end of file
+        ordering = ['-date_debut']
+
+class IndiceReference(models.Model):
+    """Valeur trimestrielle d'un indice de révision des loyers (IRL, ILC).
+
+    Tenue à jour hors requête par la commande rafraichir_indices (voir
+    core/indices.py) : les vues ne lisent que cette table.
+    """
+    TYPE_CHOICES = [
+        ('IRL', 'Indice de référence des loyers (IRL)'),
+        ('ILC', 'Indice des loyers commerciaux (ILC)'),
+    ]
+
+    type_indice = models.CharField(max_length=3, choices=TYPE_CHOICES, verbose_name="Indice")
+    annee = models.PositiveSmallIntegerField(verbose_name="Année")
+    trimestre = models.PositiveSmallIntegerField(verbose_name="Trimestre", help_text="1 à 4")
+    valeur = models.DecimalField(max_digits=6, decimal_places=2, verbose_name="Valeur")
+    mis_a_jour = models.DateTimeField(auto_now=True, verbose_name="Mis à jour le")
+
+    @property
+    def libelle_trimestre(self):
+        """Format de BailTarification.trimestre_reference, ex. « T1 2024 »."""
+        return f"T{self.trimestre} {self.annee}"
+
+    def __str__(self):
+        return f"{self.type_indice} {self.libelle_trimestre} : {self.valeur}"
+
+    class Meta:
+        verbose_name = "Indice de référence"
+        verbose_name_plural = "Indices de référence"
+        ordering = ['type_indice', '-annee', '-trimestre']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['type_indice', 'annee', 'trimestre'], name='un_indice_par_trimestre'
+            ),
+        ]
+
+
+class Tache(models.Model):
+    """Traitement long (lot de PDF, campagne, échéanciers) exécuté hors requête.
+
+    Mise en file par l'interface, exécutée par `manage.py traiter_taches`
+    (core/taches.py) ; l'application suit l'avancement et télécharge le
+    fichier produit.
+    """
+    STATUT_CHOICES = [
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', 'En cours'),
+        ('TERMINEE', 'Terminée'),
+        ('ECHEC', 'Échec'),
+    ]
+
+    type_tache = models.CharField(max_length=40, verbose_name="Type")
+    libelle = models.CharField(max_length=200, verbose_name="Libellé")
+    parametres = models.JSONField(default=dict, blank=True, verbose_name="Paramètres")
+    statut = models.CharField(max_length=12, choices=STATUT_CHOICES, default='EN_ATTENTE', verbose_name="Statut")
+    avancement = models.PositiveIntegerField(default=0, verbose_name="Étapes faites")
+    total = models.PositiveIntegerField(default=0, verbose_name="Étapes prévues")
+    message = models.TextField(blank=True, verbose_name="Message")
+    fichier = models.CharField(max_length=500, blank=True, help_text="Chemin du résultat dans TACHES_DIR")
+    nom_fichier = models.CharField(max_length=200, blank=True, verbose_name="Nom du fichier téléchargé")
+    cree_par = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        verbose_name="Demandée par",
+    )
+    cree_le = models.DateTimeField(auto_now_add=True, verbose_name="Demandée le")
+    debut = models.DateTimeField(null=True, blank=True, verbose_name="Début")
+    fin = models.DateTimeField(null=True, blank=True, verbose_name="Fin")
+    # Dernier signe de vie du worker (une tâche EN_COURS muette est orpheline)
+    battement = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def terminee(self):
+        return self.statut in ('TERMINEE', 'ECHEC')
+
+    @property
+    def pourcentage(self):
+        if self.statut == 'TERMINEE':
+            return 100
+        return int(self.avancement * 100 / self.total) if self.total else 0
+
+    def __str__(self):
+        return f"{self.libelle} ({self.get_statut_display()})"
+
+    class Meta:
+        verbose_name = "Tâche de fond"
+        verbose_name_plural = "Tâches de fond"
+        ordering = ['-cree_le', '-pk']
+        indexes = [
+            models.Index(fields=['statut', 'cree_le']),
+        ]
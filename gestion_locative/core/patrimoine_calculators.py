@@ -10,13 +10,25 @@ Ce module contient les classes de calcul pour:
 """
 
 import calendar
+from bisect import bisect_right
+from collections import OrderedDict
 from decimal import Decimal, ROUND_HALF_UP
-from datetime import date
+from datetime import date, timedelta
+from itertools import accumulate
 from dateutil.relativedelta import relativedelta
 from django.db import transaction
-from django.db.models import Sum, Q
+from django.db.models import Sum
+from django.db.models.functions import ExtractYear
 from django.utils import timezone
 
+from . import loyers_dus
+from .etat_locatif import EtatLocatif
+
+
+def _relation_prechargee(instance, relation):
+    """Objets liés déjà chargés par prefetch_related, ou None."""
+    return getattr(instance, '_prefetched_objects_cache', {}).get(relation)
+
 
 class CreditGenerator:
     """Générateur d'échéancier pour les crédits immobiliers."""
@@ -24,6 +36,20 @@ class CreditGenerator:
     def __init__(self, credit):
         self.credit = credit
 
+    def calculer_mensualite(self):
+        """Mensualité hors assurance, arrondie au centime (intérêts seuls pour un in fine)."""
+        capital = Decimal(str(self.credit.capital_emprunte))
+        taux_mensuel = Decimal(str(self.credit.taux_interet)) / 100 / 12
+        n = self.credit.duree_mois
+
+        if self.credit.type_credit == 'IN_FINE':
+            mensualite = capital * taux_mensuel
+        elif taux_mensuel == 0:
+            mensualite = capital / n
+        else:
+            mensualite = capital * (taux_mensuel * (1 + taux_mensuel) ** n) / ((1 + taux_mensuel) ** n - 1)
+        return mensualite.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
     def generer_echeancier(self):
         """
         Calcule l'échéancier complet du crédit.
@@ -54,12 +80,7 @@ class CreditGenerator:
                 })
         else:
             # Crédit amortissable classique
-            n = self.credit.duree_mois
-            if taux_mensuel == 0:
-                mensualite = capital / n
-            else:
-                mensualite = capital * (taux_mensuel * (1 + taux_mensuel) ** n) / ((1 + taux_mensuel) ** n - 1)
-            mensualite = mensualite.quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+            mensualite = self.calculer_mensualite()
             capital_restant = capital
 
             for i in range(1, self.credit.duree_mois + 1):
@@ -84,37 +105,159 @@ class CreditGenerator:
 
         return echeancier
 
+    # Champs de EcheanceCredit recalculés par generer_echeancier()
+    CHAMPS_CALCULES = ('date_echeance', 'capital_rembourse', 'interets', 'assurance', 'capital_restant_du')
+
     @transaction.atomic
-    def creer_echeances_en_base(self):
+    def synchroniser_echeances(self):
         """
-        Génère et sauvegarde l'échéancier complet en base de données.
-        Supprime l'ancien échéancier s'il existe.
-        Opération atomique : si bulk_create échoue, la suppression est annulée.
+        Aligne l'échéancier en base sur l'échéancier calculé, ligne à ligne.
+
+        Seules les échéances dont un montant ou la date change sont réécrites
+        (bulk_update) ; les échéances en plus ou en moins (durée modifiée) sont
+        créées ou supprimées. Les champs de paiement (payee, date_paiement) des
+        échéances conservées ne sont jamais touchés : relancer la génération
+        sur un crédit inchangé n'écrit rien.
+
+        Returns:
+            dict: total, creees, modifiees, supprimees
         """
         from .models import EcheanceCredit
 
-        # Supprimer les échéances existantes
-        self.credit.echeances.all().delete()
-
-        # Générer le nouvel échéancier
+        existantes = {e.numero_echeance: e for e in self.credit.echeances.all()}
         echeancier = self.generer_echeancier()
 
-        # Créer les objets en bulk
-        echeances = [
-            EcheanceCredit(
-                credit=self.credit,
-                numero_echeance=e['numero_echeance'],
-                date_echeance=e['date_echeance'],
-                capital_rembourse=e['capital_rembourse'],
-                interets=e['interets'],
-                assurance=e['assurance'],
-                capital_restant_du=e['capital_restant_du'],
-            )
-            for e in echeancier
-        ]
+        a_creer, a_modifier = [], []
+        for ligne in echeancier:
+            echeance = existantes.get(ligne['numero_echeance'])
+            if echeance is None:
+                a_creer.append(EcheanceCredit(credit=self.credit, **ligne))
+                continue
+            modifiee = False
+            for champ in self.CHAMPS_CALCULES:
+                if getattr(echeance, champ) != ligne[champ]:
+                    setattr(echeance, champ, ligne[champ])
+                    modifiee = True
+            if modifiee:
+                a_modifier.append(echeance)
+
+        supprimees = 0
+        if len(existantes) > len(echeancier):
+            supprimees, _ = self.credit.echeances.filter(numero_echeance__gt=len(echeancier)).delete()
+        EcheanceCredit.objects.bulk_update(a_modifier, self.CHAMPS_CALCULES, batch_size=100)
+        EcheanceCredit.objects.bulk_create(a_creer)
+
+        if a_creer or a_modifier or supprimees:
+            # Écritures en masse, sans signaux : intérêts et rendements changent
+            from .indicateurs import invalider_indicateurs
+            invalider_indicateurs(self.credit.immeuble_id)
+
+        return {
+            'total': len(echeancier),
+            'creees': len(a_creer),
+            'modifiees': len(a_modifier),
+            'supprimees': supprimees,
+        }
+
+    def creer_echeances_en_base(self):
+        """
+        Génère l'échéancier en base (voir synchroniser_echeances).
+
+        Returns:
+            int: Nombre d'échéances du crédit
+        """
+        return self.synchroniser_echeances()['total']
+
+
+class TableauAmortissement:
+    """
+    Échéancier d'un crédit indexé par date, calculé une fois par crédit.
+
+    Capital restant dû, intérêts et assurance cumulés à une date s'obtiennent
+    par recherche dichotomique dans l'échéancier : plus aucune puissance en
+    Decimal au moment de la requête (projections des tableaux de bord).
+
+    Le cache est partagé par tout le processus et indexé par les paramètres
+    du crédit : modifier le crédit change la clé, l'ancien tableau n'est plus
+    jamais lu (et finit évincé). Aucune invalidation à propager entre les
+    workers gunicorn.
+    """
 
-        EcheanceCredit.objects.bulk_create(echeances)
-        return len(echeances)
+    TAILLE_CACHE = 512
+    _cache = OrderedDict()
+
+    def __init__(self, credit):
+        generateur = CreditGenerator(credit)
+        echeancier = generateur.generer_echeancier()
+        self.mensualite_hors_assurance = generateur.calculer_mensualite()
+        self.capital = Decimal(str(credit.capital_emprunte))
+        self.date_debut = credit.date_debut
+        self.dates = [e['date_echeance'] for e in echeancier]
+        self.capital_restant = [e['capital_restant_du'] for e in echeancier]
+        self.interets_cumules = list(accumulate(e['interets'] for e in echeancier))
+        self.assurance_cumulee = list(accumulate(e['assurance'] for e in echeancier))
+
+    @staticmethod
+    def _cle(credit):
+        # Decimal : 150000 et 150000.00 (relu en base) donnent la même clé
+        return (
+            credit.pk, Decimal(str(credit.capital_emprunte)), Decimal(str(credit.taux_interet)),
+            credit.duree_mois, credit.date_debut, credit.type_credit,
+            Decimal(str(credit.assurance_mensuelle)),
+        )
+
+    @classmethod
+    def pour_credit(cls, credit):
+        """Tableau du crédit, construit au premier appel puis servi depuis le cache."""
+        cle = cls._cle(credit)
+        tableau = cls._cache.get(cle)
+        if tableau is None:
+            tableau = cls(credit)
+            cls._cache[cle] = tableau
+            if len(cls._cache) > cls.TAILLE_CACHE:
+                cls._cache.popitem(last=False)
+        else:
+            cls._cache.move_to_end(cle)
+        return tableau
+
+    @classmethod
+    def vider_cache(cls):
+        cls._cache.clear()
+
+    def nb_echeances_passees(self, target_date):
+        """Nombre d'échéances dont la date est antérieure ou égale à target_date."""
+        return bisect_right(self.dates, target_date)
+
+    def capital_restant_du_at(self, target_date):
+        k = self.nb_echeances_passees(target_date)
+        return self.capital_restant[k - 1] if k else self.capital
+
+    def interets_cumules_at(self, target_date):
+        """Intérêts payés depuis le début du prêt jusqu'à target_date incluse."""
+        k = self.nb_echeances_passees(target_date)
+        return self.interets_cumules[k - 1] if k else Decimal('0')
+
+    def assurance_cumulee_at(self, target_date):
+        """Assurance payée depuis le début du prêt jusqu'à target_date incluse."""
+        k = self.nb_echeances_passees(target_date)
+        return self.assurance_cumulee[k - 1] if k else Decimal('0')
+
+    def interets_entre(self, date_debut, date_fin):
+        """Intérêts des échéances comprises entre les deux dates incluses."""
+        return self.interets_cumules_at(date_fin) - self.interets_cumules_at(date_debut - timedelta(days=1))
+
+    def assurance_entre(self, date_debut, date_fin):
+        """Assurance des échéances comprises entre les deux dates incluses."""
+        return self.assurance_cumulee_at(date_fin) - self.assurance_cumulee_at(date_debut - timedelta(days=1))
+
+    def annuites_entre(self, date_debut, date_fin):
+        """Total des échéances (capital, intérêts, assurance) entre les deux dates incluses.
+
+        Compte le remboursement final d'un prêt in fine, que la mensualité ignore.
+        """
+        veille = date_debut - timedelta(days=1)
+        capital = self.capital_restant_du_at(veille) - self.capital_restant_du_at(date_fin)
+        return capital + self.interets_entre(date_debut, date_fin) + self.assurance_entre(date_debut, date_fin)
 
 
 class PatrimoineCalculator:
@@ -126,7 +269,13 @@ class PatrimoineCalculator:
         Retourne la valeur actuelle de l'immeuble.
         Utilise la dernière estimation ou le prix d'achat par défaut.
         """
-        derniere_estimation = immeuble.estimations.order_by('-date_estimation').first()
+        estimations = _relation_prechargee(immeuble, 'estimations')
+        if estimations is not None:
+            derniere_estimation = max(
+                estimations, key=lambda e: e.date_estimation, default=None
+            )
+        else:
+            derniere_estimation = immeuble.estimations.order_by('-date_estimation').first()
         if derniere_estimation:
             return derniere_estimation.valeur_estimee
         return immeuble.prix_achat or Decimal('0')
@@ -221,55 +370,20 @@ class RentabiliteCalculator:
         ATTENTION : il s'agit des loyers dus d'après les tarifications, pas des
         loyers encaissés. Les impayés ne sont pas déduits (l'application ne suit
         pas les encaissements).
-        """
-        import calendar
-
-        total_loyers = Decimal('0')
-        date_debut_annee = date(annee, 1, 1)
-        date_fin_annee = date(annee, 12, 31)
-
-        for local in immeuble.locaux.all():
-            # Filtrage en Python : un .filter() ici annulerait le prefetch_related
-            # des vues et relancerait une requete par local.
-            baux_de_lannee = [
-                bail for bail in local.baux.all()
-                if bail.date_debut <= date_fin_annee
-                and (bail.date_fin is None or bail.date_fin >= date_debut_annee)
-            ]
-            for bail in baux_de_lannee:
-                debut_effectif = max(bail.date_debut, date_debut_annee)
-                fin_effective = min(bail.date_fin, date_fin_annee) if bail.date_fin else date_fin_annee
 
-                if debut_effectif > fin_effective:
-                    continue
-
-                for mois in range(1, 13):
-                    nb_jours_mois = calendar.monthrange(annee, mois)[1]
-                    debut_mois = date(annee, mois, 1)
-                    fin_mois = date(annee, mois, nb_jours_mois)
-
-                    p_start = max(debut_mois, debut_effectif)
-                    p_end = min(fin_mois, fin_effective)
-                    if p_start > p_end:
-                        continue
-
-                    for tarif in bail.get_tarifications_for_period(p_start, p_end):
-                        seg_start = max(p_start, tarif.date_debut)
-                        seg_end = min(p_end, tarif.date_fin) if tarif.date_fin else p_end
-                        if seg_start > seg_end:
-                            continue
+        Une requête SUM sur la table des loyers dus (LoyerDu) ; au-delà de
+        l'horizon matérialisé, calcul par l'état locatif. Les deux cumulent
+        les montants exacts et n'arrondissent qu'une fois, au centime.
 
-                        nb_jours = (seg_end - seg_start).days + 1
-                        loyer_mensuel = RentabiliteCalculator._loyer_mensuel_equivalent(bail, tarif)
-
-                        if nb_jours == nb_jours_mois:
-                            total_loyers += loyer_mensuel
-                        else:
-                            total_loyers += (
-                                loyer_mensuel * Decimal(nb_jours) / Decimal(nb_jours_mois)
-                            )
-
-        return total_loyers.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        Aucune requête si l'année a été préchargée (precharger_annuels).
+        """
+        precharges = getattr(immeuble, '_annuels_precharges', {}).get(annee)
+        if precharges is not None:
+            return precharges['loyers']
+        loyers = loyers_dus.loyers_annuels(immeuble, annee)
+        if loyers is None:
+            loyers = EtatLocatif.depuis_immeuble(immeuble).loyers_annuels(immeuble.pk, annee)
+        return loyers
 
     @staticmethod
     def get_rendement_brut(immeuble, annee=None):
@@ -298,44 +412,137 @@ class RentabiliteCalculator:
         exclure_types permet d'écarter les types déjà calculés depuis l'échéancier
         de crédit, pour ne pas les compter deux fois.
         """
+        prechargees = _relation_prechargee(immeuble, 'charges_fiscales')
+        if prechargees is not None:
+            return sum(
+                (c.montant for c in prechargees
+                 if c.annee == annee and c.type_charge not in (exclure_types or ())),
+                Decimal('0'),
+            )
         charges = immeuble.charges_fiscales.filter(annee=annee)
         if exclure_types:
             charges = charges.exclude(type_charge__in=exclure_types)
         return charges.aggregate(total=Sum('montant'))['total'] or Decimal('0')
 
     @staticmethod
-    def get_interets_annuels(immeuble, annee):
+    def _charges_saisies(immeuble, annee):
+        """Charges fiscales saisies d'une année (depuis le prefetch charges_fiscales s'il existe)."""
+        charges = _relation_prechargee(immeuble, 'charges_fiscales')
+        if charges is None:
+            return list(immeuble.charges_fiscales.filter(annee=annee))
+        return [c for c in charges if c.annee == annee]
+
+    @staticmethod
+    def precharger_annuels(immeubles, annees):
         """
-        Total des intérêts payés sur une année pour tous les crédits (échéanciers).
+        Précharge loyers dus, intérêts et assurance de plusieurs immeubles.
+
+        Deux requêtes groupées pour tout le lot ; get_loyers_annuels,
+        get_interets_annuels, generer_bilan_fiscal... lisent ensuite ces
+        totaux sur l'instance sans retourner en base. Les années au-delà de
+        l'horizon des loyers dus ne sont pas préchargées (repli habituel).
+
+        Args:
+            immeubles (list): Instances d'Immeuble (modifiées en place)
+            annees: Années à précharger
         """
-        total_interets = Decimal('0')
-        date_debut = date(annee, 1, 1)
-        date_fin = date(annee, 12, 31)
+        annees = [annee for annee in set(annees) if annee <= loyers_dus.horizon_materialise()]
+        if not immeubles or not annees:
+            return
+        ids = [immeuble.pk for immeuble in immeubles]
+        loyers = loyers_dus.loyers_par_immeuble_et_annee(annees, ids)
+        frais = RentabiliteCalculator.get_frais_financiers(ids, annees)
+        zero = Decimal('0')
 
-        for credit in immeuble.credits.all():
-            interets = credit.echeances.filter(
-                date_echeance__gte=date_debut,
-                date_echeance__lte=date_fin
-            ).aggregate(total=Sum('interets'))['total'] or Decimal('0')
-            total_interets += interets
+        for immeuble in immeubles:
+            precharges = getattr(immeuble, '_annuels_precharges', {})
+            for annee in annees:
+                frais_annee = frais.get((immeuble.pk, annee), {})
+                precharges[annee] = {
+                    'loyers': loyers.get((immeuble.pk, annee), Decimal('0.00')),
+                    'interets': frais_annee.get('interets', zero),
+                    'assurance': frais_annee.get('assurance', zero),
+                }
+            immeuble._annuels_precharges = precharges
+
+    @staticmethod
+    def get_frais_financiers(immeubles=None, annees=None):
+        """
+        Intérêts et assurance emprunteur des échéanciers, par immeuble et par année.
+
+        Une seule requête groupée, quel que soit le nombre de crédits, d'immeubles
+        ou d'années.
+
+        Args:
+            immeubles: Immeubles (ou pk) à retenir (défaut : tous)
+            annees: Années à retenir (défaut : toutes)
+
+        Returns:
+            dict: {(immeuble_id, annee): {'interets': Decimal, 'assurance': Decimal}}
+        """
+        from .models import EcheanceCredit
+
+        echeances = EcheanceCredit.objects.all()
+        if immeubles is not None:
+            echeances = echeances.filter(credit__immeuble__in=immeubles)
+        if annees is not None:
+            echeances = echeances.filter(date_echeance__year__in=list(annees))
+
+        lignes = echeances.annotate(
+            annee=ExtractYear('date_echeance')
+        ).values('credit__immeuble_id', 'annee').annotate(
+            interets=Sum('interets'), assurance=Sum('assurance')
+        ).order_by()
+
+        return {
+            (ligne['credit__immeuble_id'], ligne['annee']): {
+                'interets': ligne['interets'], 'assurance': ligne['assurance'],
+            }
+            for ligne in lignes
+        }
 
-        return total_interets
+    @staticmethod
+    def _frais_financiers_annuels(immeuble, annee):
+        """
+        Intérêts et assurance d'un immeuble sur une année.
+
+        Sans requête si l'année a été préchargée (precharger_annuels) ou si les
+        vues ont préchargé credits__echeances, sinon une seule requête groupée
+        (get_frais_financiers).
+        """
+        precharges = getattr(immeuble, '_annuels_precharges', {}).get(annee)
+        if precharges is not None:
+            return precharges
+        credits_charges = _relation_prechargee(immeuble, 'credits')
+        if credits_charges is not None and all(
+            'echeances' in getattr(credit, '_prefetched_objects_cache', {})
+            for credit in credits_charges
+        ):
+            echeances = [
+                e for credit in credits_charges for e in credit.echeances.all()
+                if e.date_echeance.year == annee
+            ]
+            return {
+                'interets': sum((e.interets for e in echeances), Decimal('0')),
+                'assurance': sum((e.assurance for e in echeances), Decimal('0')),
+            }
+
+        frais = RentabiliteCalculator.get_frais_financiers([immeuble.pk], [annee])
+        return frais.get(
+            (immeuble.pk, annee), {'interets': Decimal('0'), 'assurance': Decimal('0')}
+        )
+
+    @staticmethod
+    def get_interets_annuels(immeuble, annee):
+        """
+        Total des intérêts payés sur une année pour tous les crédits (échéanciers).
+        """
+        return RentabiliteCalculator._frais_financiers_annuels(immeuble, annee)['interets']
 
     @staticmethod
     def get_assurance_emprunt_annuelle(immeuble, annee):
         """Total des primes d'assurance emprunteur d'une année (échéanciers)."""
-        total = Decimal('0')
-        date_debut = date(annee, 1, 1)
-        date_fin = date(annee, 12, 31)
-
-        for credit in immeuble.credits.all():
-            assurance = credit.echeances.filter(
-                date_echeance__gte=date_debut,
-                date_echeance__lte=date_fin
-            ).aggregate(total=Sum('assurance'))['total'] or Decimal('0')
-            total += assurance
-
-        return total
+        return RentabiliteCalculator._frais_financiers_annuels(immeuble, annee)['assurance']
 
     @staticmethod
     def get_rendement_net(immeuble, annee=None):
@@ -419,16 +626,21 @@ class FiscaliteCalculator:
         """
         loyers_bruts = RentabiliteCalculator.get_loyers_annuels(immeuble, annee)
 
-        interets_echeancier = RentabiliteCalculator.get_interets_annuels(immeuble, annee)
-        assurance_echeancier = RentabiliteCalculator.get_assurance_emprunt_annuelle(immeuble, annee)
+        frais_financiers = RentabiliteCalculator._frais_financiers_annuels(immeuble, annee)
+        interets_echeancier = frais_financiers['interets']
+        assurance_echeancier = frais_financiers['assurance']
 
-        charges_saisies = immeuble.charges_fiscales.filter(annee=annee)
+        # Une lecture (ou aucune, si charges_fiscales est préchargé), ventilée ensuite
+        charges_saisies = RentabiliteCalculator._charges_saisies(immeuble, annee)
 
         # Repli : sans échéancier, on retient ce qui a été saisi manuellement.
-        interets_saisis = charges_saisies.filter(type_charge='INTERETS').aggregate(
-            total=Sum('montant'))['total'] or Decimal('0')
-        assurance_saisie = charges_saisies.filter(type_charge='ASSURANCE_EMPRUNT').aggregate(
-            total=Sum('montant'))['total'] or Decimal('0')
+        interets_saisis = sum(
+            (c.montant for c in charges_saisies if c.type_charge == 'INTERETS'), Decimal('0')
+        )
+        assurance_saisie = sum(
+            (c.montant for c in charges_saisies if c.type_charge == 'ASSURANCE_EMPRUNT'),
+            Decimal('0'),
+        )
 
         interets_emprunts = interets_echeancier or interets_saisis
         assurance_emprunt = assurance_echeancier or assurance_saisie
@@ -436,9 +648,9 @@ class FiscaliteCalculator:
 
         # Les autres charges, ventilées par type
         charges_par_type = {}
-        for charge in charges_saisies.exclude(
-            type_charge__in=FiscaliteCalculator.TYPES_COUVERTS_PAR_ECHEANCIER
-        ):
+        for charge in charges_saisies:
+            if charge.type_charge in FiscaliteCalculator.TYPES_COUVERTS_PAR_ECHEANCIER:
+                continue
             libelle = charge.get_type_charge_display()
             charges_par_type[libelle] = charges_par_type.get(libelle, Decimal('0')) + charge.montant
 
@@ -537,26 +749,24 @@ class RatiosCalculator:
     def get_taux_vacance(immeuble, annee):
         """
         Calcule le taux de vacance : Jours vacants / 365 × 100
-        """
-        from .models import VacanceLocative
 
+        Sans requête si les vues ont préchargé locaux__vacances.
+        """
         date_debut_annee = date(annee, 1, 1)
         date_fin_annee = date(annee, 12, 31)
         total_jours_vacants = 0
-        total_locaux = immeuble.locaux.count()
+        locaux = list(immeuble.locaux.all())
+        total_locaux = len(locaux)
 
         if total_locaux == 0:
             return 0
 
-        for local in immeuble.locaux.all():
-            vacances = VacanceLocative.objects.filter(
-                local=local,
-                date_debut__lte=date_fin_annee
-            ).filter(
-                Q(date_fin__isnull=True) | Q(date_fin__gte=date_debut_annee)
-            )
-
-            for vacance in vacances:
+        for local in locaux:
+            for vacance in local.vacances.all():
+                if vacance.date_debut > date_fin_annee or (
+                    vacance.date_fin is not None and vacance.date_fin < date_debut_annee
+                ):
+                    continue
                 debut = max(vacance.date_debut, date_debut_annee)
                 fin = min(vacance.date_fin or date_fin_annee, date_fin_annee)
                 jours = (fin - debut).days + 1
@@ -5,9 +5,10 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 from reportlab.lib import colors
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 import calendar
 import logging
+import zlib
 from decimal import Decimal, ROUND_HALF_UP
 
 logger = logging.getLogger(__name__)
@@ -41,22 +42,48 @@ class PDFGenerator:
         self.p = None
         self.response = None
 
+    def _formulaire(self, nom, dessiner):
+        """
+        Dessine un formulaire ReportLab (form XObject) enregistré une fois par document.
+
+        Le premier appel enregistre le dessin dans le PDF ; chaque page suivante
+        n'y fait plus qu'une référence. L'état graphique est isolé : le
+        formulaire ne modifie ni les couleurs ni la police du canvas.
+
+        Args:
+            nom (str): Nom du formulaire, unique dans le document
+            dessiner (callable): Dessine le contenu sur self.p
+        """
+        if not self.p.hasForm(nom):
+            self.p.beginForm(nom)
+            dessiner()
+            self.p.endForm()
+        self.p.doForm(nom)
+
     def _draw_header_standard(self, titre, sous_titre=""):
         """
         Dessine l'en-tête standardisé gris avec titre centré.
 
+        Le fond et le titre forment un formulaire commun à toutes les pages du
+        document ; seul le sous-titre (période) est dessiné à chaque page.
+
         Args:
             titre (str): Titre principal (ex: "QUITTANCE DE LOYER")
             sous_titre (str): Sous-titre optionnel (ex: "Période du ...")
         """
-        # Fond gris clair
-        self.p.setFillColor(colors.HexColor("#E0E0E0"))
-        self.p.rect(1*cm, 26*cm, 19*cm, 2.5*cm, fill=1, stroke=0)
-        self.p.setFillColor(colors.black)
+        def dessiner():
+            # Fond gris clair
+            self.p.setFillColor(colors.HexColor("#E0E0E0"))
+            self.p.rect(1*cm, 26*cm, 19*cm, 2.5*cm, fill=1, stroke=0)
+            self.p.setFillColor(colors.black)
 
-        # Titre principal
+            # Titre principal
+            self.p.setFont("Helvetica-Bold", 16)
+            self.p.drawCentredString(10.5*cm, 27.2*cm, titre)
+
+        self._formulaire(f"Entete{zlib.crc32(titre.encode('utf-8')):08x}", dessiner)
+        self.p.setFillColor(colors.black)
         self.p.setFont("Helvetica-Bold", 16)
-        self.p.drawCentredString(10.5*cm, 27.2*cm, titre)
 
         # Sous-titre
         if sous_titre:
@@ -67,56 +94,65 @@ class PDFGenerator:
         """
         Dessine les cadres BAILLEUR (gauche) et LOCATAIRE (droite) standardisés.
 
-        Utilise les données du bail (propriétaire et premier occupant).
+        Utilise les données du bail (propriétaire et premier occupant). Ces
+        cadres ne changent pas d'une page à l'autre : ils sont enregistrés une
+        fois par document (un document par bail dans les lots) comme formulaire.
         """
-        # --- Cadre BAILLEUR (Gauche) ---
-        self.p.setStrokeColor(colors.grey)
-        self.p.rect(1*cm, 21.5*cm, 9*cm, 3.5*cm)  # Cadre
+        def dessiner():
+            # --- Cadre BAILLEUR (Gauche) ---
+            self.p.setStrokeColor(colors.grey)
+            self.p.rect(1*cm, 21.5*cm, 9*cm, 3.5*cm)  # Cadre
+
+            # Titre cadre bailleur
+            self.p.setFillColor(colors.HexColor("#F5F5F5"))
+            self.p.rect(1*cm, 24.2*cm, 9*cm, 0.8*cm, fill=1, stroke=1)
+            self.p.setFillColor(colors.black)
+            self.p.setFont("Helvetica-Bold", 11)
+            self.p.drawCentredString(5.5*cm, 24.4*cm, "BAILLEUR")
+
+            # Contenu bailleur
+            self.p.setFont("Helvetica", 10)
+            y_text = 23.5*cm
+            proprietaire = self.bail.local.immeuble.proprietaire
 
-        # Titre cadre bailleur
-        self.p.setFillColor(colors.HexColor("#F5F5F5"))
-        self.p.rect(1*cm, 24.2*cm, 9*cm, 0.8*cm, fill=1, stroke=1)
-        self.p.setFillColor(colors.black)
-        self.p.setFont("Helvetica-Bold", 11)
-        self.p.drawCentredString(5.5*cm, 24.4*cm, "BAILLEUR")
+            if proprietaire:
+                self.p.drawString(1.5*cm, y_text, proprietaire.nom)
+                self.p.drawString(1.5*cm, y_text - 0.5*cm, proprietaire.adresse)
+                self.p.drawString(1.5*cm, y_text - 1.0*cm, f"{proprietaire.code_postal} {proprietaire.ville}")
+            else:
+                self.p.drawString(1.5*cm, y_text, self.bail.local.immeuble.nom)
+                self.p.drawString(1.5*cm, y_text - 0.5*cm, self.bail.local.immeuble.adresse)
+                self.p.drawString(1.5*cm, y_text - 1.0*cm, f"{self.bail.local.immeuble.code_postal} {self.bail.local.immeuble.ville}")
 
-        # Contenu bailleur
-        self.p.setFont("Helvetica", 10)
-        y_text = 23.5*cm
-        proprietaire = self.bail.local.immeuble.proprietaire
+            # --- Cadre LOCATAIRE (Droite) ---
+            self.p.rect(11*cm, 21.5*cm, 9*cm, 3.5*cm)
 
-        if proprietaire:
-            self.p.drawString(1.5*cm, y_text, proprietaire.nom)
-            self.p.drawString(1.5*cm, y_text - 0.5*cm, proprietaire.adresse)
-            self.p.drawString(1.5*cm, y_text - 1.0*cm, f"{proprietaire.code_postal} {proprietaire.ville}")
-        else:
-            self.p.drawString(1.5*cm, y_text, self.bail.local.immeuble.nom)
-            self.p.drawString(1.5*cm, y_text - 0.5*cm, self.bail.local.immeuble.adresse)
-            self.p.drawString(1.5*cm, y_text - 1.0*cm, f"{self.bail.local.immeuble.code_postal} {self.bail.local.immeuble.ville}")
+            # Titre cadre locataire
+            self.p.setFillColor(colors.HexColor("#F5F5F5"))
+            self.p.rect(11*cm, 24.2*cm, 9*cm, 0.8*cm, fill=1, stroke=1)
+            self.p.setFillColor(colors.black)
+            self.p.setFont("Helvetica-Bold", 11)
+            self.p.drawCentredString(15.5*cm, 24.4*cm, "LOCATAIRE")
 
-        # --- Cadre LOCATAIRE (Droite) ---
-        self.p.rect(11*cm, 21.5*cm, 9*cm, 3.5*cm)
+            # Contenu locataire
+            self.p.setFont("Helvetica", 10)
+            y_text = 23.5*cm
+            occupant = self.bail.locataire_principal
+
+            if occupant:
+                self.p.drawString(11.5*cm, y_text, f"{occupant.nom} {occupant.prenom}")
+                self.p.drawString(11.5*cm, y_text - 0.5*cm, self.bail.local.immeuble.adresse)
+                self.p.drawString(11.5*cm, y_text - 1.0*cm, f"{self.bail.local.immeuble.code_postal} {self.bail.local.immeuble.ville}")
+                self.p.drawString(11.5*cm, y_text - 1.5*cm, f"Local: {self.bail.local.numero_porte}")
+            else:
+                self.p.drawString(11.5*cm, y_text, "Locataire")
+                self.p.drawString(11.5*cm, y_text - 0.5*cm, self.bail.local.numero_porte)
 
-        # Titre cadre locataire
-        self.p.setFillColor(colors.HexColor("#F5F5F5"))
-        self.p.rect(11*cm, 24.2*cm, 9*cm, 0.8*cm, fill=1, stroke=1)
+        self._formulaire("CadresBail", dessiner)
+        # État laissé par le dessin des cadres, sur lequel comptent les pages
+        self.p.setStrokeColor(colors.grey)
         self.p.setFillColor(colors.black)
-        self.p.setFont("Helvetica-Bold", 11)
-        self.p.drawCentredString(15.5*cm, 24.4*cm, "LOCATAIRE")
-
-        # Contenu locataire
         self.p.setFont("Helvetica", 10)
-        y_text = 23.5*cm
-        occupant = self.bail.occupants.filter(role='LOCATAIRE').first()
-
-        if occupant:
-            self.p.drawString(11.5*cm, y_text, f"{occupant.nom} {occupant.prenom}")
-            self.p.drawString(11.5*cm, y_text - 0.5*cm, self.bail.local.immeuble.adresse)
-            self.p.drawString(11.5*cm, y_text - 1.0*cm, f"{self.bail.local.immeuble.code_postal} {self.bail.local.immeuble.ville}")
-            self.p.drawString(11.5*cm, y_text - 1.5*cm, f"Local: {self.bail.local.numero_porte}")
-        else:
-            self.p.drawString(11.5*cm, y_text, "Locataire")
-            self.p.drawString(11.5*cm, y_text - 0.5*cm, self.bail.local.numero_porte)
 
     def _get_tarif_or_error(self, target_date):
         """
@@ -428,84 +464,31 @@ class PDFGenerator:
             return 27*cm
         return y
 
-    def generer_regularisation(self, date_debut, date_fin, enregistrer_historique=True):
+    def generer_regularisation(self, date_debut, date_fin, enregistrer_historique=True, decompte=None):
         """
         Génère le décompte de régularisation de charges sur une période donnée.
 
+        Le calcul est fait par core/regularisation.py ; cette méthode ne fait
+        que le dessiner (et l'historiser si demandé).
+
         Args:
             date_debut (date): Date de début de la période
             date_fin (date): Date de fin de la période
             enregistrer_historique (bool): Si True, sauvegarde dans la table Regularisation
+            decompte (DecompteRegularisation): Décompte déjà calculé (lots) ;
+                calculé pour le bail si absent
 
         Returns:
             bytes: Contenu du PDF généré
         """
         from io import BytesIO
-        from django.db.models import Sum, Q
-        from .models import Depense, Consommation, Ajustement, Regularisation
-        from .calculators import BailCalculator
+        from .regularisation import AJUSTEMENT, DEPENSE, calculer_regularisation
 
         logger.info(f"Génération régularisation pour {self.bail}, période {date_debut} au {date_fin}")
 
-        # Convertir en date si string
-        if isinstance(date_debut, str):
-            date_debut = datetime.strptime(date_debut, '%Y-%m-%d').date()
-        if isinstance(date_fin, str):
-            date_fin = datetime.strptime(date_fin, '%Y-%m-%d').date()
-
-        # Calculs via BailCalculator
-        total_provisions, details_provisions = BailCalculator.calculer_provisions_mensuelles(
-            self.bail, date_debut, date_fin
-        )
-
-        # Calcul de la durée et présence
-        nb_jours_periode = (date_fin - date_debut).days + 1
-        debut_occup = max(date_debut, self.bail.date_debut)
-        fin_occup = date_fin if not self.bail.date_fin else min(date_fin, self.bail.date_fin)
-
-        nb_jours_presence = 0
-        if debut_occup <= fin_occup:
-            nb_jours_presence = (fin_occup - debut_occup).days + 1
-
-        ratio_temps = (
-            Decimal(nb_jours_presence) / Decimal(nb_jours_periode)
-            if nb_jours_periode > 0 else Decimal('0')
-        )
-
-        # Liste des détails calculs pour annexe
-        details_calculs = []
-        details_calculs.append("--- PARAMÈTRES GÉNÉRAUX ---")
-        details_calculs.append(f"Période Régul : {date_debut} au {date_fin} ({nb_jours_periode} jours)")
-        details_calculs.append(f"Présence Locataire : {nb_jours_presence} jours (Ratio global : {ratio_temps:.6f})")
-        details_calculs.append("")
-        details_calculs.append("--- DÉTAIL DÉPENSES ---")
-
-        # Récupérer les dépenses avec select_related pour éviter les N+1 queries
-        depenses = Depense.objects.filter(
-            Q(immeuble=self.bail.local.immeuble) &
-            (
-                Q(date__range=[date_debut, date_fin]) |
-                Q(date_debut__lte=date_fin, date_fin__gte=date_debut)
-            )
-        ).select_related('cle_repartition').distinct()
-
-        # Pré-charger les quote-parts pour le local concerné (évite N+1 queries dans la boucle)
-        from .models import QuotePart
-        local_quote_parts = {
-            qp.cle_id: qp.valeur
-            for qp in QuotePart.objects.filter(local=self.bail.local)
-        }
-        # Pré-charger les totaux par clé
-        from django.db.models import Sum as AggSum
-        cle_ids = [d.cle_repartition_id for d in depenses if d.cle_repartition_id]
-        cle_totals = dict(
-            QuotePart.objects.filter(cle_id__in=cle_ids)
-            .values_list('cle_id')
-            .annotate(total=AggSum('valeur'))
-            .values_list('cle_id', 'total')
-        )
-
-        total_part_locataire = Decimal('0')
+        if decompte is None:
+            decompte = calculer_regularisation(self.bail, date_debut, date_fin)
+        date_debut, date_fin = decompte.date_debut, decompte.date_fin
 
         # Créer PDF en mémoire
         buffer = BytesIO()
@@ -520,7 +503,7 @@ class PDFGenerator:
 
         # Temps de présence
         self.p.setFont("Helvetica-Oblique", 8)
-        self.p.drawString(2*cm, 20.5*cm, f"Temps de présence du locataire : {nb_jours_presence} jours sur {nb_jours_periode} jours (Prorata : {ratio_temps*100:.2f}%)")
+        self.p.drawString(2*cm, 20.5*cm, f"Temps de présence du locataire : {decompte.nb_jours_presence} jours sur {decompte.nb_jours_periode} jours (Prorata : {decompte.ratio_temps*100:.2f}%)")
 
         # TABLEAU DES DÉPENSES
         y = 19*cm
@@ -537,141 +520,21 @@ class PDFGenerator:
         self.p.line(2*cm, y - 0.2*cm, 19*cm, y - 0.2*cm)
         y -= 0.5*cm
 
-        # Lignes de dépenses
+        # Dépenses, consommations puis ajustements
         self.p.setFont("Helvetica", 8)
-        for depense in depenses:
-            cle = depense.cle_repartition
-            if cle:
-                qp_valeur = local_quote_parts.get(cle.id)
-                total_cle = cle_totals.get(cle.id, 0)
-
-                if qp_valeur and total_cle > 0:
-                    part_theorique = (depense.montant * qp_valeur) / total_cle
-
-                    # LOGIQUE PRORATA INTELLIGENTE
-                    if depense.date_debut and depense.date_fin:
-                        duree_depense = (depense.date_fin - depense.date_debut).days + 1
-                        if duree_depense <= 0:
-                            duree_depense = 1
-
-                        start_inter = max(depense.date_debut, date_debut)
-                        end_inter = min(depense.date_fin, date_fin)
-                        start_final = max(start_inter, debut_occup)
-                        end_final = min(end_inter, fin_occup)
-
-                        nb_jours_facturables = 0
-                        if start_final <= end_final:
-                            nb_jours_facturables = (end_final - start_final).days + 1
-
-                        part_reelle = (
-                            part_theorique * Decimal(nb_jours_facturables) / Decimal(duree_depense)
-                        ).quantize(CENTIME, rounding=ROUND_HALF_UP)
-
-                        details_calculs.append(f"[Dépense] {depense.libelle} ({format_euro(depense.montant)})")
-                        details_calculs.append(f"  > Période facture : {depense.date_debut} au {depense.date_fin} ({duree_depense} jours)")
-                        details_calculs.append(f"  > Intersection présence : {nb_jours_facturables} jours")
-                        details_calculs.append(f"  > Calcul : {part_theorique:.2f}€ x ({nb_jours_facturables}/{duree_depense}) = {part_reelle:.2f}€")
-                    else:
-                        if not (date_debut <= depense.date <= date_fin):
-                            continue
-                        part_reelle = (part_theorique * ratio_temps).quantize(
-                            CENTIME, rounding=ROUND_HALF_UP
-                        )
-
-                        details_calculs.append(f"[Dépense] {depense.libelle} ({format_euro(depense.montant)})")
-                        details_calculs.append(f"  > Sans période (Date: {depense.date}) -> Lissage global")
-                        details_calculs.append(f"  > Calcul : {part_theorique:.2f}€ x Ratio {ratio_temps:.4f} = {part_reelle:.2f}€")
-
-                    total_part_locataire += part_reelle
-
-                    # Vérifier saut de page
-                    y = self._check_and_new_page(y)
-
-                    libelle_aff = f"{depense.libelle} ({cle.nom})"
-                    if depense.date_debut and depense.date_fin:
-                        libelle_aff += f" [{depense.date_debut.strftime('%d/%m')} au {depense.date_fin.strftime('%d/%m')}]"
-
-                    self.p.drawString(2*cm, y, libelle_aff[:75])
-                    self.p.drawString(12*cm, y, format_euro(depense.montant))
-                    self.p.drawString(16*cm, y, format_euro(part_reelle))
-                    y -= 0.6*cm
-
-        # CONSOMMATIONS
-        consommations = Consommation.objects.filter(
-            Q(local=self.bail.local) &
-            (
-                Q(date_releve__range=[date_debut, date_fin]) |
-                Q(date_debut__lte=date_fin, date_releve__gte=date_debut)
-            )
-        ).select_related('cle_repartition').distinct()
-
-        details_calculs.append("")
-        details_calculs.append("--- DÉTAIL CONSOMMATIONS ---")
-
-        for conso in consommations:
-            cle = conso.cle_repartition
-            if not cle.prix_unitaire:
-                # Sans prix unitaire, la consommation ne peut pas être valorisée :
-                # on le dit explicitement au lieu de l'omettre en silence.
-                avertissement = (
-                    f"[Conso] {cle.nom} : releve de {conso.quantite} NON FACTURE "
-                    f"(aucun prix unitaire defini sur la cle de repartition)."
-                )
-                details_calculs.append(avertissement)
-                logger.warning("%s - %s", self.bail, avertissement)
-                continue
-
-            quantite_reelle = Decimal(conso.quantite)
-
-            if conso.date_debut:
-                duree_conso = (conso.date_releve - conso.date_debut).days + 1
-                if duree_conso <= 0:
-                    duree_conso = 1
-
-                start_inter = max(conso.date_debut, date_debut)
-                end_inter = min(conso.date_releve, date_fin)
-
-                nb_jours_conso = 0
-                if start_inter <= end_inter:
-                    nb_jours_conso = (end_inter - start_inter).days + 1
-
-                quantite_reelle = (
-                    quantite_reelle * Decimal(nb_jours_conso) / Decimal(duree_conso)
-                )
-
-                details_calculs.append(f"[Conso] {cle.nom} (Relevé: {conso.quantite})")
-                details_calculs.append(f"  > Période relevé : {conso.date_debut} au {conso.date_releve} ({duree_conso} jours)")
-                details_calculs.append(f"  > Intersection régul : {nb_jours_conso} jours")
-                details_calculs.append(f"  > Qté retenue : {conso.quantite:.2f} x ({nb_jours_conso}/{duree_conso}) = {quantite_reelle:.2f}")
-            else:
-                details_calculs.append(f"[Conso] {cle.nom} (Relevé: {conso.quantite}) - 100% retenu")
-
-            montant_conso = (quantite_reelle * cle.prix_unitaire).quantize(
-                CENTIME, rounding=ROUND_HALF_UP
-            )
-            total_part_locataire += montant_conso
-
+        for ligne in decompte.lignes:
             y = self._check_and_new_page(y)
 
-            libelle_conso = f"{cle.nom} (Relevé: {conso.quantite})"
-            if conso.date_debut:
-                libelle_conso += f" [Prorata: {quantite_reelle:.2f}]"
-
-            self.p.drawString(2*cm, y, libelle_conso[:75])
-            self.p.drawString(12*cm, y, f"PU: {format_euro(cle.prix_unitaire)}")
-            self.p.drawString(16*cm, y, format_euro(montant_conso))
-            y -= 0.6*cm
-
-        # AJUSTEMENTS
-        ajustements = Ajustement.objects.filter(bail=self.bail, date__range=[date_debut, date_fin])
-        for ajustement in ajustements:
-            total_part_locataire += ajustement.montant
-
-            y = self._check_and_new_page(y)
+            if ligne['nature'] == DEPENSE:
+                colonne_immeuble = format_euro(ligne['montant_immeuble'])
+            elif ligne['nature'] == AJUSTEMENT:
+                colonne_immeuble = "-"
+            else:
+                colonne_immeuble = f"PU: {format_euro(ligne['prix_unitaire'])}"
 
-            self.p.drawString(2*cm, y, f"Ajustement : {ajustement.libelle}"[:75])
-            self.p.drawString(12*cm, y, "-")
-            self.p.drawString(16*cm, y, format_euro(ajustement.montant))
+            self.p.drawString(2*cm, y, ligne['libelle'][:75])
+            self.p.drawString(12*cm, y, colonne_immeuble)
+            self.p.drawString(16*cm, y, format_euro(ligne['part']))
             y -= 0.6*cm
 
         # BILAN
@@ -679,16 +542,12 @@ class PDFGenerator:
         y = self._check_and_new_page(y, min_height=4*cm)
 
         self.p.setFont("Helvetica-Bold", 11)
-        self.p.drawString(10*cm, y, f"TOTAL DÉPENSES RÉELLES : {format_euro(total_part_locataire)}")
-
-        # Provisions (calculées par BailCalculator)
-        details_calculs.append("")
-        details_calculs.extend(details_provisions)
+        self.p.drawString(10*cm, y, f"TOTAL DÉPENSES RÉELLES : {format_euro(decompte.total_reel)}")
 
         y -= 1*cm
-        self.p.drawString(10*cm, y, f"PROVISIONS VERSÉES : -{format_euro(total_provisions)}")
+        self.p.drawString(10*cm, y, f"PROVISIONS VERSÉES : -{format_euro(decompte.total_provisions)}")
 
-        solde = total_part_locataire - total_provisions
+        solde = decompte.solde
         y -= 1.5*cm
         self.p.setFont("Helvetica-Bold", 14)
         if solde > 0:
@@ -698,23 +557,7 @@ class PDFGenerator:
 
         # HISTORISATION
         if enregistrer_historique:
-            # Rejouer le meme decompte met a jour la ligne existante au lieu
-            # d'empiler un doublon dans l'historique du bail.
-            regularisation, cree = Regularisation.objects.update_or_create(
-                bail=self.bail,
-                date_debut=date_debut,
-                date_fin=date_fin,
-                defaults={
-                    'montant_reel': total_part_locataire,
-                    'montant_provisions': total_provisions,
-                    'solde': solde,
-                },
-            )
-            regularisation.full_clean(exclude=['bail'])
-            logger.info(
-                "Régularisation %s en base : solde=%s",
-                "créée" if cree else "mise à jour", solde,
-            )
+            decompte.enregistrer()
 
         # PAGE ANNEXE (DÉTAILS CALCULS)
         self.p.showPage()
@@ -723,7 +566,7 @@ class PDFGenerator:
         self.p.setFont("Courier", 9)
         y_annex = 27*cm
 
-        for line in details_calculs:
+        for line in decompte.details_calculs:
             self.p.drawString(2*cm, y_annex, line)
             y_annex -= 0.5*cm
             if y_annex < 2*cm:
@@ -877,23 +720,26 @@ class PDFGenerator:
         if isinstance(date_application, str):
             date_application = datetime.strptime(date_application, '%Y-%m-%d').date()
 
+        # Tarification révisée : celle en vigueur la veille de l'application (la
+        # nouvelle tarification peut déjà exister quand le courrier est rendu)
+        tarif_revise = (
+            self.bail.get_tarification_at(date_application - timedelta(days=1))
+            or self.bail.tarification_actuelle
+        )
+
         # Récupérer l'ancien indice
         if ancien_indice is None:
-            tarif_actuel = self.bail.tarification_actuelle
-            if tarif_actuel and tarif_actuel.indice_reference:
-                ancien_indice = tarif_actuel.indice_reference
+            if tarif_revise and tarif_revise.indice_reference:
+                ancien_indice = tarif_revise.indice_reference
             else:
                 raise ValueError("Impossible de calculer la révision : aucun indice de référence dans le bail")
 
-        # Calcul du nouveau loyer
-        ancien_loyer = self.bail.loyer_hc
+        ancien_loyer = tarif_revise.loyer_hc if tarif_revise else Decimal('0')
         nouveau_loyer = (
             ancien_loyer * Decimal(str(nouvel_indice)) / Decimal(str(ancien_indice))
         ).quantize(CENTIME, rounding=ROUND_HALF_UP)
 
-        # Récupérer l'ancien trimestre
-        tarif_actuel = self.bail.tarification_actuelle
-        ancien_trimestre = tarif_actuel.trimestre_reference if tarif_actuel else "?"
+        ancien_trimestre = tarif_revise.trimestre_reference if tarif_revise else "?"
 
         # GÉNÉRATION PDF
         buffer = BytesIO()
@@ -911,7 +757,7 @@ class PDFGenerator:
         self.p.setFont("Helvetica-Bold", 12)
         self.p.drawString(12*cm, 26*cm, "LOCATAIRE :")
         self.p.setFont("Helvetica", 12)
-        occupant = self.bail.occupants.filter(role='LOCATAIRE').first()
+        occupant = self.bail.locataire_principal
         if occupant:
             self.p.drawString(12*cm, 25.5*cm, f"{occupant.nom} {occupant.prenom}")
         self.p.drawString(12*cm, 25*cm, self.bail.local.immeuble.adresse)
@@ -0,0 +1,163 @@
+"""
+Synthèse du portefeuille : indicateurs par immeuble, totaux et projection.
+
+Un seul calcul pour les trois tableaux de bord (accueil de l'application,
+patrimoine de l'application, patrimoine de l'admin) : les immeubles et
+leurs crédits sont chargés une fois, les indicateurs lus dans les
+instantanés du jour (core/indicateurs.py), la projection calculée sur les
+échéanciers en cache. Le nombre de requêtes ne dépend pas du nombre
+d'immeubles.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from .indicateurs import indicateurs_immeubles
+from .projection_monte_carlo import ProjectionMonteCarlo
+
+# Hypothèse de revalorisation du patrimoine utilisée par la projection à 10 ans.
+# Affichée telle quelle sur le graphique : ce n'est pas une donnée mesurée.
+TAUX_REVALORISATION_ANNUEL = Decimal('1.02')
+
+DUREE_PROJECTION = 10
+
+
+class SynthesePortefeuille:
+    """
+    Indicateurs et projection d'un ensemble d'immeubles (tous par défaut).
+
+    Attributs:
+        immeubles (list): Immeubles, triés par nom, propriétaire et crédits chargés
+        indicateurs (dict): {immeuble_id: indicateurs du jour}
+        totaux (dict): valeur, crd, valeur_nette, cashflow, nb_immeubles, nb_locaux
+    """
+
+    def __init__(self, immeubles=None):
+        """
+        Args:
+            immeubles: QuerySet d'Immeuble (None = tous les immeubles)
+        """
+        from .models import Immeuble
+
+        if immeubles is None:
+            immeubles = Immeuble.objects.all()
+        self.immeubles = list(
+            immeubles.select_related('proprietaire').prefetch_related('credits').order_by('nom')
+        )
+        self.indicateurs = indicateurs_immeubles(self.immeubles)
+
+        zero = Decimal('0')
+        valeur = sum((kpi['valeur'] for kpi in self.indicateurs.values()), zero)
+        crd = sum((kpi['crd'] for kpi in self.indicateurs.values()), zero)
+        self.totaux = {
+            'valeur': valeur,
+            'crd': crd,
+            'valeur_nette': valeur - crd,
+            'cashflow': sum((kpi['cashflow'] for kpi in self.indicateurs.values()), zero),
+            'nb_immeubles': len(self.immeubles),
+            'nb_locaux': sum(kpi['nb_locaux'] for kpi in self.indicateurs.values()),
+        }
+
+    def lignes(self):
+        """Yields: (immeuble, indicateurs), dans l'ordre des noms."""
+        for immeuble in self.immeubles:
+            yield immeuble, self.indicateurs[immeuble.pk]
+
+    def lignes_graphique(self, avec_regime=False):
+        """Données par immeuble des graphiques (montants en float pour json_script)."""
+        donnees = []
+        for immeuble, kpi in self.lignes():
+            ligne = {
+                'id': immeuble.id,
+                'nom': immeuble.nom,
+                'valeur_actuelle': float(kpi['valeur']),
+                'capital_restant_du': float(kpi['crd']),
+                'valeur_nette': float(kpi['valeur_nette']),
+                'rendement_brut': kpi['rendement_brut'],
+                'cashflow': float(kpi['cashflow']),
+            }
+            if avec_regime:
+                ligne['regime_fiscal_display'] = immeuble.get_regime_fiscal_display()
+            donnees.append(ligne)
+        return donnees
+
+    def _credits(self):
+        return [credit for immeuble in self.immeubles for credit in immeuble.credits.all()]
+
+    def _crd_par_annee(self, annees):
+        """CRD total au 31 décembre de chaque année, lu dans les échéanciers en cache."""
+        credits = self._credits()
+        return [
+            sum((credit.get_capital_restant_du_at(date(annee, 12, 31)) for credit in credits), Decimal('0'))
+            for annee in annees
+        ]
+
+    def projection(self, duree=DUREE_PROJECTION):
+        """
+        Projection au 31 décembre de l'année en cours et des `duree` suivantes.
+
+        Valeur revalorisée de TAUX_REVALORISATION_ANNUEL par an, CRD lu dans
+        les échéanciers en cache (aucune requête).
+
+        Returns:
+            dict: labels, valeurs, crd, nette (listes arrondies à l'euro)
+        """
+        premiere_annee = date.today().year
+        annees = range(premiere_annee, premiere_annee + duree + 1)
+        projection = {'labels': [], 'valeurs': [], 'crd': [], 'nette': []}
+
+        for i, (annee, crd) in enumerate(zip(annees, self._crd_par_annee(annees))):
+            valeur = float(self.totaux['valeur'] * TAUX_REVALORISATION_ANNUEL ** i)
+            crd = float(crd)
+            projection['labels'].append(str(annee))
+            projection['valeurs'].append(round(valeur, 0))
+            projection['crd'].append(round(crd, 0))
+            projection['nette'].append(round(valeur - crd, 0))
+
+        return projection
+
+    def projection_stochastique(self, duree=DUREE_PROJECTION, nb_trajectoires=None):
+        """
+        Bandes de percentiles (P10, P50, P90) du patrimoine net et du cash-flow
+        annuel, mêmes années que projection() (voir core/projection_monte_carlo.py).
+
+        Loyers : cash-flow mensuel actuel + mensualités des crédits, soit les
+        loyers de tous les baux en cours. Charges : charges saisies de l'année
+        précédente hors intérêts et assurance d'emprunt (une requête).
+
+        Returns:
+            dict: labels, nette_p10/p50/p90, cashflow_p10/p50/p90 (euros arrondis)
+        """
+        from .models import ChargeFiscale
+
+        premiere_annee = date.today().year
+        annees = range(premiere_annee, premiere_annee + duree + 1)
+        credits = self._credits()
+
+        loyers_mensuels = self.totaux['cashflow'] + sum((credit.mensualite for credit in credits), Decimal('0'))
+        charges = ChargeFiscale.objects.filter(
+            immeuble__in=self.immeubles, annee=premiere_annee - 1,
+        ).exclude(type_charge__in=('INTERETS', 'ASSURANCE_EMPRUNT')).aggregate(total=Sum('montant'))['total']
+
+        # Échéances réelles de l'échéancier en cache : le capital d'un prêt in
+        # fine sort de la trésorerie l'année où le CRD tombe à zéro.
+        annuites = [
+            sum((
+                credit.tableau_amortissement.annuites_entre(date(annee, 1, 1), date(annee, 12, 31))
+                for credit in credits if credit.duree_mois
+            ), Decimal('0'))
+            for annee in annees
+        ]
+
+        projection = ProjectionMonteCarlo(
+            self.totaux['valeur'], loyers_mensuels * 12, charges or 0,
+            self._crd_par_annee(annees), annuites,
+        )
+        bandes = projection.simuler(nb_trajectoires) if nb_trajectoires else projection.simuler()
+
+        resultat = {'labels': [str(annee) for annee in annees]}
+        for nom, par_percentile in bandes.items():
+            for rang, valeurs in par_percentile.items():
+                resultat[f"{nom}_p{rang}"] = valeurs
+        return resultat
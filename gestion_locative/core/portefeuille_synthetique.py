@@ -0,0 +1,364 @@
+"""
+Portefeuille synthétique pour le profilage et les bancs de performance.
+
+Génère, de façon déterministe à partir d'une graine, un portefeuille complet :
+immeubles, locaux, baux successifs avec leurs révisions annuelles, occupants,
+vacances, crédits et échéanciers, dépenses, relevés de compteurs,
+régularisations, estimations et charges fiscales. Tout est inséré par
+bulk_create, immeuble par immeuble ; la table des loyers dus est remplie
+dans la foulée, sans passer par les signaux.
+
+Les contraintes du modèle sont respectées : une seule tarification ouverte par
+bail (one_active_tarification_per_bail), une régularisation par bail et par
+année (une_regularisation_par_periode).
+"""
+import logging
+import random
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+
+from .indicateurs import invalider_indicateurs
+from .loyers_dus import lignes_loyers_dus
+from .models import (
+    Ajustement, Bail, BailTarification, ChargeFiscale, CleRepartition, Consommation,
+    CreditImmobilier, Depense, EcheanceCredit, EstimationValeur, Immeuble, Local,
+    LoyerDu, Occupant, Proprietaire, QuotePart, Regularisation, VacanceLocative,
+)
+from .patrimoine_calculators import CreditGenerator
+from .repartition import invalider_repartition
+
+logger = logging.getLogger(__name__)
+
+CENTIME = Decimal('0.01')
+TAILLE_LOT = 1000
+
+VILLES = [
+    ('Lyon', '69003'), ('Villeurbanne', '69100'), ('Grenoble', '38000'),
+    ('Saint-Étienne', '42000'), ('Annecy', '74000'), ('Clermont-Ferrand', '63000'),
+]
+RUES = ['rue de la République', 'avenue Jean Jaurès', 'rue Garibaldi', 'cours Gambetta',
+        'rue Paul Bert', 'boulevard des Belges', 'rue Victor Hugo', 'quai Perrache']
+NOMS = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand',
+        'Leroy', 'Moreau', 'Simon', 'Laurent', 'Lefebvre', 'Michel', 'Garcia', 'Roux']
+PRENOMS = ['Camille', 'Léa', 'Manon', 'Chloé', 'Hugo', 'Lucas', 'Louis', 'Jules',
+           'Emma', 'Inès', 'Nathan', 'Sarah', 'Paul', 'Alice', 'Tom', 'Zoé']
+BANQUES = ['Crédit Agricole', 'BNP Paribas', 'Société Générale', 'LCL', 'Caisse d\'Épargne']
+TYPES_LOCAUX = ['APPART'] * 7 + ['COMMERCE', 'PARKING', 'BUREAU']
+DEPENSES = [('Électricité parties communes', 400, 1500), ('Entretien ménage', 1200, 4000),
+            ('Taxe ordures ménagères', 300, 1200), ('Assurance immeuble', 600, 2500)]
+
+
+def _euros(valeur):
+    return Decimal(valeur).quantize(CENTIME, rounding=ROUND_HALF_UP)
+
+
+class GenerateurPortefeuille:
+    """
+    Générateur de portefeuille synthétique.
+
+    Deux générations avec la même graine, les mêmes paramètres et la même
+    date de référence produisent exactement les mêmes données.
+    """
+
+    def __init__(self, graine=0, jusqu_au=None):
+        """
+        Args:
+            graine (int): Graine du générateur pseudo-aléatoire
+            jusqu_au (date): Date de référence (défaut : aujourd'hui) ; les
+                baux en cours et l'historique s'arrêtent là
+        """
+        self.aleas = random.Random(graine)
+        self.jusqu_au = jusqu_au or date.today()
+        self.compteurs = {}
+
+    def generer(self, nb_immeubles, locaux_par_immeuble=8, historique=20):
+        """
+        Crée le portefeuille.
+
+        Args:
+            nb_immeubles (int): Nombre d'immeubles
+            locaux_par_immeuble (int): Nombre moyen de locaux par immeuble
+            historique (int): Ancienneté maximale des acquisitions, en années
+
+        Returns:
+            dict: Nombre d'objets créés, par modèle
+        """
+        proprietaires = self._creer(Proprietaire, [
+            Proprietaire(
+                nom=f"SCI {self.aleas.choice(NOMS)} {i + 1}", adresse=self._adresse(),
+                ville=ville, code_postal=code_postal, type_proprietaire='SOCIETE',
+            )
+            for i, (ville, code_postal) in enumerate(
+                self.aleas.choice(VILLES) for _ in range(max(1, nb_immeubles // 10))
+            )
+        ])
+
+        for numero in range(nb_immeubles):
+            with transaction.atomic():
+                immeuble = self._generer_immeuble(
+                    numero, proprietaires[numero % len(proprietaires)],
+                    locaux_par_immeuble, historique,
+                )
+            invalider_indicateurs(immeuble.pk)
+            invalider_repartition(immeuble.pk)
+            logger.debug(f"Portefeuille synthétique : immeuble {numero + 1}/{nb_immeubles}")
+
+        return dict(self.compteurs)
+
+    # ─── Helpers ──────────────────────────────────────────────────────────
+
+    def _compter(self, modele, nombre):
+        nom = modele._meta.verbose_name_plural
+        self.compteurs[nom] = self.compteurs.get(nom, 0) + nombre
+
+    def _creer(self, modele, objets):
+        """bulk_create par lots ; les pk sont renseignés sur les objets."""
+        objets = modele.objects.bulk_create(objets, batch_size=TAILLE_LOT)
+        self._compter(modele, len(objets))
+        return objets
+
+    def _adresse(self):
+        return f"{self.aleas.randint(1, 180)} {self.aleas.choice(RUES)}"
+
+    def _date_entre(self, debut, fin):
+        return debut + timedelta(days=self.aleas.randint(0, max(0, (fin - debut).days)))
+
+    # ─── Immeuble complet ─────────────────────────────────────────────────
+
+    def _generer_immeuble(self, numero, proprietaire, locaux_par_immeuble, historique):
+        aleas = self.aleas
+        ville, code_postal = aleas.choice(VILLES)
+        date_achat = self._date_entre(
+            self.jusqu_au - relativedelta(years=historique), self.jusqu_au - relativedelta(years=1)
+        ).replace(day=1)
+        prix_achat = Decimal(aleas.randrange(150_000, 2_500_000, 5_000))
+
+        immeuble, = self._creer(Immeuble, [Immeuble(
+            proprietaire=proprietaire, nom=f"Résidence {numero + 1:04d}",
+            adresse=self._adresse(), ville=ville, code_postal=code_postal,
+            prix_achat=prix_achat, date_achat=date_achat,
+            frais_notaire=_euros(prix_achat * Decimal('0.075')),
+            frais_agence=_euros(prix_achat * Decimal(aleas.choice(['0', '0.03', '0.05']))),
+            regime_fiscal=aleas.choice(['REVENUS_FONCIERS'] * 3 + ['LMNP_REEL', 'MICRO_FONCIER']),
+        )])
+        cle_generale, cle_eau = self._creer(CleRepartition, [
+            CleRepartition(immeuble=immeuble, nom="Charges générales"),
+            CleRepartition(
+                immeuble=immeuble, nom="Eau froide", mode_repartition='CONSOMMATION',
+                prix_unitaire=Decimal(aleas.randint(350, 550)) / 100,
+            ),
+        ])
+
+        nb_locaux = max(1, round(aleas.gauss(locaux_par_immeuble, locaux_par_immeuble / 4)))
+        locaux = self._creer(Local, [
+            Local(
+                immeuble=immeuble, numero_porte=f"{etage}{rang:02d}", etage=etage,
+                surface_m2=Decimal(aleas.randint(15, 120)), type_local=aleas.choice(TYPES_LOCAUX),
+            )
+            for rang, etage in ((rang, rang // 4) for rang in range(nb_locaux))
+        ])
+        self._creer(QuotePart, [
+            QuotePart(cle=cle_generale, local=local, valeur=local.surface_m2 * 10)
+            for local in locaux
+        ])
+
+        self._generer_baux(immeuble, locaux, date_achat)
+        self._generer_credits(immeuble, date_achat, prix_achat)
+        self._generer_charges(immeuble, locaux, cle_generale, cle_eau, date_achat)
+        return immeuble
+
+    def _generer_baux(self, immeuble, locaux, date_achat):
+        """Locations successives de chaque local, séparées par des vacances."""
+        aleas = self.aleas
+        baux, tarifs_par_bail, vacances = [], [], []
+
+        for local in locaux:
+            loyer_m2 = Decimal(aleas.randint(900, 1800)) / 100
+            debut = date_achat + relativedelta(months=aleas.randint(0, 3))
+            while debut <= self.jusqu_au:
+                fin = debut + relativedelta(years=aleas.randint(1, 9), months=aleas.randint(0, 11))
+                fin = fin.replace(day=1) - timedelta(days=1)
+                en_cours = fin >= self.jusqu_au
+                bail = Bail(
+                    local=local, date_debut=debut, date_fin=None if en_cours else fin,
+                    actif=en_cours,
+                    frequence_paiement='TRIMESTRIEL' if local.type_local == 'COMMERCE' else 'MENSUEL',
+                    soumis_tva=local.type_local in ('COMMERCE', 'BUREAU'),
+                    depot_garantie=_euros(local.surface_m2 * loyer_m2),
+                )
+                baux.append(bail)
+                tarifs_par_bail.append(self._tarifications(bail, local, loyer_m2, fin))
+                if en_cours:
+                    break
+                # Vacance entre deux locations (recherche de locataire, travaux)
+                reprise = fin + timedelta(days=1) + relativedelta(months=aleas.randint(0, 4))
+                if reprise > fin + timedelta(days=1):
+                    vacances.append(VacanceLocative(
+                        local=local, date_debut=fin + timedelta(days=1),
+                        date_fin=reprise - timedelta(days=1) if reprise <= self.jusqu_au else None,
+                        motif=aleas.choice(['RECHERCHE', 'RECHERCHE', 'TRAVAUX']),
+                    ))
+                loyer_m2 *= Decimal('1.04')
+                debut = reprise
+
+        self._creer(Bail, baux)
+        for bail, tarifs in zip(baux, tarifs_par_bail):
+            for tarif in tarifs:
+                tarif.bail = bail
+        self._creer(BailTarification, [t for tarifs in tarifs_par_bail for t in tarifs])
+        self._creer(VacanceLocative, vacances)
+
+        occupants, regularisations, ajustements, loyers = [], [], [], []
+        for bail, tarifs in zip(baux, tarifs_par_bail):
+            nom = aleas.choice(NOMS)
+            occupants.append(Occupant(
+                bail=bail, nom=nom, prenom=aleas.choice(PRENOMS), role='LOCATAIRE',
+                email=f"{nom.lower()}.{bail.pk}@example.org",
+            ))
+            if aleas.random() < 0.3:
+                occupants.append(Occupant(
+                    bail=bail, nom=aleas.choice(NOMS), prenom=aleas.choice(PRENOMS), role='GARANT',
+                ))
+            regularisations += self._regularisations(bail, tarifs)
+            if aleas.random() < 0.1:
+                ajustements.append(Ajustement(
+                    bail=bail, date=self._date_entre(bail.date_debut, bail.date_fin or self.jusqu_au),
+                    libelle="Remise commerciale", montant=-Decimal(aleas.randint(20, 200)),
+                ))
+            loyers += [
+                LoyerDu(bail=bail, immeuble=immeuble, **ligne)
+                for ligne in lignes_loyers_dus(bail, tarifs)
+            ]
+
+        self._creer(Occupant, occupants)
+        self._creer(Regularisation, regularisations)
+        self._creer(Ajustement, ajustements)
+        self._creer(LoyerDu, loyers)
+
+    def _tarifications(self, bail, local, loyer_m2, fin):
+        """Tarification initiale puis révision à chaque anniversaire ; seule la dernière reste ouverte."""
+        aleas = self.aleas
+        loyer = _euros(local.surface_m2 * loyer_m2)
+        charges = _euros(local.surface_m2 * Decimal(aleas.randint(150, 300)) / 100)
+        if bail.frequence_paiement == 'TRIMESTRIEL':
+            loyer *= 3
+        indice = Decimal(aleas.randint(12500, 13500)) / 100
+
+        tarifs = []
+        debut = bail.date_debut
+        while True:
+            suivante = debut + relativedelta(years=1)
+            derniere = suivante > (bail.date_fin or self.jusqu_au)
+            tarifs.append(BailTarification(
+                date_debut=debut,
+                date_fin=bail.date_fin if derniere else suivante - timedelta(days=1),
+                loyer_hc=loyer, charges=charges, taxes=Decimal('0'), indice_reference=indice,
+                trimestre_reference=f"T{(debut.month - 1) // 3 + 1} {debut.year}",
+                reason="Bail initial" if not tarifs else "Révision IRL",
+            ))
+            if derniere:
+                return tarifs
+            variation = 1 + Decimal(aleas.randint(50, 350)) / 10000
+            indice = (indice * variation).quantize(CENTIME)
+            loyer = _euros(loyer * variation)
+            debut = suivante
+
+    def _regularisations(self, bail, tarifs):
+        """Une régularisation par année civile close pendant le bail."""
+        if bail.type_charges != 'PROVISION':
+            return []
+        regularisations = []
+        for annee in range(bail.date_debut.year, self.jusqu_au.year):
+            debut = max(bail.date_debut, date(annee, 1, 1))
+            fin = min(bail.date_fin or date(annee, 12, 31), date(annee, 12, 31))
+            if debut > fin:
+                continue
+            charges = next(
+                (t.charges for t in reversed(tarifs) if t.date_debut <= debut), tarifs[0].charges
+            )
+            provisions = _euros(charges * ((fin - debut).days + 1) / Decimal('30.4375'))
+            reel = _euros(provisions * Decimal(self.aleas.randint(85, 120)) / 100)
+            regularisations.append(Regularisation(
+                bail=bail, date_debut=debut, date_fin=fin, montant_reel=reel,
+                montant_provisions=provisions, solde=reel - provisions,
+                payee=True, date_paiement=date(annee + 1, 3, 31),
+            ))
+        return regularisations
+
+    def _generer_credits(self, immeuble, date_achat, prix_achat):
+        aleas = self.aleas
+        credits = [CreditImmobilier(
+            immeuble=immeuble, nom_banque=aleas.choice(BANQUES),
+            numero_pret=f"PR{aleas.randint(10**7, 10**8 - 1)}",
+            capital_emprunte=_euros(prix_achat * Decimal(aleas.randint(60, 100)) / 100),
+            taux_interet=Decimal(aleas.randint(80, 450)) / 100,
+            duree_mois=aleas.choice([180, 240, 240, 300]), date_debut=date_achat,
+            assurance_mensuelle=Decimal(aleas.randint(15, 90)),
+        )]
+        if aleas.random() < 0.25:
+            travaux = date_achat + relativedelta(years=aleas.randint(2, 8))
+            if travaux < self.jusqu_au:
+                credits.append(CreditImmobilier(
+                    immeuble=immeuble, nom_banque=aleas.choice(BANQUES),
+                    capital_emprunte=Decimal(aleas.randrange(20_000, 150_000, 1_000)),
+                    taux_interet=Decimal(aleas.randint(100, 500)) / 100,
+                    duree_mois=aleas.choice([84, 120, 180]), date_debut=travaux,
+                ))
+        credits = self._creer(CreditImmobilier, credits)
+        self._creer(EcheanceCredit, [
+            EcheanceCredit(credit=credit, **echeance)
+            for credit in credits
+            for echeance in CreditGenerator(credit).generer_echeancier()
+        ])
+
+    def _generer_charges(self, immeuble, locaux, cle_generale, cle_eau, date_achat):
+        """Dépenses, relevés d'eau, charges fiscales et estimations, année par année."""
+        aleas = self.aleas
+        depenses, consommations, charges_fiscales, estimations = [], [], [], []
+        index = {local.pk: Decimal(aleas.randint(0, 500)) for local in locaux}
+        valeur = immeuble.prix_achat
+
+        for annee in range(date_achat.year, self.jusqu_au.year + 1):
+            debut_annee = max(date(annee, 1, 1), date_achat)
+            fin_annee = min(date(annee, 12, 31), self.jusqu_au)
+            for libelle, minimum, maximum in DEPENSES:
+                depenses.append(Depense(
+                    immeuble=immeuble, cle_repartition=cle_generale,
+                    date=self._date_entre(debut_annee, fin_annee), libelle=libelle,
+                    montant=_euros(aleas.randint(minimum, maximum) * (1 + Decimal(len(locaux)) / 10)),
+                    date_debut=debut_annee, date_fin=fin_annee,
+                ))
+            depenses.append(Depense(
+                immeuble=immeuble, cle_repartition=cle_eau, date=fin_annee,
+                libelle="Facture eau", montant=Decimal(aleas.randint(30, 60) * len(locaux)),
+                date_debut=debut_annee, date_fin=fin_annee,
+            ))
+            for local in locaux:
+                nouvel_index = index[local.pk] + Decimal(aleas.randint(10, 80))
+                consommations.append(Consommation(
+                    local=local, cle_repartition=cle_eau, date_debut=debut_annee,
+                    date_releve=fin_annee, index_debut=index[local.pk], index_fin=nouvel_index,
+                ))
+                index[local.pk] = nouvel_index
+            charges_fiscales.append(ChargeFiscale(
+                immeuble=immeuble, type_charge='TAXE_FONCIERE', annee=annee,
+                montant=_euros(immeuble.prix_achat * Decimal('0.012')),
+            ))
+            charges_fiscales.append(ChargeFiscale(
+                immeuble=immeuble, type_charge='ASSURANCE_PNO', annee=annee,
+                montant=Decimal(aleas.randint(200, 900)),
+            ))
+            valeur = _euros(valeur * Decimal(aleas.randint(98, 106)) / 100)
+            if annee > date_achat.year and (annee - date_achat.year) % 3 == 0:
+                estimations.append(EstimationValeur(
+                    immeuble=immeuble, date_estimation=date(annee, 6, 30), valeur_estimee=valeur,
+                    source=aleas.choice(['AGENT', 'NOTAIRE', 'DVF', 'MANUELLE']),
+                ))
+
+        self._creer(Depense, depenses)
+        self._creer(Consommation, consommations)
+        self._creer(ChargeFiscale, charges_fiscales)
+        self._creer(EstimationValeur, [e for e in estimations if e.date_estimation <= self.jusqu_au])
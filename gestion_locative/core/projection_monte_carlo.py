@@ -0,0 +1,121 @@
+"""
+Projection stochastique du portefeuille (Monte Carlo).
+
+La projection déterministe (SynthesePortefeuille.projection) applique un taux
+de revalorisation fixe. Ici, des milliers de trajectoires tirent chaque année :
+  - l'indexation IRL des loyers ;
+  - l'évolution de la valeur des biens ;
+  - le taux de vacance de l'année ;
+  - l'évolution des charges non récupérables.
+Les crédits restent déterministes (CRD et annuités lus dans les échéanciers).
+Le résultat est une bande de percentiles par année, pour le patrimoine net
+(valeur - CRD + trésorerie cumulée) et le cash-flow annuel.
+
+Les tirages portent sur les totaux du portefeuille (chocs de marché communs
+à tous les immeubles) : une trajectoire coûte quelques opérations par année,
+quel que soit le nombre d'immeubles. 2 000 trajectoires sur 10 ans se
+calculent en quelques dizaines de millisecondes, sans dépendance numérique.
+
+Les HYPOTHESES sont affichées avec le graphique : ce ne sont pas des données
+mesurées.
+"""
+import random
+from math import ceil
+
+# Moyenne et écart-type annuels ; vacance : loi bêta (moyenne a / (a + b))
+HYPOTHESES = {
+    'irl': (0.020, 0.010),
+    'valeur': (0.020, 0.050),
+    'charges': (0.025, 0.015),
+    'vacance': (1.0, 19.0),
+}
+
+NB_TRAJECTOIRES = 2000
+PERCENTILES = (10, 50, 90)
+GRAINE = 20240101
+
+
+def _percentile(valeurs_triees, rang):
+    """Percentile par la méthode du rang le plus proche (liste déjà triée)."""
+    indice = max(ceil(rang / 100 * len(valeurs_triees)) - 1, 0)
+    return valeurs_triees[indice]
+
+
+def libelle_hypotheses(hypotheses=None):
+    """Hypothèses en clair, pour la note sous le graphique."""
+    h = {**HYPOTHESES, **(hypotheses or {})}
+    vac_a, vac_b = h['vacance']
+    return (
+        f"IRL {h['irl'][0]:.1%} ± {h['irl'][1]:.1%}, "
+        f"valeur {h['valeur'][0]:.1%} ± {h['valeur'][1]:.1%}, "
+        f"charges {h['charges'][0]:.1%} ± {h['charges'][1]:.1%}, "
+        f"vacance moyenne {vac_a / (vac_a + vac_b):.1%} par an"
+    ).replace('.', ',')
+
+
+class ProjectionMonteCarlo:
+    """
+    Bandes de percentiles du patrimoine net et du cash-flow annuel.
+
+    Montants en float (euros) : c'est une projection, arrondie à l'euro pour
+    l'affichage.
+    """
+
+    def __init__(self, valeur, loyers_annuels, charges_annuelles, crd, annuites,
+                 hypotheses=None, graine=GRAINE):
+        """
+        Args:
+            valeur (float): Valeur actuelle du portefeuille
+            loyers_annuels (float): Loyers annuels actuels (tout loué)
+            charges_annuelles (float): Charges annuelles non récupérables hors crédit
+            crd (list): CRD au 31 décembre de chaque année projetée, année en cours
+                d'abord (déterministe)
+            annuites (list): Échéances de crédit payées chaque année (déterministe)
+            hypotheses (dict): Remplace tout ou partie de HYPOTHESES
+            graine (int): Graine du générateur (résultat reproductible)
+        """
+        self.valeur = float(valeur)
+        self.loyers_annuels = float(loyers_annuels)
+        self.charges_annuelles = float(charges_annuelles)
+        self.crd = [float(montant) for montant in crd]
+        self.annuites = [float(montant) for montant in annuites]
+        self.hypotheses = {**HYPOTHESES, **(hypotheses or {})}
+        self.graine = graine
+
+    def simuler(self, nb_trajectoires=NB_TRAJECTOIRES):
+        """
+        Returns:
+            dict: {'nette': {p: [par année]}, 'cashflow': {p: [par année]}}
+            pour chaque percentile p de PERCENTILES
+        """
+        tirage = random.Random(self.graine)
+        gauss, beta = tirage.gauss, tirage.betavariate
+        irl_moy, irl_et = self.hypotheses['irl']
+        val_moy, val_et = self.hypotheses['valeur']
+        ch_moy, ch_et = self.hypotheses['charges']
+        vac_a, vac_b = self.hypotheses['vacance']
+        duree = len(self.crd)
+
+        nette = [[0.0] * nb_trajectoires for _ in range(duree)]
+        cashflow = [[0.0] * nb_trajectoires for _ in range(duree)]
+        for trajectoire in range(nb_trajectoires):
+            valeur, loyers, charges, tresorerie = self.valeur, self.loyers_annuels, self.charges_annuelles, 0.0
+            for annee in range(duree):
+                if annee:
+                    valeur *= 1 + gauss(val_moy, val_et)
+                    loyers *= 1 + gauss(irl_moy, irl_et)
+                    charges *= 1 + gauss(ch_moy, ch_et)
+                    flux = loyers * (1 - beta(vac_a, vac_b)) - charges - self.annuites[annee]
+                    tresorerie += flux
+                else:
+                    # Année en cours : situation actuelle, sans tirage
+                    flux = loyers - charges - self.annuites[0]
+                cashflow[annee][trajectoire] = flux
+                nette[annee][trajectoire] = valeur - self.crd[annee] + tresorerie
+
+        resultat = {'nette': {}, 'cashflow': {}}
+        for nom, series in (('nette', nette), ('cashflow', cashflow)):
+            triees = [sorted(valeurs) for valeurs in series]
+            for rang in PERCENTILES:
+                resultat[nom][rang] = [round(_percentile(valeurs, rang), 0) for valeurs in triees]
+        return resultat
@@ -0,0 +1,450 @@
+"""
+Moteur de régularisation des charges, indépendant du rendu PDF.
+
+Le décompte d'un bail (dépenses réparties, consommations, ajustements,
+provisions versées, solde) est calculé ici, sans ReportLab ; le PDF
+(PDFGenerator.generer_regularisation) et l'historique (table Regularisation)
+en sont deux consommateurs.
+
+Pour un immeuble entier, les dépenses, les quote-parts, les relevés et les
+ajustements sont chargés une fois, puis répartis sur tous les baux en une
+passe : le nombre de requêtes ne dépend pas du nombre de baux.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Q
+
+from .calculators import BailCalculator
+from .repartition import depense_dans_periode, filtre_depenses, matrices_repartition
+
+logger = logging.getLogger(__name__)
+
+CENTIME = Decimal('0.01')
+
+DEPENSE = 'DEPENSE'
+CONSOMMATION = 'CONSOMMATION'
+AJUSTEMENT = 'AJUSTEMENT'
+
+
+def _format_euro(montant):
+    # Même format que pdf_generator.format_euro, sans importer ReportLab
+    return f"{montant:,.2f}".replace(",", " ").replace(".", ",") + " €"
+
+
+def _en_date(valeur):
+    """Accepte une date ou une chaîne AAAA-MM-JJ (formulaires)."""
+    if isinstance(valeur, str):
+        return datetime.strptime(valeur, '%Y-%m-%d').date()
+    return valeur
+
+
+class DecompteRegularisation:
+    """
+    Décompte de régularisation d'un bail sur une période.
+
+    Attributs:
+        lignes (list): Un dict par ligne du décompte, dans l'ordre d'affichage :
+            nature (DEPENSE, CONSOMMATION ou AJUSTEMENT), libelle, part, et
+            montant_immeuble (dépenses) ou prix_unitaire (consommations)
+        total_reel (Decimal): Part réelle des charges du locataire
+        total_provisions (Decimal): Provisions dues sur la période
+        solde (Decimal): Reste à payer (positif) ou trop-perçu (négatif)
+        details_provisions (list): Détail mois par mois des provisions
+        details_calculs (list): Lignes de l'annexe « détail des calculs »
+    """
+
+    def __init__(self, bail, date_debut, date_fin):
+        self.bail = bail
+        self.date_debut = date_debut
+        self.date_fin = date_fin
+
+        self.nb_jours_periode = (date_fin - date_debut).days + 1
+        self.debut_occupation = max(date_debut, bail.date_debut)
+        self.fin_occupation = date_fin if not bail.date_fin else min(date_fin, bail.date_fin)
+        self.nb_jours_presence = 0
+        if self.debut_occupation <= self.fin_occupation:
+            self.nb_jours_presence = (self.fin_occupation - self.debut_occupation).days + 1
+        self.ratio_temps = (
+            Decimal(self.nb_jours_presence) / Decimal(self.nb_jours_periode)
+            if self.nb_jours_periode > 0 else Decimal('0')
+        )
+
+        self.lignes = []
+        self.total_reel = Decimal('0')
+        self.total_provisions = Decimal('0')
+        self.details_provisions = []
+        self.details_calculs = [
+            "--- PARAMÈTRES GÉNÉRAUX ---",
+            f"Période Régul : {date_debut} au {date_fin} ({self.nb_jours_periode} jours)",
+            f"Présence Locataire : {self.nb_jours_presence} jours (Ratio global : {self.ratio_temps:.6f})",
+            "",
+        ]
+
+    @property
+    def solde(self):
+        return self.total_reel - self.total_provisions
+
+    def _ajouter_ligne(self, nature, libelle, part, **colonnes):
+        self.lignes.append({'nature': nature, 'libelle': libelle, 'part': part, **colonnes})
+        self.total_reel += part
+
+    def en_dict(self):
+        """Décompte sérialisable (aperçu JSON) : montants en Decimal, dates en date."""
+        return {
+            'bail': self.bail.pk,
+            'date_debut': self.date_debut,
+            'date_fin': self.date_fin,
+            'nb_jours_periode': self.nb_jours_periode,
+            'nb_jours_presence': self.nb_jours_presence,
+            'ratio_temps': self.ratio_temps.quantize(Decimal('0.000001')),
+            'lignes': self.lignes,
+            'total_reel': self.total_reel,
+            'total_provisions': self.total_provisions,
+            'solde': self.solde,
+            'details_provisions': self.details_provisions,
+        }
+
+    def enregistrer(self):
+        """
+        Historise le décompte dans la table Regularisation.
+
+        Rejouer le même décompte met à jour la ligne existante au lieu
+        d'empiler un doublon dans l'historique du bail.
+
+        Returns:
+            tuple: (regularisation, cree)
+        """
+        from .models import Regularisation
+
+        regularisation, cree = Regularisation.objects.update_or_create(
+            bail=self.bail,
+            date_debut=self.date_debut,
+            date_fin=self.date_fin,
+            defaults={
+                'montant_reel': self.total_reel,
+                'montant_provisions': self.total_provisions,
+                'solde': self.solde,
+            },
+        )
+        regularisation.full_clean(exclude=['bail'])
+        logger.info(
+            "Régularisation %s en base : solde=%s",
+            "créée" if cree else "mise à jour", self.solde,
+        )
+        return regularisation, cree
+
+
+class MoteurRegularisation:
+    """
+    Régularisations de charges d'un ensemble de baux sur une même période.
+
+    Les données sont chargées à la construction, en un nombre fixe de
+    requêtes ; decompte() et decomptes() calculent ensuite sans accès base.
+    """
+
+    def __init__(self, baux, date_debut, date_fin):
+        """
+        Args:
+            baux: Itérable de Bail (local et tarifications préchargés de préférence)
+            date_debut (date | str): Début de la période
+            date_fin (date | str): Fin de la période
+        """
+        from django.db.models import prefetch_related_objects
+        from .models import Ajustement, Consommation
+
+        self.date_debut = _en_date(date_debut)
+        self.date_fin = _en_date(date_fin)
+        self.baux = list(baux)
+        self.erreurs = []
+        # Sans effet sur les relations déjà chargées
+        prefetch_related_objects(self.baux, 'local__immeuble', 'tarifications')
+
+        immeuble_ids = {bail.local.immeuble_id for bail in self.baux}
+        local_ids = {bail.local_id for bail in self.baux}
+        debut, fin = self.date_debut, self.date_fin
+
+        if debut.year == fin.year:
+            # Cas courant (régularisation annuelle) : matrices de l'année, en cache
+            self._lire_matrices(immeuble_ids, debut, fin)
+        else:
+            self._charger_depenses(immeuble_ids, local_ids, debut, fin)
+
+        self.consommations = defaultdict(list)
+        for consommation in Consommation.objects.filter(
+            Q(local_id__in=local_ids) &
+            (Q(date_releve__range=[debut, fin]) | Q(date_debut__lte=fin, date_releve__gte=debut))
+        ).select_related('cle_repartition').order_by('pk'):
+            self.consommations[consommation.local_id].append(consommation)
+
+        self.ajustements = defaultdict(list)
+        for ajustement in Ajustement.objects.filter(
+            bail__in=self.baux, date__range=[debut, fin]
+        ).order_by('pk'):
+            self.ajustements[ajustement.bail_id].append(ajustement)
+
+    def _lire_matrices(self, immeuble_ids, debut, fin):
+        """Dépenses, tantièmes et totaux par clé lus dans les matrices de répartition."""
+        self.depenses = defaultdict(list)
+        self.quote_parts, self.totaux_cles = {}, {}
+        for immeuble_id, matrice in matrices_repartition(immeuble_ids, debut.year).items():
+            self.depenses[immeuble_id] = [
+                depense for depense in matrice.depenses if depense_dans_periode(depense, debut, fin)
+            ]
+            self.totaux_cles.update(matrice.totaux_cles)
+            for cle_id, parts in matrice.quote_parts.items():
+                for local_id, valeur in parts.items():
+                    self.quote_parts[(cle_id, local_id)] = valeur
+
+    def _charger_depenses(self, immeuble_ids, local_ids, debut, fin):
+        """Période à cheval sur deux années : lecture directe en base (3 requêtes)."""
+        from django.db.models import Sum
+        from .models import Depense, QuotePart
+
+        self.depenses = defaultdict(list)
+        for depense in Depense.objects.filter(
+            filtre_depenses(debut, fin), immeuble_id__in=immeuble_ids,
+        ).select_related('cle_repartition').order_by('pk'):
+            self.depenses[depense.immeuble_id].append(depense)
+
+        cle_ids = {
+            depense.cle_repartition_id
+            for depenses in self.depenses.values() for depense in depenses
+            if depense.cle_repartition_id
+        }
+        self.quote_parts = {
+            (cle_id, local_id): valeur
+            for cle_id, local_id, valeur in QuotePart.objects.filter(
+                cle_id__in=cle_ids, local_id__in=local_ids
+            ).values_list('cle_id', 'local_id', 'valeur')
+        }
+        self.totaux_cles = dict(
+            QuotePart.objects.filter(cle_id__in=cle_ids)
+            .values('cle_id').annotate(total=Sum('valeur')).values_list('cle_id', 'total')
+            .order_by()
+        )
+
+    @classmethod
+    def pour_immeuble(cls, immeuble, date_debut, date_fin):
+        """Moteur sur tous les baux d'un immeuble présents pendant la période."""
+        date_debut, date_fin = _en_date(date_debut), _en_date(date_fin)
+        baux = baux_presents(date_debut, date_fin, [immeuble])
+        return cls(
+            baux.select_related('local__immeuble').prefetch_related('tarifications'), date_debut, date_fin
+        )
+
+    def decompte(self, bail):
+        """
+        Décompte d'un bail (qui doit faire partie des baux du moteur).
+
+        Raises:
+            TarificationNotFoundError: Un mois de présence sans tarification
+        """
+        decompte = DecompteRegularisation(bail, self.date_debut, self.date_fin)
+        total_provisions, details_provisions = BailCalculator.calculer_provisions_mensuelles(
+            bail, self.date_debut, self.date_fin
+        )
+
+        decompte.details_calculs.append("--- DÉTAIL DÉPENSES ---")
+        for depense in self.depenses[bail.local.immeuble_id]:
+            self._repartir_depense(decompte, depense)
+
+        decompte.details_calculs.append("")
+        decompte.details_calculs.append("--- DÉTAIL CONSOMMATIONS ---")
+        for consommation in self.consommations[bail.local_id]:
+            self._valoriser_consommation(decompte, consommation)
+
+        for ajustement in self.ajustements[bail.pk]:
+            decompte._ajouter_ligne(
+                AJUSTEMENT, f"Ajustement : {ajustement.libelle}", ajustement.montant
+            )
+
+        decompte.total_provisions = total_provisions
+        decompte.details_provisions = details_provisions
+        decompte.details_calculs.append("")
+        decompte.details_calculs.extend(details_provisions)
+        return decompte
+
+    def decomptes(self):
+        """
+        Décomptes de tous les baux, dans l'ordre des baux.
+
+        Un bail en erreur (mois sans tarification) est journalisé, ajouté à
+        `erreurs` et sauté.
+
+        Returns:
+            dict: {bail_id: DecompteRegularisation}
+        """
+        from .exceptions import TarificationNotFoundError
+
+        resultats = {}
+        for bail in self.baux:
+            try:
+                resultats[bail.pk] = self.decompte(bail)
+            except TarificationNotFoundError as e:
+                logger.error(f"Régularisation impossible pour bail {bail.pk}: {e}")
+                self.erreurs.append((bail, str(e)))
+        return resultats
+
+    def _repartir_depense(self, decompte, depense):
+        cle = depense.cle_repartition
+        if not cle:
+            return
+        qp_valeur = self.quote_parts.get((cle.id, decompte.bail.local_id))
+        total_cle = self.totaux_cles.get(cle.id, 0)
+        if not qp_valeur or total_cle <= 0:
+            return
+
+        details = decompte.details_calculs
+        part_theorique = (depense.montant * qp_valeur) / total_cle
+
+        if depense.date_debut and depense.date_fin:
+            # Prorata sur l'intersection période de la facture / régul / présence
+            duree_depense = (depense.date_fin - depense.date_debut).days + 1
+            if duree_depense <= 0:
+                duree_depense = 1
+
+            debut = max(depense.date_debut, decompte.date_debut, decompte.debut_occupation)
+            fin = min(depense.date_fin, decompte.date_fin, decompte.fin_occupation)
+            nb_jours_facturables = (fin - debut).days + 1 if debut <= fin else 0
+
+            part_reelle = (
+                part_theorique * Decimal(nb_jours_facturables) / Decimal(duree_depense)
+            ).quantize(CENTIME, rounding=ROUND_HALF_UP)
+
+            details.append(f"[Dépense] {depense.libelle} ({_format_euro(depense.montant)})")
+            details.append(f"  > Période facture : {depense.date_debut} au {depense.date_fin} ({duree_depense} jours)")
+            details.append(f"  > Intersection présence : {nb_jours_facturables} jours")
+            details.append(f"  > Calcul : {part_theorique:.2f}€ x ({nb_jours_facturables}/{duree_depense}) = {part_reelle:.2f}€")
+        else:
+            if not (decompte.date_debut <= depense.date <= decompte.date_fin):
+                return
+            part_reelle = (part_theorique * decompte.ratio_temps).quantize(
+                CENTIME, rounding=ROUND_HALF_UP
+            )
+
+            details.append(f"[Dépense] {depense.libelle} ({_format_euro(depense.montant)})")
+            details.append(f"  > Sans période (Date: {depense.date}) -> Lissage global")
+            details.append(f"  > Calcul : {part_theorique:.2f}€ x Ratio {decompte.ratio_temps:.4f} = {part_reelle:.2f}€")
+
+        libelle = f"{depense.libelle} ({cle.nom})"
+        if depense.date_debut and depense.date_fin:
+            libelle += f" [{depense.date_debut.strftime('%d/%m')} au {depense.date_fin.strftime('%d/%m')}]"
+        decompte._ajouter_ligne(DEPENSE, libelle, part_reelle, montant_immeuble=depense.montant)
+
+    def _valoriser_consommation(self, decompte, consommation):
+        cle = consommation.cle_repartition
+        details = decompte.details_calculs
+        if not cle.prix_unitaire:
+            # Sans prix unitaire, la consommation ne peut pas être valorisée :
+            # on le dit explicitement au lieu de l'omettre en silence.
+            avertissement = (
+                f"[Conso] {cle.nom} : releve de {consommation.quantite} NON FACTURE "
+                f"(aucun prix unitaire defini sur la cle de repartition)."
+            )
+            details.append(avertissement)
+            logger.warning("%s - %s", decompte.bail, avertissement)
+            return
+
+        quantite_reelle = Decimal(consommation.quantite)
+
+        if consommation.date_debut:
+            duree_conso = (consommation.date_releve - consommation.date_debut).days + 1
+            if duree_conso <= 0:
+                duree_conso = 1
+
+            debut = max(consommation.date_debut, decompte.date_debut)
+            fin = min(consommation.date_releve, decompte.date_fin)
+            nb_jours_conso = (fin - debut).days + 1 if debut <= fin else 0
+
+            quantite_reelle = quantite_reelle * Decimal(nb_jours_conso) / Decimal(duree_conso)
+
+            details.append(f"[Conso] {cle.nom} (Relevé: {consommation.quantite})")
+            details.append(f"  > Période relevé : {consommation.date_debut} au {consommation.date_releve} ({duree_conso} jours)")
+            details.append(f"  > Intersection régul : {nb_jours_conso} jours")
+            details.append(f"  > Qté retenue : {consommation.quantite:.2f} x ({nb_jours_conso}/{duree_conso}) = {quantite_reelle:.2f}")
+        else:
+            details.append(f"[Conso] {cle.nom} (Relevé: {consommation.quantite}) - 100% retenu")
+
+        montant = (quantite_reelle * cle.prix_unitaire).quantize(CENTIME, rounding=ROUND_HALF_UP)
+
+        libelle = f"{cle.nom} (Relevé: {consommation.quantite})"
+        if consommation.date_debut:
+            libelle += f" [Prorata: {quantite_reelle:.2f}]"
+        decompte._ajouter_ligne(CONSOMMATION, libelle, montant, prix_unitaire=cle.prix_unitaire)
+
+
+def baux_presents(date_debut, date_fin, immeubles=None):
+    """QuerySet des baux ayant couru pendant la période (des immeubles donnés)."""
+    from .models import Bail
+
+    baux = Bail.objects.filter(
+        Q(date_fin__isnull=True) | Q(date_fin__gte=date_debut), date_debut__lte=date_fin,
+    )
+    if immeubles is not None:
+        baux = baux.filter(local__immeuble__in=immeubles)
+    return baux.order_by('local__numero_porte', 'pk')
+
+
+def calculer_regularisation(bail, date_debut, date_fin):
+    """Décompte d'un seul bail (raccourci de MoteurRegularisation)."""
+    return MoteurRegularisation([bail], date_debut, date_fin).decompte(bail)
+
+
+def enregistrer_decomptes(decomptes):
+    """
+    Historise plusieurs décomptes d'un coup (clôture d'un immeuble).
+
+    Les lignes existantes pour le même bail et la même période sont mises à
+    jour, les autres créées : 3 requêtes quel que soit le nombre de baux.
+    Chaque ligne est validée (full_clean) avant l'écriture groupée, comme
+    dans DecompteRegularisation.enregistrer() : une ligne invalide lève
+    ValidationError et rien n'est écrit.
+
+    Args:
+        decomptes: Itérable de DecompteRegularisation de même période
+
+    Returns:
+        tuple: (nombre créé, nombre mis à jour)
+    """
+    from .models import Regularisation
+
+    decomptes = list(decomptes)
+    if not decomptes:
+        return 0, 0
+    date_debut, date_fin = decomptes[0].date_debut, decomptes[0].date_fin
+
+    with transaction.atomic():
+        existantes = {
+            regularisation.bail_id: regularisation
+            for regularisation in Regularisation.objects.select_for_update().filter(
+                bail__in=[decompte.bail for decompte in decomptes],
+                date_debut=date_debut, date_fin=date_fin,
+            )
+        }
+        a_creer, a_modifier = [], []
+        for decompte in decomptes:
+            regularisation = existantes.get(decompte.bail.pk)
+            if regularisation is None:
+                regularisation = Regularisation(
+                    bail=decompte.bail, date_debut=date_debut, date_fin=date_fin
+                )
+                a_creer.append(regularisation)
+            else:
+                a_modifier.append(regularisation)
+            regularisation.montant_reel = decompte.total_reel
+            regularisation.montant_provisions = decompte.total_provisions
+            regularisation.solde = decompte.solde
+            # bulk_create / bulk_update ne valident rien
+            regularisation.full_clean(exclude=['bail'])
+
+        Regularisation.objects.bulk_create(a_creer)
+        Regularisation.objects.bulk_update(
+            a_modifier, ['montant_reel', 'montant_provisions', 'solde']
+        )
+
+    logger.info(f"Régularisations historisées : {len(a_creer)} créée(s), {len(a_modifier)} mise(s) à jour")
+    return len(a_creer), len(a_modifier)
@@ -0,0 +1,234 @@
+"""
+Matrice de répartition des charges d'un immeuble pour une année.
+
+Deux tableaux calculés ensemble, une fois par immeuble et par année :
+  - clés × locaux : les tantièmes de chaque local et le total de chaque clé ;
+  - dépenses × locaux : la part de chaque dépense revenant à chaque local,
+    au prorata de la part de la dépense tombant dans l'année.
+
+La matrice est gardée dans le cache partagé. Les signaux (core/signals.py)
+l'invalident dès qu'une dépense, une quote-part ou une clé de l'immeuble est
+écrite : chaque écriture incrémente la « génération » de l'immeuble, qui fait
+partie de la clé de cache, toutes années confondues.
+
+Lue par le moteur de régularisation, la fiche d'une clé (pourcentages) et le
+rapport des charges par local.
+"""
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+CENTIME = Decimal('0.01')
+DUREE_CACHE = 24 * 3600
+
+
+def _cle_generation(immeuble_id):
+    return f"repartition:generation:{immeuble_id}"
+
+
+def _cle(immeuble_id, annee, generation):
+    return f"repartition:matrice:{immeuble_id}:{annee}:{generation}"
+
+
+def filtre_depenses(debut, fin):
+    """Dépenses datées dans [debut, fin] ou dont la période chevauche [debut, fin]."""
+    return Q(date__range=[debut, fin]) | Q(date_debut__lte=fin, date_fin__gte=debut)
+
+
+def depense_dans_periode(depense, debut, fin):
+    """Même critère que filtre_depenses, sur une instance déjà chargée."""
+    if debut <= depense.date <= fin:
+        return True
+    return bool(
+        depense.date_debut and depense.date_fin
+        and depense.date_debut <= fin and depense.date_fin >= debut
+    )
+
+
+def ratio_periode(depense, debut, fin):
+    """
+    Part d'une dépense tombant dans [debut, fin].
+
+    Dépense avec période : jours communs / durée de la période. Sans période :
+    tout ou rien selon sa date.
+    """
+    if depense.date_debut and depense.date_fin:
+        duree = max((depense.date_fin - depense.date_debut).days + 1, 1)
+        debut_commun = max(depense.date_debut, debut)
+        fin_commune = min(depense.date_fin, fin)
+        if debut_commun > fin_commune:
+            return Decimal('0')
+        return Decimal((fin_commune - debut_commun).days + 1) / Decimal(duree)
+    return Decimal('1') if debut <= depense.date <= fin else Decimal('0')
+
+
+class MatriceRepartition:
+    """
+    Répartition des charges d'un immeuble sur une année civile.
+
+    Attributs:
+        quote_parts (dict): {cle_id: {local_id: tantièmes}}
+        totaux_cles (dict): {cle_id: total des tantièmes}
+        depenses (list): Dépenses de l'année (clé chargée), dans l'ordre des pk
+        parts_depenses (dict): {depense_id: {local_id: montant au centime}}
+        non_reparti (Decimal): Part de l'année des dépenses sans clé ni quote-part
+    """
+
+    def __init__(self, immeuble_id, annee, quote_parts, depenses):
+        """
+        Args:
+            immeuble_id (int): Immeuble
+            annee (int): Année civile
+            quote_parts: Itérable de (cle_id, local_id, valeur)
+            depenses (list): Dépenses de l'immeuble touchant l'année
+        """
+        self.immeuble_id = immeuble_id
+        self.annee = annee
+        self.quote_parts = defaultdict(dict)
+        self.totaux_cles = defaultdict(Decimal)
+        for cle_id, local_id, valeur in quote_parts:
+            self.quote_parts[cle_id][local_id] = valeur
+            self.totaux_cles[cle_id] += valeur
+        self.quote_parts = dict(self.quote_parts)
+        self.totaux_cles = dict(self.totaux_cles)
+        self.depenses = depenses
+
+        debut, fin = date(annee, 1, 1), date(annee, 12, 31)
+        self.parts_depenses = {}
+        self.non_reparti = Decimal('0')
+        for depense in depenses:
+            ratio = ratio_periode(depense, debut, fin)
+            parts = self.quote_parts.get(depense.cle_repartition_id, {})
+            total = self.totaux_cles.get(depense.cle_repartition_id, 0)
+            if not parts or total <= 0:
+                self.non_reparti += (depense.montant * ratio).quantize(CENTIME, rounding=ROUND_HALF_UP)
+                continue
+            # Une multiplication par local : montant x ratio / total, puis x tantièmes
+            facteur = depense.montant * ratio / total
+            self.parts_depenses[depense.pk] = {
+                local_id: (facteur * valeur).quantize(CENTIME, rounding=ROUND_HALF_UP)
+                for local_id, valeur in parts.items()
+            }
+
+    @classmethod
+    def calculer(cls, immeuble_ids, annee):
+        """
+        Matrices de plusieurs immeubles, en 2 requêtes.
+
+        Les clés d'un immeuble sont les siennes plus celles (d'un autre
+        immeuble) qu'utilisent ses dépenses de l'année.
+
+        Returns:
+            dict: {immeuble_id: MatriceRepartition}
+        """
+        from .models import Depense, QuotePart
+
+        immeuble_ids = list(immeuble_ids)
+        depenses = defaultdict(list)
+        cles_par_immeuble = defaultdict(set)
+        for depense in Depense.objects.filter(
+            filtre_depenses(date(annee, 1, 1), date(annee, 12, 31)),
+            immeuble_id__in=immeuble_ids,
+        ).select_related('cle_repartition').order_by('pk'):
+            depenses[depense.immeuble_id].append(depense)
+            if depense.cle_repartition_id:
+                cles_par_immeuble[depense.immeuble_id].add(depense.cle_repartition_id)
+
+        lignes_par_cle = defaultdict(list)
+        for cle_id, cle_immeuble_id, local_id, valeur in QuotePart.objects.filter(
+            Q(cle__immeuble_id__in=immeuble_ids)
+            | Q(cle_id__in=set().union(*cles_par_immeuble.values()))
+        ).values_list('cle_id', 'cle__immeuble_id', 'local_id', 'valeur'):
+            lignes_par_cle[cle_id].append((cle_id, local_id, valeur))
+            cles_par_immeuble[cle_immeuble_id].add(cle_id)
+
+        return {
+            immeuble_id: cls(
+                immeuble_id, annee,
+                [ligne for cle_id in cles_par_immeuble[immeuble_id] for ligne in lignes_par_cle[cle_id]],
+                depenses[immeuble_id],
+            )
+            for immeuble_id in immeuble_ids
+        }
+
+    def pourcentages(self, cle_id):
+        """Part de chaque local dans une clé, en pourcentage : {local_id: Decimal à 0,1 %}."""
+        total = self.totaux_cles.get(cle_id)
+        if not total:
+            return {}
+        return {
+            local_id: (valeur * 100 / total).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+            for local_id, valeur in self.quote_parts[cle_id].items()
+        }
+
+    def charges_par_local(self):
+        """Charges de l'année par local et par clé : {local_id: {cle_id: Decimal}}."""
+        charges = defaultdict(lambda: defaultdict(Decimal))
+        for depense in self.depenses:
+            for local_id, part in self.parts_depenses.get(depense.pk, {}).items():
+                charges[local_id][depense.cle_repartition_id] += part
+        return {local_id: dict(par_cle) for local_id, par_cle in charges.items()}
+
+
+def matrices_repartition(immeuble_ids, annee):
+    """
+    Matrices de répartition de plusieurs immeubles : {immeuble_id: MatriceRepartition}.
+
+    Deux lectures groupées du cache ; les matrices absentes sont calculées
+    ensemble (2 requêtes) puis mises en cache.
+    """
+    immeuble_ids = list(dict.fromkeys(immeuble_ids))
+    generations = cache.get_many([_cle_generation(immeuble_id) for immeuble_id in immeuble_ids])
+    cles = {
+        immeuble_id: _cle(immeuble_id, annee, generations.get(_cle_generation(immeuble_id), 0))
+        for immeuble_id in immeuble_ids
+    }
+    en_cache = cache.get_many(list(cles.values()))
+    resultats = {
+        immeuble_id: en_cache[cle] for immeuble_id, cle in cles.items() if cle in en_cache
+    }
+
+    manquants = [immeuble_id for immeuble_id in immeuble_ids if immeuble_id not in resultats]
+    if manquants:
+        logger.debug(f"Matrices de répartition {annee} calculées pour {len(manquants)} immeuble(s)")
+        calculees = MatriceRepartition.calculer(manquants, annee)
+        cache.set_many({cles[pk]: matrice for pk, matrice in calculees.items()}, DUREE_CACHE)
+        resultats.update(calculees)
+
+    return resultats
+
+
+def matrice_repartition(immeuble_id, annee):
+    """Matrice de répartition d'un immeuble pour une année (en cache, calculée au besoin)."""
+    return matrices_repartition([immeuble_id], annee)[immeuble_id]
+
+
+def invalider_repartition(*immeuble_ids):
+    """
+    Périme les matrices de toutes les années des immeubles donnés.
+
+    Incrément immédiat, puis de nouveau après le commit : un autre worker a pu
+    recalculer entre-temps à partir des données d'avant la transaction.
+    """
+    immeuble_ids = {immeuble_id for immeuble_id in immeuble_ids if immeuble_id}
+
+    def incrementer():
+        for immeuble_id in immeuble_ids:
+            cle = _cle_generation(immeuble_id)
+            cache.add(cle, 0, None)
+            try:
+                cache.incr(cle)
+            except ValueError:
+                # Évincée entre add() et incr()
+                cache.set(cle, 1, None)
+
+    if immeuble_ids:
+        incrementer()
+        transaction.on_commit(incrementer)
@@ -0,0 +1,221 @@
+"""
+Campagne de révision annuelle des loyers (IRL / ILC).
+
+Révise en une fois tous les baux dont l'anniversaire tombe un mois donné :
+  1. sélection des baux actifs entrés ce mois-là une année antérieure, avec
+     leurs tarifications (nombre fixe de requêtes, documents_lot.precharger_baux) ;
+  2. calcul des nouveaux loyers par BailCalculator.calculer_revision_irl,
+     contre la table IndiceReference (core/indices.py) : l'indice retenu est
+     celui du trimestre de référence du bail, un an plus tard ;
+  3. application dans une transaction : les tarifications en cours sont
+     fermées la veille de l'anniversaire (bulk_update), les nouvelles créées
+     (bulk_create), puis les courriers rendus en lot (LotRevisions).
+
+bulk_update et bulk_create ne déclenchent pas les signaux : les loyers dus
+des baux révisés et les indicateurs de leurs immeubles sont recalculés ici.
+"""
+import calendar
+import logging
+from datetime import date, timedelta
+
+from django.db import transaction
+
+from .calculators import BailCalculator
+from .documents_lot import LotDocuments, precharger_baux
+from .indicateurs import invalider_indicateurs
+from .indices import lire_periode, type_indice_du_bail
+from .loyers_dus import rafraichir_loyers_dus
+
+logger = logging.getLogger(__name__)
+
+
+class Revision:
+    """Révision calculée d'un bail (non enregistrée)."""
+
+    def __init__(self, bail, tarif, date_application, type_indice, nouveau_trimestre, nouvel_indice, calcul):
+        self.bail = bail
+        self.tarif = tarif
+        self.date_application = date_application
+        self.type_indice = type_indice
+        self.nouveau_trimestre = nouveau_trimestre
+        self.nouvel_indice = nouvel_indice
+        self.ancien_indice = calcul['ancien_indice']
+        self.ancien_loyer = calcul['ancien_loyer']
+        self.nouveau_loyer = calcul['nouveau_loyer']
+        self.variation_pct = calcul['variation_pct']
+
+
+def date_anniversaire(bail, annee):
+    """Anniversaire du bail en `annee` (fin février pour un bail entré un 29)."""
+    debut = bail.date_debut
+    return date(annee, debut.month, min(debut.day, calendar.monthrange(annee, debut.month)[1]))
+
+
+class CampagneRevision:
+    """
+    Révisions des baux dont l'anniversaire tombe en `mois`/`annee`.
+
+    Attributs:
+        revisions (list): Revision des baux révisables, par immeuble et porte
+        ecartes (list): (bail, motif) des baux non révisables (indice non
+            publié, pas d'indice de référence, déjà révisé...)
+    """
+
+    def __init__(self, annee, mois, baux=None):
+        """
+        Args:
+            annee (int): Année de la révision
+            mois (int): Mois anniversaire (1 à 12)
+            baux: QuerySet de Bail à considérer (défaut : tous les baux actifs)
+        """
+        from .models import Bail, IndiceReference
+
+        self.annee = annee
+        self.mois = mois
+        if baux is None:
+            baux = Bail.objects.filter(actif=True)
+        candidats = precharger_baux(baux.filter(date_debut__month=mois, date_debut__year__lt=annee))
+
+        # Table des indices en une requête (quelques centaines de lignes au plus)
+        indices = {
+            (type_indice, annee_indice, trimestre): valeur
+            for type_indice, annee_indice, trimestre, valeur in IndiceReference.objects.values_list(
+                'type_indice', 'annee', 'trimestre', 'valeur'
+            )
+        }
+
+        self.revisions = []
+        self.ecartes = []
+        for bail in candidats:
+            revision = self._reviser(bail, indices)
+            if isinstance(revision, str):
+                self.ecartes.append((bail, revision))
+            else:
+                self.revisions.append(revision)
+
+    def _reviser(self, bail, indices):
+        """Revision du bail, ou motif (str) pour lequel il est écarté."""
+        date_application = date_anniversaire(bail, self.annee)
+        if bail.date_fin and bail.date_fin < date_application:
+            return "Bail terminé avant l'anniversaire"
+        if any(tarif.date_debut >= date_application for tarif in bail.tarifications.all()):
+            return "Déjà révisé (tarification à partir de l'anniversaire)"
+
+        tarif = bail.get_tarification_at(date_application - timedelta(days=1))
+        if tarif is None:
+            return "Aucune tarification la veille de l'anniversaire"
+        periode = lire_periode(tarif.trimestre_reference)
+        if not tarif.indice_reference or periode is None:
+            return "Indice ou trimestre de référence non renseigné"
+
+        type_indice = type_indice_du_bail(bail)
+        annee_indice, trimestre = periode[0] + 1, periode[1]
+        nouvel_indice = indices.get((type_indice, annee_indice, trimestre))
+        nouveau_trimestre = f"T{trimestre} {annee_indice}"
+        if nouvel_indice is None:
+            return f"{type_indice} {nouveau_trimestre} absent de la table des indices"
+
+        calcul = BailCalculator.calculer_revision_irl(bail, nouvel_indice, tarif=tarif)
+        return Revision(bail, tarif, date_application, type_indice, nouveau_trimestre, nouvel_indice, calcul)
+
+    def appliquer(self):
+        """
+        Enregistre toutes les révisions dans une transaction.
+
+        Returns:
+            list: Nouvelles BailTarification créées
+        """
+        from .models import BailTarification
+
+        if not self.revisions:
+            return []
+
+        with transaction.atomic():
+            # Double envoi du formulaire : un bail révisé entre-temps est écarté
+            deja_revises = set(BailTarification.objects.filter(
+                bail_id__in=[revision.bail.pk for revision in self.revisions],
+                date_debut__gte=min(revision.date_application for revision in self.revisions),
+            ).values_list('bail_id', 'date_debut'))
+            for revision in list(self.revisions):
+                if any(bail_id == revision.bail.pk and debut >= revision.date_application
+                       for bail_id, debut in deja_revises):
+                    self.revisions.remove(revision)
+                    self.ecartes.append((revision.bail, "Déjà révisé (tarification à partir de l'anniversaire)"))
+
+            anciennes = []
+            nouvelles = []
+            for revision in self.revisions:
+                tarif = revision.tarif
+                fin_precedente = tarif.date_fin
+                tarif.date_fin = revision.date_application - timedelta(days=1)
+                anciennes.append(tarif)
+                nouvelles.append(BailTarification(
+                    bail=revision.bail,
+                    date_debut=revision.date_application,
+                    date_fin=fin_precedente,
+                    loyer_hc=revision.nouveau_loyer,
+                    charges=tarif.charges,
+                    taxes=tarif.taxes,
+                    indice_reference=revision.nouvel_indice,
+                    trimestre_reference=revision.nouveau_trimestre,
+                    reason=f"Révision {revision.type_indice} {revision.nouveau_trimestre}",
+                    notes=(
+                        f"Campagne de révision {self.mois:02d}/{self.annee}. "
+                        f"Ancien: {revision.ancien_loyer:.2f}€, indice {revision.ancien_indice} "
+                        f"({tarif.trimestre_reference})"
+                    ),
+                ))
+            # Fermer avant de créer : une seule tarification ouverte par bail
+            BailTarification.objects.bulk_update(anciennes, ['date_fin'], batch_size=100)
+            BailTarification.objects.bulk_create(nouvelles, batch_size=100)
+
+            for revision in self.revisions:
+                rafraichir_loyers_dus(revision.bail, revision.date_application, None)
+
+        if self.revisions:
+            invalider_indicateurs(*{revision.bail.local.immeuble_id for revision in self.revisions})
+        logger.info(
+            f"Campagne de révision {self.mois:02d}/{self.annee} : "
+            f"{len(nouvelles)} tarification(s) créée(s), {len(self.ecartes)} bail(s) écarté(s)"
+        )
+        return nouvelles
+
+    def arguments_courriers(self):
+        """Arguments des courriers par bail révisé, sérialisables en JSON (paramètres d'une Tache)."""
+        return {
+            str(revision.bail.pk): [
+                str(revision.nouvel_indice), revision.nouveau_trimestre,
+                revision.date_application.isoformat(), str(revision.ancien_indice),
+            ]
+            for revision in self.revisions
+        }
+
+    def courriers(self, processus=None):
+        """Lot des courriers de révision (à itérer après appliquer())."""
+        return LotRevisions(self.annee, self.mois, self.arguments_courriers(), processus=processus)
+
+
+class LotRevisions(LotDocuments):
+    """Courriers de révision d'une campagne, un par bail révisé.
+
+    Les baux sont relus après appliquer() : le courrier lit la tarification
+    de la veille de l'anniversaire, déjà fermée. Les arguments par bail sont
+    ceux de CampagneRevision.arguments_courriers(), qu'une tâche conserve
+    pour rendre à nouveau les courriers d'une campagne déjà appliquée.
+    """
+
+    methode = 'generer_revision_loyer'
+    prefixe = 'Revision_Loyer'
+
+    def __init__(self, annee, mois, courriers, processus=None):
+        from .models import Bail
+
+        self.par_bail = {int(bail_id): arguments for bail_id, arguments in courriers.items()}
+        super().__init__(Bail.objects.filter(pk__in=self.par_bail), (), f"{annee}-{mois:02d}", processus)
+
+    def _arguments(self, bail):
+        nouvel_indice, nouveau_trimestre, date_application, ancien_indice = self.par_bail[bail.pk]
+        return (
+            float(nouvel_indice), nouveau_trimestre,
+            date.fromisoformat(date_application), float(ancien_indice),
+        )
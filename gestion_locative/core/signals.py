@@ -0,0 +1,180 @@
+"""
+Signaux : tenue à jour des données dérivées (loyers dus, indicateurs et
+matrices de répartition en cache).
+
+Chargé par CoreConfig.ready(). Les bulk_create et QuerySet.update() ne
+déclenchent pas ces signaux : après un import en masse, lancer
+`python manage.py rafraichir_loyers_dus` (qui invalide aussi les caches).
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .indicateurs import invalider_indicateurs
+from .loyers_dus import rafraichir_loyers_dus
+from .models import (
+    Bail, BailTarification, ChargeFiscale, CleRepartition, CreditImmobilier, Depense,
+    EcheanceCredit, EstimationValeur, Immeuble, Local, LoyerDu, QuotePart, VacanceLocative,
+)
+from .repartition import invalider_repartition
+
+# Champs du bail qui changent les loyers dus de tous ses mois
+CHAMPS_BAIL_LOYERS = ('local_id', 'date_debut', 'date_fin', 'frequence_paiement', 'soumis_tva', 'taux_tva')
+
+
+def _suppression_directe(origin, modele):
+    """Vrai si la suppression vise ce modèle, faux si elle vient d'une cascade
+    (le bail parent disparaît de toute façon avec ses loyers dus)."""
+    if isinstance(origin, QuerySet):
+        return origin.model is modele
+    return isinstance(origin, modele)
+
+
+@receiver(pre_save, sender=BailTarification)
+def memoriser_periode_tarification(sender, instance, raw=False, **kwargs):
+    """Garde l'ancienne période : les mois qu'elle couvrait sont aussi à recalculer."""
+    instance._periode_precedente = None
+    if instance.pk and not raw:
+        instance._periode_precedente = BailTarification.objects.filter(
+            pk=instance.pk
+        ).values_list('date_debut', 'date_fin').first()
+
+
+@receiver(post_save, sender=BailTarification)
+def tarification_enregistree(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    periodes = [(instance.date_debut, instance.date_fin)]
+    if getattr(instance, '_periode_precedente', None):
+        periodes.append(instance._periode_precedente)
+    fins = [fin for _, fin in periodes]
+    fin = None if None in fins else max(fins)
+    rafraichir_loyers_dus(instance.bail, min(debut for debut, _ in periodes), fin)
+
+
+@receiver(post_delete, sender=BailTarification)
+def tarification_supprimee(sender, instance, origin=None, **kwargs):
+    if not _suppression_directe(origin, BailTarification):
+        return
+    rafraichir_loyers_dus(instance.bail, instance.date_debut, instance.date_fin)
+
+
+@receiver(pre_save, sender=Bail)
+def memoriser_champs_bail(sender, instance, raw=False, **kwargs):
+    instance._champs_loyers_precedents = None
+    if instance.pk and not raw:
+        instance._champs_loyers_precedents = Bail.objects.filter(
+            pk=instance.pk
+        ).values_list(*CHAMPS_BAIL_LOYERS).first()
+
+
+@receiver(post_save, sender=Bail)
+def bail_enregistre(sender, instance, created, raw=False, **kwargs):
+    """Un bail modifié est recalculé en entier, mais seulement si un champ
+    utile au calcul a changé (pas pour un simple passage à inactif)."""
+    if raw:
+        return
+    precedents = getattr(instance, '_champs_loyers_precedents', None)
+    actuels = tuple(getattr(instance, champ) for champ in CHAMPS_BAIL_LOYERS)
+    if created or precedents is None or tuple(precedents) != actuels:
+        rafraichir_loyers_dus(instance)
+
+
+@receiver(pre_save, sender=Local)
+def memoriser_immeuble_local(sender, instance, raw=False, **kwargs):
+    instance._immeuble_precedent = None
+    if instance.pk and not raw:
+        instance._immeuble_precedent = Local.objects.filter(
+            pk=instance.pk
+        ).values_list('immeuble_id', flat=True).first()
+
+
+@receiver(post_save, sender=Local)
+def local_enregistre(sender, instance, raw=False, **kwargs):
+    """Un local changé d'immeuble emporte ses loyers dus (immeuble dénormalisé)."""
+    precedent = getattr(instance, '_immeuble_precedent', None)
+    if raw or precedent is None or precedent == instance.immeuble_id:
+        return
+    LoyerDu.objects.filter(bail__local=instance).update(immeuble_id=instance.immeuble_id)
+    invalider_indicateurs(precedent)
+    invalider_repartition(precedent, instance.immeuble_id)
+
+
+# ─── Indicateurs en cache ────────────────────────────────────────────────────
+
+# Modèle écrit → immeuble dont les indicateurs changent
+IMMEUBLE_CONCERNE = {
+    Immeuble: lambda obj: obj.pk,
+    Local: lambda obj: obj.immeuble_id,
+    Bail: lambda obj: obj.local.immeuble_id,
+    BailTarification: lambda obj: obj.bail.local.immeuble_id,
+    VacanceLocative: lambda obj: obj.local.immeuble_id,
+    CreditImmobilier: lambda obj: obj.immeuble_id,
+    EcheanceCredit: lambda obj: obj.credit.immeuble_id,
+    EstimationValeur: lambda obj: obj.immeuble_id,
+    ChargeFiscale: lambda obj: obj.immeuble_id,
+}
+
+
+def _invalider_indicateurs_de(sender, instance, **kwargs):
+    try:
+        immeuble_id = IMMEUBLE_CONCERNE[sender](instance)
+    except ObjectDoesNotExist:
+        # Parent déjà supprimé : ses propres signaux ont invalidé l'immeuble
+        return
+    invalider_indicateurs(immeuble_id)
+
+
+for _modele in IMMEUBLE_CONCERNE:
+    post_save.connect(_invalider_indicateurs_de, sender=_modele, dispatch_uid=f'indicateurs_save_{_modele.__name__}')
+    post_delete.connect(_invalider_indicateurs_de, sender=_modele, dispatch_uid=f'indicateurs_delete_{_modele.__name__}')
+
+
+# ─── Matrices de répartition en cache ────────────────────────────────────────
+
+def _immeubles_de_la_cle(cle_id, immeuble_id):
+    """Immeuble de la clé, et ceux dont des dépenses l'utilisent (saisie rapide)."""
+    return {immeuble_id, *Depense.objects.filter(
+        cle_repartition_id=cle_id
+    ).values_list('immeuble_id', flat=True).distinct()}
+
+
+@receiver(post_save, sender=Immeuble)
+@receiver(post_delete, sender=Immeuble)
+def immeuble_ecrit(sender, instance, **kwargs):
+    # Un pk libéré peut être réattribué (SQLite) : pas de matrice héritée
+    invalider_repartition(instance.pk)
+
+
+@receiver(pre_save, sender=Depense)
+def memoriser_immeuble_depense(sender, instance, raw=False, **kwargs):
+    """Une dépense changée d'immeuble périme aussi la matrice de l'ancien."""
+    instance._immeuble_precedent = None
+    if instance.pk and not raw:
+        instance._immeuble_precedent = Depense.objects.filter(
+            pk=instance.pk
+        ).values_list('immeuble_id', flat=True).first()
+
+
+@receiver(post_save, sender=Depense)
+@receiver(post_delete, sender=Depense)
+def depense_ecrite(sender, instance, **kwargs):
+    invalider_repartition(instance.immeuble_id, getattr(instance, '_immeuble_precedent', None))
+
+
+@receiver(post_save, sender=CleRepartition)
+@receiver(pre_delete, sender=CleRepartition)  # avant que les dépenses ne perdent leur clé
+def cle_ecrite(sender, instance, **kwargs):
+    invalider_repartition(*_immeubles_de_la_cle(instance.pk, instance.immeuble_id))
+
+
+@receiver(post_save, sender=QuotePart)
+@receiver(post_delete, sender=QuotePart)
+def quote_part_ecrite(sender, instance, **kwargs):
+    try:
+        immeuble_id = instance.cle.immeuble_id
+    except ObjectDoesNotExist:
+        # Clé déjà supprimée : ses propres signaux ont invalidé les immeubles
+        return
+    invalider_repartition(*_immeubles_de_la_cle(instance.cle_id, immeuble_id))
@@ -0,0 +1,360 @@
+"""
+Simulation de remboursements anticipés et de renégociations d'un crédit.
+
+Un scénario est une liste d'événements datés appliqués à l'échéancier
+contractuel du crédit :
+  - RemboursementAnticipe : capital remboursé, durée ou mensualité réduite ;
+  - Renegociation : nouveau taux (et frais) sur le capital restant dû ;
+  - Differe : report partiel (intérêts seuls) ou total (intérêts capitalisés) ;
+  - ChangementDuree : nouvelle durée restante.
+
+Les montants sont suivis en centimes entiers (arrondi au centime à chaque
+échéance, comme CreditGenerator) : un scénario sans événement redonne
+l'échéancier en base. L'échéancier de référence est calculé une fois ; chaque
+scénario repart de son état à la veille de son premier événement. Une grille
+de N scénarios (montants × dates) ne recalcule donc que les mois qui suivent
+chaque divergence.
+
+Les montants de remboursement anticipé supportent des indemnités (IRA)
+plafonnées à 6 mois d'intérêts sur le capital remboursé et à 3 % du capital
+restant dû avant le remboursement (article L313-48 du code de la
+consommation).
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from dateutil.relativedelta import relativedelta
+
+from .patrimoine_calculators import CreditGenerator
+
+CENTIME = Decimal('0.01')
+
+REDUIRE_DUREE = 'DUREE'
+REDUIRE_MENSUALITE = 'MENSUALITE'
+
+
+def _centimes(montant):
+    return int((Decimal(str(montant)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def _euros(centimes):
+    return (Decimal(centimes) / 100).quantize(CENTIME)
+
+
+def _taux_mensuel(taux):
+    """Taux mensuel calculé comme CreditGenerator (Decimal), et sa fraction exacte (num, den)."""
+    taux_mensuel = Decimal(str(taux)) / 100 / 12
+    return taux_mensuel, taux_mensuel.as_integer_ratio()
+
+
+def _interets_du_mois(crd, fraction):
+    """Intérêts d'un mois en centimes, arrondis au centime (demi vers le haut), en entiers."""
+    numerateur, denominateur = fraction
+    return (2 * crd * numerateur + denominateur) // (2 * denominateur)
+
+
+def _annuite(crd, taux_mensuel, mois):
+    """Mensualité hors assurance (centimes) amortissant `crd` en `mois` au taux mensuel donné."""
+    if mois <= 0:
+        return crd
+    capital = Decimal(crd) / 100
+    if taux_mensuel == 0:
+        mensualite = capital / mois
+    else:
+        mensualite = capital * (taux_mensuel * (1 + taux_mensuel) ** mois) / ((1 + taux_mensuel) ** mois - 1)
+    return _centimes(mensualite.quantize(CENTIME, rounding=ROUND_HALF_UP))
+
+
+# ─── Événements ──────────────────────────────────────────────────────────────
+
+class Evenement:
+    """Événement appliqué à la première échéance datée du jour `date_effet` ou après."""
+
+    def __init__(self, date_effet):
+        self.date_effet = date_effet
+
+    def appliquer(self, etat):
+        raise NotImplementedError
+
+
+class RemboursementAnticipe(Evenement):
+    """Remboursement partiel de capital (`montant` en euros)."""
+
+    def __init__(self, date_effet, montant, reduire=REDUIRE_DUREE):
+        """
+        Args:
+            date_effet (date): Date du remboursement
+            montant (Decimal): Capital remboursé (plafonné au capital restant dû)
+            reduire (str): REDUIRE_DUREE (mensualité gardée) ou REDUIRE_MENSUALITE (durée gardée)
+        """
+        super().__init__(date_effet)
+        self.montant = _centimes(montant)
+        self.reduire = reduire
+
+    def appliquer(self, etat):
+        montant = min(self.montant, etat.crd)
+        etat.indemnites += min(
+            6 * _interets_du_mois(montant, etat.fraction),
+            (3 * etat.crd + 50) // 100,
+        )
+        etat.rembourse += montant
+        etat.crd -= montant
+        if self.reduire == REDUIRE_MENSUALITE:
+            etat.recalculer_mensualite()
+
+
+class Renegociation(Evenement):
+    """Nouveau taux sur le capital restant dû, durée restante inchangée."""
+
+    def __init__(self, date_effet, taux, frais=0):
+        """
+        Args:
+            date_effet (date): Date de prise d'effet
+            taux (Decimal): Nouveau taux annuel en %
+            frais (Decimal): Frais de dossier, de garantie... en euros
+        """
+        super().__init__(date_effet)
+        self.taux, self.fraction = _taux_mensuel(taux)
+        self.frais = _centimes(frais)
+
+    def appliquer(self, etat):
+        etat.taux, etat.fraction = self.taux, self.fraction
+        etat.frais += self.frais
+        etat.recalculer_mensualite()
+
+
+class Differe(Evenement):
+    """
+    Report d'échéances pendant `mois` mois, qui allonge d'autant le prêt.
+
+    Partiel : seuls les intérêts sont payés. Total : rien n'est payé, les
+    intérêts s'ajoutent au capital restant dû.
+    """
+
+    def __init__(self, date_effet, mois, total=False):
+        super().__init__(date_effet)
+        self.mois = mois
+        self.total = total
+
+    def appliquer(self, etat):
+        etat.differe = self.mois
+        etat.differe_total = self.total
+
+
+class ChangementDuree(Evenement):
+    """Nouvelle durée restante (en mois, échéance de la date d'effet comprise)."""
+
+    def __init__(self, date_effet, duree_restante):
+        super().__init__(date_effet)
+        self.duree_restante = duree_restante
+
+    def appliquer(self, etat):
+        etat.restants = self.duree_restante
+        etat.recalculer_mensualite()
+
+
+class Scenario:
+    """Suite d'événements nommée ; sans événement, l'échéancier contractuel."""
+
+    def __init__(self, nom, evenements=()):
+        self.nom = nom
+        self.evenements = sorted(evenements, key=lambda evenement: evenement.date_effet)
+
+
+def grille_remboursements(montants, dates, reduire=REDUIRE_DUREE):
+    """Un scénario de remboursement anticipé par couple (montant, date)."""
+    return [
+        Scenario(f"{montant} € le {jour:%d/%m/%Y}", [RemboursementAnticipe(jour, montant, reduire)])
+        for jour in dates for montant in montants
+    ]
+
+
+# ─── Moteur ──────────────────────────────────────────────────────────────────
+
+class _Etat:
+    """État du prêt entre deux échéances (montants en centimes)."""
+
+    __slots__ = (
+        'crd', 'taux', 'fraction', 'mensualite', 'restants', 'in_fine', 'differe', 'differe_total',
+        'interets', 'paye', 'rembourse', 'indemnites', 'frais', 'mois', 'derniere_mensualite',
+    )
+
+    def copie(self):
+        copie = _Etat()
+        for attribut in self.__slots__:
+            setattr(copie, attribut, getattr(self, attribut))
+        return copie
+
+    def recalculer_mensualite(self):
+        if not self.in_fine:
+            self.mensualite = _annuite(self.crd, self.taux, self.restants)
+
+    def echeance(self):
+        """Passe une échéance. Returns: bool, False quand le prêt est soldé."""
+        interets = _interets_du_mois(self.crd, self.fraction)
+        self.interets += interets
+        self.mois += 1
+
+        if self.differe:
+            self.differe -= 1
+            if self.differe_total:
+                self.crd += interets
+                paye = 0
+            else:
+                paye = interets
+            if not self.differe:
+                self.recalculer_mensualite()
+        else:
+            if self.restants <= 1 or self.in_fine:
+                capital = self.crd if self.restants <= 1 else 0
+            else:
+                capital = min(self.mensualite - interets, self.crd)
+            self.crd -= capital
+            self.restants -= 1
+            paye = capital + interets
+
+        self.paye += paye
+        self.derniere_mensualite = paye
+        return self.crd > 0
+
+
+class ResultatSimulation:
+    """
+    Résultat d'un scénario.
+
+    Attributs (Decimal en euros sauf mention) :
+        nom (str), interets, assurance, indemnites, frais, cout_total (intérêts,
+        assurance, indemnités et frais), economie (cout_total du crédit de
+        référence moins celui du scénario), duree_mois (int), date_fin (date),
+        derniere_mensualite (hors assurance), courbe_crd (list de (date, Decimal))
+    """
+
+    def __init__(self, nom, credit, etat, crd_mensuels, assurance):
+        self.nom = nom
+        self.interets = _euros(etat.interets)
+        self.assurance = _euros(assurance * etat.mois)
+        self.indemnites = _euros(etat.indemnites)
+        self.frais = _euros(etat.frais)
+        self.cout_total = self.interets + self.assurance + self.indemnites + self.frais
+        self.economie = Decimal('0.00')
+        self.duree_mois = etat.mois
+        self.date_fin = credit.date_debut + relativedelta(months=etat.mois)
+        self.derniere_mensualite = _euros(etat.derniere_mensualite)
+        self._date_debut = credit.date_debut
+        self._capital = _centimes(credit.capital_emprunte)
+        self._crd = crd_mensuels
+
+    @property
+    def courbe_crd(self):
+        """Capital restant dû après chaque échéance : [(date, Decimal)]."""
+        return [
+            (self._date_debut + relativedelta(months=mois), _euros(crd))
+            for mois, crd in enumerate(self._crd, start=1)
+        ]
+
+    def crd_au(self, jour):
+        """Capital restant dû après les échéances datées de `jour` ou avant."""
+        passees = _rang_echeance(self._date_debut, jour)
+        if self._date_debut + relativedelta(months=passees) > jour:
+            passees -= 1
+        if passees <= 0:
+            return _euros(self._capital)
+        if passees > len(self._crd):
+            return Decimal('0.00')
+        return _euros(self._crd[passees - 1])
+
+
+def _rang_echeance(date_debut, jour):
+    """Rang de la première échéance datée de `jour` ou après (1 = première)."""
+    rang = (jour.year - date_debut.year) * 12 + jour.month - date_debut.month
+    if date_debut + relativedelta(months=rang) < jour:
+        rang += 1
+    return max(rang, 1)
+
+
+class SimulateurCredit:
+    """
+    Évalue des scénarios sur un crédit, côte à côte.
+
+    L'échéancier de référence (sans événement) est calculé une fois et ses
+    états mensuels gardés ; un scénario repart de l'état de référence à la
+    veille de son premier événement.
+    """
+
+    def __init__(self, credit):
+        """
+        Args:
+            credit: Instance de CreditImmobilier (non enregistrée acceptée)
+        """
+        self.credit = credit
+        self.assurance = _centimes(credit.assurance_mensuelle or 0)
+
+        etat = _Etat()
+        etat.crd = _centimes(credit.capital_emprunte)
+        etat.taux, etat.fraction = _taux_mensuel(credit.taux_interet)
+        etat.mensualite = _centimes(CreditGenerator(credit).calculer_mensualite())
+        etat.restants = credit.duree_mois
+        etat.in_fine = credit.type_credit == 'IN_FINE'
+        etat.differe = 0
+        etat.differe_total = False
+        etat.interets = etat.paye = etat.rembourse = etat.indemnites = etat.frais = 0
+        etat.mois = etat.derniere_mensualite = 0
+
+        # etats[k] : état après k échéances ; crd_reference[k - 1] : CRD après l'échéance k
+        self._etats = [etat.copie()]
+        self._crd_reference = []
+        while etat.restants > 0 and etat.echeance():
+            self._etats.append(etat.copie())
+            self._crd_reference.append(etat.crd)
+        self._crd_reference.append(etat.crd)
+        self._etat_final = etat
+        self.reference = ResultatSimulation(
+            "Échéancier actuel", credit, etat, self._crd_reference, self.assurance
+        )
+
+    def simuler(self, scenario):
+        """Returns: ResultatSimulation du scénario (economie par rapport à la référence)."""
+        evenements = [
+            (_rang_echeance(self.credit.date_debut, evenement.date_effet), evenement)
+            for evenement in scenario.evenements
+        ]
+        evenements = [(rang, evenement) for rang, evenement in evenements if rang <= len(self._etats)]
+        if not evenements:
+            return ResultatSimulation(
+                scenario.nom, self.credit, self._etat_final, self._crd_reference, self.assurance
+            )
+
+        premier = evenements[0][0]
+        etat = self._etats[premier - 1].copie()
+        crd_mensuels = self._crd_reference[:premier - 1]
+        a_appliquer = iter(evenements)
+        suivant = next(a_appliquer, None)
+        en_cours = True
+        while en_cours:
+            rang = etat.mois + 1
+            while suivant and suivant[0] == rang:
+                suivant[1].appliquer(etat)
+                suivant = next(a_appliquer, None)
+            if etat.crd <= 0:
+                break
+            en_cours = etat.echeance()
+            crd_mensuels.append(etat.crd)
+            if etat.restants <= 0 and not etat.differe:
+                en_cours = False
+
+        resultat = ResultatSimulation(scenario.nom, self.credit, etat, crd_mensuels, self.assurance)
+        resultat.economie = self.reference.cout_total - resultat.cout_total
+        return resultat
+
+    def comparer(self, scenarios):
+        """Returns: list de ResultatSimulation, référence en tête puis un par scénario."""
+        return [self.reference] + [self.simuler(scenario) for scenario in scenarios]
+
+
+def simuler_credits(credits, scenarios):
+    """
+    Mêmes scénarios sur plusieurs crédits (offres de renégociation...).
+
+    Returns:
+        dict: {credit_pk: [ResultatSimulation, référence en tête]}
+    """
+    return {credit.pk: SimulateurCredit(credit).comparer(scenarios) for credit in credits}
@@ -0,0 +1,375 @@
+"""
+File de tâches de fond en base (table Tache), sans courtier externe.
+
+Les traitements longs (ZIP de documents, clôture des charges, campagne de
+révision, régénération d'échéanciers) ne tournent plus dans la requête HTTP,
+sous le timeout de 120 s de gunicorn et en occupant l'un des deux workers :
+la vue crée une Tache (soumettre) et redirige vers sa page de suivi, que
+l'application rafraîchit par HTMX jusqu'au téléchargement du résultat.
+
+Les tâches sont exécutées par `python manage.py traiter_taches`, lancé en
+tâche de fond dans le même conteneur (docker-entrypoint.sh). Plusieurs
+workers peuvent tourner : une tâche est réservée par un UPDATE conditionnel
+sur son statut, qu'un seul d'entre eux peut gagner.
+
+Un traitement est une fonction f(tache) enregistrée par @traitement(type).
+Elle signale son avancement par avancer(tache, fait, total) et dépose son
+résultat dans settings.TACHES_DIR (chemin_resultat).
+
+Pendant l'exécution, un fil du worker renouvelle le battement de la tâche
+(Battement) : une tâche vivante n'est jamais prise pour une orpheline, même
+si son traitement reste longtemps sans appeler avancer().
+"""
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TRAITEMENTS = {}
+
+# Écritures d'avancement espacées d'au moins une seconde (SQLite partagé avec le web)
+INTERVALLE_AVANCEMENT = 1.0
+# Battement d'une tâche en cours, quel que soit son avancement
+INTERVALLE_BATTEMENT = 60.0
+# Tâche EN_COURS sans signe de vie depuis ce délai : worker arrêté en route
+DELAI_ORPHELINE = timedelta(minutes=30)
+
+
+def traitement(type_tache):
+    """Décorateur : enregistre la fonction qui exécute les tâches de ce type."""
+    def enregistrer(fonction):
+        TRAITEMENTS[type_tache] = fonction
+        return fonction
+    return enregistrer
+
+
+def soumettre(type_tache, libelle, parametres=None, utilisateur=None):
+    """
+    Met une tâche en file.
+
+    Args:
+        type_tache (str): Clé de TRAITEMENTS
+        libelle (str): Description affichée dans le suivi
+        parametres (dict): Paramètres JSON du traitement
+        utilisateur: Auteur de la demande (None si inconnu)
+
+    Returns:
+        Tache
+    """
+    from .models import Tache
+
+    if type_tache not in TRAITEMENTS:
+        raise ValueError(f"Type de tâche inconnu : {type_tache}")
+    if utilisateur is not None and not utilisateur.is_authenticated:
+        utilisateur = None
+    tache = Tache.objects.create(
+        type_tache=type_tache, libelle=libelle, parametres=parametres or {}, cree_par=utilisateur,
+    )
+    logger.info(f"Tâche {tache.pk} en file : {libelle}")
+    return tache
+
+
+def avancer(tache, fait, total=None, message=None, forcer=False):
+    """Enregistre l'avancement (au plus une écriture par INTERVALLE_AVANCEMENT)."""
+    from .models import Tache
+
+    tache.avancement = fait
+    if total is not None:
+        tache.total = total
+    if message is not None:
+        tache.message = message
+    maintenant = time.monotonic()
+    if not forcer and maintenant - getattr(tache, '_derniere_ecriture', 0) < INTERVALLE_AVANCEMENT:
+        return
+    tache._derniere_ecriture = maintenant
+    Tache.objects.filter(pk=tache.pk).update(
+        avancement=tache.avancement, total=tache.total, message=tache.message, battement=timezone.now(),
+    )
+
+
+def chemin_resultat(tache, nom_fichier):
+    """Chemin du fichier produit par la tâche (enregistré sur la tâche)."""
+    dossier = Path(settings.TACHES_DIR)
+    dossier.mkdir(parents=True, exist_ok=True)
+    tache.fichier = str(dossier / f"{tache.pk}_{nom_fichier}")
+    tache.nom_fichier = nom_fichier
+    return Path(tache.fichier)
+
+
+def abandonner_resultat(tache):
+    """Supprime le fichier (partiel) d'une tâche dont le traitement a échoué."""
+    if tache.fichier:
+        Path(tache.fichier).unlink(missing_ok=True)
+    tache.fichier = tache.nom_fichier = ''
+
+
+def reserver_tache():
+    """Réserve la plus ancienne tâche en attente, ou None si la file est vide."""
+    from .models import Tache
+
+    en_attente = Tache.objects.filter(statut='EN_ATTENTE').order_by('cree_le', 'pk')
+    for pk in en_attente.values_list('pk', flat=True)[:10]:
+        maintenant = timezone.now()
+        # Un seul worker voit cet UPDATE modifier une ligne
+        if Tache.objects.filter(pk=pk, statut='EN_ATTENTE').update(
+            statut='EN_COURS', debut=maintenant, battement=maintenant,
+        ):
+            return Tache.objects.get(pk=pk)
+    return None
+
+
+class Battement(threading.Thread):
+    """Fil qui renouvelle le battement d'une tâche EN_COURS jusqu'à arreter()."""
+
+    def __init__(self, tache, intervalle=None):
+        super().__init__(name=f"battement-tache-{tache.pk}", daemon=True)
+        self.tache_id = tache.pk
+        self.intervalle = INTERVALLE_BATTEMENT if intervalle is None else intervalle
+        self._arret = threading.Event()
+
+    def battre(self):
+        """Signe de vie de la tâche (sans effet si elle n'est plus en cours)."""
+        from .models import Tache
+        return Tache.objects.filter(pk=self.tache_id, statut='EN_COURS').update(battement=timezone.now())
+
+    def run(self):
+        try:
+            while not self._arret.wait(self.intervalle):
+                try:
+                    self.battre()
+                except DatabaseError:
+                    logger.exception(f"Battement de la tâche {self.tache_id} en échec")
+        finally:
+            # Connexion propre à ce fil
+            connection.close()
+
+    def arreter(self):
+        self._arret.set()
+        self.join()
+
+
+def executer(tache):
+    """
+    Exécute une tâche réservée et enregistre son issue.
+
+    Les exceptions du traitement passent la tâche en échec ; seule une
+    DatabaseError de l'enregistrement final remonte (au worker).
+    """
+    debut = time.monotonic()
+    battement = Battement(tache)
+    battement.start()
+    try:
+        TRAITEMENTS[tache.type_tache](tache)
+    except Exception as e:
+        logger.exception(f"Tâche {tache.pk} ({tache.type_tache}) en échec")
+        # Archive à moitié écrite : ni conservée, ni proposée au téléchargement
+        abandonner_resultat(tache)
+        tache.statut = 'ECHEC'
+        tache.message = f"{tache.message}\n{e}".strip()
+    else:
+        tache.statut = 'TERMINEE'
+        tache.avancement = tache.total
+    finally:
+        battement.arreter()
+    tache.fin = timezone.now()
+    tache.battement = tache.fin
+    tache.save(update_fields=[
+        'statut', 'avancement', 'total', 'message', 'fichier', 'nom_fichier', 'fin', 'battement',
+    ])
+    logger.info(f"Tâche {tache.pk} {tache.statut.lower()} en {time.monotonic() - debut:.1f} s")
+    return tache
+
+
+def traiter_en_attente(limite=None):
+    """
+    Exécute les tâches en attente, l'une après l'autre.
+
+    Returns:
+        int: Nombre de tâches exécutées
+    """
+    nombre = 0
+    while limite is None or nombre < limite:
+        tache = reserver_tache()
+        if tache is None:
+            break
+        executer(tache)
+        nombre += 1
+    return nombre
+
+
+def abandonner_orphelines(delai=DELAI_ORPHELINE):
+    """Passe en échec les tâches EN_COURS muettes depuis `delai` (worker arrêté)."""
+    from .models import Tache
+
+    nombre = Tache.objects.filter(statut='EN_COURS', battement__lt=timezone.now() - delai).update(
+        statut='ECHEC', fin=timezone.now(), message="Interrompue : le worker s'est arrêté pendant l'exécution.",
+    )
+    if nombre:
+        logger.warning(f"{nombre} tâche(s) orpheline(s) passée(s) en échec")
+    return nombre
+
+
+def relancer(taches):
+    """
+    Remet en file des tâches terminées ou en échec (mêmes paramètres).
+
+    Returns:
+        int: Nombre de tâches remises en file
+    """
+    taches = taches.filter(statut__in=('TERMINEE', 'ECHEC'))
+    _supprimer_fichiers(taches)
+    return taches.update(
+        statut='EN_ATTENTE', avancement=0, message='', fichier='', nom_fichier='',
+        debut=None, fin=None, battement=None,
+    )
+
+
+def purger(age_max_jours):
+    """
+    Supprime les tâches terminées depuis plus de `age_max_jours` jours, et leurs fichiers.
+
+    Returns:
+        int: Nombre de tâches supprimées
+    """
+    from .models import Tache
+
+    anciennes = Tache.objects.filter(
+        statut__in=('TERMINEE', 'ECHEC'), fin__lt=timezone.now() - timedelta(days=age_max_jours),
+    )
+    _supprimer_fichiers(anciennes)
+    nombre, _ = anciennes.delete()
+    return nombre
+
+
+def _supprimer_fichiers(taches):
+    for fichier in taches.exclude(fichier='').values_list('fichier', flat=True):
+        try:
+            os.remove(fichier)
+        except FileNotFoundError:
+            pass
+
+
+# ─── Traitements ─────────────────────────────────────────────────────────────
+
+def _ecrire_zip(tache, lot, nom_archive):
+    """Écrit le ZIP d'un lot de documents en signalant chaque PDF rendu."""
+    from .documents_lot import zip_en_flux
+
+    total = len(lot)
+    if not total:
+        tache.message = "Aucun document à générer."
+        return
+    avancer(tache, 0, total, forcer=True)
+
+    def documents():
+        for fait, document in enumerate(lot, start=1):
+            yield document
+            avancer(tache, fait)
+
+    chemin = chemin_resultat(tache, nom_archive)
+    with open(chemin, 'wb') as sortie:
+        for morceau in zip_en_flux(documents()):
+            sortie.write(morceau)
+
+    tache.message = f"{total - len(lot.erreurs)} document(s) générés."
+    if lot.erreurs:
+        tache.message += f" {len(lot.erreurs)} en erreur :\n" + "\n".join(
+            f"- {bail} : {erreur}" for bail, erreur in lot.erreurs
+        )
+
+
+def _baux(parametres):
+    from .models import Bail
+    return Bail.objects.filter(pk__in=parametres['baux'])
+
+
+@traitement('quittances_zip')
+def traiter_quittances(tache):
+    from .documents_lot import LotQuittances
+    periode = date.fromisoformat(tache.parametres['periode'])
+    _ecrire_zip(tache, LotQuittances(_baux(tache.parametres), periode), f"Quittances_{periode:%Y-%m}.zip")
+
+
+@traitement('avis_echeance_zip')
+def traiter_avis_echeance(tache):
+    from .documents_lot import LotAvisEcheance
+    periode = date.fromisoformat(tache.parametres['periode'])
+    _ecrire_zip(tache, LotAvisEcheance(_baux(tache.parametres), periode), f"Avis_Echeance_{periode:%Y-%m}.zip")
+
+
+@traitement('regularisations_zip')
+def traiter_regularisations(tache):
+    """Régularisations de baux choisis, ou de tous les baux présents des immeubles choisis."""
+    from .documents_lot import LotRegularisations
+    from .models import Immeuble
+    from .regularisation import baux_presents
+
+    debut = date.fromisoformat(tache.parametres['date_debut'])
+    fin = date.fromisoformat(tache.parametres['date_fin'])
+    if 'immeubles' in tache.parametres:
+        baux = baux_presents(debut, fin, Immeuble.objects.filter(pk__in=tache.parametres['immeubles']))
+    else:
+        baux = _baux(tache.parametres)
+    avancer(tache, 0, message="Calcul des décomptes...", forcer=True)
+    _ecrire_zip(tache, LotRegularisations(baux, debut, fin), f"Regularisations_{debut:%Y}.zip")
+
+
+@traitement('campagne_revision')
+def traiter_campagne_revision(tache):
+    """
+    Applique la campagne puis rend les courriers.
+
+    Les révisions sont enregistrées (appliquer) avant le rendu : leurs
+    courriers sont conservés dans les paramètres de la tâche, qu'une tâche
+    relancée rend sans réviser une seconde fois. Un rendu en échec n'annule
+    pas les révisions : la tâche aboutit, avec l'erreur dans son message.
+    """
+    from .revision_campagne import CampagneRevision, LotRevisions
+
+    annee, mois = tache.parametres['annee'], tache.parametres['mois']
+    if 'courriers' not in tache.parametres:
+        campagne = CampagneRevision(annee, mois)
+        campagne.appliquer()
+        tache.parametres['courriers'] = campagne.arguments_courriers()
+        tache.parametres['ecartes'] = len(campagne.ecartes)
+        tache.save(update_fields=['parametres'])
+    courriers = tache.parametres['courriers']
+    if not courriers:
+        tache.message = "Aucun bail à réviser pour ce mois."
+        return
+
+    bilan = f"{len(courriers)} loyer(s) révisé(s), {tache.parametres['ecartes']} bail(s) écarté(s). "
+    try:
+        _ecrire_zip(tache, LotRevisions(annee, mois, courriers), f"Revisions_{annee}-{mois:02d}.zip")
+    except Exception as e:
+        logger.exception(f"Courriers de la campagne {mois:02d}/{annee} (tâche {tache.pk}) en échec")
+        abandonner_resultat(tache)
+        tache.message = bilan + f"Courriers non générés ({e}) : relancer la tâche pour les produire."
+        return
+    tache.message = bilan + tache.message
+
+
+@traitement('echeanciers')
+def traiter_echeanciers(tache):
+    from .models import CreditImmobilier
+    from .patrimoine_calculators import CreditGenerator
+
+    credits = list(CreditImmobilier.objects.filter(pk__in=tache.parametres['credits']))
+    total = {'total': 0, 'creees': 0, 'modifiees': 0, 'supprimees': 0}
+    avancer(tache, 0, len(credits), forcer=True)
+    for fait, credit in enumerate(credits, start=1):
+        for cle, valeur in CreditGenerator(credit).synchroniser_echeances().items():
+            total[cle] += valeur
+        avancer(tache, fait)
+    tache.message = (
+        f"{total['total']} échéances pour {len(credits)} crédit(s) : {total['creees']} créée(s), "
+        f"{total['modifiees']} modifiée(s), {total['supprimees']} supprimée(s)."
+    )
@@ -3,12 +3,15 @@ Tests de non-regression pour les calculs financiers et la securite.
 
 Chaque test porte la reference du constat d'audit qu'il verrouille (C-01, E-03...).
 """
-from datetime import date
-from decimal import Decimal
+import io
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
 
 from django.contrib.auth.models import User
 from django.test import TestCase, Client
-from django.test.utils import CaptureQueriesContext
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.db import connection
 from django.core.exceptions import ValidationError
 
@@ -16,14 +19,37 @@ from core.models import (
     Proprietaire, Immeuble, Local, Bail, BailTarification, Occupant,
     CleRepartition, QuotePart, Depense, Consommation, Regularisation,
     CreditImmobilier, ChargeFiscale, VacanceLocative, EstimationValeur, Ajustement,
+    IndiceReference, Tache,
 )
 from core.calculators import BailCalculator
 from core.patrimoine_calculators import (
-    CreditGenerator, FiscaliteCalculator, RentabiliteCalculator,
+    CreditGenerator, FiscaliteCalculator, PatrimoineCalculator, RentabiliteCalculator,
 )
 
 
-class BaseFixture(TestCase):
+class TestCaseIsole(TestCase):
+    """Cache memoire et dossiers temporaires (PDF en cache, fichiers des taches).
+
+    Le cache fichier et les dossiers du volume de donnees garderaient d'un
+    lancement a l'autre des indicateurs (memes pk), des compteurs de connexion
+    et des PDF qui fausseraient les resultats.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        dossier = tempfile.TemporaryDirectory(prefix='gestion_locative_tests_')
+        cls.addClassCleanup(dossier.cleanup)
+        reglages = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            PDF_CACHE_DIR=Path(dossier.name) / 'pdf',
+            TACHES_DIR=Path(dossier.name) / 'taches',
+        )
+        reglages.enable()
+        cls.addClassCleanup(reglages.disable)
+        super().setUpClass()
+
+
+class BaseFixture(TestCaseIsole):
     """Jeu de donnees minimal partage."""
 
     def setUp(self):
@@ -154,6 +180,39 @@ class BilanFiscalTests(BaseFixture):
         self.assertEqual(bilan['charges']['interets_emprunts'], Decimal("1980"))
         self.assertEqual(bilan['resultat']['total_charges'], Decimal("1980"))
 
+    def test_frais_financiers_en_une_requete(self):
+        """P-06 : interets et assurance de tout le portefeuille en une requete groupee."""
+        autre = Immeuble.objects.create(
+            proprietaire=self.proprietaire, nom="B", adresse="b", ville="Lyon",
+            code_postal="69001", prix_achat=Decimal("100000"), date_achat=date(2020, 1, 1),
+        )
+        for credit in (
+            CreditImmobilier.objects.create(
+                immeuble=self.immeuble, nom_banque="Autre", capital_emprunte=Decimal("50000"),
+                taux_interet=Decimal("3"), duree_mois=120, date_debut=date(2023, 6, 1),
+            ),
+            CreditImmobilier.objects.create(
+                immeuble=autre, nom_banque="B", capital_emprunte=Decimal("80000"),
+                taux_interet=Decimal("1.5"), duree_mois=180, date_debut=date(2022, 1, 1),
+                assurance_mensuelle=Decimal("10"),
+            ),
+        ):
+            CreditGenerator(credit).creer_echeances_en_base()
+
+        with self.assertNumQueries(1):
+            frais = RentabiliteCalculator.get_frais_financiers(annees=[2024, 2025])
+        self.assertEqual(len(frais), 4)
+        attendu = sum(
+            e.interets for c in self.immeuble.credits.all()
+            for e in c.echeances.filter(date_echeance__year=2024)
+        )
+        self.assertEqual(frais[(self.immeuble.pk, 2024)]['interets'], attendu)
+        self.assertEqual(frais[(autre.pk, 2025)]['assurance'], Decimal("120"))
+
+        immeuble = Immeuble.objects.prefetch_related('credits__echeances').get(pk=self.immeuble.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(RentabiliteCalculator.get_interets_annuels(immeuble, 2024), attendu)
+
 
 class CoutAcquisitionTests(BaseFixture):
     """E-03 : le prix d'achat est hors frais, les frais s'ajoutent une seule fois."""
@@ -197,6 +256,43 @@ class CreditTests(BaseFixture):
         self.assertEqual(echeancier[-1]['capital_restant_du'], Decimal("0.00"))
 
 
+class TableauAmortissementTests(BaseFixture):
+    """P-05 : CRD et cumuls lus dans l'echeancier en cache, invalide quand le credit change."""
+
+    def setUp(self):
+        super().setUp()
+        self.credit = CreditImmobilier.objects.create(
+            immeuble=self.immeuble, nom_banque="B", capital_emprunte=Decimal("150000"),
+            taux_interet=Decimal("3.2"), duree_mois=180, date_debut=date(2022, 3, 10),
+            assurance_mensuelle=Decimal("25"),
+        )
+        self.echeancier = CreditGenerator(self.credit).generer_echeancier()
+
+    def test_crd_et_cumuls_conformes_a_l_echeancier(self):
+        e = self.echeancier[23]
+        self.assertEqual(self.credit.get_capital_restant_du_at(e['date_echeance']), e['capital_restant_du'])
+        veille = e['date_echeance'] - timedelta(days=1)
+        self.assertEqual(self.credit.get_capital_restant_du_at(veille), self.echeancier[22]['capital_restant_du'])
+        self.assertEqual(self.credit.get_capital_restant_du_at(date(2022, 3, 1)), Decimal("150000"))
+        self.assertEqual(self.credit.get_capital_restant_du_at(date(2040, 1, 1)), Decimal("0.00"))
+
+        tableau = self.credit.tableau_amortissement
+        self.assertEqual(
+            tableau.interets_entre(date(2023, 1, 1), date(2023, 12, 31)),
+            sum(x['interets'] for x in self.echeancier if x['date_echeance'].year == 2023),
+        )
+        self.assertEqual(tableau.assurance_entre(date(2023, 1, 1), date(2023, 12, 31)), Decimal("300"))
+        self.assertEqual(self.credit.mensualite_hors_assurance, CreditGenerator(self.credit).calculer_mensualite())
+
+    def test_cache_invalide_quand_le_credit_change(self):
+        tableau = self.credit.tableau_amortissement
+        self.assertIs(CreditImmobilier.objects.get(pk=self.credit.pk).tableau_amortissement, tableau)
+        self.credit.taux_interet = Decimal("2.5")
+        self.credit.save()
+        self.assertIsNot(self.credit.tableau_amortissement, tableau)
+        self.assertLess(self.credit.mensualite_hors_assurance, tableau.mensualite_hors_assurance)
+
+
 class ModelValidationTests(BaseFixture):
     """M-09 : validations metier manquantes."""
 
@@ -328,7 +424,213 @@ class PerformanceTests(BaseFixture):
         self.assertLessEqual(len(requetes), 1)
 
 
-class FiltresTests(TestCase):
+class BudgetRequetesTests(TestCaseIsole):
+    """P-09 : le nombre de requetes de chaque page ne croit pas avec le portefeuille.
+
+    Chaque URL de core/urls.py et core/urls_app.py, et chaque liste de l'admin,
+    est mesuree sur des portefeuilles de tailles croissantes (cache vide).
+    Tailles par defaut : 1 et 10 immeubles ; BUDGET_REQUETES_TAILLES=1,10,100
+    pour le banc complet, BUDGET_REQUETES_RAPPORT=1 pour afficher les mesures.
+    """
+
+    # Modeles designes par le premier segment des routes (locaux/<pk>/...)
+    SEGMENTS = {
+        'immeubles': 'immeuble', 'locaux': 'local', 'baux': 'bail',
+        'occupants': 'occupant', 'estimations': 'estimation', 'credits': 'credit',
+        'depenses': 'depense', 'cles': 'cle', 'quotesparts': 'quotepart',
+        'consommations': 'consommation', 'regularisations': 'regularisation',
+        'ajustements': 'ajustement', 'taches': 'tache',
+    }
+    # Parametres nommes des routes imbriquees et de l'API
+    PARAMETRES = {
+        'immeuble_pk': 'immeuble', 'immeuble_id': 'immeuble', 'local_pk': 'local',
+        'bail_pk': 'bail', 'cle_pk': 'cle',
+    }
+    ONGLETS = {
+        'app_immeuble_tab': ('general', 'locaux', 'finances', 'estimations', 'consommations'),
+        'app_bail_tab': ('info', 'occupants', 'regularisations', 'documents'),
+    }
+    # Parametres GET obligatoires de certaines routes
+    REQUETES = {'regularisation_apercu': 'date_debut=2024-01-01&date_fin=2024-12-31'}
+    # Vues qui ne s'appellent pas en GET dans un banc (deconnexion, ecriture, fichier de tache)
+    EXCLUES = {'app_logout', 'creer_tarification_from_revision', 'app_tache_telecharger'}
+
+    def _peupler(self, nb_immeubles):
+        """Portefeuille synthetique ; chaque immeuble a 2 + nb_immeubles // 10 locaux."""
+        proprietaire = Proprietaire.objects.create(
+            nom="Banc", adresse="a", ville="Lyon", code_postal="69001"
+        )
+        objets = {}
+        for i in range(nb_immeubles):
+            immeuble = Immeuble.objects.create(
+                proprietaire=proprietaire, nom=f"Immeuble {i:03d}", adresse="a",
+                ville="Lyon", code_postal="69001", prix_achat=Decimal("200000"),
+                date_achat=date(2020, 1, 1), frais_notaire=Decimal("15000"),
+            )
+            cle = CleRepartition.objects.create(immeuble=immeuble, nom="Generales")
+            cle_eau = CleRepartition.objects.create(
+                immeuble=immeuble, nom="Eau", mode_repartition='CONSOMMATION',
+                prix_unitaire=Decimal("4.5"),
+            )
+            Depense.objects.create(
+                immeuble=immeuble, cle_repartition=cle, date=date(2024, 5, 1),
+                libelle="EDF", montant=Decimal("1200"),
+            )
+            credit = CreditImmobilier.objects.create(
+                immeuble=immeuble, nom_banque="Banque", capital_emprunte=Decimal("150000"),
+                taux_interet=Decimal("2"), duree_mois=240, date_debut=date(2021, 1, 1),
+                assurance_mensuelle=Decimal("20"),
+            )
+            CreditGenerator(credit).creer_echeances_en_base()
+            estimation = EstimationValeur.objects.create(
+                immeuble=immeuble, date_estimation=date(2024, 1, 1),
+                valeur_estimee=Decimal("240000"),
+            )
+            ChargeFiscale.objects.create(
+                immeuble=immeuble, type_charge='TAXE_FONCIERE', annee=2024,
+                montant=Decimal("800"),
+            )
+            for j in range(2 + nb_immeubles // 10):
+                local = Local.objects.create(
+                    immeuble=immeuble, numero_porte=str(j), surface_m2=Decimal("50")
+                )
+                quotepart = QuotePart.objects.create(cle=cle, local=local, valeur=Decimal("100"))
+                consommation = Consommation.objects.create(
+                    local=local, cle_repartition=cle_eau, date_releve=date(2024, 12, 31),
+                    index_debut=Decimal("100"), index_fin=Decimal("130"),
+                )
+                VacanceLocative.objects.create(
+                    local=local, date_debut=date(2019, 10, 1), date_fin=date(2019, 12, 31)
+                )
+                ancien = Bail.objects.create(
+                    local=local, date_debut=date(2018, 1, 1), date_fin=date(2019, 9, 30),
+                    actif=False,
+                )
+                BailTarification.objects.create(
+                    bail=ancien, date_debut=date(2018, 1, 1),
+                    loyer_hc=Decimal("480"), charges=Decimal("80"),
+                )
+                bail = Bail.objects.create(
+                    local=local, date_debut=date(2020, 1, 1), depot_garantie=Decimal("900")
+                )
+                BailTarification.objects.create(
+                    bail=bail, date_debut=date(2020, 1, 1), date_fin=date(2023, 12, 31),
+                    loyer_hc=Decimal("500"), charges=Decimal("100"),
+                )
+                BailTarification.objects.create(
+                    bail=bail, date_debut=date(2024, 1, 1), loyer_hc=Decimal("520"),
+                    charges=Decimal("100"), indice_reference=Decimal("143.46"),
+                    trimestre_reference="T1 2024",
+                )
+                occupant = Occupant.objects.create(bail=bail, nom=f"L{j}", prenom="C")
+                regularisation = Regularisation.objects.create(
+                    bail=bail, date_debut=date(2023, 1, 1), date_fin=date(2023, 12, 31),
+                    montant_reel=Decimal("1100"), montant_provisions=Decimal("1200"),
+                    solde=Decimal("-100"),
+                )
+                ajustement = Ajustement.objects.create(
+                    bail=bail, date=date(2024, 3, 1), libelle="Geste", montant=Decimal("-20")
+                )
+            if i == 0:
+                # Le premier immeuble (et son dernier local) sert de cible aux pages de detail
+                objets = {
+                    'immeuble': immeuble, 'local': local, 'bail': bail, 'occupant': occupant,
+                    'estimation': estimation, 'credit': credit, 'depense': immeuble.depenses.first(),
+                    'cle': cle, 'quotepart': quotepart, 'consommation': consommation,
+                    'regularisation': regularisation, 'ajustement': ajustement,
+                    'tache': Tache.objects.create(
+                        type_tache='echeanciers', libelle="Echeanciers", statut='TERMINEE',
+                    ),
+                }
+        return objets
+
+    def _urls(self, objets):
+        """URL de chaque route GET des deux applications, puis les listes de l'admin."""
+        from django.contrib import admin
+        from django.urls import reverse
+        from core import urls, urls_app
+
+        adresses = []
+        for prefixe, module in (('/api/', urls), ('/app/', urls_app)):
+            for motif in module.urlpatterns:
+                if motif.name in self.EXCLUES:
+                    continue
+                route = str(motif.pattern)
+                segment = self.SEGMENTS.get(route.split('/')[0])
+                parametres = {}
+                for nom in motif.pattern.converters:
+                    if nom == 'pk':
+                        parametres[nom] = objets[segment or 'bail'].pk
+                    elif nom in self.PARAMETRES:
+                        parametres[nom] = objets[self.PARAMETRES[nom]].pk
+                for onglet in self.ONGLETS.get(motif.name, [None]):
+                    if onglet:
+                        parametres['tab'] = onglet
+                    adresse = reverse(motif.name, kwargs=parametres)
+                    if motif.name in self.REQUETES:
+                        adresse += '?' + self.REQUETES[motif.name]
+                    adresses.append(adresse)
+        for modele in admin.site._registry:
+            adresses.append(reverse(
+                f'admin:{modele._meta.app_label}_{modele._meta.model_name}_changelist'
+            ))
+        return adresses
+
+    def _mesurer(self, nb_immeubles):
+        """{nom de la route: (requetes, secondes)} pour un portefeuille de nb_immeubles."""
+        import time
+        from django.core.cache import cache
+        from django.db import transaction
+        from django.urls import resolve
+
+        mesures = {}
+        with transaction.atomic():
+            objets = self._peupler(nb_immeubles)
+            self.client.force_login(
+                User.objects.create_superuser('banc', 'b@c.d', 'motdepasse-solide-1')
+            )
+            for url in self._urls(objets):
+                cache.clear()
+                debut = time.perf_counter()
+                with CaptureQueriesContext(connection) as requetes:
+                    reponse = self.client.get(url)
+                duree = time.perf_counter() - debut
+                self.assertLess(reponse.status_code, 400, url)
+                correspondance = resolve(url.split('?')[0])
+                nom = correspondance.url_name + (
+                    f"[{correspondance.kwargs['tab']}]" if 'tab' in correspondance.kwargs else ''
+                )
+                mesures[nom] = (len(requetes), duree)
+            transaction.set_rollback(True)
+        return mesures
+
+    def test_requetes_independantes_de_la_taille(self):
+        import os
+        tailles = [
+            int(taille) for taille in os.environ.get('BUDGET_REQUETES_TAILLES', '1,10').split(',')
+        ]
+        mesures = {taille: self._mesurer(taille) for taille in tailles}
+
+        if os.environ.get('BUDGET_REQUETES_RAPPORT'):
+            print(f"\n{'page':45}" + ''.join(f"{f'{t} imm.':>18}" for t in tailles))
+            for nom in mesures[tailles[0]]:
+                print(f"{nom:45}" + ''.join(
+                    f"{mesures[t][nom][0]:>7} req {mesures[t][nom][1] * 1000:>6.0f} ms"
+                    for t in tailles
+                ))
+
+        croissances = [
+            f"{nom} : " + " -> ".join(str(mesures[t][nom][0]) for t in tailles)
+            for nom in mesures[tailles[0]]
+            if len({mesures[t][nom][0] for t in tailles}) > 1
+        ]
+        self.assertEqual(
+            croissances, [],
+            "Requetes croissant avec la taille du portefeuille :\n" + "\n".join(croissances),
+        )
+
+
+class FiltresTests(TestCaseIsole):
     """M-08 : une valeur absente ne doit pas s'afficher comme un montant nul."""
 
     def test_euro_valeur_absente(self):
@@ -403,7 +705,7 @@ class GenerationPdfTests(BaseFixture):
             local=self.local, cle_repartition=cle_eau, date_releve=date(2024, 6, 30),
             index_debut=Decimal("100"), index_fin=Decimal("150"),
         )
-        with self.assertLogs('core.pdf_generator', level='WARNING') as journal:
+        with self.assertLogs('core.regularisation', level='WARNING') as journal:
             self._generateur().generer_regularisation('2024-01-01', '2024-12-31', False)
         self.assertTrue(any("NON FACTURE" in ligne for ligne in journal.output))
 
@@ -420,7 +722,1498 @@ class GenerationPdfTests(BaseFixture):
         self.assertTrue(pdf.startswith(b'%PDF'))
 
 
-class ToutesLesPagesTests(TestCase):
+class QuittancesParLotTests(BaseFixture):
+    """P-01 / P-02 : lots de documents en requetes fixes, ZIP envoye en flux."""
+
+    def _creer_baux(self, nombre):
+        for i in range(nombre):
+            local = Local.objects.create(
+                immeuble=self.immeuble, numero_porte=f"L{i}", surface_m2=Decimal("40")
+            )
+            bail = Bail.objects.create(local=local, date_debut=date(2024, 1, 1))
+            BailTarification.objects.create(
+                bail=bail, date_debut=date(2024, 1, 1),
+                loyer_hc=Decimal("500"), charges=Decimal("50"),
+            )
+            Occupant.objects.create(bail=bail, nom=f"Nom {i}", prenom="A", role='LOCATAIRE')
+
+    def _generer(self, **kwargs):
+        from core.documents_lot import LotQuittances
+        lot = LotQuittances(Bail.objects.all(), date(2024, 3, 1), **kwargs)
+        return lot, list(lot)
+
+    def test_nombre_de_requetes_independant_du_nombre_de_baux(self):
+        self._creer_baux(2)
+        with CaptureQueriesContext(connection) as petit_lot:
+            _, fichiers = self._generer(processus=0)
+        self.assertEqual(len(fichiers), 2)
+
+        self._creer_baux(6)
+        with CaptureQueriesContext(connection) as grand_lot:
+            _, fichiers = self._generer(processus=0)
+        self.assertEqual(len(fichiers), 8)
+        self.assertEqual(len(grand_lot), len(petit_lot))
+
+    def test_bail_sans_tarification_ignore(self):
+        self._creer_baux(2)
+        Bail.objects.create(local=self.local, date_debut=date(2024, 1, 1))
+        lot, fichiers = self._generer(processus=0)
+        self.assertEqual(len(fichiers), 2)
+        self.assertEqual(len(lot.erreurs), 1)
+        self.assertEqual(fichiers[0][0], "Quittance_NOM_0_L0_2024-03.pdf")
+
+    def test_rendu_multi_processus_identique(self):
+        self._creer_baux(3)
+        _, sequentiel = self._generer(processus=0)
+        _, parallele = self._generer(processus=2)
+        self.assertEqual([nom for nom, _ in parallele], [nom for nom, _ in sequentiel])
+        self.assertTrue(all(pdf.startswith(b'%PDF') for _, pdf in parallele))
+
+    def test_zip_en_flux_un_morceau_par_document(self):
+        import io
+        import zipfile
+        from core.documents_lot import LotAvisEcheance, zip_en_flux
+        self._creer_baux(3)
+        lot = LotAvisEcheance(Bail.objects.all(), date(2024, 3, 1), processus=0)
+        morceaux = list(zip_en_flux(lot))
+        # Un morceau par PDF + le repertoire central
+        self.assertEqual(len(morceaux), 4)
+        with zipfile.ZipFile(io.BytesIO(b''.join(morceaux))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(len(archive.namelist()), 3)
+            self.assertTrue(archive.namelist()[0].startswith("Avis_Echeance_NOM_0_L0"))
+
+    def test_action_admin_passe_par_une_tache(self):
+        self._creer_baux(2)
+        admin_user = User.objects.create_superuser('admin', password='motdepasse-solide-1')
+        self.client.force_login(admin_user)
+        reponse = self.client.post('/admin/core/bail/', {
+            'action': 'generer_regularisations_zip',
+            '_selected_action': list(Bail.objects.values_list('pk', flat=True)),
+        })
+        # Le ZIP est produit par le worker de taches, pas dans la requete
+        self.assertEqual(reponse.status_code, 302)
+        self.assertEqual(Regularisation.objects.count(), 0)
+        from core import taches
+        self.assertEqual(taches.traiter_en_attente(), 1)
+        reponse = self.client.get(reponse.url.rstrip('/') + '/telecharger/')
+        self.assertTrue(b''.join(reponse.streaming_content).startswith(b'PK'))
+        self.assertEqual(Regularisation.objects.count(), 2)
+
+
+class EtatLocatifTests(BaseFixture):
+    """P-03 : l'etat locatif entier donne les memes loyers, au centime, que l'ancien calcul Decimal."""
+
+    def setUp(self):
+        super().setUp()
+        bail = Bail.objects.create(
+            local=self.local, date_debut=date(2023, 3, 15), date_fin=date(2025, 8, 20),
+        )
+        BailTarification.objects.create(
+            bail=bail, date_debut=date(2023, 3, 15), date_fin=date(2024, 2, 9),
+            loyer_hc=Decimal("733.33"),
+        )
+        BailTarification.objects.create(
+            bail=bail, date_debut=date(2024, 2, 10), loyer_hc=Decimal("751.17"),
+        )
+        local = Local.objects.create(
+            immeuble=self.immeuble, numero_porte="2", surface_m2=Decimal("80")
+        )
+        bail = Bail.objects.create(
+            local=local, date_debut=date(2024, 5, 7), frequence_paiement='TRIMESTRIEL',
+        )
+        BailTarification.objects.create(
+            bail=bail, date_debut=date(2024, 5, 7), loyer_hc=Decimal("2000.01"),
+        )
+
+    @staticmethod
+    def _loyers_reference(immeuble, annee):
+        """Ancien algorithme (Decimal, mois par mois), conserve comme reference."""
+        import calendar
+        total = Decimal('0')
+        for local in immeuble.locaux.all():
+            for bail in local.baux.all():
+                debut = max(bail.date_debut, date(annee, 1, 1))
+                fin = min(bail.date_fin or date(annee, 12, 31), date(annee, 12, 31))
+                for mois in range(1, 13):
+                    nb = calendar.monthrange(annee, mois)[1]
+                    p_start = max(date(annee, mois, 1), debut)
+                    p_end = min(date(annee, mois, nb), fin)
+                    if p_start > p_end:
+                        continue
+                    for tarif in bail.get_tarifications_for_period(p_start, p_end):
+                        s = max(p_start, tarif.date_debut)
+                        e = min(p_end, tarif.date_fin) if tarif.date_fin else p_end
+                        if s > e:
+                            continue
+                        loyer = tarif.loyer_hc / 3 if bail.frequence_paiement == 'TRIMESTRIEL' else tarif.loyer_hc
+                        total += loyer * Decimal((e - s).days + 1) / Decimal(nb)
+        return total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    def test_identique_a_l_ancien_calcul(self):
+        for annee in range(2022, 2027):
+            self.assertEqual(
+                RentabiliteCalculator.get_loyers_annuels(self.immeuble, annee),
+                self._loyers_reference(self.immeuble, annee),
+                annee,
+            )
+
+    def test_portefeuille_en_une_passe(self):
+        from core.etat_locatif import EtatLocatif
+        with self.assertNumQueries(2):
+            etat = EtatLocatif.depuis_immeubles()
+        with self.assertNumQueries(0):
+            etat.calculer(range(2022, 2027))
+            total = etat.loyers_portefeuille(2024)
+        self.assertEqual(total, self._loyers_reference(self.immeuble, 2024))
+        self.assertEqual(etat.loyers_annuels(self.immeuble.pk, 2022), Decimal('0.00'))
+
+
+class LoyersDusTests(BaseFixture):
+    """P-04 : la table des loyers dus suit les tarifications, mois par mois."""
+
+    def setUp(self):
+        super().setUp()
+        self.bail = Bail.objects.create(
+            local=self.local, date_debut=date(2024, 1, 15), soumis_tva=True,
+        )
+        self.tarif = BailTarification.objects.create(
+            bail=self.bail, date_debut=date(2024, 1, 15), date_fin=date(2024, 6, 30),
+            loyer_hc=Decimal("700"), charges=Decimal("90"),
+        )
+        BailTarification.objects.create(
+            bail=self.bail, date_debut=date(2024, 7, 1),
+            loyer_hc=Decimal("720"), charges=Decimal("95"),
+        )
+
+    def test_totaux_identiques_aux_calculateurs(self):
+        from core.etat_locatif import EtatLocatif
+        from core.loyers_dus import horizon_materialise, provisions_dues
+        etat = EtatLocatif.depuis_immeubles()
+        horizon_materialise()  # lu une fois puis gardé en cache
+        with self.assertNumQueries(1):
+            loyers = RentabiliteCalculator.get_loyers_annuels(self.immeuble, 2024)
+        self.assertEqual(loyers, etat.loyers_annuels(self.immeuble.pk, 2024))
+        total, _ = BailCalculator.calculer_provisions_mensuelles(
+            self.bail, date(2024, 1, 1), date(2024, 12, 31)
+        )
+        self.assertEqual(provisions_dues(self.bail, date(2024, 1, 1), date(2024, 12, 31)), total)
+        janvier = self.bail.loyers_dus.get(mois=date(2024, 1, 1))
+        self.assertEqual(janvier.jours_factures, 17)
+        self.assertEqual(janvier.tva, ((janvier.loyer_hc + janvier.charges) * Decimal("0.2")).quantize(Decimal("0.01")))
+
+    def test_seuls_les_mois_touches_sont_recalcules(self):
+        avant = dict(self.bail.loyers_dus.values_list('mois', 'pk'))
+        self.tarif.loyer_hc = Decimal("710")
+        self.tarif.save()
+        apres = dict(self.bail.loyers_dus.values_list('mois', 'pk'))
+        self.assertEqual(avant[date(2024, 9, 1)], apres[date(2024, 9, 1)])
+        self.assertNotEqual(avant[date(2024, 3, 1)], apres[date(2024, 3, 1)])
+        self.assertEqual(self.bail.loyers_dus.get(mois=date(2024, 3, 1)).loyer_hc, Decimal("710.00"))
+
+    def test_suppressions(self):
+        self.tarif.delete()
+        self.assertFalse(self.bail.loyers_dus.filter(mois__lt=date(2024, 7, 1)).exists())
+        self.bail.delete()
+        from core.models import LoyerDu
+        self.assertFalse(LoyerDu.objects.exists())
+
+    def test_horizon_materialise_et_prolongation(self):
+        from django.core.cache import cache
+        from django.core.management import call_command
+        from core.loyers_dus import enregistrer_horizon, horizon, horizon_materialise, loyers_annuels
+        from core.etat_locatif import EtatLocatif
+        self.addCleanup(cache.clear)
+        # Annee non materialisee (conteneur qui a passe le 1er janvier) : repli, pas de somme partielle
+        enregistrer_horizon(2023)
+        self.assertIsNone(loyers_annuels(self.immeuble, 2024))
+        self.assertEqual(
+            RentabiliteCalculator.get_loyers_annuels(self.immeuble, 2024),
+            EtatLocatif.depuis_immeubles().loyers_annuels(self.immeuble.pk, 2024),
+        )
+
+        derniere = horizon().year
+        self.bail.loyers_dus.filter(mois__year=derniere).delete()
+        cache.clear()
+        self.assertEqual(horizon_materialise(), derniere - 1)
+        call_command('rafraichir_loyers_dus', '--prolonger', stdout=io.StringIO())
+        self.assertEqual(self.bail.loyers_dus.filter(mois__year=derniere).count(), 12)
+        self.assertEqual(horizon_materialise(), derniere)
+
+    def test_local_change_d_immeuble(self):
+        from core.models import LoyerDu
+        autre = Immeuble.objects.create(
+            proprietaire=self.proprietaire, nom="Residence B", adresse="2 rue B",
+            ville="Lyon", code_postal="69002",
+        )
+        self.local.immeuble = autre
+        self.local.save()
+        self.assertEqual(set(LoyerDu.objects.values_list('immeuble_id', flat=True)), {autre.pk})
+
+
+class IndicateursCacheTests(BaseFixture):
+    """P-07 : instantanés des indicateurs en cache, invalidés à chaque écriture."""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        cache.clear()
+        bail = Bail.objects.create(local=self.local, date_debut=date(2020, 1, 1))
+        BailTarification.objects.create(
+            bail=bail, date_debut=date(2020, 1, 1),
+            loyer_hc=Decimal("800"), charges=Decimal("100"),
+        )
+
+    def test_second_affichage_sans_recalcul(self):
+        from core.indicateurs import indicateurs_immeubles
+        indicateurs_immeubles([self.immeuble])
+        with self.assertNumQueries(0):
+            kpi = indicateurs_immeubles([self.immeuble])[self.immeuble.pk]
+        self.assertEqual(kpi['valeur'], PatrimoineCalculator.get_valeur_actuelle(self.immeuble))
+        self.assertEqual(kpi['nb_locaux'], 1)
+
+    def test_ecriture_invalide_l_instantane(self):
+        from core.indicateurs import indicateurs_immeuble
+        self.assertEqual(indicateurs_immeuble(self.immeuble)['valeur'], Decimal("200000"))
+        EstimationValeur.objects.create(
+            immeuble=self.immeuble, date_estimation=date.today(),
+            valeur_estimee=Decimal("260000"),
+        )
+        self.assertEqual(indicateurs_immeuble(self.immeuble)['valeur'], Decimal("260000"))
+        Local.objects.create(immeuble=self.immeuble, numero_porte="2", surface_m2=Decimal("30"))
+        self.assertEqual(indicateurs_immeuble(self.immeuble)['nb_locaux'], 2)
+
+
+class SynthesePortefeuilleTests(BaseFixture):
+    """P-08 : une synthèse unique, à nombre de requêtes fixe, pour les trois tableaux de bord."""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        cache.clear()
+        self._equiper(self.immeuble, self.local)
+
+    def _equiper(self, immeuble, local):
+        bail = Bail.objects.create(local=local, date_debut=date(2020, 1, 1))
+        BailTarification.objects.create(
+            bail=bail, date_debut=date(2020, 1, 1),
+            loyer_hc=Decimal("650"), charges=Decimal("50"),
+        )
+        VacanceLocative.objects.create(
+            local=local, date_debut=date(date.today().year, 1, 1),
+            date_fin=date(date.today().year, 1, 20),
+        )
+        ChargeFiscale.objects.create(
+            immeuble=immeuble, type_charge='TAXE_FONCIERE',
+            annee=date.today().year, montant=Decimal("900"),
+        )
+        credit = CreditImmobilier.objects.create(
+            immeuble=immeuble, nom_banque="Banque", capital_emprunte=Decimal("120000"),
+            taux_interet=Decimal("1.8"), duree_mois=240, date_debut=date(2021, 1, 1),
+            assurance_mensuelle=Decimal("15"),
+        )
+        CreditGenerator(credit).creer_echeances_en_base()
+
+    def _requetes_synthese(self):
+        from django.core.cache import cache
+        from core.portefeuille import SynthesePortefeuille
+        cache.clear()
+        with CaptureQueriesContext(connection) as requetes:
+            synthese = SynthesePortefeuille()
+            synthese.projection()
+        return len(requetes), synthese
+
+    def test_requetes_independantes_du_nombre_d_immeubles(self):
+        nb_un, _ = self._requetes_synthese()
+        for i in range(3):
+            immeuble = Immeuble.objects.create(
+                proprietaire=self.proprietaire, nom=f"Immeuble {i}", adresse="a",
+                ville="Lyon", code_postal="69001", prix_achat=Decimal("150000"),
+                date_achat=date(2020, 1, 1),
+            )
+            self._equiper(immeuble, Local.objects.create(
+                immeuble=immeuble, numero_porte="1", surface_m2=Decimal("40")
+            ))
+        nb_quatre, synthese = self._requetes_synthese()
+        self.assertEqual(nb_un, nb_quatre)
+        self.assertEqual(synthese.totaux['nb_immeubles'], 4)
+
+    def test_memes_valeurs_que_les_calculateurs(self):
+        from core.patrimoine_calculators import RatiosCalculator
+        _, synthese = self._requetes_synthese()
+        kpi = synthese.indicateurs[self.immeuble.pk]
+        immeuble = Immeuble.objects.get(pk=self.immeuble.pk)
+        annee = date.today().year
+        self.assertEqual(kpi['rendement_net'], RentabiliteCalculator.get_rendement_net(immeuble, annee))
+        self.assertEqual(kpi['rendement_brut'], RentabiliteCalculator.get_rendement_brut(immeuble, annee))
+        self.assertEqual(kpi['taux_occupation'], RatiosCalculator.get_taux_occupation(immeuble, annee))
+        self.assertEqual(kpi['crd'], PatrimoineCalculator.get_capital_restant_du(immeuble))
+        self.assertEqual(len(synthese.projection()['labels']), 11)
+
+
+class PortefeuilleSynthetiqueTests(TestCaseIsole):
+    """P-10 : portefeuille synthétique déterministe, cohérent avec les calculateurs."""
+
+    JUSQU_AU = date(2025, 6, 30)
+
+    def _generer(self, graine=7):
+        from core.portefeuille_synthetique import GenerateurPortefeuille
+        return GenerateurPortefeuille(graine=graine, jusqu_au=self.JUSQU_AU).generer(
+            3, locaux_par_immeuble=4, historique=8
+        )
+
+    def _signature(self):
+        from core.models import LoyerDu
+        return (
+            list(Immeuble.objects.order_by('pk').values_list('nom', 'prix_achat', 'date_achat')),
+            list(BailTarification.objects.order_by('pk').values_list(
+                'date_debut', 'date_fin', 'loyer_hc', 'charges'
+            )),
+            list(LoyerDu.objects.order_by('pk').values_list('mois', 'loyer_hc_exact')),
+        )
+
+    def test_meme_graine_memes_donnees(self):
+        from django.db import transaction
+        signatures = []
+        for _ in range(2):
+            with transaction.atomic():
+                compteurs = self._generer()
+                signatures.append((compteurs, self._signature()))
+                transaction.set_rollback(True)
+        self.assertEqual(signatures[0], signatures[1])
+        self.assertEqual(signatures[0][0][Immeuble._meta.verbose_name_plural], 3)
+
+    def test_contraintes_et_registre_des_loyers(self):
+        from django.db.models import Count, Q
+        from core.etat_locatif import EtatLocatif
+        from core.loyers_dus import loyers_annuels
+        self._generer()
+        ouvertes = Bail.objects.annotate(
+            nb=Count('tarifications', filter=Q(tarifications__date_fin__isnull=True))
+        ).filter(nb__gt=1)
+        self.assertFalse(ouvertes.exists())
+
+        etat = EtatLocatif.depuis_immeubles()
+        for immeuble in Immeuble.objects.all():
+            for annee in (2020, 2024):
+                self.assertEqual(
+                    loyers_annuels(immeuble, annee), etat.loyers_annuels(immeuble.pk, annee)
+                )
+
+    def test_commande(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        sortie = StringIO()
+        call_command('generer_portefeuille', immeubles=2, locaux=2, historique=5, stdout=sortie)
+        self.assertEqual(Immeuble.objects.count(), 2)
+        with self.assertRaises(CommandError):
+            call_command('generer_portefeuille', immeubles=0, stdout=sortie)
+
+
+class MoteurRegularisationTests(BaseFixture):
+    """P-11 : décomptes calculés sans ReportLab, un immeuble entier en requêtes fixes."""
+
+    def setUp(self):
+        super().setUp()
+        self.cle = CleRepartition.objects.create(
+            immeuble=self.immeuble, nom="Charges generales", mode_repartition='TANTIEMES'
+        )
+        self.cle_eau = CleRepartition.objects.create(
+            immeuble=self.immeuble, nom="Eau froide", mode_repartition='CONSOMMATION',
+            prix_unitaire=Decimal("4"),
+        )
+        Depense.objects.create(
+            immeuble=self.immeuble, cle_repartition=self.cle, date=date(2024, 5, 15),
+            libelle="Entretien", montant=Decimal("2400"),
+            date_debut=date(2024, 1, 1), date_fin=date(2024, 12, 31),
+        )
+        Depense.objects.create(
+            immeuble=self.immeuble, cle_repartition=self.cle, date=date(2024, 9, 1),
+            libelle="Ramonage", montant=Decimal("300"),
+        )
+        self.baux = []
+        self._creer_baux([self.local])
+
+    def _creer_baux(self, locaux):
+        for local in locaux:
+            QuotePart.objects.create(cle=self.cle, local=local, valeur=Decimal("100"))
+            bail = Bail.objects.create(local=local, date_debut=date(2024, 3, 1))
+            BailTarification.objects.create(
+                bail=bail, date_debut=date(2024, 3, 1),
+                loyer_hc=Decimal("500"), charges=Decimal("80"),
+            )
+            Consommation.objects.create(
+                local=local, cle_repartition=self.cle_eau, date_releve=date(2024, 12, 31),
+                index_debut=Decimal("10"), index_fin=Decimal("40"),
+            )
+            Ajustement.objects.create(
+                bail=bail, date=date(2024, 6, 1), libelle="Remise", montant=Decimal("-20"),
+            )
+            self.baux.append(bail)
+
+    def _locaux(self, nombre):
+        return [
+            Local.objects.create(immeuble=self.immeuble, numero_porte=f"L{i}", surface_m2=Decimal("30"))
+            for i in range(nombre)
+        ]
+
+    def _moteur(self):
+        from core.regularisation import MoteurRegularisation
+        return MoteurRegularisation.pour_immeuble(self.immeuble, date(2024, 1, 1), date(2024, 12, 31))
+
+    def test_decompte_d_un_bail(self):
+        from core.regularisation import calculer_regularisation
+        decompte = calculer_regularisation(self.baux[0], '2024-01-01', '2024-12-31')
+        # Entretien au prorata de la présence (306/366 j), ramonage lissé, eau, remise
+        self.assertEqual([ligne['nature'] for ligne in decompte.lignes],
+                         ['DEPENSE', 'DEPENSE', 'CONSOMMATION', 'AJUSTEMENT'])
+        self.assertEqual(decompte.lignes[0]['part'], Decimal("2006.56"))
+        self.assertEqual(decompte.lignes[1]['part'], Decimal("250.82"))
+        self.assertEqual(decompte.total_reel, Decimal("2357.38"))
+        self.assertEqual(decompte.total_provisions, Decimal("800"))
+        self.assertEqual(decompte.solde, Decimal("1557.38"))
+
+    def test_requetes_independantes_du_nombre_de_baux(self):
+        self._creer_baux(self._locaux(1))
+        with CaptureQueriesContext(connection) as petit:
+            self._moteur().decomptes()
+        self._creer_baux(self._locaux(4))
+        with CaptureQueriesContext(connection) as grand:
+            decomptes = self._moteur().decomptes()
+        self.assertEqual(len(decomptes), 6)
+        self.assertEqual(len(grand), len(petit))
+
+    def test_lot_identique_au_calcul_unitaire_et_historise(self):
+        from core.documents_lot import LotRegularisations
+        from core.regularisation import calculer_regularisation
+        self._creer_baux(self._locaux(2))
+        decomptes = self._moteur().decomptes()
+        for bail in self.baux:
+            unitaire = calculer_regularisation(bail, date(2024, 1, 1), date(2024, 12, 31))
+            self.assertEqual(decomptes[bail.pk].solde, unitaire.solde)
+            self.assertEqual(decomptes[bail.pk].details_calculs, unitaire.details_calculs)
+
+        for _ in range(2):
+            lot = LotRegularisations(
+                Bail.objects.all(), date(2024, 1, 1), date(2024, 12, 31), processus=0
+            )
+            fichiers = list(lot)
+        self.assertEqual(len(fichiers), 3)
+        self.assertEqual(Regularisation.objects.count(), 3)
+        self.assertEqual(
+            Regularisation.objects.get(bail=self.baux[0]).solde,
+            decomptes[self.baux[0].pk].solde,
+        )
+
+    def test_lot_valide_comme_l_enregistrement_unitaire(self):
+        from core.regularisation import enregistrer_decomptes
+        self._creer_baux(self._locaux(2))
+        decomptes = self._moteur().decomptes()
+        decomptes[self.baux[0].pk].enregistrer()
+        # Ligne existante devenue invalide (date de paiement sans paiement)
+        Regularisation.objects.update(date_paiement=date(2030, 1, 1))
+        with self.assertRaises(ValidationError):
+            enregistrer_decomptes(decomptes.values())
+        self.assertEqual(Regularisation.objects.count(), 1)
+
+    def test_cloture_d_un_immeuble_par_l_admin(self):
+        annee = date.today().year - 1
+        Bail.objects.update(date_debut=date(annee, 1, 1))
+        BailTarification.objects.update(date_debut=date(annee, 1, 1))
+        admin_user = User.objects.create_superuser('admin', password='motdepasse-solide-1')
+        self.client.force_login(admin_user)
+        reponse = self.client.post('/admin/core/immeuble/', {
+            'action': 'cloturer_charges_zip', '_selected_action': [self.immeuble.pk],
+        })
+        self.assertEqual(reponse.status_code, 302)
+        from core import taches
+        taches.traiter_en_attente()
+        reponse = self.client.get(reponse.url.rstrip('/') + '/telecharger/')
+        self.assertTrue(b''.join(reponse.streaming_content).startswith(b'PK'))
+        self.assertEqual(Regularisation.objects.filter(date_debut=date(annee, 1, 1)).count(), 1)
+
+
+class ApercuRegularisationTests(BaseFixture):
+    """P-12 : aperçu JSON / HTMX d'une régularisation, sans PDF ni écriture."""
+
+    def setUp(self):
+        super().setUp()
+        cle = CleRepartition.objects.create(
+            immeuble=self.immeuble, nom="Charges generales", mode_repartition='TANTIEMES'
+        )
+        QuotePart.objects.create(cle=cle, local=self.local, valeur=Decimal("100"))
+        Depense.objects.create(
+            immeuble=self.immeuble, cle_repartition=cle, date=date(2024, 5, 15),
+            libelle="Entretien", montant=Decimal("1200"),
+            date_debut=date(2024, 1, 1), date_fin=date(2024, 12, 31),
+        )
+        self.bail = Bail.objects.create(local=self.local, date_debut=date(2024, 1, 1))
+        BailTarification.objects.create(
+            bail=self.bail, date_debut=date(2024, 1, 1),
+            loyer_hc=Decimal("500"), charges=Decimal("90"),
+        )
+        self.client.force_login(
+            User.objects.create_superuser('admin', password='motdepasse-solide-1')
+        )
+        self.url = f'/api/regularisation/{self.bail.pk}/apercu/'
+
+    def test_json_sans_ecriture(self):
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(self.url, {'date_debut': '2024-01-01', 'date_fin': '2024-12-31'})
+        self.assertEqual(reponse.status_code, 200)
+        donnees = reponse.json()
+        self.assertEqual(donnees['total_reel'], "1200.00")
+        self.assertEqual(donnees['total_provisions'], "1080.00")
+        self.assertEqual(donnees['solde'], "120.00")
+        self.assertEqual(donnees['lignes'][0]['nature'], 'DEPENSE')
+        self.assertEqual(len(donnees['details_provisions']), 12)
+        self.assertEqual(Regularisation.objects.count(), 0)
+        self.assertFalse(any(
+            q['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))
+            for q in requetes.captured_queries
+        ))
+
+    def test_fragment_htmx_et_erreurs(self):
+        reponse = self.client.get(
+            self.url, {'date_debut': '2024-01-01', 'date_fin': '2024-06-30'}, HTTP_HX_REQUEST='true'
+        )
+        # 1200 x 182/366 - 6 x 90
+        self.assertContains(reponse, "Reste à payer")
+        self.assertContains(reponse, "56,72 €")
+        reponse = self.client.get(self.url, {'date_debut': '2024-12-31', 'date_fin': '2024-01-01'})
+        self.assertEqual(reponse.status_code, 400)
+        BailTarification.objects.filter(bail=self.bail).delete()
+        reponse = self.client.get(self.url, {'date_debut': '2024-01-01', 'date_fin': '2024-12-31'})
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn("Aucune tarification", reponse.json()['erreur'])
+
+
+class MatriceRepartitionTests(BaseFixture):
+    """P-13 : matrice de répartition par immeuble et par année, en cache jusqu'à la prochaine écriture."""
+
+    def setUp(self):
+        super().setUp()
+        self.local_b = Local.objects.create(
+            immeuble=self.immeuble, numero_porte="2", surface_m2=Decimal("30")
+        )
+        self.cle = CleRepartition.objects.create(
+            immeuble=self.immeuble, nom="Generales", mode_repartition='TANTIEMES'
+        )
+        self.qp = QuotePart.objects.create(cle=self.cle, local=self.local, valeur=Decimal("600"))
+        QuotePart.objects.create(cle=self.cle, local=self.local_b, valeur=Decimal("400"))
+        # Facture à cheval sur 2023 et 2024 : 366 jours sur 731 en 2024
+        self.depense = Depense.objects.create(
+            immeuble=self.immeuble, cle_repartition=self.cle, date=date(2024, 1, 15),
+            libelle="Contrat ascenseur", montant=Decimal("7310"),
+            date_debut=date(2023, 1, 1), date_fin=date(2024, 12, 31),
+        )
+        Depense.objects.create(
+            immeuble=self.immeuble, date=date(2024, 3, 1), libelle="Sans cle", montant=Decimal("50"),
+        )
+
+    def _matrice(self, annee=2024):
+        from core.repartition import matrice_repartition
+        return matrice_repartition(self.immeuble.pk, annee)
+
+    def test_parts_prorata_et_cache(self):
+        matrice = self._matrice()
+        self.assertEqual(matrice.parts_depenses[self.depense.pk], {
+            self.local.pk: Decimal("2196.00"), self.local_b.pk: Decimal("1464.00"),
+        })
+        self.assertEqual(matrice.non_reparti, Decimal("50.00"))
+        self.assertEqual(matrice.pourcentages(self.cle.pk)[self.local.pk], Decimal("60.0"))
+        self.assertEqual(
+            matrice.charges_par_local()[self.local_b.pk], {self.cle.pk: Decimal("1464.00")}
+        )
+        with self.assertNumQueries(0):
+            self._matrice()
+
+    def test_ecritures_invalident(self):
+        self._matrice()
+        self.qp.valeur = Decimal("100")
+        self.qp.save()
+        self.assertEqual(self._matrice().pourcentages(self.cle.pk)[self.local.pk], Decimal("20.0"))
+        Depense.objects.create(
+            immeuble=self.immeuble, cle_repartition=self.cle, date=date(2024, 6, 1),
+            libelle="Ramonage", montant=Decimal("500"),
+        )
+        self.assertEqual(len(self._matrice().depenses), 3)
+        self.cle.delete()
+        self.assertEqual(self._matrice().non_reparti, Decimal("4210.00"))
+
+    def test_regularisation_et_rapport_lisent_la_matrice(self):
+        from core.regularisation import MoteurRegularisation
+        bail = Bail.objects.create(local=self.local_b, date_debut=date(2024, 1, 1))
+        BailTarification.objects.create(
+            bail=bail, date_debut=date(2024, 1, 1), loyer_hc=Decimal("400"), charges=Decimal("100"),
+        )
+        moteur = MoteurRegularisation([bail], date(2024, 1, 1), date(2024, 12, 31))
+        self.assertEqual(moteur.decompte(bail).total_reel, Decimal("1464.00"))
+        # Période à cheval : lecture directe, même répartition
+        moteur = MoteurRegularisation([bail], date(2023, 7, 1), date(2024, 12, 31))
+        self.assertEqual(moteur.decompte(bail).total_reel, Decimal("1464.00"))
+
+        self.client.force_login(User.objects.create_user('gestion', password='motdepasse-solide-1'))
+        reponse = self.client.get(f'/app/immeubles/{self.immeuble.pk}/charges/', {'annee': 2024})
+        self.assertContains(reponse, "3 660,00 €")
+        for annee in ('99999', '0', 'abc'):
+            reponse = self.client.get(f'/app/immeubles/{self.immeuble.pk}/charges/', {'annee': annee})
+            self.assertEqual(reponse.status_code, 400)
+        reponse = self.client.get(f'/app/cles/{self.cle.pk}/')
+        self.assertContains(reponse, "60,0%")
+
+
+class FormulairesPdfTests(BaseFixture):
+    """P-14 : en-tête et cadres bailleur/locataire enregistrés une fois par document."""
+
+    def setUp(self):
+        super().setUp()
+        self.bail = Bail.objects.create(local=self.local, date_debut=date(2024, 1, 1))
+        BailTarification.objects.create(
+            bail=self.bail, date_debut=date(2024, 1, 1),
+            loyer_hc=Decimal("500"), charges=Decimal("100"),
+        )
+        Occupant.objects.create(bail=self.bail, nom="Martin", prenom="Claire", role='LOCATAIRE')
+
+    def _quittance(self, nb_mois):
+        from core.pdf_generator import PDFGenerator
+        return PDFGenerator(self.bail).generer_quittance(
+            [date(2024, mois, 1) for mois in range(1, nb_mois + 1)]
+        )
+
+    def test_un_formulaire_par_partie_fixe(self):
+        une_page, douze_pages = self._quittance(1), self._quittance(12)
+        self.assertEqual(une_page.count(b'/Subtype /Form'), 2)
+        self.assertEqual(douze_pages.count(b'/Subtype /Form'), 2)
+
+    def test_titres_distincts(self):
+        from core.pdf_generator import PDFGenerator
+        pdf = PDFGenerator(self.bail).generer_avis_echeance([date(2024, 1, 1), date(2024, 2, 1)])
+        self.assertEqual(pdf.count(b'/Subtype /Form'), 2)
+
+
+class CachePdfTests(BaseFixture):
+    """P-15 : PDF en cache disque, adressés par l'empreinte de leurs données."""
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        super().setUp()
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(PDF_CACHE_DIR=dossier.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+        self.bail = Bail.objects.create(local=self.local, date_debut=date(2024, 1, 1))
+        self.tarif = BailTarification.objects.create(
+            bail=self.bail, date_debut=date(2024, 1, 1),
+            loyer_hc=Decimal("500"), charges=Decimal("100"),
+        )
+        Occupant.objects.create(bail=self.bail, nom="Martin", prenom="Claire", role='LOCATAIRE')
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse-solide-1'))
+
+    def _telecharger(self):
+        reponse = self.client.post(f'/api/quittance/{self.bail.pk}/', {'periodes': ['2024-03-01']})
+        self.assertEqual(reponse.status_code, 200)
+        return b''.join(reponse.streaming_content)
+
+    def _empreinte(self):
+        from core import cache_pdf
+        bail = Bail.objects.get(pk=self.bail.pk)
+        return cache_pdf.empreinte(bail, 'generer_quittance', ['2024-03-01'])
+
+    def test_second_telechargement_lu_sur_disque(self):
+        from core import cache_pdf
+        self.assertTrue(self._telecharger().startswith(b'%PDF'))
+        fichier = cache_pdf.lire(self._empreinte())
+        self.assertIsNotNone(fichier)
+        # Contenu remplacé : seul un téléchargement servi depuis le disque le renvoie
+        fichier.write_bytes(b'%PDF-en-cache')
+        self.assertEqual(self._telecharger(), b'%PDF-en-cache')
+
+    def test_donnee_modifiee_change_l_empreinte(self):
+        avant = self._empreinte()
+        self.assertEqual(avant, self._empreinte())
+        self.tarif.loyer_hc = Decimal("520")
+        self.tarif.save()
+        apres_loyer = self._empreinte()
+        self.assertNotEqual(apres_loyer, avant)
+        self.proprietaire.adresse = "2 rue B"
+        self.proprietaire.save()
+        self.assertNotEqual(self._empreinte(), apres_loyer)
+
+    def test_lot_ne_rend_que_les_absents(self):
+        from core import cache_pdf
+        from core.documents_lot import LotQuittances
+        premier = dict(LotQuittances(Bail.objects.all(), date(2024, 3, 1), processus=0))
+        cache_pdf.lire(self._empreinte()).write_bytes(b'%PDF-en-cache')
+        second = dict(LotQuittances(Bail.objects.all(), date(2024, 3, 1), processus=0))
+        self.assertEqual(list(second), list(premier))
+        self.assertEqual(list(second.values()), [b'%PDF-en-cache'])
+
+    def test_purge(self):
+        from core import cache_pdf
+        self._telecharger()
+        self.assertEqual(cache_pdf.purger(1), 0)
+        self.assertEqual(cache_pdf.purger(-1), 1)
+        self.assertIsNone(cache_pdf.lire(self._empreinte()))
+
+
+class ListesAdminAnnoteesTests(BaseFixture):
+    """P-16 : listes admin des baux et immeubles annotées en SQL (tri, filtres, requêtes fixes)."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse-solide-1'))
+
+    def _creer_baux(self, nombre, debut=0):
+        for i in range(debut, debut + nombre):
+            local = Local.objects.create(
+                immeuble=self.immeuble, numero_porte=f"L{i}", surface_m2=Decimal("40")
+            )
+            bail = Bail.objects.create(local=local, date_debut=date(2020, 1, 1))
+            # Ancienne tarification close + tarification en cours
+            BailTarification.objects.create(
+                bail=bail, date_debut=date(2020, 1, 1), date_fin=date(2020, 12, 31),
+                loyer_hc=Decimal("100"), charges=Decimal("10"),
+            )
+            BailTarification.objects.create(
+                bail=bail, date_debut=date(2021, 1, 1), loyer_hc=Decimal(400 + i), charges=Decimal("50"),
+            )
+            Occupant.objects.create(bail=bail, nom=f"Nom{i}", prenom="A", role='LOCATAIRE')
+
+    def _lister(self, url):
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        return reponse, len(requetes)
+
+    def test_annotations_egales_aux_proprietes(self):
+        from core.admin import annoter_tarification_actuelle
+        self._creer_baux(2)
+        Bail.objects.create(local=self.local, date_debut=date(2020, 1, 1))
+        for bail in annoter_tarification_actuelle(Bail.objects.all()):
+            self.assertEqual(bail.loyer_hc_actuel or Decimal("0"), bail.loyer_hc)
+            self.assertEqual(bail.charges_actuelles or Decimal("0"), bail.charges)
+            locataire = bail.locataire_principal
+            self.assertEqual(
+                bail.locataire_nom, f"{locataire.nom} {locataire.prenom}" if locataire else None
+            )
+
+    def test_liste_des_baux_en_requetes_fixes_et_triable(self):
+        self._creer_baux(2)
+        _, petite = self._lister('/admin/core/bail/')
+        self._creer_baux(8, debut=2)
+        reponse, grande = self._lister('/admin/core/bail/?o=-4')
+        self.assertEqual(grande, petite)
+        lignes = list(reponse.context['cl'].result_list)
+        self.assertEqual([b.loyer_hc_actuel for b in lignes[:2]], [Decimal("409"), Decimal("408")])
+
+        Bail.objects.create(local=self.local, date_debut=date(2020, 1, 1))
+        reponse, _ = self._lister('/admin/core/bail/?tarification_en_cours=non')
+        self.assertEqual(reponse.context['cl'].result_count, 1)
+
+    def test_liste_des_immeubles_triable(self):
+        Immeuble.objects.create(
+            proprietaire=self.proprietaire, nom="Residence B", adresse="2 rue B",
+            ville="Lyon", code_postal="69002", prix_achat=Decimal("100000"),
+        )
+        EstimationValeur.objects.create(
+            immeuble=self.immeuble, date_estimation=date(2024, 1, 1), valeur_estimee=Decimal("250000"),
+        )
+        reponse, _ = self._lister('/admin/core/immeuble/?o=5')
+        self.assertEqual(
+            [i.valeur_actuelle for i in reponse.context['cl'].result_list],
+            [Decimal("100000"), Decimal("250000")],
+        )
+        reponse, _ = self._lister('/admin/core/immeuble/?financement=comptant')
+        self.assertEqual(reponse.context['cl'].result_count, 2)
+
+
+class EcheancierPagineTests(BaseFixture):
+    """P-17 : échéancier lu par pages keyset autour de l'échéance en cours, résumé annuel en SQL."""
+
+    def setUp(self):
+        from core.patrimoine_calculators import CreditGenerator
+        super().setUp()
+        self.credit = CreditImmobilier.objects.create(
+            immeuble=self.immeuble, nom_banque="Banque", capital_emprunte=Decimal("150000"),
+            taux_interet=Decimal("2"), duree_mois=300, date_debut=date(2020, 1, 1),
+            assurance_mensuelle=Decimal("20"),
+        )
+        CreditGenerator(self.credit).creer_echeances_en_base()
+
+    def test_page_par_defaut_autour_de_l_echeance_courante(self):
+        from core.echeancier import page_echeancier
+        with self.assertNumQueries(2):
+            page = page_echeancier(self.credit.pk, jour=date(2024, 6, 15))
+        numeros = [e.numero_echeance for e in page.echeances]
+        self.assertIn(page.courante, numeros)
+        self.assertEqual(numeros[0], page.courante - 12)
+        self.assertEqual(len(numeros), 25)
+
+        suivante = page_echeancier(self.credit.pk, apres=page.suivante)
+        self.assertEqual(suivante.echeances[0].numero_echeance, numeros[-1] + 1)
+        retour = page_echeancier(self.credit.pk, avant=suivante.precedente)
+        self.assertEqual([e.numero_echeance for e in retour.echeances], numeros)
+
+    def test_bornes_du_pret(self):
+        from core.echeancier import page_echeancier
+        premiere = page_echeancier(self.credit.pk, apres=0)
+        self.assertIsNone(premiere.precedente)
+        terminee = page_echeancier(self.credit.pk, jour=date(2050, 1, 1))
+        self.assertIsNone(terminee.courante)
+        self.assertIsNone(terminee.suivante)
+        self.assertEqual(terminee.echeances[-1].numero_echeance, 300)
+
+    def test_resume_annuel(self):
+        from django.db.models import Sum
+        from core.echeancier import resume_annuel
+        with self.assertNumQueries(1):
+            annees = resume_annuel(self.credit.pk)
+        # Première échéance un mois après le déblocage : 11 en 2020, 1 en 2045
+        self.assertEqual(len(annees), 26)
+        self.assertEqual((annees[0]['nb_echeances'], annees[-1]['nb_echeances']), (11, 1))
+        self.assertEqual(
+            sum(a['interets'] for a in annees),
+            self.credit.echeances.aggregate(total=Sum('interets'))['total'],
+        )
+        self.assertEqual(annees[-1]['capital_restant_du'], Decimal("0"))
+
+    def test_pages_en_requetes_fixes(self):
+        from core.patrimoine_calculators import CreditGenerator
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse-solide-1'))
+        court = CreditImmobilier.objects.create(
+            immeuble=self.immeuble, nom_banque="Banque 2", capital_emprunte=Decimal("20000"),
+            taux_interet=Decimal("2"), duree_mois=36, date_debut=date(2024, 1, 1),
+        )
+        CreditGenerator(court).creer_echeances_en_base()
+        mesures = []
+        for credit in (court, self.credit):
+            for url in (f'/app/credits/{credit.pk}/echeancier/', f'/app/credits/{credit.pk}/echeancier/?vue=annuel'):
+                with CaptureQueriesContext(connection) as requetes:
+                    reponse = self.client.get(url)
+                self.assertEqual(reponse.status_code, 200)
+                mesures.append(len(requetes))
+        self.assertEqual(mesures[:2], mesures[2:])
+        reponse = self.client.get(f'/admin/core/creditimmobilier/{self.credit.pk}/change/')
+        self.assertContains(reponse, f'/app/credits/{self.credit.pk}/echeancier/')
+
+
+class SynchronisationEcheancierTests(BaseFixture):
+    """P-18 : régénérer un échéancier ne réécrit que les échéances changées et garde les paiements."""
+
+    def setUp(self):
+        from core.patrimoine_calculators import CreditGenerator
+        super().setUp()
+        self.credit = CreditImmobilier.objects.create(
+            immeuble=self.immeuble, nom_banque="Banque", capital_emprunte=Decimal("100000"),
+            taux_interet=Decimal("2"), duree_mois=120, date_debut=date(2020, 1, 1),
+            assurance_mensuelle=Decimal("20"),
+        )
+        CreditGenerator(self.credit).synchroniser_echeances()
+        self.credit.echeances.filter(numero_echeance__lte=3).update(payee=True, date_paiement=date(2020, 4, 1))
+
+    def _synchroniser(self):
+        from core.patrimoine_calculators import CreditGenerator
+        return CreditGenerator(CreditImmobilier.objects.get(pk=self.credit.pk)).synchroniser_echeances()
+
+    def test_credit_inchange_aucune_ecriture(self):
+        with CaptureQueriesContext(connection) as requetes:
+            bilan = self._synchroniser()
+        self.assertEqual(bilan, {'total': 120, 'creees': 0, 'modifiees': 0, 'supprimees': 0})
+        self.assertFalse([q for q in requetes if not q['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))])
+
+    def test_assurance_modifiee_paiements_conserves(self):
+        self.credit.assurance_mensuelle = Decimal("25")
+        self.credit.save()
+        bilan = self._synchroniser()
+        self.assertEqual((bilan['modifiees'], bilan['creees'], bilan['supprimees']), (120, 0, 0))
+        self.assertEqual(self.credit.echeances.filter(payee=True).count(), 3)
+        self.assertEqual(self.credit.echeances.get(numero_echeance=1).assurance, Decimal("25.00"))
+
+    def test_duree_modifiee(self):
+        self.credit.duree_mois = 100
+        self.credit.save()
+        bilan = self._synchroniser()
+        self.assertEqual((bilan['total'], bilan['supprimees']), (100, 20))
+        self.assertEqual(self.credit.echeances.count(), 100)
+        self.assertEqual(self.credit.echeances.get(numero_echeance=1).date_paiement, date(2020, 4, 1))
+
+        self.credit.duree_mois = 130
+        self.credit.save()
+        self.assertEqual(self._synchroniser()['creees'], 30)
+        self.assertEqual(self.credit.echeances.count(), 130)
+        self.assertEqual(self.credit.echeances.get(numero_echeance=130).capital_restant_du, Decimal("0.00"))
+
+
+class SimulationCreditTests(BaseFixture):
+    """P-19 : remboursements anticipés, renégociations et différés simulés au centime."""
+
+    def setUp(self):
+        super().setUp()
+        self.credit = CreditImmobilier(
+            immeuble=self.immeuble, nom_banque="Banque", capital_emprunte=Decimal("200000"),
+            taux_interet=Decimal("2.5"), duree_mois=300, date_debut=date(2020, 1, 1),
+            assurance_mensuelle=Decimal("20"),
+        )
+
+    def test_reference_identique_a_l_echeancier(self):
+        from core.patrimoine_calculators import CreditGenerator
+        from core.simulation_credit import SimulateurCredit
+        for type_credit in ('AMORTISSABLE', 'IN_FINE'):
+            self.credit.type_credit = type_credit
+            echeancier = CreditGenerator(self.credit).generer_echeancier()
+            reference = SimulateurCredit(self.credit).reference
+            self.assertEqual(
+                [crd for _, crd in reference.courbe_crd],
+                [e['capital_restant_du'] for e in echeancier],
+            )
+            self.assertEqual(reference.interets, sum(e['interets'] for e in echeancier))
+
+    def test_grille_de_remboursements(self):
+        from core.simulation_credit import SimulateurCredit, grille_remboursements
+        resultats = SimulateurCredit(self.credit).comparer(
+            grille_remboursements([10000, 20000], [date(2021, 1, 1), date(2030, 1, 1)])
+        )
+        self.assertEqual(len(resultats), 5)
+        reference, tot_10k, tot_20k, tard_10k, _ = resultats
+        # Plus tôt et plus gros : plus d'économie, prêt plus court
+        self.assertGreater(tot_20k.economie, tot_10k.economie)
+        self.assertGreater(tot_10k.economie, tard_10k.economie)
+        self.assertGreater(tard_10k.economie, 0)
+        self.assertLess(tot_10k.duree_mois, reference.duree_mois)
+        # IRA : 6 mois d'intérêts sur 10 000 € à 2,5 %, sous le plafond de 3 % du CRD
+        self.assertEqual(tot_10k.indemnites, Decimal("125.00") - Decimal("0.02"))
+        # Même CRD que la référence avant le remboursement
+        self.assertEqual(tot_10k.crd_au(date(2020, 12, 31)), reference.crd_au(date(2020, 12, 31)))
+
+    def test_renegociation_differe_et_duree(self):
+        from core.simulation_credit import (
+            ChangementDuree, Differe, RemboursementAnticipe, Renegociation, Scenario,
+            SimulateurCredit, REDUIRE_MENSUALITE,
+        )
+        simulateur = SimulateurCredit(self.credit)
+        jour = date(2025, 1, 1)
+        renegocie = simulateur.simuler(Scenario("1,5 %", [Renegociation(jour, "1.5", frais=1000)]))
+        self.assertEqual(renegocie.duree_mois, 300)
+        self.assertGreater(renegocie.economie, 0)
+        self.assertEqual(renegocie.frais, Decimal("1000.00"))
+
+        mensualite_reduite = simulateur.simuler(
+            Scenario("50k", [RemboursementAnticipe(jour, 50000, REDUIRE_MENSUALITE)])
+        )
+        self.assertEqual(mensualite_reduite.duree_mois, 300)
+        self.assertLess(mensualite_reduite.derniere_mensualite, simulateur.reference.derniere_mensualite)
+
+        differe = simulateur.simuler(Scenario("report", [Differe(jour, 6, total=True)]))
+        self.assertEqual(differe.duree_mois, 306)
+        self.assertLess(differe.economie, 0)
+
+        raccourci = simulateur.simuler(Scenario("10 ans", [ChangementDuree(jour, 120)]))
+        self.assertEqual(raccourci.duree_mois, 60 + 120 - 1)
+        self.assertEqual(raccourci.crd_au(date(2060, 1, 1)), Decimal("0.00"))
+
+
+class ProjectionMonteCarloTests(BaseFixture):
+    """P-20 : projection stochastique du portefeuille, bandes P10 / P50 / P90."""
+
+    def _projection(self, **kwargs):
+        from core.projection_monte_carlo import ProjectionMonteCarlo
+        return ProjectionMonteCarlo(
+            300000, 24000, 3000, [150000 - i * 10000 for i in range(11)], [12000] * 11, **kwargs
+        )
+
+    def test_reproductible_et_ordonnee(self):
+        bandes = self._projection().simuler(500)
+        self.assertEqual(bandes, self._projection().simuler(500))
+        self.assertNotEqual(bandes, self._projection(graine=1).simuler(500))
+        for serie in ('nette', 'cashflow'):
+            for p10, p50, p90 in zip(bandes[serie][10], bandes[serie][50], bandes[serie][90]):
+                self.assertLessEqual(p10, p50)
+                self.assertLessEqual(p50, p90)
+        # Année en cours sans tirage : bande de largeur nulle
+        self.assertEqual(bandes['nette'][10][0], bandes['nette'][90][0])
+        self.assertEqual(bandes['cashflow'][50][0], 24000 - 3000 - 12000)
+        self.assertLess(bandes['nette'][10][10], bandes['nette'][90][10])
+
+    def test_sans_volatilite_deterministe(self):
+        sans_alea = {'irl': (0.0, 0.0), 'valeur': (0.0, 0.0), 'charges': (0.0, 0.0), 'vacance': (1e-9, 1e9)}
+        bandes = self._projection(hypotheses=sans_alea).simuler(50)
+        self.assertEqual(bandes['cashflow'][10], [9000.0] * 11)
+        self.assertEqual(bandes['nette'][90], [300000 - (150000 - i * 10000) + 9000 * i for i in range(11)])
+
+    def test_synthese_et_tableaux_de_bord(self):
+        from core.portefeuille import SynthesePortefeuille
+        CreditImmobilier.objects.create(
+            immeuble=self.immeuble, nom_banque="Banque", capital_emprunte=Decimal("150000"),
+            taux_interet=Decimal("2"), duree_mois=240, date_debut=date(2020, 1, 1),
+        )
+        projection = SynthesePortefeuille().projection_stochastique(nb_trajectoires=200)
+        self.assertEqual(projection['labels'], SynthesePortefeuille().projection()['labels'])
+        self.assertEqual(len(projection['nette_p50']), len(projection['labels']))
+
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse-solide-1'))
+        for url in ('/app/patrimoine/', '/api/patrimoine/dashboard/'):
+            reponse = self.client.get(url)
+            self.assertEqual(reponse.status_code, 200)
+            self.assertContains(reponse, 'projection-mc-data')
+
+    def test_remboursement_in_fine_sort_de_la_tresorerie(self):
+        from core.portefeuille import SynthesePortefeuille
+        annee = date.today().year
+        sans_credit = SynthesePortefeuille().projection_stochastique(nb_trajectoires=200)
+        credit = CreditImmobilier.objects.create(
+            immeuble=self.immeuble, nom_banque="Banque", capital_emprunte=Decimal("150000"),
+            taux_interet=Decimal("2"), duree_mois=35, date_debut=date(annee - 1, 1, 1), type_credit='IN_FINE',
+        )
+        tableau = credit.tableau_amortissement
+        interets = [tableau.interets_entre(date(a, 1, 1), date(a, 12, 31)) for a in (annee, annee + 1)]
+        self.assertEqual(
+            tableau.annuites_entre(date(annee + 1, 1, 1), date(annee + 1, 12, 31)), Decimal("150000") + interets[1],
+        )
+        # Mêmes tirages (même graine, mêmes loyers) : le cash-flow médian baisse
+        # exactement des échéances, dont les 150 000 € de capital l'année du remboursement
+        avec_credit = SynthesePortefeuille().projection_stochastique(nb_trajectoires=200)
+        baisse = [sans - avec for sans, avec in zip(sans_credit['cashflow_p50'], avec_credit['cashflow_p50'])]
+        self.assertAlmostEqual(baisse[0], float(interets[0]), delta=1)
+        self.assertAlmostEqual(baisse[1], float(Decimal("150000") + interets[1]), delta=1)
+        self.assertEqual(baisse[2:], [0] * len(baisse[2:]))
+
+
+class IndicesReferenceTests(BaseFixture):
+    """P-21 : indices IRL / ILC stockés en base, importés hors requête (CSV INSEE)."""
+
+    CSV_INSEE = (
+        '"Libellé";"Indice de référence des loyers";"Indice des loyers commerciaux"\n'
+        '"idBank";"001515333";"001515332"\n'
+        '"Dernière mise à jour";"15/01/2025 12:00";"20/12/2024 12:00"\n'
+        '"Période";"";""\n'
+        '"2024-T4";"145,47";""\n'
+        '"2024-T3";"144,51";"136,21"\n'
+        '"2024-T2";"145,17";"135,30"\n'
+    )
+
+    def test_import_csv_et_mise_a_jour(self):
+        from core.indices import derniers_indices, importer_csv_insee, valeur_indice
+        self.assertEqual(importer_csv_insee(self.CSV_INSEE), {'IRL': 3, 'ILC': 2})
+        # Réimport corrigé : mise à jour, pas de doublon
+        self.assertEqual(importer_csv_insee('2024-T4;145,50\n', type_indice='IRL'), {'IRL': 1})
+        self.assertEqual(IndiceReference.objects.count(), 5)
+        self.assertEqual(
+            derniers_indices('IRL'),
+            [{'trimestre': 'T4 2024', 'valeur': Decimal('145.50')},
+             {'trimestre': 'T3 2024', 'valeur': Decimal('144.51')},
+             {'trimestre': 'T2 2024', 'valeur': Decimal('145.17')}],
+        )
+        self.assertEqual(valeur_indice('ILC', 'T3 2024'), Decimal('136.21'))
+        self.assertIsNone(valeur_indice('ILC', 'T4 2024'))
+
+    def test_commande_csv(self):
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as fichier:
+            fichier.write(self.CSV_INSEE)
+        self.addCleanup(os.unlink, fichier.name)
+        sortie = StringIO()
+        call_command('rafraichir_indices', csv=fichier.name, stdout=sortie)
+        self.assertIn("IRL : 3", sortie.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('rafraichir_indices', csv=fichier.name + '.absent', stdout=sortie)
+
+    def test_formulaire_revision_sans_reseau(self):
+        from unittest import mock
+        from core.indices import importer_csv_insee
+        importer_csv_insee(self.CSV_INSEE)
+        bail = Bail.objects.create(local=self.local, date_debut=date(2024, 1, 1))
+        BailTarification.objects.create(
+            bail=bail, date_debut=date(2024, 1, 1), loyer_hc=Decimal("500"),
+            indice_reference=Decimal("140.00"), trimestre_reference="T4 2023",
+        )
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse-solide-1'))
+        with mock.patch('urllib.request.urlopen', side_effect=AssertionError("accès réseau")):
+            reponse = self.client.get(f'/api/revision_loyer/{bail.pk}/')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertContains(reponse, 'value="145.47|T4 2024"')
+
+        # La valeur postée est relue en base
+        reponse = self.client.post(f'/api/revision_loyer/{bail.pk}/', {
+            'choix_indice': '999|T4 2024', 'date_application': '2025-01-01', 'update_bail': 'on',
+        })
+        self.assertEqual(reponse.status_code, 302)
+        self.assertEqual(self.client.session['nouvelle_tarification']['nouvel_indice'], 145.47)
+
+
+class CampagneRevisionTests(BaseFixture):
+    """P-22 : révision en lot des baux d'un mois anniversaire, en écritures groupées."""
+
+    def setUp(self):
+        super().setUp()
+        from core.indices import enregistrer_indices
+        enregistrer_indices('IRL', [(2024, 1, Decimal("143.46")), (2025, 1, Decimal("145.47"))])
+        self.baux = []
+        for porte, trimestre in (("1", "T1 2024"), ("2", "T1 2024"), ("3", "T2 2024")):
+            local = self.local if porte == "1" else Local.objects.create(
+                immeuble=self.immeuble, numero_porte=porte, surface_m2=Decimal("40")
+            )
+            bail = Bail.objects.create(local=local, date_debut=date(2024, 4, 15))
+            BailTarification.objects.create(
+                bail=bail, date_debut=date(2024, 4, 15), loyer_hc=Decimal("600"), charges=Decimal("50"),
+                indice_reference=Decimal("143.46"), trimestre_reference=trimestre,
+            )
+            self.baux.append(bail)
+        # Anniversaire dans un autre mois : hors campagne
+        autre = Bail.objects.create(
+            local=Local.objects.create(immeuble=self.immeuble, numero_porte="4", surface_m2=Decimal("30")),
+            date_debut=date(2024, 5, 1),
+        )
+        BailTarification.objects.create(bail=autre, date_debut=date(2024, 5, 1), loyer_hc=Decimal("500"))
+
+    def test_calcul_et_application(self):
+        from core.models import LoyerDu
+        from core.revision_campagne import CampagneRevision
+        with self.assertNumQueries(4):
+            campagne = CampagneRevision(2025, 4)
+        self.assertEqual([r.bail for r in campagne.revisions], self.baux[:2])
+        self.assertEqual(campagne.ecartes, [(self.baux[2], "IRL T2 2025 absent de la table des indices")])
+        revision = campagne.revisions[0]
+        self.assertEqual(revision.date_application, date(2025, 4, 15))
+        self.assertEqual(revision.nouveau_loyer, Decimal("608.41"))
+
+        nouvelles = campagne.appliquer()
+        self.assertEqual(len(nouvelles), 2)
+        bail = Bail.objects.get(pk=self.baux[0].pk)
+        self.assertEqual(bail.get_tarification_at(date(2025, 4, 14)).loyer_hc, Decimal("600.00"))
+        nouvelle = bail.get_tarification_at(date(2025, 4, 15))
+        self.assertEqual((nouvelle.loyer_hc, nouvelle.charges, nouvelle.trimestre_reference),
+                         (Decimal("608.41"), Decimal("50.00"), "T1 2025"))
+        # Loyers dus recalculés malgré bulk_create : mai 2025 au nouveau loyer
+        self.assertEqual(LoyerDu.objects.get(bail=bail, mois=date(2025, 5, 1)).loyer_hc, Decimal("608.41"))
+
+        # Relancer la campagne ne révise pas deux fois
+        relance = CampagneRevision(2025, 4)
+        self.assertEqual(relance.revisions, [])
+        self.assertEqual(len(relance.ecartes), 3)
+
+    def test_vue_zip_des_courriers(self):
+        import io
+        import zipfile
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse-solide-1'))
+        reponse = self.client.get('/api/revision_loyer/campagne/?annee=2025&mois=4')
+        self.assertContains(reponse, "608,41")
+        self.assertContains(reponse, "absent de la table des indices")
+
+        reponse = self.client.post('/api/revision_loyer/campagne/', {'annee': 2025, 'mois': 4})
+        self.assertEqual(reponse.status_code, 302)
+        from core import taches
+        taches.traiter_en_attente()
+        reponse = self.client.get(reponse.url.rstrip('/') + '/telecharger/')
+        with zipfile.ZipFile(io.BytesIO(b''.join(reponse.streaming_content))) as archive:
+            self.assertEqual(len(archive.namelist()), 2)
+            self.assertTrue(all(nom.startswith('Revision_Loyer_') for nom in archive.namelist()))
+        self.assertEqual(BailTarification.objects.filter(date_debut=date(2025, 4, 15)).count(), 2)
+
+    def test_courriers_en_echec_relances_sans_nouvelle_revision(self):
+        import zipfile
+        from core import taches
+        tache = taches.soumettre('campagne_revision', "Campagne 04/2025", {'annee': 2025, 'mois': 4})
+        # TACHES_DIR inutilisable : les loyers sont révisés, le ZIP échoue
+        with tempfile.NamedTemporaryFile() as fichier, override_settings(TACHES_DIR=fichier.name):
+            taches.traiter_en_attente()
+        tache.refresh_from_db()
+        self.assertEqual((tache.statut, tache.fichier), ('TERMINEE', ''))
+        self.assertIn("Courriers non générés", tache.message)
+        self.assertEqual(sorted(tache.parametres['courriers']), sorted(str(bail.pk) for bail in self.baux[:2]))
+        self.assertEqual(BailTarification.objects.filter(date_debut=date(2025, 4, 15)).count(), 2)
+
+        self.assertEqual(taches.relancer(Tache.objects.filter(pk=tache.pk)), 1)
+        taches.traiter_en_attente()
+        tache.refresh_from_db()
+        self.assertTrue(tache.message.startswith("2 loyer(s) révisé(s), 1 bail(s) écarté(s). 2 document(s)"))
+        with zipfile.ZipFile(tache.fichier) as archive:
+            self.assertEqual(len(archive.namelist()), 2)
+        self.assertEqual(BailTarification.objects.filter(date_debut=date(2025, 4, 15)).count(), 2)
+
+
+class TachesDeFondTests(BaseFixture):
+    """P-23 : les traitements longs passent par la file de taches, hors des workers web."""
+
+    def setUp(self):
+        super().setUp()
+        from core import taches
+        self.taches = taches
+        self.bail = Bail.objects.create(local=self.local, date_debut=date(2024, 1, 1))
+        BailTarification.objects.create(
+            bail=self.bail, date_debut=date(2024, 1, 1), loyer_hc=Decimal("500"), charges=Decimal("50"),
+        )
+        Occupant.objects.create(bail=self.bail, nom="Martin", prenom="A", role='LOCATAIRE')
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse-solide-1'))
+
+    def _soumettre_quittances(self):
+        return self.taches.soumettre(
+            'quittances_zip', "Quittances", {'baux': [self.bail.pk], 'periode': '2024-03-01'},
+        )
+
+    def test_reservation_exclusive(self):
+        tache = self._soumettre_quittances()
+        reservee = self.taches.reserver_tache()
+        self.assertEqual((reservee.pk, reservee.statut), (tache.pk, 'EN_COURS'))
+        # Un second worker ne recupere pas la meme tache
+        self.assertIsNone(self.taches.reserver_tache())
+        with self.assertRaises(ValueError):
+            self.taches.soumettre('inconnu', "Inconnu")
+
+    def test_execution_et_echec(self):
+        import zipfile
+        self._soumettre_quittances()
+        tache = self.taches.executer(self.taches.reserver_tache())
+        self.assertEqual((tache.statut, tache.avancement, tache.total), ('TERMINEE', 1, 1))
+        with zipfile.ZipFile(tache.fichier) as archive:
+            self.assertEqual(len(archive.namelist()), 1)
+
+        self.taches.soumettre('echeanciers', "Echeanciers", {})
+        tache = self.taches.executer(self.taches.reserver_tache())
+        self.assertEqual(tache.statut, 'ECHEC')
+        self.assertIn("credits", tache.message)
+
+    def test_orphelines_et_purge(self):
+        self._soumettre_quittances()
+        tache = self.taches.reserver_tache()
+        Tache.objects.filter(pk=tache.pk).update(battement=tache.battement - timedelta(hours=1))
+        self.assertEqual(self.taches.abandonner_orphelines(), 1)
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, 'ECHEC')
+        Tache.objects.filter(pk=tache.pk).update(fin=tache.fin - timedelta(days=10))
+        self.assertEqual(self.taches.purger(7), 1)
+
+    def test_echec_en_cours_d_ecriture(self):
+        chemins = []
+
+        def ecrire_puis_echouer(tache):
+            chemins.append(self.taches.chemin_resultat(tache, "Partiel.zip"))
+            with open(chemins[0], 'wb') as sortie:
+                sortie.write(b"PK debut d'archive")
+            raise RuntimeError("Rendu interrompu")
+
+        self.taches.traitement('echec_test')(ecrire_puis_echouer)
+        self.addCleanup(self.taches.TRAITEMENTS.pop, 'echec_test')
+        self.taches.soumettre('echec_test', "Echec")
+        tache = self.taches.reserver_tache()
+        self.taches.executer(tache)
+        self.assertFalse(chemins[0].exists())
+        tache.refresh_from_db()
+        self.assertEqual((tache.statut, tache.fichier, tache.nom_fichier), ('ECHEC', '', ''))
+        self.assertIn("Rendu interrompu", tache.message)
+
+    def test_battement_d_une_tache_en_cours(self):
+        self._soumettre_quittances()
+        tache = self.taches.reserver_tache()
+        Tache.objects.filter(pk=tache.pk).update(battement=tache.battement - timedelta(hours=1))
+        # Le worker signale la tâche vivante même sans avancement
+        battement = self.taches.Battement(tache)
+        self.assertEqual(battement.battre(), 1)
+        self.assertEqual(self.taches.abandonner_orphelines(), 0)
+        # Le fil de battement s'arrête avec la tâche
+        battement.start()
+        battement.arreter()
+        self.assertFalse(battement.is_alive())
+        self.assertEqual(self.taches.executer(tache).statut, 'TERMINEE')
+        self.assertEqual(battement.battre(), 0)
+
+    def test_suivi_htmx_puis_telechargement(self):
+        tache = self._soumettre_quittances()
+        reponse = self.client.get(f'/app/taches/{tache.pk}/etat/')
+        self.assertContains(reponse, 'hx-trigger="load delay:2s"')
+        self.assertNotContains(reponse, '/telecharger/')
+
+        self.taches.traiter_en_attente()
+        reponse = self.client.get(f'/app/taches/{tache.pk}/etat/')
+        self.assertNotContains(reponse, 'hx-trigger')
+        self.assertContains(reponse, f'/app/taches/{tache.pk}/telecharger/')
+        reponse = self.client.get(f'/app/taches/{tache.pk}/telecharger/')
+        self.assertEqual(reponse['Content-Disposition'], 'attachment; filename="Quittances_2024-03.zip"')
+
+    def test_commande_une_fois(self):
+        from django.core.management import call_command
+        tache = self._soumettre_quittances()
+        call_command('traiter_taches', '--une-fois', verbosity=0)
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, 'TERMINEE')
+
+
+class FriseTarificationsTests(BaseFixture):
+    """P-24 : une frise par bail pour la recherche par date et les controles de continuite."""
+
+    def _tarif(self, debut, fin=None):
+        return BailTarification(date_debut=debut, date_fin=fin, loyer_hc=Decimal("500"))
+
+    def test_recherche_par_date(self):
+        from core.frise_tarifications import FriseTarifications
+        t1 = self._tarif(date(2022, 1, 1), date(2022, 12, 31))
+        t2 = self._tarif(date(2023, 1, 1), date(2023, 6, 30))
+        t3 = self._tarif(date(2024, 1, 1))
+        frise = FriseTarifications([t3, t1, t2])
+        self.assertIs(frise.a_la_date(date(2022, 6, 1)), t1)
+        self.assertIs(frise.a_la_date(date(2023, 6, 30)), t2)
+        self.assertIsNone(frise.a_la_date(date(2023, 9, 1)))
+        self.assertIs(frise.a_la_date(date(2030, 1, 1)), t3)
+        self.assertIsNone(frise.a_la_date(date(2021, 1, 1)))
+        self.assertEqual(frise.sur_periode(date(2022, 12, 1), date(2024, 1, 1)), [t1, t2, t3])
+        # Periode ouverte englobant une plus recente : la plus recente l'emporte, l'autre reste trouvee
+        ouverte = self._tarif(date(2020, 1, 1))
+        frise = FriseTarifications([ouverte, t2])
+        self.assertIs(frise.a_la_date(date(2023, 3, 1)), t2)
+        self.assertIs(frise.a_la_date(date(2023, 9, 1)), ouverte)
+
+    def test_trous_et_chevauchements_en_un_balayage(self):
+        from core.frise_tarifications import CHEVAUCHEMENT, TROU, FriseTarifications
+        frise = FriseTarifications([
+            self._tarif(date(2022, 1, 1), date(2022, 12, 31)),
+            self._tarif(date(2023, 2, 1), date(2023, 12, 31)),
+            self._tarif(date(2023, 12, 1)),
+        ])
+        trou, chevauchement = frise.anomalies()
+        self.assertEqual((trou.type_anomalie, trou.debut, trou.fin, trou.jours),
+                         (TROU, date(2023, 1, 1), date(2023, 1, 31), 31))
+        self.assertEqual((chevauchement.type_anomalie, chevauchement.jours), (CHEVAUCHEMENT, 31))
+        self.assertEqual(str(trou), "Trou de 31 jour(s) entre 31/12/2022 et 01/02/2023")
+
+        bail = Bail.objects.create(local=self.local, date_debut=date(2022, 1, 1))
+        BailTarification.objects.create(bail=bail, date_debut=date(2022, 1, 1), date_fin=date(2022, 12, 31),
+                                        loyer_hc=Decimal("500"))
+        BailTarification.objects.create(bail=bail, date_debut=date(2023, 2, 1), loyer_hc=Decimal("520"))
+        continu, trous = BailCalculator.verifier_continuite_tarifications(bail)
+        self.assertFalse(continu)
+        self.assertEqual(trous, [{'end': date(2022, 12, 31), 'start': date(2023, 2, 1), 'days': 31}])
+        with self.assertRaises(ValidationError):
+            BailTarification(bail=bail, date_debut=date(2022, 6, 1), date_fin=date(2023, 1, 15),
+                             loyer_hc=Decimal("1")).full_clean()
+
+    def test_audit_du_portefeuille_en_une_requete(self):
+        from core.frise_tarifications import (
+            AUCUNE_TARIFICATION, SANS_TARIF_ACTIF, TROU, rapport_continuite,
+        )
+        baux = []
+        for porte in range(4):
+            local = Local.objects.create(immeuble=self.immeuble, numero_porte=f"A{porte}", surface_m2=Decimal("30"))
+            baux.append(Bail.objects.create(local=local, date_debut=date(2023, 1, 1)))
+        continu, troue, vide, expire = baux
+        BailTarification.objects.create(bail=continu, date_debut=date(2023, 1, 1), date_fin=date(2023, 12, 31),
+                                        loyer_hc=Decimal("500"))
+        BailTarification.objects.create(bail=continu, date_debut=date(2024, 1, 1), loyer_hc=Decimal("510"))
+        BailTarification.objects.create(bail=troue, date_debut=date(2023, 1, 1), date_fin=date(2023, 6, 30),
+                                        loyer_hc=Decimal("500"))
+        BailTarification.objects.create(bail=troue, date_debut=date(2023, 8, 1), loyer_hc=Decimal("510"))
+        BailTarification.objects.create(bail=expire, date_debut=date(2023, 1, 1), date_fin=date(2023, 12, 31),
+                                        loyer_hc=Decimal("500"))
+
+        with self.assertNumQueries(1):
+            lignes = rapport_continuite(Bail.objects.filter(pk__in=[b.pk for b in baux]), jour=date(2024, 6, 1))
+        anomalies = {}
+        for ligne in lignes:
+            anomalies.setdefault(ligne.bail_id, []).append(ligne.anomalie)
+        self.assertEqual(set(anomalies), {troue.pk, vide.pk, expire.pk})
+        self.assertEqual([a.type_anomalie for a in anomalies[troue.pk]], [TROU])
+        self.assertEqual([a.type_anomalie for a in anomalies[vide.pk]], [AUCUNE_TARIFICATION])
+        self.assertEqual([a.type_anomalie for a in anomalies[expire.pk]], [SANS_TARIF_ACTIF])
+
+
+class AuditTarificationsTests(BaseFixture):
+    """P-25 : audit de tout le portefeuille en une requete (fenetres MAX), export CSV."""
+
+    def setUp(self):
+        super().setUp()
+        self.baux = {}
+        periodes = {
+            'continu': [(date(2023, 1, 1), date(2023, 12, 31)), (date(2024, 1, 1), None)],
+            'troue': [(date(2023, 1, 1), date(2023, 6, 30)), (date(2023, 8, 1), None)],
+            # Longue periode englobante : deux chevauchements, pas de faux trou entre les deux autres
+            'imbrique': [(date(2023, 1, 1), date(2024, 12, 31)), (date(2023, 2, 1), date(2023, 3, 31)),
+                         (date(2023, 6, 1), date(2023, 9, 30))],
+            'vide': [],
+            'sorti': [(date(2023, 1, 1), None)],
+        }
+        for porte, dates in periodes.items():
+            local = Local.objects.create(immeuble=self.immeuble, numero_porte=porte, surface_m2=Decimal("30"))
+            bail = Bail.objects.create(local=local, date_debut=date(2023, 1, 1))
+            BailTarification.objects.bulk_create(
+                BailTarification(bail=bail, date_debut=debut, date_fin=fin, loyer_hc=Decimal("500"))
+                for debut, fin in dates
+            )
+            self.baux[porte] = bail
+        Bail.objects.filter(pk=self.baux['sorti'].pk).update(date_fin=date(2024, 3, 31))
+
+    def test_une_requete_pour_tout_le_portefeuille(self):
+        from core.frise_tarifications import FriseTarifications, rapport_continuite
+        with self.assertNumQueries(1):
+            lignes = rapport_continuite(jour=date(2024, 6, 1))
+        anomalies = {}
+        for ligne in lignes:
+            anomalies.setdefault(ligne.bail_id, []).append(ligne.anomalie)
+        types = {bail_id: [a.type_anomalie for a in liste] for bail_id, liste in anomalies.items()}
+        self.assertEqual(types, {
+            self.baux['troue'].pk: ['TROU'],
+            self.baux['imbrique'].pk: ['CHEVAUCHEMENT', 'CHEVAUCHEMENT'],
+            self.baux['vide'].pk: ['AUCUNE_TARIFICATION'],
+            self.baux['sorti'].pk: ['APRES_FIN_BAIL'],
+        })
+        # Memes trous et chevauchements, et memes tarifications en cause, que le
+        # balayage en Python de la frise : pour 'imbrique', la longue periode
+        # couvrante et non la precedente par date de debut
+        for porte in ('troue', 'imbrique'):
+            frise = FriseTarifications(self.baux[porte].tarifications.all())
+            self.assertEqual(
+                [(a.type_anomalie, a.debut, a.fin, [(t.pk, t.date_debut, t.date_fin) for t in a.tarifs])
+                 for a in frise.anomalies()],
+                [(a.type_anomalie, a.debut, a.fin, [(t.pk, t.date_debut, t.date_fin) for t in a.tarifs])
+                 for a in anomalies[self.baux[porte].pk]],
+            )
+        longue = self.baux['imbrique'].tarifications.get(date_debut=date(2023, 1, 1))
+        self.assertEqual(anomalies[self.baux['imbrique'].pk][1].tarifs[0].pk, longue.pk)
+        self.assertEqual(str(anomalies[self.baux['troue'].pk][0]), "Trou de 31 jour(s) entre 30/06/2023 et 01/08/2023")
+
+    def test_page_et_export_csv(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse-solide-1'))
+        reponse = self.client.get('/app/tarifications/audit/?type=TROU')
+        self.assertContains(reponse, "Trou de 31 jour(s)")
+        self.assertNotContains(reponse, "Chevauchement entre")
+
+        reponse = self.client.get('/app/tarifications/audit/?export=csv')
+        self.assertEqual(reponse['Content-Type'], 'text/csv; charset=utf-8')
+        lignes = reponse.content.decode('utf-8-sig').splitlines()
+        self.assertEqual(lignes[0], "Immeuble;Porte;Entrée;Sortie;Anomalie;Du;Au;Jours;Détail")
+        self.assertIn("Residence A;troue;01/01/2023;;Trou;01/07/2023;31/07/2023;31;"
+                      "Trou de 31 jour(s) entre 30/06/2023 et 01/08/2023", lignes)
+
+    def test_commande_et_action_admin(self):
+        import io
+        import os
+        import tempfile
+        from django.core.management import call_command
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'audit.csv')
+            sortie = io.StringIO()
+            call_command('auditer_tarifications', '--csv', chemin, '--date', '2024-06-01', stdout=sortie)
+            self.assertIn("5 anomalie(s) sur 4 bail(s)", sortie.getvalue())
+            with open(chemin, encoding='utf-8-sig') as fichier:
+                self.assertEqual(len(fichier.read().splitlines()), 6)
+
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse-solide-1'))
+        reponse = self.client.post('/admin/core/bail/', {
+            'action': 'verifier_continuite_tarifications',
+            '_selected_action': [self.baux['troue'].pk, self.baux['continu'].pk],
+        }, follow=True)
+        messages = [str(message) for message in reponse.context['messages']]
+        self.assertEqual(len(messages), 1)
+        self.assertIn("Porte troue", messages[0])
+
+
+class ToutesLesPagesTests(TestCaseIsole):
     """Fumigation : chaque page doit repondre, y compris apres le passage en Decimal.
 
     C'est ce test qui a rattrape les melanges Decimal/float dans les vues de
@@ -4,9 +4,11 @@ from .views import (
     generer_quittance_pdf,
     generer_avis_echeance_pdf,
     generer_regularisation_pdf,
+    apercu_regularisation,
     generer_solde_tout_compte_pdf,
     generer_revision_loyer_pdf,
     creer_tarification_from_revision,
+    campagne_revision_loyers,
     dashboard_patrimoine,
     dashboard_immeuble_detail,
     bilan_fiscal_immeuble,
@@ -17,9 +19,11 @@ urlpatterns = [
     path('quittance/<int:pk>/', generer_quittance_pdf, name='quittance_pdf'),
     path('avis_echeance/<int:pk>/', generer_avis_echeance_pdf, name='avis_echeance_pdf'),
     path('regularisation/<int:pk>/', generer_regularisation_pdf, name='regularisation_pdf'),
+    path('regularisation/<int:pk>/apercu/', apercu_regularisation, name='regularisation_apercu'),
     path('solde_tout_compte/<int:pk>/', generer_solde_tout_compte_pdf, name='solde_tout_compte_pdf'),
     path('revision_loyer/<int:pk>/', generer_revision_loyer_pdf, name='revision_loyer_pdf'),
     path('creer_tarification_revision/<int:pk>/', creer_tarification_from_revision, name='creer_tarification_from_revision'),
+    path('revision_loyer/campagne/', campagne_revision_loyers, name='campagne_revision_loyers'),
 
     # Dashboard Patrimoine
     path('patrimoine/dashboard/', dashboard_patrimoine, name='dashboard_patrimoine'),
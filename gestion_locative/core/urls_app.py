@@ -50,6 +50,7 @@ urlpatterns = [
     path('immeubles/<int:immeuble_pk>/credits/creer/', views_app.credit_create_view, name='app_credit_create'),
     path('credits/<int:pk>/modifier/', views_app.credit_edit_view, name='app_credit_edit'),
     path('credits/<int:pk>/supprimer/', views_app.credit_delete_view, name='app_credit_delete'),
+    path('credits/<int:pk>/echeancier/', views_app.credit_echeancier_view, name='app_credit_echeancier'),
 
     # Depenses - CRUD
     path('immeubles/<int:immeuble_pk>/depenses/creer/', views_app.depense_create_view, name='app_depense_create'),
@@ -62,6 +63,9 @@ urlpatterns = [
     path('cles/<int:pk>/modifier/', views_app.cle_edit_view, name='app_cle_edit'),
     path('cles/<int:pk>/supprimer/', views_app.cle_delete_view, name='app_cle_delete'),
 
+    # Charges de l'annee par local (matrice de repartition)
+    path('immeubles/<int:pk>/charges/', views_app.charges_locaux_view, name='app_charges_locaux'),
+
     # Quotes-parts - CRUD
     path('cles/<int:cle_pk>/quotesparts/creer/', views_app.quotepart_create_view, name='app_quotepart_create'),
     path('quotesparts/<int:pk>/modifier/', views_app.quotepart_edit_view, name='app_quotepart_edit'),
@@ -85,4 +89,13 @@ urlpatterns = [
     # Patrimoine
     path('patrimoine/', views_app.patrimoine_dashboard_view, name='app_patrimoine'),
     path('immeubles/<int:pk>/fiscal/', views_app.bilan_fiscal_view, name='app_bilan_fiscal'),
+
+    # Audit des tarifications
+    path('tarifications/audit/', views_app.audit_tarifications_view, name='app_audit_tarifications'),
+
+    # Taches de fond
+    path('taches/', views_app.taches_view, name='app_taches'),
+    path('taches/<int:pk>/', views_app.tache_detail_view, name='app_tache_detail'),
+    path('taches/<int:pk>/etat/', views_app.tache_etat_view, name='app_tache_etat'),
+    path('taches/<int:pk>/telecharger/', views_app.tache_telecharger_view, name='app_tache_telecharger'),
 ]
@@ -5,29 +5,28 @@ Version optimisée utilisant PDFGenerator et templates Django.
 import logging
 import re
 from datetime import datetime, date, timedelta
-from decimal import Decimal
 from io import BytesIO
 
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.db import transaction
 from django.db.models import Q
 from django.middleware.csrf import get_token
 from django.contrib.admin.views.decorators import staff_member_required
-from django.core.cache import cache
 
+from . import cache_pdf, taches
 from .models import Immeuble, Bail, Local
 from .pdf_generator import PDFGenerator
 from .calculators import BailCalculator
 from .exceptions import TarificationNotFoundError
+from .indices import derniers_indices, type_indice_du_bail, valeur_indice
 from .patrimoine_calculators import PatrimoineCalculator, RentabiliteCalculator
+from .portefeuille import SynthesePortefeuille, TAUX_REVALORISATION_ANNUEL
+from .projection_monte_carlo import NB_TRAJECTOIRES, libelle_hypotheses
 
 # Configuration logging
 logger = logging.getLogger(__name__)
 
-# Hypothese de revalorisation annuelle du patrimoine pour les projections.
-TAUX_REVALORISATION_ANNUEL = 1.02
-
 
 # ============================================================================
 # HELPERS
@@ -159,9 +158,8 @@ def generer_quittance_pdf(request, pk):
         if not periodes_selectionnees:
             return HttpResponse("Erreur: Aucune période sélectionnée.", status=400)
 
-        # Générer PDF
-        generator = PDFGenerator(bail)
-        pdf_content = generator.generer_quittance(periodes_selectionnees)
+        # PDF depuis le cache disque, rendu au premier téléchargement
+        fichier = cache_pdf.document(bail, 'generer_quittance', periodes_selectionnees)
 
         # Préparer nom fichier
         occupant = bail.occupants.filter(role='LOCATAIRE').first()
@@ -173,11 +171,12 @@ def generer_quittance_pdf(request, pk):
 
         filename = f"Quittance_{_nom_fichier_sur(nom_locataire)}_{periode_str}.pdf"
 
-        # Retourner PDF
-        response = HttpResponse(pdf_content, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # Retourner PDF (FileResponse : envoyé par le serveur WSGI, sans copie en mémoire)
+        response = FileResponse(
+            open(fichier, 'rb'), as_attachment=True, filename=filename, content_type='application/pdf'
+        )
 
-        logger.info(f"Quittance générée: {filename} ({len(pdf_content)} bytes)")
+        logger.info(f"Quittance générée: {filename} ({fichier.stat().st_size} bytes)")
         return response
 
     except TarificationNotFoundError as e:
@@ -223,8 +222,7 @@ def generer_avis_echeance_pdf(request, pk):
         if not periodes_selectionnees:
             return HttpResponse("Erreur: Aucune période sélectionnée.", status=400)
 
-        generator = PDFGenerator(bail)
-        pdf_content = generator.generer_avis_echeance(periodes_selectionnees)
+        fichier = cache_pdf.document(bail, 'generer_avis_echeance', periodes_selectionnees)
 
         occupant = bail.occupants.filter(role='LOCATAIRE').first()
         nom_locataire = occupant.nom.upper().replace(" ", "_") if occupant else "Inconnu"
@@ -232,8 +230,9 @@ def generer_avis_echeance_pdf(request, pk):
         date_debut = _nom_fichier_sur(min(periodes_selectionnees), "debut")
         filename = f"AvisEcheance_{_nom_fichier_sur(nom_locataire)}_{date_debut}.pdf"
 
-        response = HttpResponse(pdf_content, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response = FileResponse(
+            open(fichier, 'rb'), as_attachment=True, filename=filename, content_type='application/pdf'
+        )
 
         logger.info(f"Avis d'échéance généré: {filename}")
         return response
@@ -312,6 +311,44 @@ def generer_regularisation_pdf(request, pk):
         return HttpResponse("Une erreur interne est survenue. Consultez les logs pour plus de détails.", status=500)
 
 
+@staff_member_required
+def apercu_regularisation(request, pk):
+    """
+    Aperçu du décompte de régularisation, sans PDF ni écriture en base.
+
+    GET date_debut / date_fin (AAAA-MM-JJ). Renvoie le décompte en JSON, ou
+    le fragment HTML affiché sous le formulaire pour une requête HTMX.
+    """
+    from django.http import JsonResponse
+    from .regularisation import calculer_regularisation
+
+    bail = get_object_or_404(
+        Bail.objects.select_related('local__immeuble').prefetch_related('tarifications'), pk=pk
+    )
+    htmx = request.headers.get('HX-Request') == 'true'
+
+    try:
+        date_debut = datetime.strptime(request.GET.get('date_debut', ''), '%Y-%m-%d').date()
+        date_fin = datetime.strptime(request.GET.get('date_fin', ''), '%Y-%m-%d').date()
+        if date_debut > date_fin:
+            raise ValueError
+    except ValueError:
+        erreur = "Période invalide."
+    else:
+        try:
+            decompte = calculer_regularisation(bail, date_debut, date_fin)
+        except TarificationNotFoundError as e:
+            erreur = str(e)
+        else:
+            if htmx:
+                return render(request, 'pdf_forms/regularisation_apercu.html', {'decompte': decompte})
+            return JsonResponse(decompte.en_dict())
+
+    if htmx:
+        return render(request, 'pdf_forms/regularisation_apercu.html', {'erreur': erreur})
+    return JsonResponse({'erreur': erreur}, status=400)
+
+
 # ============================================================================
 # VUES PDF REFACTORISÉES - SOLDE DE TOUT COMPTE
 # ============================================================================
@@ -381,65 +418,6 @@ def generer_solde_tout_compte_pdf(request, pk):
 # VUES PDF REFACTORISÉES - RÉVISION LOYER
 # ============================================================================
 
-def fetch_insee_indices(url, limit=8, max_retries=2):
-    """Récupère les derniers indices (Trimestre, Valeur) sur le site de l'INSEE.
-
-    Le résultat est mis en cache 24 h : les indices ne changent qu'une fois par
-    trimestre, et l'appel réseau bloque un worker gunicorn le temps de la réponse.
-    """
-    import urllib.request
-    import urllib.error
-    import re
-    import time
-
-    cle_cache = f"insee-indices:{url}"
-    en_cache = cache.get(cle_cache)
-    if en_cache is not None:
-        logger.debug("Indices INSEE servis depuis le cache")
-        return en_cache
-
-    for attempt in range(max_retries):
-        try:
-            req = urllib.request.Request(
-                url,
-                data=None,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                }
-            )
-            with urllib.request.urlopen(req, timeout=5) as response:
-                html = response.read().decode('utf-8')
-                pattern = r'<th[^>]*>(T[1-4] [0-9]{4})</th>[\s\S]*?<td class="nombre">([0-9]+,[0-9]+)</td>'
-                matches = re.findall(pattern, html)
-
-                indices = []
-                for match in matches[:limit]:
-                    trimestre = match[0]
-                    valeur = match[1].replace(',', '.')
-                    indices.append({'trimestre': trimestre, 'valeur': float(valeur)})
-
-                if not indices:
-                    # Le format de la page a change : mieux vaut le savoir que
-                    # de servir une liste vide sans explication.
-                    logger.error(
-                        "Aucun indice extrait de %s : le format de la page INSEE a "
-                        "probablement change.", url,
-                    )
-                else:
-                    cache.set(cle_cache, indices, 24 * 3600)
-                return indices
-        except urllib.error.URLError as e:
-            wait_time = 2 ** attempt
-            logger.warning(f"Erreur réseau INSEE (tentative {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(wait_time)
-        except Exception as e:
-            logger.warning(f"Erreur récupération INSEE : {e}")
-            break
-
-    return []
-
-
 @staff_member_required
 def generer_revision_loyer_pdf(request, pk):
     """
@@ -452,14 +430,9 @@ def generer_revision_loyer_pdf(request, pk):
 
     # GET : Afficher formulaire
     if request.method != 'POST':
-        # Tentative de récupération des indices INSEE
-        url_insee = "https://www.insee.fr/fr/statistiques/serie/001515333"  # IRL
-        nom_indice = "IRL"
-        if bail.local.type_local != 'APPART':
-            url_insee = "https://www.insee.fr/fr/statistiques/serie/001515332"  # ILC
-            nom_indice = "ILC"
-
-        indices_dispos = fetch_insee_indices(url_insee)
+        # Indices lus en base (commande rafraichir_indices), jamais sur le réseau
+        nom_indice = type_indice_du_bail(bail)
+        indices_dispos = derniers_indices(nom_indice)
 
         tarif_actuel = bail.tarification_actuelle
         loyer_actuel = f"{tarif_actuel.loyer_hc} €" if tarif_actuel else "Non défini"
@@ -485,7 +458,9 @@ def generer_revision_loyer_pdf(request, pk):
         try:
             if choix and choix != "MANUEL":
                 val_str, trim_str = choix.split('|')
-                nouvel_indice = float(val_str)
+                # La valeur de référence est celle de la base, pas celle du formulaire
+                en_base = valeur_indice(type_indice_du_bail(bail), trim_str)
+                nouvel_indice = float(en_base if en_base is not None else val_str)
                 nouveau_trimestre = trim_str
             else:
                 raw_indice = request.POST.get('nouvel_indice_manuel', '')
@@ -640,6 +615,52 @@ def creer_tarification_from_revision(request, pk):
         return HttpResponse("Une erreur interne est survenue. Consultez les logs pour plus de détails.", status=500)
 
 
+# ============================================================================
+# CAMPAGNE DE RÉVISION (tous les baux d'un mois anniversaire)
+# ============================================================================
+
+@staff_member_required
+def campagne_revision_loyers(request):
+    """
+    Révision en lot des baux dont l'anniversaire tombe un mois donné.
+
+    GET : aperçu des nouveaux loyers et des baux écartés (rien n'est enregistré).
+    POST : la campagne est mise en file (tâche de fond) : tarifications créées
+    dans une transaction puis courriers en ZIP, à télécharger depuis le suivi.
+    """
+    from .revision_campagne import CampagneRevision
+
+    prochain_mois = date.today().replace(day=1) + timedelta(days=31)
+    donnees = request.POST if request.method == 'POST' else request.GET
+    try:
+        annee = int(donnees.get('annee', prochain_mois.year))
+        mois = int(donnees.get('mois', prochain_mois.month))
+        date(annee, mois, 1)
+    except (TypeError, ValueError):
+        return HttpResponse("Erreur: Année ou mois invalide.", status=400)
+
+    campagne = CampagneRevision(annee, mois)
+
+    if request.method != 'POST':
+        context = {
+            'annee': annee,
+            'mois': mois,
+            'mois_choix': range(1, 13),
+            'campagne': campagne,
+        }
+        return render(request, 'pdf_forms/campagne_revision_form.html', context)
+
+    if not campagne.revisions:
+        return HttpResponse("Aucun bail à réviser pour ce mois.", status=400)
+
+    tache = taches.soumettre(
+        'campagne_revision', f"Campagne de révision {mois:02d}/{annee}",
+        {'annee': annee, 'mois': mois}, request.user,
+    )
+    logger.info(f"Campagne de révision {mois:02d}/{annee} mise en file ({len(campagne.revisions)} bail(s))")
+    return redirect('app_tache_detail', pk=tache.pk)
+
+
 # ============================================================================
 # DASHBOARD PATRIMOINE
 # ============================================================================
@@ -651,92 +672,27 @@ def dashboard_patrimoine(request):
     Affiche graphiques et indicateurs globaux.
     Accessible uniquement aux utilisateurs staff.
     """
-    import json
-    from dateutil.relativedelta import relativedelta
-
-    # Récupérer tous les immeubles
-    immeubles = Immeuble.objects.all().prefetch_related('credits', 'locaux__baux', 'estimations')
-
-    # Calculer données pour chaque immeuble
-    immeubles_data = []
-    total_valeur = Decimal('0')
-    total_crd = Decimal('0')
-    total_cashflow = Decimal('0')
-    total_locaux = 0
-
-    for immeuble in immeubles:
-        valeur = PatrimoineCalculator.get_valeur_actuelle(immeuble)
-        crd = PatrimoineCalculator.get_capital_restant_du(immeuble)
-        cashflow = RentabiliteCalculator.get_cashflow_mensuel(immeuble)
-        rendement = RentabiliteCalculator.get_rendement_brut(immeuble)
-        nb_locaux = immeuble.locaux.count()
-
-        total_valeur += valeur
-        total_crd += crd
-        total_cashflow += cashflow
-        total_locaux += nb_locaux
-
-        immeubles_data.append({
-            'id': immeuble.id,
-            'nom': immeuble.nom,
-            'regime_fiscal_display': immeuble.get_regime_fiscal_display(),
-            'valeur_actuelle': float(valeur),
-            'capital_restant_du': float(crd),
-            'valeur_nette': float(valeur - crd),
-            'rendement_brut': rendement,
-            'cashflow': float(cashflow),
-        })
+    synthese = SynthesePortefeuille()
+    immeubles_data = synthese.lignes_graphique(avec_regime=True)
 
-    # Totaux
     totaux = {
-        'valeur_totale': total_valeur,
-        'crd_total': total_crd,
-        'valeur_nette': total_valeur - total_crd,
-        'cashflow_total': total_cashflow,
-        'nb_immeubles': immeubles.count(),
-        'nb_locaux': total_locaux,
+        'valeur_totale': synthese.totaux['valeur'],
+        'crd_total': synthese.totaux['crd'],
+        'valeur_nette': synthese.totaux['valeur_nette'],
+        'cashflow_total': synthese.totaux['cashflow'],
+        'nb_immeubles': synthese.totaux['nb_immeubles'],
+        'nb_locaux': synthese.totaux['nb_locaux'],
     }
 
     # Données pour les graphiques (rendues via json_script, jamais via |safe)
-
-    # Projection sur 10 ans
-    today = date.today()
-    projection_labels = []
-    projection_valeurs = []
-    projection_crd = []
-    projection_nette = []
-
-    for i in range(0, 11):
-        annee = today.year + i
-        projection_labels.append(str(annee))
-
-        # Valeur (on garde la même pour simplifier, ou on ajoute une appréciation)
-        valeur_projetee = float(total_valeur) * (TAUX_REVALORISATION_ANNUEL ** i)
-        projection_valeurs.append(round(valeur_projetee, 0))
-
-        # CRD (décroissant)
-        target_date = date(annee, 12, 31)
-        crd_projete = float(sum(
-            (credit.get_capital_restant_du_at(target_date)
-             for immeuble in immeubles
-             for credit in immeuble.credits.all()),
-            Decimal('0'),
-        ))
-        projection_crd.append(round(crd_projete, 0))
-
-        # Valeur nette
-        projection_nette.append(round(valeur_projetee - crd_projete, 0))
-
     context = {
         'immeubles': immeubles_data,
         'totaux': totaux,
         'immeubles_data_json': immeubles_data,
-        'projection_data_json': {
-            'labels': projection_labels,
-            'valeurs': projection_valeurs,
-            'crd': projection_crd,
-            'nette': projection_nette,
-        },
+        'projection_data_json': synthese.projection(),
+        'projection_mc_json': synthese.projection_stochastique(),
+        'hypotheses_mc': libelle_hypotheses(),
+        'nb_trajectoires_mc': NB_TRAJECTOIRES,
         'taux_revalorisation': TAUX_REVALORISATION_ANNUEL,
     }
 
@@ -787,7 +743,7 @@ def dashboard_immeuble_detail(request, immeuble_id):
 
     locaux_details = []
     for local in immeuble.locaux.all():
-        bail_actif = local.baux.filter(actif=True).first()
+        bail_actif = local.bail_actif
         local_data = {
             'local': local,
             'surface_m2': float(local.surface_m2 or 0),
@@ -825,7 +781,7 @@ def dashboard_immeuble_detail(request, immeuble_id):
                 local_data['loyer_m2'] = loyer_hc / float(local.surface_m2) if local.surface_m2 else 0
                 local_data['frequence'] = bail_actif.get_frequence_paiement_display()
 
-            locataire = bail_actif.occupants.filter(role='LOCATAIRE').first()
+            locataire = bail_actif.locataire_principal
             local_data['locataire'] = locataire.nom if locataire else "Non renseigné"
             local_data['date_debut_bail'] = bail_actif.date_debut
         else:
@@ -910,7 +866,7 @@ def dashboard_immeuble_detail(request, immeuble_id):
         projection_crd.append({
             'annee': today.year + i,
             'crd': round(crd, 0),
-            'valeur_nette': round(valeur_actuelle * (TAUX_REVALORISATION_ANNUEL ** i) - crd, 0)
+            'valeur_nette': round(valeur_actuelle * float(TAUX_REVALORISATION_ANNUEL ** i) - crd, 0)
         })
 
     # === CONTEXTE ===
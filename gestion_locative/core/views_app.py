@@ -13,12 +13,12 @@ from django.shortcuts import render, redirect, get_object_or_404, resolve_url
 from django.utils.http import url_has_allowed_host_and_scheme
 
 from django import forms as django_forms
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse
 
 from core.models import (
     Immeuble, Local, Bail, BailTarification, Occupant,
     Regularisation, EstimationValeur, CreditImmobilier,
-    CleRepartition, QuotePart, Depense, Consommation, Ajustement,
+    CleRepartition, QuotePart, Depense, Consommation, Ajustement, Tache,
 )
 from core.forms import (
     DepenseQuickForm, ImmeubleForm, LocalForm, BailForm,
@@ -27,18 +27,19 @@ from core.forms import (
     QuotePartForm, ConsommationForm, RegularisationForm, AjustementForm,
 )
 from core.patrimoine_calculators import (
-    PatrimoineCalculator, RentabiliteCalculator, RatiosCalculator,
-    FiscaliteCalculator, CreditGenerator,
+    RentabiliteCalculator, FiscaliteCalculator, CreditGenerator,
 )
 
+from core.echeancier import page_echeancier, resume_annuel
+from core.frise_tarifications import LIBELLES, ecrire_csv, rapport_continuite
+from core.indicateurs import indicateurs_immeuble
+from core.portefeuille import SynthesePortefeuille, TAUX_REVALORISATION_ANNUEL
+from core.projection_monte_carlo import NB_TRAJECTOIRES, libelle_hypotheses
+from core.repartition import matrice_repartition
 from core.views import generer_periodes_disponibles
 
 logger = logging.getLogger(__name__)
 
-# Hypothese de revalorisation du patrimoine utilisee par la projection a 10 ans.
-# Affichee telle quelle sur le graphique : ce n'est pas une donnee mesuree.
-TAUX_REVALORISATION_ANNUEL = Decimal('1.02')
-
 
 # Limitation des tentatives de connexion (M-04)
 MAX_TENTATIVES_CONNEXION = 5
@@ -109,50 +110,28 @@ def logout_view(request):
 @login_required
 def dashboard_view(request):
     """Dashboard portfolio : KPIs globaux + cartes immeubles."""
-    immeubles = Immeuble.objects.select_related('proprietaire').prefetch_related(
-        'locaux__baux__tarifications',
-        'locaux__baux__occupants',
-        'locaux__vacances',
-        'credits',
-        'estimations',
-    ).order_by('nom')
-
-    immeubles_data = []
-    total_valeur = Decimal('0')
-    total_crd = Decimal('0')
-    total_cashflow = Decimal('0')
-    annee = date.today().year
-
-    for immeuble in immeubles:
-        valeur = PatrimoineCalculator.get_valeur_actuelle(immeuble)
-        crd = PatrimoineCalculator.get_capital_restant_du(immeuble)
-        valeur_nette = PatrimoineCalculator.get_valeur_nette(immeuble)
-        rendement_brut = RentabiliteCalculator.get_rendement_brut(immeuble)
-        rendement_net = RentabiliteCalculator.get_rendement_net(immeuble)
-        cashflow = RentabiliteCalculator.get_cashflow_mensuel(immeuble)
-        taux_occupation = RatiosCalculator.get_taux_occupation(immeuble, annee)
-
-        total_valeur += valeur or Decimal('0')
-        total_crd += crd or Decimal('0')
-        total_cashflow += cashflow or Decimal('0')
+    synthese = SynthesePortefeuille()
 
-        immeubles_data.append({
+    immeubles_data = [
+        {
             'immeuble': immeuble,
-            'valeur': valeur,
-            'crd': crd,
-            'valeur_nette': valeur_nette,
-            'rendement_brut': rendement_brut,
-            'rendement_net': rendement_net,
-            'cashflow': cashflow,
-            'taux_occupation': taux_occupation,
-        })
+            'valeur': kpi['valeur'],
+            'crd': kpi['crd'],
+            'valeur_nette': kpi['valeur_nette'],
+            'rendement_brut': kpi['rendement_brut'],
+            'rendement_net': kpi['rendement_net'],
+            'cashflow': kpi['cashflow'],
+            'taux_occupation': kpi['taux_occupation'],
+        }
+        for immeuble, kpi in synthese.lignes()
+    ]
 
     context = {
         'immeubles_data': immeubles_data,
-        'total_valeur': total_valeur,
-        'total_crd': total_crd,
-        'total_valeur_nette': total_valeur - total_crd,
-        'total_cashflow': total_cashflow,
+        'total_valeur': synthese.totaux['valeur'],
+        'total_crd': synthese.totaux['crd'],
+        'total_valeur_nette': synthese.totaux['valeur_nette'],
+        'total_cashflow': synthese.totaux['cashflow'],
     }
 
     return render(request, 'app/dashboard/index.html', context)
@@ -192,20 +171,9 @@ def immeuble_detail_view(request, pk):
         pk=pk,
     )
 
-    annee = date.today().year
-    valeur = PatrimoineCalculator.get_valeur_actuelle(immeuble)
-    crd = PatrimoineCalculator.get_capital_restant_du(immeuble)
-
     context = {
         'immeuble': immeuble,
-        'valeur': valeur,
-        'crd': crd,
-        'valeur_nette': PatrimoineCalculator.get_valeur_nette(immeuble),
-        'plus_value': PatrimoineCalculator.get_plus_value_latente(immeuble),
-        'rendement_brut': RentabiliteCalculator.get_rendement_brut(immeuble),
-        'rendement_net': RentabiliteCalculator.get_rendement_net(immeuble),
-        'cashflow': RentabiliteCalculator.get_cashflow_mensuel(immeuble),
-        'taux_occupation': RatiosCalculator.get_taux_occupation(immeuble, annee),
+        **indicateurs_immeuble(immeuble),
         'active_tab': request.GET.get('tab', 'general'),
     }
 
@@ -233,24 +201,15 @@ def immeuble_tab_view(request, pk, tab):
     annee = date.today().year
     context = {
         'immeuble': immeuble,
-        'valeur': PatrimoineCalculator.get_valeur_actuelle(immeuble),
-        'crd': PatrimoineCalculator.get_capital_restant_du(immeuble),
-        'valeur_nette': PatrimoineCalculator.get_valeur_nette(immeuble),
-        'plus_value': PatrimoineCalculator.get_plus_value_latente(immeuble),
-        'rendement_brut': RentabiliteCalculator.get_rendement_brut(immeuble),
-        'rendement_net': RentabiliteCalculator.get_rendement_net(immeuble),
-        'cashflow': RentabiliteCalculator.get_cashflow_mensuel(immeuble),
-        'taux_occupation': RatiosCalculator.get_taux_occupation(immeuble, annee),
+        **indicateurs_immeuble(immeuble),
     }
 
     # Données spécifiques par onglet
     if tab == 'locaux':
         locaux_data = []
         for local in immeuble.locaux.all():
-            bail_actif = local.baux.filter(actif=True).first()
-            locataire = None
-            if bail_actif:
-                locataire = bail_actif.occupants.filter(role='LOCATAIRE').first()
+            bail_actif = local.bail_actif
+            locataire = bail_actif.locataire_principal if bail_actif else None
             locaux_data.append({
                 'local': local,
                 'bail_actif': bail_actif,
@@ -650,7 +609,10 @@ def credit_edit_view(request, pk):
     if request.method == 'POST':
         form = CreditImmobilierForm(request.POST, instance=credit)
         if form.is_valid():
-            form.save()
+            # Échéancier recalé sur les nouvelles conditions, paiements conservés
+            with transaction.atomic():
+                credit = form.save()
+                CreditGenerator(credit).synchroniser_echeances()
             return _modal_success()
     else:
         form = CreditImmobilierForm(instance=credit)
@@ -658,6 +620,25 @@ def credit_edit_view(request, pk):
     return _modal_form_response(request, form, f'Modifier credit {credit.nom_banque}', action_url)
 
 
+@login_required
+def credit_echeancier_view(request, pk):
+    """Échéancier d'un crédit, par pages autour de l'échéance en cours ou résumé par année."""
+    credit = get_object_or_404(CreditImmobilier.objects.select_related('immeuble'), pk=pk)
+    vue = 'annuel' if request.GET.get('vue') == 'annuel' else 'mensuel'
+
+    context = {'credit': credit, 'vue': vue}
+    if vue == 'annuel':
+        context['annees'] = resume_annuel(credit.pk)
+    else:
+        def _numero(nom):
+            try:
+                return int(request.GET[nom])
+            except (KeyError, ValueError):
+                return None
+        context['page'] = page_echeancier(credit.pk, apres=_numero('apres'), avant=_numero('avant'))
+    return render(request, 'app/credits/echeancier.html', context)
+
+
 @login_required
 def credit_delete_view(request, pk):
     """Supprimer un credit (modal HTMX)."""
@@ -962,14 +943,13 @@ def cle_detail_view(request, pk):
         ),
         pk=pk,
     )
-    total_tantiemes = sum(float(qp.valeur) for qp in cle.quote_parts.all())
-    quotes_data = []
-    for qp in cle.quote_parts.all():
-        pct = (float(qp.valeur) / total_tantiemes * 100) if total_tantiemes else 0
-        quotes_data.append({
-            'qp': qp,
-            'pourcentage': round(pct, 1),
-        })
+    matrice = matrice_repartition(cle.immeuble_id, date.today().year)
+    total_tantiemes = matrice.totaux_cles.get(cle.pk, Decimal('0'))
+    pourcentages = matrice.pourcentages(cle.pk)
+    quotes_data = [
+        {'qp': qp, 'pourcentage': pourcentages.get(qp.local_id, Decimal('0'))}
+        for qp in cle.quote_parts.all()
+    ]
 
     context = {
         'cle': cle,
@@ -980,6 +960,41 @@ def cle_detail_view(request, pk):
     return render(request, 'app/charges/cle_detail.html', context)
 
 
+@login_required
+def charges_locaux_view(request, pk):
+    """Charges d'une année réparties par local et par clé (matrice de répartition)."""
+    immeuble = get_object_or_404(Immeuble, pk=pk)
+    try:
+        annee = int(request.GET.get('annee', date.today().year - 1))
+        date(annee, 1, 1)
+    except (TypeError, ValueError):
+        return HttpResponse("Erreur: Année invalide.", status=400)
+
+    matrice = matrice_repartition(immeuble.pk, annee)
+    cles = list(immeuble.cles_repartition.order_by('nom'))
+    charges = matrice.charges_par_local()
+    lignes = []
+    for local in immeuble.locaux.order_by('numero_porte'):
+        par_cle = charges.get(local.pk, {})
+        lignes.append({
+            'local': local,
+            'montants': [par_cle.get(cle.pk, Decimal('0')) for cle in cles],
+            'total': sum(par_cle.values(), Decimal('0')),
+        })
+
+    context = {
+        'immeuble': immeuble,
+        'annee': annee,
+        'annees_disponibles': range(date.today().year, date.today().year - 6, -1),
+        'cles': cles,
+        'lignes': lignes,
+        'totaux_cles': [sum((ligne['montants'][i] for ligne in lignes), Decimal('0')) for i in range(len(cles))],
+        'total': sum((ligne['total'] for ligne in lignes), Decimal('0')),
+        'non_reparti': matrice.non_reparti,
+    }
+    return render(request, 'app/charges/charges_locaux.html', context)
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # Patrimoine
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -987,77 +1002,22 @@ def cle_detail_view(request, pk):
 @login_required
 def patrimoine_dashboard_view(request):
     """Dashboard patrimoine global avec graphiques."""
-    from dateutil.relativedelta import relativedelta
-
-    immeubles = Immeuble.objects.all().prefetch_related(
-        'credits', 'locaux__baux__tarifications', 'estimations',
-    )
-
-    immeubles_data = []
-    total_valeur = Decimal('0')
-    total_crd = Decimal('0')
-    total_cashflow = Decimal('0')
-    total_locaux = 0
-
-    for immeuble in immeubles:
-        valeur = PatrimoineCalculator.get_valeur_actuelle(immeuble)
-        crd = PatrimoineCalculator.get_capital_restant_du(immeuble)
-        cashflow = RentabiliteCalculator.get_cashflow_mensuel(immeuble)
-        rendement = RentabiliteCalculator.get_rendement_brut(immeuble)
-        nb_locaux = immeuble.locaux.count()
-
-        total_valeur += valeur
-        total_crd += crd
-        total_cashflow += cashflow
-        total_locaux += nb_locaux
-
-        immeubles_data.append({
-            'id': immeuble.id,
-            'nom': immeuble.nom,
-            'valeur_actuelle': float(valeur),
-            'capital_restant_du': float(crd),
-            'valeur_nette': float(valeur - crd),
-            'rendement_brut': rendement,
-            'cashflow': float(cashflow),
-        })
-
-    # Projection 10 ans
-    today = date.today()
-    projection_labels = []
-    projection_valeurs = []
-    projection_crd = []
-    projection_nette = []
-
-    for i in range(11):
-        annee = today.year + i
-        projection_labels.append(str(annee))
-        valeur_projetee = float(total_valeur) * float(TAUX_REVALORISATION_ANNUEL ** i)
-        projection_valeurs.append(round(valeur_projetee, 0))
-        target_date = date(annee, 12, 31)
-        crd_projete = float(sum(
-            (credit.get_capital_restant_du_at(target_date)
-             for immeuble in immeubles
-             for credit in immeuble.credits.all()),
-            Decimal('0'),
-        ))
-        projection_crd.append(round(crd_projete, 0))
-        projection_nette.append(round(valeur_projetee - crd_projete, 0))
+    synthese = SynthesePortefeuille()
+    immeubles_data = synthese.lignes_graphique()
 
     context = {
         'immeubles_data': immeubles_data,
-        'total_valeur': total_valeur,
-        'total_crd': total_crd,
-        'total_valeur_nette': total_valeur - total_crd,
-        'total_cashflow': total_cashflow,
-        'nb_immeubles': immeubles.count(),
-        'nb_locaux': total_locaux,
+        'total_valeur': synthese.totaux['valeur'],
+        'total_crd': synthese.totaux['crd'],
+        'total_valeur_nette': synthese.totaux['valeur_nette'],
+        'total_cashflow': synthese.totaux['cashflow'],
+        'nb_immeubles': synthese.totaux['nb_immeubles'],
+        'nb_locaux': synthese.totaux['nb_locaux'],
         'immeubles_data_json': immeubles_data,
-        'projection_data_json': {
-            'labels': projection_labels,
-            'valeurs': projection_valeurs,
-            'crd': projection_crd,
-            'nette': projection_nette,
-        },
+        'projection_data_json': synthese.projection(),
+        'projection_mc_json': synthese.projection_stochastique(),
+        'hypotheses_mc': libelle_hypotheses(),
+        'nb_trajectoires_mc': NB_TRAJECTOIRES,
         'taux_revalorisation': TAUX_REVALORISATION_ANNUEL,
     }
 
@@ -1129,3 +1089,72 @@ def bilan_fiscal_view(request, pk):
     }
 
     return render(request, 'app/patrimoine/bilan_fiscal.html', context)
+
+
+# ─── Audit des tarifications ─────────────────────────────────────────────────
+
+# Lignes affichées au-delà desquelles la page renvoie vers l'export CSV
+LIGNES_AUDIT_AFFICHEES = 500
+
+
+@login_required
+def audit_tarifications_view(request):
+    """Audit de continuité des tarifications de tout le portefeuille (?export=csv)."""
+    lignes = rapport_continuite()
+    compteurs = {}
+    for ligne in lignes:
+        compteurs[ligne.anomalie.type_anomalie] = compteurs.get(ligne.anomalie.type_anomalie, 0) + 1
+    type_choisi = request.GET.get('type', '')
+    if type_choisi in LIBELLES:
+        lignes = [ligne for ligne in lignes if ligne.anomalie.type_anomalie == type_choisi]
+
+    if request.GET.get('export') == 'csv':
+        reponse = HttpResponse(content_type='text/csv; charset=utf-8')
+        reponse['Content-Disposition'] = f'attachment; filename="audit_tarifications_{date.today():%Y%m%d}.csv"'
+        reponse.write('\ufeff')  # BOM : accents corrects à l'ouverture dans Excel
+        ecrire_csv(lignes, reponse)
+        return reponse
+
+    return render(request, 'app/tarifications/audit.html', {
+        'lignes': lignes[:LIGNES_AUDIT_AFFICHEES],
+        'nb_lignes': len(lignes),
+        'tronque': len(lignes) > LIGNES_AUDIT_AFFICHEES,
+        'types': [(cle, libelle, compteurs.get(cle, 0)) for cle, libelle in LIBELLES.items()],
+        'type_choisi': type_choisi,
+    })
+
+
+# ─── Tâches de fond ────────────────────────────────────────────────────────
+
+@login_required
+def taches_view(request):
+    """Dernières tâches de fond (ZIP de documents, campagnes, échéanciers)."""
+    taches = Tache.objects.select_related('cree_par')[:50]
+    return render(request, 'app/taches/liste.html', {'taches': taches})
+
+
+@login_required
+def tache_detail_view(request, pk):
+    """Suivi d'une tâche : l'état se rafraîchit par HTMX jusqu'à la fin."""
+    tache = get_object_or_404(Tache, pk=pk)
+    return render(request, 'app/taches/detail.html', {'tache': tache})
+
+
+@login_required
+def tache_etat_view(request, pk):
+    """Fragment HTMX de l'état d'une tâche (se redemande tant qu'elle tourne)."""
+    tache = get_object_or_404(Tache, pk=pk)
+    return render(request, 'app/taches/_etat.html', {'tache': tache})
+
+
+@login_required
+def tache_telecharger_view(request, pk):
+    """Fichier produit par une tâche terminée."""
+    tache = get_object_or_404(Tache, pk=pk, statut='TERMINEE')
+    if not tache.fichier:
+        raise Http404("Cette tâche n'a pas produit de fichier.")
+    try:
+        fichier = open(tache.fichier, 'rb')
+    except FileNotFoundError:
+        raise Http404("Le fichier de cette tâche a été purgé.")
+    return FileResponse(fichier, as_attachment=True, filename=tache.nom_fichier)
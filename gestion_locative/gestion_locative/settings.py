@@ -199,7 +199,8 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
 
 # Cache : partage entre les workers gunicorn (compteur de tentatives de
-# connexion, indices INSEE). Un cache memoire serait local a chaque worker.
+# connexion, indices INSEE, indicateurs des immeubles). Un cache memoire
+# serait local a chaque worker.
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
@@ -208,6 +209,20 @@ CACHES = {
     }
 }
 
+# Generation de documents par lot (quittances groupees) : nombre de processus
+# de rendu PDF. 0 = rendu dans le worker gunicorn lui-meme (adapte aux NAS a
+# 2 coeurs) ; au-dela, le rendu ReportLab est reparti sur autant de processus.
+PDF_LOT_PROCESSUS = int(os.environ.get('PDF_LOT_PROCESSUS', '0'))
+
+# Cache des PDF generes (quittances, avis d'echeance), dans le volume de
+# donnees : un document deja rendu pour les memes donnees est servi depuis
+# le disque (core/cache_pdf.py).
+PDF_CACHE_DIR = Path(os.environ.get('DJANGO_PDF_CACHE_DIR', DOSSIER_DONNEES / 'pdf'))
+
+# Taches de fond (core/taches.py) : fichiers produits (ZIP de documents...),
+# telecharges depuis l'application une fois la tache terminee.
+TACHES_DIR = Path(os.environ.get('DJANGO_TACHES_DIR', DOSSIER_DONNEES / 'taches'))
+
 # Logging Configuration
 # https://docs.djangoproject.com/en/6.0/topics/logging/
 